@@ -22,17 +22,28 @@ import importlib
 import itertools
 import logging
 import pkgutil
+import threading
 import traceback
 
 from functools import wraps
 
 import six
 
-from convert2rhel import utils
+from six import moves
+
+from convert2rhel import timings, utils
 
 
 logger = logging.getLogger(__name__)
 
+#: Environment variable to opt in to running the independent system checks in
+#: parallel. Its value is the maximum number of Actions running at once.
+PARALLEL_ACTIONS_ENVVAR = "CONVERT2RHEL_PARALLEL_ACTIONS"
+
+#: How often the parallel Stage scheduler checks for a KeyboardInterrupt while
+#: waiting for the running Actions, in seconds.
+_PARALLEL_ACTIONS_POLL_INTERVAL = 0.1
+
 
 #: Status code of an Action.
 #:
@@ -179,6 +190,15 @@ class Action:
     #: have to import the class to reference them in the Sequence.
     dependencies = ()
 
+    #: Set to True in Actions which are not safe to run concurrently with
+    #: other Actions, for instance because they use the rpm or yum/dnf python
+    #: modules in-process, query the repositories or fork child processes
+    #: through :func:`convert2rhel.utils.run_as_child_process`, which could
+    #: inherit the locks held by the other threads. When the Stage runs its
+    #: Actions in parallel, such an Action runs only once no other Action is
+    #: running and no other Action starts until it finishes.
+    serial_only = False
+
     def __init__(self):
         """
         The attributes set here should be set when the run() method returns.
@@ -445,7 +465,7 @@ class Stage:
     #: Private attribute to allow unittests to override this dir
     _actions_dir = "convert2rhel.actions.%s"
 
-    def __init__(self, stage_name, task_header=None, next_stage=None):
+    def __init__(self, stage_name, task_header=None, next_stage=None, max_parallel_actions=1):
         """
         Stages define a set of Actions which should be executed as a group.
 
@@ -459,6 +479,10 @@ class Stage:
         :param next_stage: A Stage which will automatically be run after the
             Actions in this Stage have had a change to run.
         :type next_stage: str
+        :param max_parallel_actions: Maximum number of the Actions of this
+            Stage to run at once. By default, the Actions run one after
+            another.
+        :type max_parallel_actions: int
 
         Stages are used for ordering only. This is different from
         Action.dependencies which are used for both ordering and to determine
@@ -471,6 +495,7 @@ class Stage:
         self.stage_name = stage_name
         self.task_header = task_header if task_header else stage_name
         self.next_stage = next_stage
+        self.max_parallel_actions = max_parallel_actions
         self._has_run = False
 
         python_package = importlib.import_module(self._actions_dir % self.stage_name)
@@ -527,50 +552,17 @@ class Stage:
         failures = [] if failures is None else list(failures)
         skips = [] if skips is None else list(skips)
 
-        # When testing for failed dependencies, we need the Action ids of failures and skips so
-        # record those separately
-        failed_action_ids = set()
-
-        for action_class in resolve_action_order(
-            self.actions, previously_resolved_actions=successes + failures + skips
-        ):
-            # Decide if we need to skip because deps have failed
-            failed_deps = [d for d in action_class.dependencies if d in failed_action_ids]
-
-            action = action_class()
-
-            if failed_deps:
-                to_be = "was"
-                if len(failed_deps) > 1:
-                    to_be = "were"
-                description = "Skipped because %s %s not successful" % (
-                    utils.format_sequence_as_message(failed_deps),
-                    to_be,
-                )
+        action_classes = list(
+            resolve_action_order(self.actions, previously_resolved_actions=successes + failures + skips)
+        )
 
-                action.set_result(level="SKIP", id="SKIP", title="Skipped action", description=description)
+        def report(action, skipped):
+            # Categorize the results
+            if skipped:
+                logger.error("Skipped %s. %s" % (action.id, action.result.description))
                 skips.append(action)
-                failed_action_ids.add(action.id)
-                logger.error("Skipped %s. %s" % (action.id, description))
-                continue
-
-            # Run the Action
-            try:
-                action.run()
-            except (Exception, SystemExit) as e:
-                # Uncaught exceptions are handled by constructing a generic
-                # failure message here that should be reported
-                description = (
-                    "Unhandled exception was caught: %s\n"
-                    "Please file a bug at https://issues.redhat.com/ to have this"
-                    " fixed or a specific error message added.\n"
-                    "Traceback: %s" % (e, traceback.format_exc())
-                )
-                action.set_result(
-                    level="ERROR", id="UNEXPECTED_ERROR", title="Unhandled exception caught", description=description
-                )
+                return
 
-            # Categorize the results
             if action.result.level <= STATUS_CODE["WARNING"]:
                 logger.info("%s has succeeded" % action.id)
                 successes.append(action)
@@ -581,13 +573,281 @@ class Stage:
                 )
                 logger.error(message)
                 failures.append(action)
-                failed_action_ids.add(action.id)
+
+        with timings.trace.span("Stage: %s" % self.stage_name, "stage"):
+            if self.max_parallel_actions > 1:
+                self._run_actions_in_parallel(action_classes, report)
+            else:
+                finished_actions = {}
+                for action_class in action_classes:
+                    action, skipped = _run_action(action_class, finished_actions)
+                    finished_actions[action.id] = action
+                    report(action, skipped)
 
         if self.next_stage:
             successes, failures, skips = self.next_stage.run(successes, failures, skips)
 
         return FinishedActions(successes, failures, skips)
 
+    def _run_actions_in_parallel(self, action_classes, report):
+        """
+        Run the Actions on a pool of threads as soon as their dependencies have finished.
+
+        The log messages of every Action are held back while it runs and are
+        emitted, together with the result of the Action, in the same order
+        the Actions would run in one after another.
+
+        :param action_classes: The Actions of this Stage in the order returned
+            by :func:`resolve_action_order`.
+        :type action_classes: list
+        :param report: Called with every finished Action and whether it was
+            skipped, in the order of ``action_classes``.
+        :type report: Callable[[Action, bool], None]
+        """
+        stage_action_ids = set(action_class.id for action_class in action_classes)
+        # Actions which have finished, by their id. Read by the dependency checks.
+        finished_actions = {}
+        # (action, skipped, log records) of the finished Actions, by their position in action_classes
+        results = {}
+        pending = list(enumerate(action_classes))
+        running = set()
+        serial_action_running = False
+        completed = moves.queue.Queue()
+
+        def run_in_thread(index, action):
+            log_buffer.start_buffering()
+            try:
+                _run_action_instance(action)
+            finally:
+                completed.put((index, action, log_buffer.stop_buffering()))
+
+        handlers = logging.getLogger("convert2rhel").handlers[:]
+        log_buffer = _ActionLogBuffer(handlers)
+        for handler in handlers:
+            handler.addFilter(log_buffer)
+        try:
+            next_to_report = 0
+            while next_to_report < len(action_classes):
+                # Start every Action whose dependencies have finished, in the
+                # stable order, as long as the serial-only Actions allow it.
+                for index, action_class in list(pending):
+                    dependencies = [d for d in action_class.dependencies if d in stage_action_ids]
+                    if not all(d in finished_actions for d in dependencies):
+                        continue
+
+                    if _get_failed_dependencies(action_class, finished_actions):
+                        action, _ = _skip_action_if_dependencies_failed(action_class, finished_actions)
+                        pending.remove((index, action_class))
+                        finished_actions[action.id] = action
+                        results[index] = (action, True, [])
+                        continue
+
+                    if serial_action_running or len(running) >= self.max_parallel_actions:
+                        break
+                    if action_class.serial_only and running:
+                        # Wait for the running Actions to finish first. The
+                        # Actions after it in the order can still start.
+                        continue
+
+                    # Instantiated only once it starts
+                    action = action_class()
+                    pending.remove((index, action_class))
+                    running.add(index)
+                    serial_action_running = action_class.serial_only
+                    thread = threading.Thread(target=run_in_thread, args=(index, action))
+                    thread.daemon = True
+                    thread.start()
+
+                while next_to_report in results:
+                    action, skipped, records = results.pop(next_to_report)
+                    log_buffer.emit_records(records)
+                    report(action, skipped)
+                    next_to_report += 1
+
+                if running:
+                    index, action, records = _wait_for_action(completed)
+                    running.remove(index)
+                    serial_action_running = False
+                    finished_actions[action.id] = action
+                    results[index] = (action, False, records)
+        finally:
+            for handler in handlers:
+                handler.removeFilter(log_buffer)
+
+
+def _get_failed_dependencies(action_class, finished_actions):
+    """
+    Get the dependencies of the Action which were not successful.
+
+    :param action_class: The Action to check.
+    :type action_class: type
+    :param finished_actions: The Actions of the Stage which have finished, by their id.
+    :type finished_actions: Mapping
+    :rtype: list[str]
+    """
+    return [
+        d
+        for d in action_class.dependencies
+        if d in finished_actions and finished_actions[d].result.level > STATUS_CODE["WARNING"]
+    ]
+
+
+def _skip_action_if_dependencies_failed(action_class, finished_actions):
+    """
+    Instantiate the Action and set its result to SKIP when one of its dependencies was not successful.
+
+    :param action_class: The Action to instantiate.
+    :type action_class: type
+    :param finished_actions: The Actions of the Stage which have finished, by their id.
+    :type finished_actions: Mapping
+    :returns: 2-tuple of the Action and whether it was skipped.
+    :rtype: tuple[Action, bool]
+    """
+    failed_deps = _get_failed_dependencies(action_class, finished_actions)
+
+    action = action_class()
+
+    if not failed_deps:
+        return action, False
+
+    to_be = "was"
+    if len(failed_deps) > 1:
+        to_be = "were"
+    description = "Skipped because %s %s not successful" % (
+        utils.format_sequence_as_message(failed_deps),
+        to_be,
+    )
+
+    action.set_result(level="SKIP", id="SKIP", title="Skipped action", description=description)
+    return action, True
+
+
+def _run_action_instance(action):
+    """
+    Run the Action, turning uncaught exceptions into an error result.
+
+    The time the Action takes is recorded in :data:`convert2rhel.timings.timings`.
+
+    :param action: The Action to run.
+    :type action: Action
+    """
+    try:
+        with timings.timings.measure_action(action.id), timings.trace.span(action.id, "action"):
+            action.run()
+    except (Exception, SystemExit) as e:
+        # Uncaught exceptions are handled by constructing a generic
+        # failure message here that should be reported
+        description = (
+            "Unhandled exception was caught: %s\n"
+            "Please file a bug at https://issues.redhat.com/ to have this"
+            " fixed or a specific error message added.\n"
+            "Traceback: %s" % (e, traceback.format_exc())
+        )
+        action.set_result(
+            level="ERROR", id="UNEXPECTED_ERROR", title="Unhandled exception caught", description=description
+        )
+
+
+def _run_action(action_class, finished_actions):
+    """
+    Run the Action unless one of its dependencies was not successful.
+
+    :returns: 2-tuple of the Action and whether it was skipped.
+    :rtype: tuple[Action, bool]
+    """
+    action, skipped = _skip_action_if_dependencies_failed(action_class, finished_actions)
+    if not skipped:
+        _run_action_instance(action)
+
+    return action, skipped
+
+
+def _wait_for_action(completed):
+    """
+    Wait for an Action running in a thread to finish.
+
+    The queue is polled with a timeout so that a KeyboardInterrupt is
+    delivered to the main thread right away, even on Python 2.
+
+    :param completed: Queue the threads put the finished Actions to.
+    :type completed: six.moves.queue.Queue
+    """
+    while True:
+        try:
+            return completed.get(True, _PARALLEL_ACTIONS_POLL_INTERVAL)
+        except moves.queue.Empty:
+            continue
+
+
+class _ActionLogBuffer(logging.Filter):
+    """
+    Log filter holding back the log records of the Actions running in threads.
+
+    The filter is added to the handlers of the convert2rhel logger. The
+    records logged from a thread which called :meth:`start_buffering` are
+    kept, instead of being passed to the handlers, until they are passed to
+    :meth:`emit_records`. Records logged from any other thread pass through.
+    """
+
+    def __init__(self, handlers):
+        """
+        :param handlers: The handlers the filter is added to.
+        :type handlers: list[logging.Handler]
+        """
+        logging.Filter.__init__(self)
+        self._handlers = handlers
+        self._buffers = {}
+
+    def start_buffering(self):
+        """Start holding back the records logged from the current thread."""
+        self._buffers[threading.current_thread().ident] = []
+
+    def stop_buffering(self):
+        """
+        Stop holding back the records logged from the current thread.
+
+        :returns: The records held back since :meth:`start_buffering`.
+        :rtype: list[logging.LogRecord]
+        """
+        return self._buffers.pop(threading.current_thread().ident, [])
+
+    def filter(self, record):
+        buffered_records = self._buffers.get(threading.current_thread().ident)
+        if buffered_records is None:
+            return True
+
+        # Every handler the record is passed to asks, keep it only once
+        if not buffered_records or buffered_records[-1] is not record:
+            buffered_records.append(record)
+        return False
+
+    def emit_records(self, records):
+        """
+        Pass the records to the handlers.
+
+        Has to be called from a thread which is not holding back its records.
+
+        :param records: The records to emit.
+        :type records: list[logging.LogRecord]
+        """
+        for record in records:
+            for handler in self._handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+def get_max_parallel_actions():
+    """
+    Get the maximum number of system checks to run at once.
+
+    Running the system checks in parallel is opt-in through the
+    :data:`PARALLEL_ACTIONS_ENVVAR` environment variable.
+
+    :returns: The value of the environment variable, 1 if it's not set or invalid.
+    :rtype: int
+    """
+    return utils.get_env_number(PARALLEL_ACTIONS_ENVVAR, 1, minimum=1)
+
 
 def resolve_action_order(potential_actions, previously_resolved_actions=None):
     """
@@ -692,7 +952,16 @@ def run_actions():
     # (system_checks), it will operate on the first Stage and then recursively
     # call check_dependencies() or run() on the next_stage.
     pre_ponr_changes = Stage("pre_ponr_changes", "Making recoverable changes")
-    system_checks = Stage("system_checks", "Check whether system is ready for conversion", next_stage=pre_ponr_changes)
+    # The system checks are mostly independent of each other and spend most
+    # of their time waiting for subprocesses. Running them in parallel is
+    # opt-in. The pre_ponr_changes Stage changes the system so it always runs
+    # its Actions one after another.
+    system_checks = Stage(
+        "system_checks",
+        "Check whether system is ready for conversion",
+        next_stage=pre_ponr_changes,
+        max_parallel_actions=get_max_parallel_actions(),
+    )
 
     try:
         # Check dependencies are satisfied for system_checks and all subsequent
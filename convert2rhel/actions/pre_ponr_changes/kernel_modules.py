@@ -15,14 +15,12 @@
 
 __metaclass__ = type
 
-import itertools
 import logging
 import os
 import re
 
-from functools import cmp_to_key
-
-from convert2rhel import actions, pkghandler
+from convert2rhel import actions
+from convert2rhel.kmodindex import KmodIndexError, get_kmod_comparison_key, get_rhel_kmods
 from convert2rhel.systeminfo import system_info
 from convert2rhel.utils import run_subprocess
 
@@ -31,6 +29,14 @@ logger = logging.getLogger(__name__)
 
 LINK_PREVENT_KMODS_FROM_LOADING = "https://access.redhat.com/solutions/41278"
 
+# List of the kernel modules currently loaded, the same data lsmod formats for us
+PROC_MODULES_PATH = "/proc/modules"
+# Directory holding the modules and the depmod generated indexes of each kernel
+KERNEL_MODULES_DIR = "/lib/modules"
+
+# Compression suffixes a kernel module file name can carry after ".ko"
+_KMOD_SUFFIX_RE = re.compile(r"\.ko(\.(xz|gz|zst))?$")
+
 
 class RHELKernelModuleNotFound(Exception):
     pass
@@ -49,43 +55,104 @@ class EnsureKernelModulesCompatibility(actions.Action):
         kernel modules in case of different kernel release
         """
         logger.debug("Getting a list of loaded kernel modules.")
-        lsmod_output, _ = run_subprocess(["/usr/sbin/lsmod"], print_output=False)
-        modules = re.findall(r"^(\w+)\s.+$", lsmod_output, flags=re.MULTILINE)[1:]
-        kernel_modules = [
-            self._get_kmod_comparison_key(run_subprocess(["modinfo", "-F", "filename", module], print_output=False)[0])
-            for module in modules
-        ]
-        return set(kernel_modules)
+        modules = self._get_loaded_kmod_names()
+        kernel_modules = self._get_kmod_keys_from_modules_dep(modules)
+
+        # Only the modules that modules.dep doesn't know about (e.g. the index
+        # is missing or outdated) are resolved the slow way, one modinfo call
+        # per module.
+        for module in modules:
+            if module not in kernel_modules:
+                kernel_modules[module] = self._get_kmod_comparison_key(
+                    run_subprocess(["modinfo", "-F", "filename", module], print_output=False)[0]
+                )
 
-    def _get_rhel_supported_kmods(self):
-        """Return set of target RHEL supported kernel modules."""
-        basecmd = [
-            "repoquery",
-            "--releasever=%s" % system_info.releasever,
-        ]
+        return set(kernel_modules.values())
 
-        if system_info.version.major == 8:
-            basecmd.append("--setopt=module_platform_id=platform:el8")
+    def _get_loaded_kmod_names(self):
+        """Get the names of the kernel modules loaded on host.
 
-        for repoid in system_info.get_enabled_rhel_repos():
-            basecmd.extend(("--repoid", repoid))
+        The names are read from /proc/modules. The lsmod command, which
+        formats the very same file, is used only when the file can't be read.
 
-        cmd = basecmd[:]
-        cmd.append("-f")
-        cmd.append("/lib/modules/*.ko*")
+        :return: Names of the loaded kernel modules.
+        :rtype: list[str]
+        """
+        try:
+            with open(PROC_MODULES_PATH) as proc_modules:
+                return [line.split()[0] for line in proc_modules if line.strip()]
+        except (IOError, OSError) as err:
+            logger.debug("Unable to read %s: %s. Falling back to lsmod." % (PROC_MODULES_PATH, str(err)))
 
-        # Without the release package installed, dnf can't determine the
-        # modularity platform ID. get output of a command to get all
-        # packages which are the source of kmods
-        kmod_pkgs_str, _ = run_subprocess(cmd, print_output=False)
+        lsmod_output, _ = run_subprocess(["/usr/sbin/lsmod"], print_output=False)
+        return re.findall(r"^(\w+)\s.+$", lsmod_output, flags=re.MULTILINE)[1:]
+
+    def _get_kmod_keys_from_modules_dep(self, modules):
+        """Resolve kernel modules to their comparison keys using the modules.dep index.
+
+        modules.dep, generated by depmod, lists every module available for
+        a kernel, so reading it once resolves all the loaded modules without
+        running modinfo for each of them.
+
+        :param modules: Names of the kernel modules to resolve.
+        :type modules: list[str]
+        :return: Mapping of the module name to the same comparison key
+            :meth:`_get_kmod_comparison_key` creates from the output of
+            ``modinfo -F filename``. Modules which are not in the index are
+            left out.
+        :rtype: dict[str, str]
+        """
+        kernel_release = system_info.booted_kernel or os.uname()[2]
+        modules_dep_path = os.path.join(KERNEL_MODULES_DIR, kernel_release, "modules.dep")
+
+        wanted = set(modules)
+        kmod_keys = {}
+        try:
+            with open(modules_dep_path) as modules_dep:
+                for line in modules_dep:
+                    kmod_path = line.split(":", 1)[0].strip()
+                    if not kmod_path:
+                        continue
+
+                    # The kernel always reports module names with underscores,
+                    # while the file names might use dashes instead.
+                    module = _KMOD_SUFFIX_RE.sub("", os.path.basename(kmod_path)).replace("-", "_")
+                    if module not in wanted:
+                        continue
+
+                    # Current depmod writes paths relative to the kernel
+                    # release directory which is exactly the comparison key.
+                    # Old versions write absolute paths.
+                    if kmod_path.startswith("/"):
+                        kmod_keys[module] = self._get_kmod_comparison_key(kmod_path)
+                    else:
+                        kmod_keys[module] = kmod_path
+        except (IOError, OSError) as err:
+            logger.debug("Unable to read %s: %s" % (modules_dep_path, str(err)))
+
+        return kmod_keys
+
+    def _get_rhel_supported_kmods(self):
+        """Return set of target RHEL supported kernel modules.
+
+        The kernel modules are read in-process from the file lists of the
+        packages in the enabled repositories, see
+        :func:`convert2rhel.kmodindex.get_rhel_kmods`.
+        """
+        enabled_repos = system_info.get_enabled_rhel_repos()
+        try:
+            kmod_pkgs, rhel_kmods = get_rhel_kmods(enabled_repos, system_info.releasever)
+        except KmodIndexError as e:
+            logger.debug(str(e))
+            raise RHELKernelModuleNotFound(
+                "Unable to list the kernel modules in the packages available in the enabled repositories (%s)."
+                % ", ".join(enabled_repos)
+            )
 
-        # from these packages we select only the latest one
-        kmod_pkgs = self._get_most_recent_unique_kernel_pkgs(kmod_pkgs_str.rstrip("\n").split())
         if not kmod_pkgs:
-            logger.debug("Output of the previous repoquery command:\n{0}".format(kmod_pkgs_str))
             raise RHELKernelModuleNotFound(
                 "No packages containing kernel modules available in the enabled repositories (%s)."
-                % ", ".join(system_info.get_enabled_rhel_repos())
+                % ", ".join(enabled_repos)
             )
 
         logger.info(
@@ -93,91 +160,17 @@ class EnsureKernelModulesCompatibility(actions.Action):
             " kernel packages available in the enabled repositories:\n {0}".format("\n ".join(kmod_pkgs))
         )
 
-        # querying obtained packages for files they produces
-        cmd = basecmd[:]
-        cmd.append("-l")
-        cmd.extend(kmod_pkgs)
-        rhel_kmods_str, _ = run_subprocess(cmd, print_output=False)
-
-        return self._get_rhel_kmods_keys(rhel_kmods_str)
-
-    def _get_most_recent_unique_kernel_pkgs(self, pkgs):
-        """Return the most recent versions of all kernel packages.
-
-        When we scan kernel modules provided by kernel packages
-        it is expensive to check each kernel pkg. Since each new
-        kernel pkg do not deprecate kernel modules we only select
-        the most recent ones.
-
-        .. note::
-            All RHEL kmods packages starts with kernel* or kmod*
-
-        For example, consider the following list of packages::
-
-            list_of_pkgs = [
-                'kernel-core-0:4.18.0-240.10.1.el8_3.x86_64',
-                'kernel-core-0:4.19.0-240.10.1.el8_3.x86_64',
-                'kmod-debug-core-0:4.18.0-240.10.1.el8_3.x86_64',
-                'kmod-debug-core-0:4.18.0-245.10.1.el8_3.x86_64
-            ]
-
-        And when this function gets called with that same list of packages,
-        we have the following output::
-
-            result = get_most_recent_unique_kernel_pkgs(pkgs=list_of_pkgs)
-            print(result)
-            # (
-            #   'kernel-core-0:4.19.0-240.10.1.el8_3.x86_64',
-            #   'kmod-debug-core-0:4.18.0-245.10.1.el8_3.x86_64'
-            # )
-
-        :param pkgs: A list of package names to be analyzed.
-        :type pkgs: list[str]
-        :return: A tuple of packages name sorted and normalized
-        :rtype: tuple[str]
-        """
-
-        pkgs_groups = itertools.groupby(sorted(pkgs), lambda pkg_name: pkg_name.split(":")[0])
-        list_of_sorted_pkgs = []
-        for distinct_kernel_pkgs in pkgs_groups:
-            if distinct_kernel_pkgs[0].startswith(("kernel", "kmod")):
-                list_of_sorted_pkgs.append(
-                    max(
-                        distinct_kernel_pkgs[1],
-                        key=cmp_to_key(pkghandler.compare_package_versions),
-                    )
-                )
-
-        return tuple(list_of_sorted_pkgs)
+        return rhel_kmods
 
     def _get_kmod_comparison_key(self, path):
         """Create a comparison key from the kernel module absolute path.
 
-        Converts the path:
-            - /lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz -> kernel/lib/a.ko.xz
-
-        .. note:
-            The standard kernel modules are located under /lib/modules/{some
-            kernel release}/. If we want to make sure that the kernel package
-            is present on RHEL, we need to compare the full path, but because
-            kernel release might be different, we compare the relative paths
-            after kernel release.
+        See :func:`convert2rhel.kmodindex.get_kmod_comparison_key`.
 
         :param path: The complete path to the kernel module being analyzed.
         :type path: str
         """
-        return "/".join(path.strip().split("/")[4:])
-
-    def _get_rhel_kmods_keys(self, rhel_kmods_str):
-        kernel_module_keys = [
-            self._get_kmod_comparison_key(kmod_path)
-            for kmod_path in filter(
-                lambda path: path.endswith(("ko.xz", "ko")),
-                rhel_kmods_str.rstrip("\n").split(),
-            )
-        ]
-
-        return set(kernel_module_keys)
+        return get_kmod_comparison_key(path)
 
     def _get_unsupported_kmods(self, host_kmods, rhel_supported_kmods):
         """
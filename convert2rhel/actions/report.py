@@ -54,8 +54,11 @@ _STATUS_TO_COLOR = {
     202: "FAIL",
 }
 
+#: Number of the slowest Actions and commands listed in the report
+_SLOWEST_STEPS_LIMIT = 10
 
-def summary_as_json(results, json_file=CONVERT2RHEL_JSON_RESULTS):
+
+def summary_as_json(results, json_file=CONVERT2RHEL_JSON_RESULTS, timings=None):
     """
     Output the results as a json_file.
 
@@ -63,22 +66,29 @@ def summary_as_json(results, json_file=CONVERT2RHEL_JSON_RESULTS):
     :type results: dict
     :keyword json_file: Filename of a file to write the json results to.
     :type json_file: str
+    :keyword timings: The time spent in the Actions and the commands they ran,
+        as returned by :meth:`convert2rhel.timings.Timings.to_dict`.
+    :type timings: dict | None
 
     The json output is a slight modification to the results data that is passed in:
 
-    * The outermost container is a dictionary.  The current two fields are:
-        :format_version: This is currently "1.0".  It will be increased
-            whenever the version changes.
+    * The outermost container is a dictionary.  The current fields are:
+        :format_version: This is currently "1.1".  It will be increased
+            whenever the version changes. See schemas/assessment-schema-1.1.json.
         :actions: This contains a modified copy of the results
+        :timings: Optional. A copy of the timings, when given. convert2rhel
+            includes them only when running with --debug.
 
     * The results are modified so that status codes use their symbolic names
       instead of the numeric values.
     """
     # Use an envelope so we can add other, non-result info if necessary.
     envelope = {
-        "format_version": "1.0",
+        "format_version": "1.1",
         "actions": copy.deepcopy(results),
     }
+    if timings is not None:
+        envelope["timings"] = copy.deepcopy(timings)
 
     # Use the symbolic name in the json output
     for action in envelope["actions"].values():
@@ -118,7 +128,7 @@ def wrap_paragraphs(text, width=70, **kwargs):
     return "\n".join(output)
 
 
-def summary(results, include_all_reports=False, with_colors=True):
+def summary(results, include_all_reports=False, with_colors=True, timings=None):
     """Output a summary regarding the actions execution.
 
     This summary is intended to be used to inform the user about the results
@@ -181,6 +191,9 @@ def summary(results, include_all_reports=False, with_colors=True):
     :keyword include_all_reports: If all reports should be logged instead of the
         highest ones.
     :type include_all_reports: bool
+    :keyword timings: When given, the slowest Actions and commands are listed
+        after the messages. See :meth:`convert2rhel.timings.Timings.to_dict`.
+    :type timings: dict | None
     """
     logger.task("Pre-conversion analysis report")
     combined_results_and_message = {}
@@ -237,9 +250,51 @@ def summary(results, include_all_reports=False, with_colors=True):
     if not combined_results_and_message:
         report.append("No problems detected during the analysis!")
 
+    if timings is not None:
+        report.append("")
+        report.extend(format_slowest_steps(timings))
+
     logger.info("%s\n" % "\n".join(report))
 
 
+def format_slowest_steps(timings, limit=_SLOWEST_STEPS_LIMIT):
+    """
+    Format a table of the Actions and commands which took the longest.
+
+    The Actions and the commands are sorted together by their wall time. The
+    commands are listed under the id of the Action which ran them.
+
+    :param timings: The timings as returned by :meth:`convert2rhel.timings.Timings.to_dict`.
+    :type timings: dict
+    :keyword limit: Maximum number of rows of the table.
+    :type limit: int
+    :return: The lines of the table.
+    :rtype: list[str]
+    """
+    steps = []
+    for action_id, action_timings in timings["actions"].items():
+        steps.append(
+            (
+                action_timings["wall_time"],
+                "%7.3fs  %+8dK" % (action_timings["cpu_time"], action_timings["max_rss_delta_kb"]),
+                action_id,
+            )
+        )
+        for command in action_timings["commands"]:
+            steps.append((command["duration"], "", "%s: %s" % (action_id, command["command"])))
+    for command in timings["commands"]:
+        steps.append((command["duration"], "", command["command"]))
+
+    steps.sort(key=lambda step: step[0], reverse=True)
+
+    lines = ["{highlight} SLOWEST STEPS {highlight}".format(highlight="=" * 10)]
+    lines.append("%8s  %8s  %9s  %s" % ("Wall", "CPU", "Max RSS", "Step"))
+    for wall_time, usage, name in steps[:limit]:
+        lines.append("%7.3fs  %-19s  %s" % (wall_time, usage, name))
+
+    return lines
+
+
 def format_report_section_heading(status_code):
     """
     Format a section heading for a status in the report.
@@ -24,7 +24,7 @@ import rpm
 
 from convert2rhel import __version__ as installed_convert2rhel_version
 from convert2rhel import actions, utils
-from convert2rhel.pkghandler import parse_pkg_string
+from convert2rhel.repoquery import RepoQueryError, repo_query
 from convert2rhel.systeminfo import system_info
 
 
@@ -73,30 +73,24 @@ class Convert2rhelLatest(actions.Action):
         repo_path = os.path.join(repo_dir, "convert2rhel.repo")
         utils.store_content_to_file(filename=repo_path, content=CONVERT2RHEL_REPO_CONTENT)
 
-        cmd = [
-            "repoquery",
-            "--disablerepo=*",
-            "--enablerepo=convert2rhel",
-            "--releasever=%s" % system_info.version.major,
-            "--setopt=reposdir=%s" % repo_dir,
-            "--qf",
-            "C2R %{NAME}-%{EPOCH}:%{VERSION}-%{RELEASE}.%{ARCH}",
-            "convert2rhel",
-        ]
-
         # Note: This is safe because we're creating in utils.TMP_DIR which is hardcoded to
         # /var/lib/convert2rhel which does not have any world-writable directory components.
         utils.mkdir_p(repo_dir)
 
         try:
-            raw_output_convert2rhel_versions, return_code = utils.run_subprocess(cmd, print_output=False)
-        finally:
-            shutil.rmtree(repo_dir)
-
-        if return_code != 0:
+            # Each package is a tuple of (name, epoch, version, release, arch)
+            convert2rhel_versions = repo_query.query(
+                ["convert2rhel"],
+                fields=("name", "epoch", "version", "release", "arch"),
+                reposdir=repo_dir,
+                enable_repos=["convert2rhel"],
+                disable_repos=["*"],
+                releasever=system_info.version.major,
+            )
+        except RepoQueryError as e:
             diagnosis = (
                 "Couldn't check if the current installed convert2rhel is the latest version.\n"
-                "repoquery failed with the following output:\n%s" % (raw_output_convert2rhel_versions)
+                "repoquery failed with the following output:\n%s" % (e.output)
             )
             logger.warning(diagnosis)
             self.add_message(
@@ -107,41 +101,10 @@ class Convert2rhelLatest(actions.Action):
                 diagnosis=diagnosis,
             )
             return
-
-        # convert the raw output of convert2rhel version strings into a list
-        raw_output_convert2rhel_versions = raw_output_convert2rhel_versions.splitlines()
-
-        temp_raw_output = []
-
-        # We are expecting an repoquery output to be similar to this:
-        # C2R convert2rhel-0:0.17-1.el7.noarch
-        # We need the `C2R` identifier to be present on the line so we can know for
-        # sure that the line we are working with is the a line that contains
-        # relevant repoquery information to our check, otherwise, we just log the
-        # information as debug and do nothing with it.
-        for raw_version in raw_output_convert2rhel_versions:
-            if "C2R" in raw_version:
-                temp_raw_output.append(raw_version.lstrip("C2R "))
-            else:
-                # Mainly for debugging purposes to see what is happening if we got
-                # anything else that does not have the C2R identifier at the start
-                # of the line.
-                logger.debug("Got a line without the C2R identifier: %s" % raw_version)
-        raw_output_convert2rhel_versions = temp_raw_output
+        finally:
+            shutil.rmtree(repo_dir)
 
         latest_available_version = ("0", "0.00", "0")
-        convert2rhel_versions = []
-
-        # add each tuple of fields obtained from parse_pkg_string() to convert2rhel_versions
-        for raw_pkg in raw_output_convert2rhel_versions:
-            try:
-                parsed_pkg = parse_pkg_string(raw_pkg)
-            except ValueError as exc:
-                # Not a valid package string input
-                logger.debug(exc)
-                continue
-            convert2rhel_versions.append(parsed_pkg)
-
         logger.debug("Found %s convert2rhel package(s)" % len(convert2rhel_versions))
 
         # This loop will determine the latest available convert2rhel version in the yum repo.
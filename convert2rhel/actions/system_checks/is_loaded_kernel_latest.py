@@ -21,6 +21,7 @@ import os
 from convert2rhel import actions
 from convert2rhel.pkghandler import compare_package_versions
 from convert2rhel.repo import get_hardcoded_repofiles_dir
+from convert2rhel.repoquery import RepoQueryError, repo_query
 from convert2rhel.systeminfo import system_info
 from convert2rhel.utils import run_subprocess
 
@@ -44,14 +45,6 @@ class IsLoadedKernelLatest(actions.Action):
             )
             return
 
-        cmd = [
-            "repoquery",
-            "--setopt=exclude=",
-            "--quiet",
-            "--qf",
-            "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
-        ]
-
         reposdir = get_hardcoded_repofiles_dir()
         if reposdir and not system_info.has_internet_access:
             logger.warning("Skipping the check as no internet connection has been detected.")
@@ -63,20 +56,11 @@ class IsLoadedKernelLatest(actions.Action):
             )
             return
 
-        # If the reposdir variable is not empty, meaning that it detected the
-        # hardcoded repofiles, we should use that
-        # instead of the system repositories located under /etc/yum.repos.d
-        if reposdir:
-            cmd.append("--setopt=reposdir=%s" % reposdir)
-
         # For Oracle/CentOS Linux 8 the `kernel` is just a meta package, instead,
         # we check for `kernel-core`. But 7 releases, the correct way to check is
         # using `kernel`.
         package_to_check = "kernel-core" if system_info.version.major >= 8 else "kernel"
 
-        # Append the package name as the last item on the list
-        cmd.append(package_to_check)
-
         unsupported_skip = os.environ.get("CONVERT2RHEL_UNSUPPORTED_SKIP_KERNEL_CURRENCY_CHECK", None)
 
         # Skip the kernel package check and print a warning if the user used the special environment variable for it
@@ -104,10 +88,17 @@ class IsLoadedKernelLatest(actions.Action):
         # hardcoded repofiles available under `/usr/share/convert2rhel/repos`,
         # meaning that the tool will fetch only the latest kernels available for
         # that EUS version, and not the most updated version from other newer
-        # versions.
-        repoquery_output, return_code = run_subprocess(cmd, print_output=False)
-        if return_code != 0:
-            logger.debug("Got the following output: %s", repoquery_output)
+        # versions. Without the hardcoded repofiles, the system repositories
+        # located under /etc/yum.repos.d are used.
+        try:
+            packages = repo_query.query(
+                [package_to_check],
+                fields=("buildtime", "version", "release", "repoid"),
+                reposdir=reposdir,
+                setopts=("exclude=",),
+            )
+        except RepoQueryError as e:
+            logger.debug("Got the following output: %s", e.output)
             logger.warning(
                 "Couldn't fetch the list of the most recent kernels available in "
                 "the repositories. Skipping the loaded kernel check."
@@ -123,23 +114,6 @@ class IsLoadedKernelLatest(actions.Action):
             )
             return
 
-        packages = []
-        # We are expecting a repoquery output to be similar to this:
-        #   C2R     1671212820      3.10.0-1160.81.1.el7    updates
-        # We need the `C2R` identifier to be present on the line so we can know for
-        # sure that the line we are working with is a line that contains
-        # relevant repoquery information to our check, otherwise, we just log the
-        # information as debug and do nothing with it.
-        for line in repoquery_output.split("\n"):
-            if line.strip() and "C2R" in line:
-                _, build_time, latest_kernel, repoid = tuple(str(line).split("\t"))
-                packages.append((build_time, latest_kernel, repoid))
-            else:
-                # Mainly for debugging purposes to see what is happening if we got
-                # anything else that does not have the C2R identifier at the start
-                # of the line.
-                logger.debug("Got a line without the C2R identifier: %s" % line)
-
         # If we don't have any packages, then something went wrong, bail out by default
         if not packages:
             self.set_result(
@@ -158,8 +132,8 @@ class IsLoadedKernelLatest(actions.Action):
             )
             return
 
-        packages.sort(key=lambda x: x[0], reverse=True)
-        _, latest_kernel, repoid = packages[0]
+        _, version, release, repoid = max(packages, key=lambda pkg: pkg[0])
+        latest_kernel = "%s-%s" % (version, release)
 
         uname_output, _ = run_subprocess(["uname", "-r"], print_output=False)
         loaded_kernel = uname_output.rsplit(".", 1)[0]
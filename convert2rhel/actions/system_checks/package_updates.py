@@ -28,6 +28,8 @@ logger = logging.getLogger(__name__)
 
 class PackageUpdates(actions.Action):
     id = "PACKAGE_UPDATES"
+    # Loads the repositories and the package sack with yum/dnf in-process
+    serial_only = True
 
     def run(self):
         """Ensure that the system packages installed are up-to-date."""
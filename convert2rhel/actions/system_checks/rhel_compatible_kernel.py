@@ -50,6 +50,8 @@ class KernelIncompatibleError(Exception):
 
 class RhelCompatibleKernel(actions.Action):
     id = "RHEL_COMPATIBLE_KERNEL"
+    # Queries the installed packages with yum/dnf and rpm in-process
+    serial_only = True
 
     def run(self):
         """Ensure the booted kernel is signed, is standard (not UEK, realtime, ...), and has the same version as in RHEL.
@@ -21,12 +21,14 @@ import os
 import re
 import shutil
 
+from collections import OrderedDict
+
 import six
 
 from convert2rhel import utils
 from convert2rhel.repo import get_hardcoded_repofiles_dir
 from convert2rhel.systeminfo import system_info
-from convert2rhel.utils import BACKUP_DIR, download_pkg, remove_orphan_folders, run_subprocess
+from convert2rhel.utils import BACKUP_DIR, download_pkg, download_pkgs, remove_orphan_folders, run_subprocess
 
 
 loggerinst = logging.getLogger(__name__)
@@ -65,6 +67,25 @@ class ChangedRPMPackagesController(object):
         )
         self.removed_pkgs.append(restorable_pkg)
 
+    def backup_and_track_removed_pkgs(
+        self,
+        pkgs,
+        reposdir=None,
+        set_releasever=False,
+        custom_releasever=None,
+        varsdir=None,
+    ):
+        """Add removed RPM pkgs to the list of removed pkgs, backing them up all at once."""
+        restorable_pkgs = [RestorablePackage(pkg) for pkg in pkgs]
+        RestorablePackage.backup_many(
+            restorable_pkgs,
+            reposdir=reposdir,
+            set_releasever=set_releasever,
+            custom_releasever=custom_releasever,
+            varsdir=varsdir,
+        )
+        self.removed_pkgs.extend(restorable_pkgs)
+
     def _remove_installed_pkgs(self):
         """For each package installed during conversion remove it."""
         loggerinst.task("Rollback: Remove installed packages")
@@ -283,6 +304,60 @@ class RestorableChange(object):
         self.enabled = False
 
 
+class InstalledRpmKeys(object):
+    """The keyids of the GPG keys imported into the rpmdb.
+
+    The gpg-pubkey packages are all queried at once, the first time a key is
+    looked up. The keys imported and removed through :class:`RestorableRpmKey`
+    are tracked from then on. Call :meth:`invalidate` when the keys change
+    otherwise.
+    """
+
+    def __init__(self):
+        self._keyids = None
+
+    def invalidate(self):
+        """Drop the keyids so that they are queried again on the next lookup."""
+        self._keyids = None
+
+    def __contains__(self, keyid):
+        if self._keyids is None:
+            self._keyids = self._query()
+
+        return keyid in self._keyids
+
+    def add(self, keyid):
+        if self._keyids is not None:
+            self._keyids.add(keyid)
+
+    def discard(self, keyid):
+        if self._keyids is not None:
+            self._keyids.discard(keyid)
+
+    @staticmethod
+    def _query():
+        """Query the rpmdb for the keyids of all the gpg-pubkey packages.
+
+        :raises utils.ImportGPGKeyError: When the rpmdb can't be queried.
+        :rtype: set[str]
+        """
+        output, status = utils.run_subprocess(
+            ["rpm", "-q", "gpg-pubkey", "--queryformat", "%{VERSION}\n"], print_output=False
+        )
+
+        if status == 0:
+            return set(line.strip() for line in output.splitlines() if line.strip())
+
+        if status == 1 and "package gpg-pubkey is not installed" in output:
+            return set()
+
+        raise utils.ImportGPGKeyError("Searching the rpmdb for the gpg keys failed: Code %s: %s" % (status, output))
+
+
+installed_rpm_keys = InstalledRpmKeys()  # pylint: disable=C0103
+utils.register_cache(installed_rpm_keys.invalidate)
+
+
 class RestorableRpmKey(RestorableChange):
     """Import a GPG key into rpm in a reversible fashion."""
 
@@ -309,6 +384,7 @@ class RestorableRpmKey(RestorableChange):
             if ret_code != 0:
                 raise utils.ImportGPGKeyError("Failed to import the GPG key %s: %s" % (self.keyfile, output))
 
+            installed_rpm_keys.add(self.keyid)
             self.previously_installed = False
 
         else:
@@ -319,22 +395,13 @@ class RestorableRpmKey(RestorableChange):
     @property
     def installed(self):
         """Whether the GPG key has been imported into the rpmdb."""
-        output, status = utils.run_subprocess(["rpm", "-q", "gpg-pubkey-%s" % self.keyid], print_output=False)
-
-        if status == 0:
-            return True
-
-        if status == 1 and "package gpg-pubkey-%s is not installed" % self.keyid in output:
-            return False
-
-        raise utils.ImportGPGKeyError(
-            "Searching the rpmdb for the gpg key %s failed: Code %s: %s" % (self.keyid, status, output)
-        )
+        return self.keyid in installed_rpm_keys
 
     def restore(self):
         """Ensure the rpmdb has or does not have the GPG key according to the state before we ran."""
         if self.enabled and self.previously_installed is False:
             utils.run_subprocess(["rpm", "-e", "gpg-pubkey-%s" % self.keyid])
+            installed_rpm_keys.discard(self.keyid)
 
         super(RestorableRpmKey, self).restore()
 
@@ -411,46 +478,88 @@ class RestorablePackage(object):
         """
         loggerinst.info("Backing up %s." % self.name)
         if os.path.isdir(BACKUP_DIR):
-            # If we detect that the current system is an EUS release, then we
-            # proceed to use the hardcoded_repofiles, otherwise, we use the
-            # custom reposdir that comes from the method parameter. This is
-            # mainly because of CentOS Linux which we have hardcoded repofiles.
-            # If we ever put Oracle Linux repofiles to ship with convert2rhel,
-            # them the second part of this condition can be dropped.
-            if system_info.corresponds_to_rhel_eus_release() and system_info.id == "centos":
-                reposdir = get_hardcoded_repofiles_dir()
-
-            # One of the reasons we hardcode repofiles pointing to archived
-            # repositories of older system minor versions is that we need to be
-            # able to download an older package version as a backup. Because for
-            # example the default repofiles on CentOS Linux 8.4 point only to
-            # 8.latest repositories that already don't contain 8.4 packages.
-            if not system_info.has_internet_access:
-                if reposdir:
-                    loggerinst.debug(
-                        "Not using repository files stored in %s due to the absence of internet access." % reposdir
-                    )
-                self.path = download_pkg(
-                    self.name,
-                    dest=BACKUP_DIR,
-                    set_releasever=set_releasever,
-                    custom_releasever=custom_releasever,
-                    varsdir=varsdir,
-                )
-            else:
-                if reposdir:
-                    loggerinst.debug("Using repository files stored in %s." % reposdir)
-                self.path = download_pkg(
-                    self.name,
-                    dest=BACKUP_DIR,
-                    set_releasever=set_releasever,
-                    reposdir=reposdir,
-                    custom_releasever=custom_releasever,
-                    varsdir=varsdir,
-                )
+            self.path = download_pkg(
+                self.name,
+                dest=BACKUP_DIR,
+                set_releasever=set_releasever,
+                reposdir=self._get_reposdir(reposdir),
+                custom_releasever=custom_releasever,
+                varsdir=varsdir,
+            )
         else:
             loggerinst.warning("Can't access %s" % BACKUP_DIR)
 
+    @classmethod
+    def backup_many(
+        cls,
+        restorable_pkgs,
+        reposdir=None,
+        set_releasever=False,
+        custom_releasever=None,
+        varsdir=None,
+    ):
+        """Save versions of several RPM packages.
+
+        The packages are downloaded together so that the repository metadata is loaded only once instead of for
+        every package. Apart from that it's the same as calling :meth:`backup` on each of them.
+
+        :param restorable_pkgs: The packages to back up.
+        :type restorable_pkgs: list[RestorablePackage]
+        :param reposdir: Custom repositories directory to be used in the backup.
+        :type reposdir: str
+        """
+        if not restorable_pkgs:
+            return
+
+        loggerinst.info("Backing up %s." % ", ".join(pkg.name for pkg in restorable_pkgs))
+        if not os.path.isdir(BACKUP_DIR):
+            loggerinst.warning("Can't access %s" % BACKUP_DIR)
+            return
+
+        paths = download_pkgs(
+            [pkg.name for pkg in restorable_pkgs],
+            dest=BACKUP_DIR,
+            set_releasever=set_releasever,
+            reposdir=cls._get_reposdir(reposdir),
+            custom_releasever=custom_releasever,
+            varsdir=varsdir,
+        )
+        for restorable_pkg, path in zip(restorable_pkgs, paths):
+            restorable_pkg.path = path
+
+    @staticmethod
+    def _get_reposdir(reposdir):
+        """Return the repositories directory to download the backups from.
+
+        :param reposdir: Custom repositories directory requested by the caller.
+        :type reposdir: str
+        :rtype: str | None
+        """
+        # If we detect that the current system is an EUS release, then we
+        # proceed to use the hardcoded_repofiles, otherwise, we use the
+        # custom reposdir that comes from the method parameter. This is
+        # mainly because of CentOS Linux which we have hardcoded repofiles.
+        # If we ever put Oracle Linux repofiles to ship with convert2rhel,
+        # them the second part of this condition can be dropped.
+        if system_info.corresponds_to_rhel_eus_release() and system_info.id == "centos":
+            reposdir = get_hardcoded_repofiles_dir()
+
+        # One of the reasons we hardcode repofiles pointing to archived
+        # repositories of older system minor versions is that we need to be
+        # able to download an older package version as a backup. Because for
+        # example the default repofiles on CentOS Linux 8.4 point only to
+        # 8.latest repositories that already don't contain 8.4 packages.
+        if not system_info.has_internet_access:
+            if reposdir:
+                loggerinst.debug(
+                    "Not using repository files stored in %s due to the absence of internet access." % reposdir
+                )
+            return None
+
+        if reposdir:
+            loggerinst.debug("Using repository files stored in %s." % reposdir)
+        return reposdir
+
 
 def remove_pkgs(
     pkgs_to_remove,
@@ -479,28 +588,46 @@ def remove_pkgs(
         # Some packages, when removed, will also remove repo files, making it
         # impossible to access the repositories to download a backup. For this
         # reason we first back up *all* packages and only after that we remove them.
-        for nevra in pkgs_to_remove:
-            changed_pkgs_control.backup_and_track_removed_pkg(
-                pkg=nevra,
-                reposdir=reposdir,
-                set_releasever=set_releasever,
-                custom_releasever=custom_releasever,
-                varsdir=varsdir,
-            )
+        changed_pkgs_control.backup_and_track_removed_pkgs(
+            pkgs=pkgs_to_remove,
+            reposdir=reposdir,
+            set_releasever=set_releasever,
+            custom_releasever=custom_releasever,
+            varsdir=varsdir,
+        )
 
-    pkgs_failed_to_remove = []
-    pkgs_removed = []
+    # It's necessary to remove an epoch from the NEVRA string returned by yum because the rpm command does not
+    # handle the epoch well and considers the package we want to remove as not installed. On the other hand, the
+    # epoch in NEVRA returned by dnf is handled by rpm just fine.
+    nvras = OrderedDict()
     for nevra in pkgs_to_remove:
-        # It's necessary to remove an epoch from the NEVRA string returned by yum because the rpm command does not
-        # handle the epoch well and considers the package we want to remove as not installed. On the other hand, the
-        # epoch in NEVRA returned by dnf is handled by rpm just fine.
         nvra = remove_epoch_from_yum_nevra_notation(nevra)
         loggerinst.info("Removing package: %s" % nvra)
-        _, ret_code = run_subprocess(["rpm", "-e", "--nodeps", nvra])
-        if ret_code != 0:
-            pkgs_failed_to_remove.append(nevra)
-        else:
-            pkgs_removed.append(nevra)
+        nvras[nvra] = nevra
+
+    pkgs_to_erase = list(nvras)
+    nvras_failed = []
+    if len(pkgs_to_erase) > 1:
+        # rpm refuses to remove anything when one of the packages is not
+        # installed. Those would fail on their own anyway.
+        installed = _get_installed_pkgs(pkgs_to_erase)
+        nvras_failed = [nvra for nvra in pkgs_to_erase if nvra not in installed]
+        pkgs_to_erase = [nvra for nvra in pkgs_to_erase if nvra in installed]
+
+    nvras_removed, nvras_failed_to_erase = _erase_pkgs(pkgs_to_erase)
+    nvras_failed.extend(nvras_failed_to_erase)
+
+    nvras_removed = set(nvras_removed)
+    nvras_failed = set(nvras_failed)
+    pkgs_removed = [nevra for nvra, nevra in nvras.items() if nvra in nvras_removed]
+    pkgs_failed_to_remove = [nevra for nvra, nevra in nvras.items() if nvra in nvras_failed]
+
+    if pkgs_removed:
+        # Imported here to avoid a circular import between backup and pkghandler.
+        from convert2rhel import pkghandler
+
+        pkghandler.installed_packages.invalidate()
+        pkghandler.session.refresh_system_repo()
 
     if pkgs_failed_to_remove:
         if critical:
@@ -511,6 +638,57 @@ def remove_pkgs(
     return pkgs_removed
 
 
+def _erase_pkgs(nvras):
+    """Remove packages in a single rpm transaction, not heeding to their dependencies.
+
+    Removing all the packages at once opens and locks the rpmdb just once instead of for every package. If the
+    transaction fails, the packages which are still installed are split in halves and removed separately until the
+    packages which can't be removed are found.
+
+    :param nvras: NVRAs of installed packages to remove.
+    :type nvras: list[str]
+    :return: The removed packages and the packages that failed to be removed.
+    :rtype: tuple[list[str], list[str]]
+    """
+    if not nvras:
+        return [], []
+
+    _, ret_code = run_subprocess(["rpm", "-e", "--nodeps"] + nvras)
+    if ret_code == 0:
+        return list(nvras), []
+
+    if len(nvras) == 1:
+        return [], list(nvras)
+
+    # rpm may have removed some of the packages before failing, e.g. when
+    # a scriptlet of one of the packages fails
+    installed = _get_installed_pkgs(nvras)
+    removed = [nvra for nvra in nvras if nvra not in installed]
+    remaining = [nvra for nvra in nvras if nvra in installed]
+    loggerinst.debug("Failed to remove the packages at once. Looking for the packages which can't be removed.")
+
+    half = len(remaining) // 2 or 1
+    failed = []
+    for part in (remaining[:half], remaining[half:]):
+        part_removed, part_failed = _erase_pkgs(part)
+        removed.extend(part_removed)
+        failed.extend(part_failed)
+
+    return removed, failed
+
+
+def _get_installed_pkgs(nvras):
+    """Return those of the given packages which are installed.
+
+    :param nvras: NVRAs of the packages to check.
+    :type nvras: list[str]
+    :rtype: set[str]
+    """
+    output, _ = run_subprocess(["rpm", "-q"] + nvras, print_cmd=False, print_output=False)
+    not_installed = set(re.findall(r"^package (.+) is not installed$", output, flags=re.MULTILINE))
+    return set(nvra for nvra in nvras if nvra not in not_installed)
+
+
 def remove_epoch_from_yum_nevra_notation(package_nevra):
     """Remove epoch from the NEVRA string returned by yum.
 
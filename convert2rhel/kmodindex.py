@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+import logging
+import os
+
+import rpm
+
+from convert2rhel import pkgmanager, utils
+from convert2rhel.pkgmanager.session import session
+from convert2rhel.repoquery import get_repomd_revisions
+
+
+loggerinst = logging.getLogger(__name__)
+
+# The kernel modules available in the repositories, shared between the
+# convert2rhel runs.
+KMOD_INDEX_FILE = os.path.join(utils.TMP_DIR, "kmod-index.json")
+
+# To be changed whenever the structure of the index file changes. Indexes of
+# other versions are ignored.
+_KMOD_INDEX_VERSION = 2
+
+# The kernel modules shipped in the packages
+_KMOD_FILE_GLOB = "/lib/modules/*.ko*"
+_KMOD_DIR = "/lib/modules/"
+_KMOD_FILE_SUFFIXES = ("ko.xz", "ko")
+
+# All RHEL packages with kernel modules start with one of these
+_KMOD_PKG_PREFIXES = ("kernel", "kmod")
+
+
+class KmodIndexError(Exception):
+    """Raised when the kernel modules in the repositories can't be indexed."""
+
+
+def get_kmod_comparison_key(path):
+    """Create a comparison key from the kernel module absolute path.
+
+    Converts the path:
+        - /lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz -> kernel/lib/a.ko.xz
+
+    .. note:
+        The standard kernel modules are located under /lib/modules/{some
+        kernel release}/. If we want to make sure that the kernel package
+        is present on RHEL, we need to compare the full path, but because
+        kernel release might be different, we compare the relative paths
+        after kernel release.
+
+    :param path: The complete path to the kernel module being analyzed.
+    :type path: str
+    :rtype: str
+    """
+    return "/".join(path.strip().split("/")[4:])
+
+
+def get_rhel_kmods(repoids, releasever, index_file=None):
+    """Get the kernel modules available in the repositories.
+
+    Only the most recent version of every package with kernel modules, across
+    all the repositories, is taken into account, each kernel package version
+    doesn't deprecate the kernel modules of the previous ones.
+
+    The kernel modules are read from the file lists of the packages loaded
+    into the yum/dnf sack. The result is stored per repository together with
+    the revision of its metadata in the yum/dnf cache so that the following
+    runs read the file lists only of the repositories whose metadata changed.
+    The metadata is loaded, and refreshed once expired as per the
+    metadata_expire option of the repositories, before comparing the
+    revisions.
+
+    :param repoids: The repositories to look into.
+    :type repoids: list[str]
+    :param releasever: The $releasever to use in the repofiles.
+    :type releasever: str
+    :param index_file: Where to store the index. Defaults to :data:`KMOD_INDEX_FILE`.
+    :type index_file: str | None
+    :raises KmodIndexError: When the metadata of the repositories can't be loaded.
+    :return: Tuple of the packages with the kernel modules, in the "name-epoch:version-release.arch" form, and the
+        comparison keys of the kernel modules, see :func:`get_kmod_comparison_key`.
+    :rtype: tuple[list[str], set[str]]
+    """
+    index_file = index_file or KMOD_INDEX_FILE
+    index = _load_index(index_file)
+
+    session_key = ("kmods", tuple(repoids), releasever)
+    base = _load_metadata(session_key, repoids, releasever)
+
+    # Read after loading the metadata as it might have just been refreshed
+    revisions = _get_repo_revisions()
+    outdated = []
+    for repoid in repoids:
+        entry = index["repos"].get(repoid)
+        # Without any cached metadata there's nothing to tell whether the
+        # repository changed
+        if (
+            not entry
+            or not revisions.get(repoid)
+            or entry["releasever"] != releasever
+            or entry["revision"] != revisions[repoid]
+        ):
+            outdated.append(repoid)
+
+    if outdated:
+        loggerinst.debug("Indexing the kernel modules in the repositories: %s" % ", ".join(outdated))
+        index["repos"].update(_index_repos(session_key, base, releasever, outdated, revisions))
+        _save_index(index_file, index)
+    else:
+        loggerinst.debug("Using the stored index of the kernel modules in the repositories.")
+
+    newest = {}
+    for repoid in repoids:
+        for name, pkg in index["repos"][repoid]["packages"].items():
+            if name not in newest or rpm.labelCompare(tuple(pkg["evr"]), tuple(newest[name]["evr"])) > 0:
+                newest[name] = pkg
+
+    kmods = set()
+    for pkg in newest.values():
+        kmods.update(pkg["kmods"])
+
+    return sorted(pkg["package"] for pkg in newest.values()), kmods
+
+
+def _load_metadata(session_key, repoids, releasever):
+    """Get the base object with the metadata of the repositories loaded.
+
+    :raises KmodIndexError: When the metadata of the repositories can't be loaded.
+    :rtype: yum.YumBase | dnf.Base
+    """
+    try:
+        base = session.get_base(session_key, lambda: _create_base(repoids, releasever))
+        if pkgmanager.TYPE == "yum":
+            # yum loads the metadata on the first access of the sack
+            base.pkgSack  # pylint: disable=pointless-statement
+    except pkgmanager.RepoError as e:
+        session.close_base(session_key)
+        raise KmodIndexError("Unable to load the metadata of the repositories: %s" % str(e))
+
+    return base
+
+
+def _index_repos(session_key, base, releasever, outdated, revisions):
+    """Read the kernel modules from the file lists of the packages in the repositories.
+
+    :param session_key: The key of the base object in the package manager session.
+    :type session_key: tuple
+    :param base: The base object with all the repositories loaded, see :func:`_load_metadata`.
+    :type base: yum.YumBase | dnf.Base
+    :param releasever: The $releasever to use in the repofiles.
+    :type releasever: str
+    :param outdated: The repositories to index.
+    :type outdated: list[str]
+    :param revisions: The revisions of the cached repository metadata, see :func:`_get_repo_revisions`.
+    :type revisions: dict[str, list[str]]
+    :raises KmodIndexError: When the metadata of the repositories can't be loaded.
+    :return: The index entry of each of the outdated repositories, with the most recent version of every package
+        with kernel modules in the repository by the package name.
+    :rtype: dict[str, dict]
+    """
+    try:
+        if pkgmanager.TYPE == "yum":
+            pkgs = base.pkgSack.searchFiles(_KMOD_FILE_GLOB)
+        else:
+            pkgs = base.sack.query().available().filter(reponame=outdated, file__glob=_KMOD_FILE_GLOB)
+    except pkgmanager.RepoError as e:
+        session.close_base(session_key)
+        raise KmodIndexError("Unable to load the metadata of the repositories: %s" % str(e))
+
+    newest = {}
+    for pkg in pkgs:
+        repoid = pkg.repoid if pkgmanager.TYPE == "yum" else pkg.reponame
+        if repoid not in outdated or not pkg.name.startswith(_KMOD_PKG_PREFIXES):
+            continue
+
+        key = (repoid, pkg.name)
+        if key not in newest or _is_newer(pkg, newest[key]):
+            newest[key] = pkg
+
+    entries = dict(
+        (repoid, {"releasever": releasever, "revision": revisions.get(repoid), "packages": {}}) for repoid in outdated
+    )
+    for (repoid, name), pkg in newest.items():
+        kmods = set(
+            get_kmod_comparison_key(path)
+            for path in _get_files(pkg)
+            if path.startswith(_KMOD_DIR) and path.endswith(_KMOD_FILE_SUFFIXES)
+        )
+        entries[repoid]["packages"][name] = {
+            "package": "%s-%s:%s-%s.%s" % (pkg.name, pkg.epoch, pkg.version, pkg.release, pkg.arch),
+            "evr": [str(pkg.epoch), pkg.version, pkg.release],
+            "kmods": sorted(kmods),
+        }
+
+    return entries
+
+
+def _create_base(repoids, releasever):
+    """Create a base object with only the repositories loaded.
+
+    :rtype: yum.YumBase | dnf.Base
+    """
+    if pkgmanager.TYPE == "yum":
+        base = pkgmanager.YumBase()
+        # Disable plugins (when kept enabled yum outputs useless text every call)
+        base.doConfigSetup(init_plugins=False)
+        base.conf.yumvar["releasever"] = releasever
+        base.repos.disableRepo("*")
+        for repoid in repoids:
+            base.repos.enableRepo(repoid)
+        return base
+
+    base = pkgmanager.Base()
+    base.conf.substitutions["releasever"] = releasever
+    # Without the release package installed, dnf can't determine the
+    # modularity platform ID.
+    base.conf.module_platform_id = "platform:el8"
+    base.read_all_repos()
+    for repo in base.repos.all():
+        if repo.id in repoids:
+            repo.enable()
+        else:
+            repo.disable()
+    base.fill_sack(load_system_repo=False, load_available_repos=True)
+    return base
+
+
+def _is_newer(pkg, other):
+    """Whether the package is of a higher version than the other one."""
+    if pkgmanager.TYPE == "yum":
+        return pkg.verGT(other)
+    return pkg.evr_gt(other)
+
+
+def _get_files(pkg):
+    """Get the files of a package in the repository, read from the file lists of the repository metadata.
+
+    :rtype: list[str]
+    """
+    if pkgmanager.TYPE == "yum":
+        return pkg.returnFileEntries(ftype="file")
+    return pkg.files
+
+
+def _get_repo_revisions():
+    """Get the revisions of the repository metadata in the yum/dnf cache per repository.
+
+    The cache directory of a repository is ``<repoid>-<hash>`` with dnf and
+    ``<basearch>/<releasever>/<repoid>`` with yum.
+
+    :return: Mapping of the repository ID to the sorted revisions of all its cached metadata, e.g. of different
+        releasevers.
+    :rtype: dict[str, list[str]]
+    """
+    revisions = {}
+    for path, revision in get_repomd_revisions().items():
+        if "/dnf/" in path:
+            repoid = os.path.basename(os.path.dirname(os.path.dirname(path))).rsplit("-", 1)[0]
+        else:
+            repoid = os.path.basename(os.path.dirname(path))
+        revisions.setdefault(repoid, []).append(revision)
+
+    return dict((repoid, sorted(repo_revisions)) for repoid, repo_revisions in revisions.items())
+
+
+def _load_index(index_file):
+    """Load the on-disk index.
+
+    :return: The index. An empty one if there's no usable index file.
+    :rtype: dict
+    """
+    empty_index = {"version": _KMOD_INDEX_VERSION, "repos": {}}
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        loggerinst.debug("Unable to load the kernel modules index from %s: %s" % (index_file, str(e)))
+        return empty_index
+
+    if not isinstance(index, dict) or index.get("version") != _KMOD_INDEX_VERSION:
+        loggerinst.debug("Ignoring the kernel modules index %s of an unsupported version." % index_file)
+        return empty_index
+
+    return index
+
+
+def _save_index(index_file, index):
+    """Store the on-disk index.
+
+    Failing to store the index is not fatal, the repositories are just going
+    to be indexed again the next time.
+    """
+    tmp_file = "%s.tmp" % index_file
+    try:
+        utils.mkdir_p(os.path.dirname(index_file))
+        with open(tmp_file, "w") as f:
+            os.chmod(tmp_file, 0o600)
+            json.dump(index, f, separators=(",", ":"))
+        os.rename(tmp_file, index_file)
+    except (IOError, OSError) as e:
+        loggerinst.debug("Unable to store the kernel modules index to %s: %s" % (index_file, str(e)))
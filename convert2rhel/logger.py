@@ -26,16 +26,37 @@ DEBUG     (10)    Prints debug message (using date/time)
 FILE      (5)     CUSTOM LABEL - Outputs with the DEBUG label but only to a file
                   handle (using date/time)
 """
+import atexit
+import contextlib
 import logging
+import multiprocessing.util
 import os
 import shutil
 import sys
+import threading
+import time
 
 from time import gmtime, strftime
 
+from six.moves import queue
+
 
 LOG_DIR = "/var/log/convert2rhel"
 
+# When set to anything but "0", the records are written to the terminal and
+# the log file by a background thread, see QueueHandler.
+ASYNC_LOGGING_ENVVAR = "CONVERT2RHEL_ASYNC_LOGGING"
+
+# The QueueHandler set up by setup_logger_handler(), if any
+_queue_handler = None  # pylint: disable=C0103
+
+# The terminal and the log file handlers set up by setup_logger_handler()
+_output_handlers = []  # pylint: disable=C0103
+
+# Whether the debug records go to the terminal too, set once the --debug
+# option is parsed, see set_debug()
+_debug_enabled = False  # pylint: disable=C0103
+
 
 class LogLevelTask(object):
     level = 15
@@ -54,7 +75,14 @@ def setup_logger_handler(log_name, log_dir):
     from your application's main start point.
         log_name = the name for the log file
         log_dir = path to the dir where log file will be presented
+
+    With the CONVERT2RHEL_ASYNC_LOGGING environment variable set, the records
+    are written by a background thread, see :class:`QueueHandler`, and the
+    records going only to the log file are written in blocks, see
+    :class:`BufferedFileHandler`.
     """
+    global _queue_handler, _output_handlers  # pylint: disable=C0103
+
     # set custom labels
     logging.addLevelName(LogLevelTask.level, LogLevelTask.label)
     logging.addLevelName(LogLevelFile.level, LogLevelFile.label)
@@ -78,17 +106,268 @@ def setup_logger_handler(log_name, log_dir):
     formatter.disable_colors(should_disable_color_output())
     stdout_handler.setFormatter(formatter)
     stdout_handler.setLevel(logging.DEBUG)
-    logger.addHandler(stdout_handler)
+
+    # Imported here to avoid a circular import
+    from convert2rhel.utils import get_env_flag
+
+    async_logging = get_env_flag(ASYNC_LOGGING_ENVVAR)
 
     # create file handler
     if not os.path.isdir(log_dir):
         os.makedirs(log_dir)  # pragma: no cover
-    handler = logging.FileHandler(os.path.join(log_dir, log_name), "a")
+    # Holding the records back risks losing the tail of the log when
+    # convert2rhel gets killed, it's opted in to together with the background
+    # writer thread
+    file_handler_class = BufferedFileHandler if async_logging else logging.FileHandler
+    handler = file_handler_class(os.path.join(log_dir, log_name), "a")
     formatter = CustomFormatter("%(message)s")
     formatter.disable_colors(True)
     handler.setFormatter(formatter)
     handler.setLevel(LogLevelFile.level)
-    logger.addHandler(handler)
+
+    _output_handlers = [stdout_handler, handler]
+    for output_handler in _output_handlers:
+        # The locks are held while forking, see prepared_for_fork()
+        multiprocessing.util.register_after_fork(output_handler, logging.Handler.createLock)
+
+    if not async_logging:
+        _queue_handler = None
+        logger.addHandler(stdout_handler)
+        logger.addHandler(handler)
+    else:
+        _queue_handler = QueueHandler([stdout_handler, handler])
+        logger.addHandler(_queue_handler)
+
+
+def flush():
+    """Write out all the records logged so far.
+
+    Waits for the background writer thread, if any, and flushes the records
+    the :class:`BufferedFileHandler` holds back. Call it before writing to the
+    terminal other than through the logger, e.g. before prompting the user,
+    and before a child process exits.
+    """
+    if _queue_handler is not None:
+        _queue_handler.flush()
+
+    for handler in _output_handlers:
+        handler.acquire()
+        try:
+            _flush_handler(handler)
+        finally:
+            handler.release()
+
+
+def _flush_handler(handler):
+    # The stream might have been closed already, e.g. at exit
+    try:
+        handler.flush()
+    except (IOError, OSError, ValueError):
+        pass
+
+
+# A child process exits through os._exit(), it has to call flush() itself
+atexit.register(flush)
+
+
+@contextlib.contextmanager
+def prepared_for_fork():
+    """Write out all the records and hold the locks of the handlers while forking a child process.
+
+    Forking while the writer thread, or any other thread, is in the middle of
+    writing a record would leave the child with the handler lock, or the lock
+    of the stream, held forever. The child would hang on its first record.
+    The handler locks are created anew in the child, see
+    :func:`setup_logger_handler`. The records held back in the buffer of the
+    log file are written before forking, so that they aren't written by both
+    the processes.
+    """
+    flush()
+    for handler in _output_handlers:
+        handler.acquire()
+    try:
+        # Records logged by other threads since the flush above
+        for handler in _output_handlers:
+            _flush_handler(handler)
+        yield
+    finally:
+        for handler in reversed(_output_handlers):
+            handler.release()
+
+
+class BufferedFileHandler(logging.FileHandler, object):
+    """File handler that doesn't flush the file after every record that goes only to the log file.
+
+    The records that go only to the log file, e.g. the progress of every
+    package in a transaction, can come by the tens of thousands. They are
+    written in blocks, at most :attr:`flush_interval` seconds late. Any other
+    record flushes all the records before it right away.
+    """
+
+    flush_interval = 1.0
+
+    def __init__(self, *args, **kwargs):
+        super(BufferedFileHandler, self).__init__(*args, **kwargs)
+        self._deferred_flush = False
+        self._last_flush = time.time()
+
+    def emit(self, record):
+        # The logging.StreamHandler flushes the stream after writing each record
+        self._deferred_flush = record.levelno < logging.DEBUG
+        try:
+            super(BufferedFileHandler, self).emit(record)
+        finally:
+            self._deferred_flush = False
+
+    def flush(self):
+        now = time.time()
+        if self._deferred_flush and now - self._last_flush < self.flush_interval:
+            return
+
+        super(BufferedFileHandler, self).flush()
+        self._last_flush = now
+
+
+class QueueHandler(logging.Handler, object):
+    """Handler that passes the records to other handlers in a background thread.
+
+    Logging a record only puts it into a queue. A single writer thread takes
+    all the records queued so far, formats them and writes them to each of the
+    handlers at once, flushing each stream once per batch. That keeps writing
+    to the terminal and the log file out of the loops which log a lot, e.g.
+    the output of a command printed line by line.
+
+    The records logged in a forked child process, which doesn't have the
+    writer thread, are passed to the handlers right away. The child processes
+    have to be forked within :func:`prepared_for_fork`.
+    """
+
+    def __init__(self, handlers):
+        """
+        :param handlers: The handlers to pass the records to. Their levels and filters apply.
+        :type handlers: list[logging.Handler]
+        """
+        super(QueueHandler, self).__init__()
+        self.handlers = handlers
+        self._queue = queue.Queue()
+        self._pid = os.getpid()
+        self._writer = threading.Thread(target=self._write, name="convert2rhel-logging")
+        self._writer.daemon = True
+        self._writer.start()
+
+    def emit(self, record):
+        if os.getpid() != self._pid:
+            _handle_records(self.handlers, [record])
+            return
+
+        try:
+            self._queue.put(self.prepare(record))
+        except Exception:  # pylint: disable=broad-except
+            self.handleError(record)
+
+    def prepare(self, record):
+        """Render the parts of the record which might change before the writer thread gets to it.
+
+        The message is merged with its arguments and the traceback is turned
+        into text, so that the record doesn't hold the mutable arguments nor
+        the frames of the traceback.
+
+        :type record: logging.LogRecord
+        :rtype: logging.LogRecord
+        """
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def flush(self):
+        """Wait until the writer thread writes all the records queued so far."""
+        if os.getpid() != self._pid or not self._writer.is_alive():
+            return
+        self._queue.join()
+
+    def close(self):
+        if os.getpid() == self._pid and self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        super(QueueHandler, self).close()
+
+    def _write(self):
+        while True:
+            records = [self._queue.get()]
+            while True:
+                try:
+                    records.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                _handle_records(self.handlers, [record for record in records if record is not None])
+            finally:
+                for _ in records:
+                    self._queue.task_done()
+
+            if None in records:
+                return
+
+
+def _handle_records(handlers, records):
+    """Write a batch of records to each of the handlers.
+
+    The stream handlers get all the records they accept written at once and
+    flushed once, other handlers get them one by one.
+
+    :type handlers: list[logging.Handler]
+    :type records: list[logging.LogRecord]
+    """
+    for handler in handlers:
+        accepted = [record for record in records if record.levelno >= handler.level and handler.filter(record)]
+        if not accepted:
+            continue
+
+        if not isinstance(handler, logging.StreamHandler) or getattr(handler, "stream", None) is None:
+            for record in accepted:
+                handler.handle(record)
+            continue
+
+        terminator = getattr(handler, "terminator", "\n")
+        handler.acquire()
+        try:
+            try:
+                text = "".join(handler.format(record) + terminator for record in accepted)
+                handler.stream.write(text)
+            except UnicodeError:
+                # Python 2 can't join the str and unicode messages of some encodings, write them one by one
+                for record in accepted:
+                    handler.emit(record)
+                continue
+            except Exception:  # pylint: disable=broad-except
+                handler.handleError(accepted[-1])
+                continue
+
+            if isinstance(handler, BufferedFileHandler):
+                handler._deferred_flush = all(record.levelno < logging.DEBUG for record in accepted)
+            try:
+                handler.flush()
+            finally:
+                handler._deferred_flush = False
+        finally:
+            handler.release()
+
+
+def set_debug(enabled):
+    """Set whether the debug records go to the terminal too, not only to the log file.
+
+    Called once the --debug option is parsed.
+
+    :param enabled: Whether convert2rhel runs with --debug.
+    :type enabled: bool
+    """
+    global _debug_enabled  # pylint: disable=C0103
+
+    _debug_enabled = enabled
 
 
 def should_disable_color_output():
@@ -156,14 +435,14 @@ def _file(self, msg, *args, **kwargs):
 def _critical(self, msg, *args, **kwargs):
     if self.isEnabledFor(logging.CRITICAL):
         self._log(logging.CRITICAL, msg, args, **kwargs)
+        # The message has to be written before the exit, the writer thread doesn't outlive the process
+        flush()
         sys.exit(msg)
 
 
 def _debug(self, msg, *args, **kwargs):
     if self.isEnabledFor(logging.DEBUG):
-        from convert2rhel.toolopts import tool_opts
-
-        if tool_opts.debug:
+        if _debug_enabled:
             self._log(logging.DEBUG, msg, args, **kwargs)
         else:
             self._log(LogLevelFile.level, msg, args, **kwargs)
@@ -196,6 +475,9 @@ def colorize(message, color="OKGREEN"):
 class CustomFormatter(logging.Formatter, object):
     """Custom formatter to handle different logging formats based on logging level
 
+    A formatter for each of the levels, with the colors applied, is prepared
+    up front and picked by the level of the record.
+
     Python 2.6 workaround - logging.Formatter class does not use new-style
         class and causes 'TypeError: super() argument 1 must be type, not
         classobj' so we use multiple inheritance to get around the problem.
@@ -203,36 +485,36 @@ class CustomFormatter(logging.Formatter, object):
 
     color_disabled = False
 
+    def __init__(self, *args, **kwargs):
+        super(CustomFormatter, self).__init__(*args, **kwargs)
+        self._build_formatters()
+
     def disable_colors(self, value):
         self.color_disabled = value
+        self._build_formatters()
+
+    def _build_formatters(self):
+        def compile_format(fmt, color=None, datefmt=None):
+            if color and not self.color_disabled:
+                fmt = colorize(fmt, color)
+            return logging.Formatter(fmt, datefmt)
+
+        error_formatter = compile_format("%(levelname)s - %(message)s", "FAIL")
+        self._formatters = {
+            LogLevelTask.level: compile_format(
+                "\n[%(asctime)s] %(levelname)s - [%(message)s] %(task_padding)s", "OKGREEN", "%Y-%m-%dT%H:%M:%S%z"
+            ),
+            logging.INFO: compile_format("%(message)s"),
+            logging.WARNING: compile_format("%(levelname)s - %(message)s", "WARNING"),
+            logging.ERROR: error_formatter,
+            logging.CRITICAL: error_formatter,
+        }
+        self._default_formatter = compile_format(
+            "[%(asctime)s] %(levelname)s - %(message)s", None, "%Y-%m-%dT%H:%M:%S%z"
+        )
 
     def format(self, record):
         if record.levelno == LogLevelTask.level:
-            temp = "*" * (90 - len(record.msg) - 25)
-            fmt_orig = "\n[%(asctime)s] %(levelname)s - [%(message)s] " + temp
-            new_fmt = fmt_orig if self.color_disabled else colorize(fmt_orig, "OKGREEN")
-            self._fmt = new_fmt
-            self.datefmt = "%Y-%m-%dT%H:%M:%S%z"
-        elif record.levelno in [logging.INFO]:
-            self._fmt = "%(message)s"
-            self.datefmt = ""
-        elif record.levelno in [logging.WARNING]:
-            fmt_orig = "%(levelname)s - %(message)s"
-            new_fmt = fmt_orig if self.color_disabled else colorize(fmt_orig, "WARNING")
-            self._fmt = new_fmt
-            self.datefmt = ""
-        elif record.levelno in [logging.CRITICAL, logging.ERROR]:
-            fmt_orig = "%(levelname)s - %(message)s"
-            new_fmt = fmt_orig if self.color_disabled else colorize(fmt_orig, "FAIL")
-            self._fmt = new_fmt
-            self.datefmt = ""
-        else:
-            self._fmt = "[%(asctime)s] %(levelname)s - %(message)s"
-            self.datefmt = "%Y-%m-%dT%H:%M:%S%z"
-
-        if hasattr(self, "_style"):
-            # Python 3 has _style for formatter
-            # Overwriting the style _fmt gets the result we want
-            self._style._fmt = self._fmt
+            record.task_padding = "*" * (90 - len(record.msg) - 25)
 
-        return super(CustomFormatter, self).format(record)
+        return self._formatters.get(record.levelno, self._default_formatter).format(record)
@@ -21,7 +21,7 @@ import sys
 
 from convert2rhel import actions, applock, backup, breadcrumbs, checks, grub
 from convert2rhel import logger as logger_module
-from convert2rhel import pkghandler, pkgmanager, redhatrelease, repo, subscription, systeminfo, toolopts, utils
+from convert2rhel import pkghandler, pkgmanager, redhatrelease, repo, subscription, systeminfo, timings, toolopts, utils
 from convert2rhel.actions import level_for_raw_action_data, report
 
 
@@ -82,6 +82,11 @@ def main():
 
     # handle command line arguments
     toolopts.CLI()
+    logger_module.set_debug(toolopts.tool_opts.debug)
+
+    if toolopts.tool_opts.profile_trace:
+        timings.trace.enable(toolopts.tool_opts.profile_trace)
+        timings.trace.set_phase("INIT")
 
     try:
         with applock.ApplicationLock("convert2rhel"):
@@ -100,6 +105,7 @@ def main_locked(process_phase):
     pre_conversion_results = None
     try:
         process_phase = ConversionPhase.POST_CLI
+        timings.trace.set_phase("POST_CLI")
         perform_boilerplate()
 
         gather_system_info()
@@ -110,10 +116,12 @@ def main_locked(process_phase):
         # actions.run_actions() (either from a bug or from the user hitting
         # Ctrl-C)
         process_phase = ConversionPhase.PRE_PONR_CHANGES
+        timings.trace.set_phase("PRE_PONR_CHANGES")
         pre_conversion_results = actions.run_actions()
 
         if toolopts.tool_opts.activity == "analysis":
             process_phase = ConversionPhase.ANALYZE_EXIT
+            timings.trace.set_phase("ANALYZE_EXIT")
             raise _AnalyzeExit()
 
         pre_conversion_failures = actions.find_actions_of_severity(
@@ -128,6 +136,7 @@ def main_locked(process_phase):
             pre_conversion_results,
             include_all_reports=False,
             with_colors=logger_module.should_disable_color_output(),
+            timings=_get_report_timings(),
         )
 
         loggerinst.warning("********************************************************")
@@ -141,6 +150,7 @@ def main_locked(process_phase):
         utils.ask_to_continue()
 
         process_phase = ConversionPhase.POST_PONR_CHANGES
+        timings.trace.set_phase("POST_PONR_CHANGES")
         post_ponr_changes()
         loggerinst.info("\nConversion successful!\n")
 
@@ -156,6 +166,7 @@ def main_locked(process_phase):
             pre_conversion_results,
             include_all_reports=True,
             with_colors=logger_module.should_disable_color_output(),
+            timings=_get_report_timings(),
         )
         return 0
 
@@ -182,6 +193,7 @@ def main_locked(process_phase):
                     pre_conversion_results,
                     include_all_reports=(toolopts.tool_opts.activity == "analysis"),
                     with_colors=logger_module.should_disable_color_output(),
+                    timings=_get_report_timings(),
                 )
         elif process_phase == ConversionPhase.POST_PONR_CHANGES:
             # After the process of subscription is done and the mass update of
@@ -202,11 +214,24 @@ def main_locked(process_phase):
         # Write the assessment to a file as json data so that other tools can
         # parse and act upon it.
         if pre_conversion_results:
-            actions.report.summary_as_json(pre_conversion_results)
+            actions.report.summary_as_json(pre_conversion_results, timings=_get_report_timings())
+
+        timings.trace.write()
+        utils.stop_child_process_workers()
 
     return 0
 
 
+def _get_report_timings():
+    """Get the timings to include in the reports, only when debugging.
+
+    :rtype: dict | None
+    """
+    if toolopts.tool_opts.debug:
+        return timings.timings.to_dict()
+    return None
+
+
 #
 # Boilerplate Tasks
 #
@@ -290,6 +315,9 @@ def post_ponr_conversion():
     """Perform main steps for system conversion."""
     transaction_handler = pkgmanager.create_transaction_handler()
     loggerinst.task("Convert: Replace system packages")
+    # Nothing the worker processes loaded before the point of no return is
+    # carried over to the replacement of the packages
+    utils.stop_child_process_workers()
     transaction_handler.run_transaction()
     loggerinst.task("Convert: Prepare kernel")
     pkghandler.preserve_only_rhel_kernel()
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+"""Reading of the OpenPGP public keys, as specified in RFC 4880.
+
+Only as much of the format is understood as is needed to identify the keys
+rpm imports, i.e. the primary public key packets of version 4.
+"""
+
+__metaclass__ = type
+
+import base64
+import binascii
+import hashlib
+import struct
+
+
+_ARMOR_BEGIN = "-----BEGIN PGP PUBLIC KEY BLOCK-----"
+_ARMOR_END = "-----END PGP PUBLIC KEY BLOCK-----"
+
+# Packet tag of the primary public key
+_PUBLIC_KEY_PACKET_TAG = 6
+
+
+class OpenPGPError(Exception):
+    """Raised when a file doesn't contain a readable OpenPGP public key."""
+
+
+def get_fingerprint(keyfile):
+    """Get the fingerprint of the first public key in an ASCII armored key file.
+
+    :param keyfile: Path to the key file.
+    :type keyfile: str
+    :raises OpenPGPError: When the file doesn't contain a public key of a supported version.
+    :raises IOError: When the file can't be read.
+    :return: The fingerprint as lowercase hex digits.
+    :rtype: str
+    """
+    with open(keyfile) as f:
+        data = dearmor(f.read())
+
+    for tag, body in iter_packets(data):
+        if tag == _PUBLIC_KEY_PACKET_TAG:
+            return _get_v4_fingerprint(body)
+
+    raise OpenPGPError("No public key found in %s." % keyfile)
+
+
+def get_keyid(fingerprint):
+    """Get the key ID rpm names the gpg-pubkey package of a key after, e.g. gpg-pubkey-fd431d51-4ae0493b.
+
+    rpm uses the last 4 bytes of the 8 byte key ID, which is the end of the fingerprint for v4 keys.
+
+    :param fingerprint: Fingerprint of a v4 key as hex digits.
+    :type fingerprint: str
+    :rtype: str
+    """
+    return fingerprint[-8:].lower()
+
+
+def dearmor(text):
+    """Decode the first public key block of an ASCII armored text.
+
+    :param text: The ASCII armored text.
+    :type text: str
+    :raises OpenPGPError: When there's no public key block in the text or it can't be decoded.
+    :return: The binary packets of the key block.
+    :rtype: bytes
+    """
+    lines = iter(text.splitlines())
+    for line in lines:
+        if line.strip() == _ARMOR_BEGIN:
+            break
+    else:
+        raise OpenPGPError("No ASCII armored public key block found.")
+
+    # The armor headers, e.g. "Version: GnuPG v1", end with an empty line
+    for line in lines:
+        if not line.strip():
+            break
+
+    encoded = []
+    for line in lines:
+        line = line.strip()
+        # The optional checksum, the integrity of the data is verified by rpm
+        if line == _ARMOR_END or line.startswith("="):
+            break
+        encoded.append(line)
+    else:
+        raise OpenPGPError("The ASCII armored public key block is not terminated.")
+
+    try:
+        return base64.b64decode("".join(encoded))
+    except (TypeError, ValueError, binascii.Error) as e:
+        raise OpenPGPError("Unable to decode the ASCII armored public key block: %s" % str(e))
+
+
+def iter_packets(data):
+    """Iterate over the OpenPGP packets.
+
+    :param data: The binary packets.
+    :type data: bytes
+    :raises OpenPGPError: When the data isn't made up of whole packets.
+    :return: The tag and the body of each packet.
+    :rtype: Iterator[tuple[int, bytearray]]
+    """
+    data = bytearray(data)
+    offset = 0
+    while offset < len(data):
+        header = data[offset]
+        if not header & 0x80:
+            raise OpenPGPError("Invalid OpenPGP packet header at offset %d." % offset)
+
+        if header & 0x40:
+            # New format packet
+            tag = header & 0x3F
+            length, offset = _read_new_format_length(data, offset + 1)
+        else:
+            # Old format packet
+            tag = (header >> 2) & 0x0F
+            length_type = header & 0x03
+            offset += 1
+            if length_type == 3:
+                # Indeterminate length, up to the end of the data
+                length = len(data) - offset
+            else:
+                length_size = (1, 2, 4)[length_type]
+                length = _read_int(data, offset, length_size)
+                offset += length_size
+
+        if offset + length > len(data):
+            raise OpenPGPError("Truncated OpenPGP packet at offset %d." % offset)
+
+        yield tag, data[offset : offset + length]
+        offset += length
+
+
+def _read_new_format_length(data, offset):
+    """Read the body length of a new format packet.
+
+    :return: The body length and the offset of the body.
+    :rtype: tuple[int, int]
+    """
+    first = _read_int(data, offset, 1)
+    if first < 192:
+        return first, offset + 1
+    if first < 224:
+        return ((first - 192) << 8) + _read_int(data, offset + 1, 1) + 192, offset + 2
+    if first == 255:
+        return _read_int(data, offset + 1, 4), offset + 5
+
+    # Partial body lengths are not allowed for the key packets
+    raise OpenPGPError("Unsupported partial OpenPGP packet length at offset %d." % offset)
+
+
+def _read_int(data, offset, size):
+    """Read a big endian unsigned number."""
+    if offset + size > len(data):
+        raise OpenPGPError("Truncated OpenPGP packet header at offset %d." % offset)
+
+    return struct.unpack(">" + {1: "B", 2: "H", 4: "I"}[size], bytes(data[offset : offset + size]))[0]
+
+
+def _get_v4_fingerprint(body):
+    """Compute the fingerprint of a v4 public key packet.
+
+    :param body: The body of the public key packet.
+    :type body: bytearray
+    :raises OpenPGPError: When the key is not of version 4.
+    :rtype: str
+    """
+    if not body or body[0] != 4:
+        raise OpenPGPError("Unsupported OpenPGP public key version %s." % (body[0] if body else None))
+
+    return hashlib.sha1(b"\x99" + struct.pack(">H", len(body)) + bytes(body)).hexdigest()
@@ -15,18 +15,23 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import fnmatch
 import glob
 import logging
+import multiprocessing
 import os
 import os.path
 import re
+import threading
 
-from collections import namedtuple
+from collections import OrderedDict, namedtuple
 
 import rpm
 
 from convert2rhel import backup, pkgmanager, utils
 from convert2rhel.backup import RestorableFile, remove_pkgs
+from convert2rhel.pkgmanager.session import RPMDB_PATH, get_rpmdb_state, session
+from convert2rhel.repoquery import RepoQueryError, repo_query
 from convert2rhel.systeminfo import system_info
 from convert2rhel.toolopts import tool_opts
 
@@ -69,6 +74,13 @@ _UBI_8_REPO_CONTENT = (
 # Path to the repository file that we store the RHEL8-compatible repo file.
 _UBI_8_REPO_PATH = os.path.join(_RHSM_TMP_DIR, "ubi_8.repo")
 
+# Query format printing the signature of a package the way `rpm -qi` does,
+# e.g. "RSA/SHA256, Tue 23 Aug 2022 08:06:00 -03, Key ID f55ad3fb5323552a"
+_PKG_SIGNATURE_QUERYFORMAT = (
+    "%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:"
+    "{%|SIGGPG?{%{SIGGPG:pgpsig}}:{%|SIGPGP?{%{SIGPGP:pgpsig}}:{(none)}|}|}|}|"
+)
+
 _VERSIONLOCK_FILE_PATH = "/etc/yum/pluginconf.d/versionlock.list"  # This file is used by the dnf plugin as well
 versionlock_file = RestorableFile(_VERSIONLOCK_FILE_PATH)  # pylint: disable=C0103
 
@@ -97,6 +109,28 @@ PKG_RELEASE = PKG_VERSION
 # Set of valid arches
 PKG_ARCH = ("x86_64", "s390x", "i686", "i86", "ppc64le", "aarch64", "noarch")
 
+# Package string in one of the NEVR, NVR, ENVR formats (the arch, if any, is
+# part of the release). Versions and releases can't contain a dash so the name
+# is everything up to the second to last dash.
+_NEVR_FAST_FORMAT = re.compile(
+    r"^(?:(?P<leading_epoch>\d+):)?(?P<name>[^\s:]+)-(?:(?P<epoch>\d+):)?(?P<version>[^\s:-]+)-(?P<release>[^\s:-]+)$"
+)
+
+# How many parsed package strings to remember in parse_pkg_string()
+_PARSED_PKG_CACHE_SIZE = 8192
+# Least recently used cache of the results of parse_pkg_string()
+_parsed_pkg_cache = OrderedDict()  # pylint: disable=C0103
+# Guards _parsed_pkg_cache as the packages are parsed from the threads of the parallel actions too
+_parsed_pkg_cache_lock = threading.Lock()  # pylint: disable=C0103
+
+
+def _clear_parsed_pkg_cache():
+    with _parsed_pkg_cache_lock:
+        _parsed_pkg_cache.clear()
+
+
+utils.register_cache(_clear_parsed_pkg_cache)
+
 # Namedtuple to represent a package NEVRA.
 PackageNevra = namedtuple(
     "PackageNevra",
@@ -227,6 +261,10 @@ class RestorablePackageSet(backup.RestorableChange):
                 "Failed to install subscription-manager packages. See the above yum output for details."
             )
 
+        # The rpmdb has changed, don't serve package information from before the install.
+        installed_packages.invalidate()
+        session.refresh_system_repo()
+
         installed_pkg_names = get_pkg_names_from_rpm_paths(rpms_to_install)
         loggerinst.info(
             "\nPackages we installed or updated:\n%s" % utils.format_sequence_as_message(installed_pkg_names)
@@ -380,11 +418,232 @@ def _get_pkg_fingerprint(signature):
     return fingerprint_match.group(1) if fingerprint_match else "none"
 
 
+def _get_pkg_labels(nevra):
+    """Return the strings that ``rpm -q`` would accept to refer to a package.
+
+    :param nevra: The NEVRA of the package.
+    :type nevra: PackageNevra
+    :return: Every label the package can be looked up by, for example
+        ``kernel``, ``kernel.x86_64`` or ``kernel-0:3.10.0-1160.el7.x86_64``.
+    :rtype: tuple[str]
+    """
+    name, epoch, version, release, arch = nevra
+    labels = [
+        name,
+        "%s-%s" % (name, version),
+        "%s-%s-%s" % (name, version, release),
+        "%s-%s:%s-%s" % (name, epoch, version, release),
+    ]
+    if arch:
+        labels.extend(
+            (
+                "%s.%s" % (name, arch),
+                "%s-%s-%s.%s" % (name, version, release, arch),
+                "%s-%s:%s-%s.%s" % (name, epoch, version, release, arch),
+            )
+        )
+
+    return tuple(labels)
+
+
+def _is_pkg_glob(pattern):
+    """Whether the package pattern contains shell-style wildcards."""
+    return "*" in pattern or "?" in pattern or "[" in pattern
+
+
+# The installed packages and their indexes, loaded together
+_InventorySnapshot = namedtuple("_InventorySnapshot", ("packages", "by_label", "by_fingerprint", "by_vendor"))
+
+
+class InstalledPackageInventory(object):
+    """In-memory snapshot of the packages installed on the system.
+
+    Querying the rpmdb with a big query format and parsing every line of the
+    output is slow on systems with thousands of packages. This class queries
+    the rpmdb once and then serves every lookup from memory, indexed by the
+    package labels (name, name.arch, NVR, NEVRA, ...), the fingerprint of the
+    signing key and the vendor.
+
+    The snapshot is reloaded automatically whenever the rpmdb files change on
+    disk. Code which changes the rpmdb can also call :meth:`invalidate` to
+    drop the snapshot explicitly.
+    """
+
+    def __init__(self, rpmdb_path=RPMDB_PATH):
+        self.rpmdb_path = rpmdb_path
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._rpmdb_state = None
+
+    def invalidate(self):
+        """Drop the snapshot so that it is reloaded on the next lookup."""
+        with self._lock:
+            self._snapshot = None
+            self._rpmdb_state = None
+
+    def _load(self):
+        """Load the snapshot if it is not loaded yet or the rpmdb has changed.
+
+        The snapshot is built completely before it replaces the previous one,
+        so the lookups running in other threads never see half-built indexes.
+
+        :rtype: _InventorySnapshot
+        """
+        with self._lock:
+            rpmdb_state = get_rpmdb_state(self.rpmdb_path)
+            if self._snapshot is not None and rpmdb_state is not None and rpmdb_state == self._rpmdb_state:
+                return self._snapshot
+
+            if self._snapshot is not None:
+                loggerinst.debug("The rpmdb has changed, reloading information about installed packages.")
+
+            try:
+                packages = _read_installed_pkg_information_from_rpmdb()
+            except (rpm.error, utils.UnableToSerialize) as e:
+                loggerinst.debug("Unable to read the rpmdb directly, falling back to the rpm command: %s" % str(e))
+                packages = _query_installed_pkg_information()
+
+            snapshot = _InventorySnapshot(packages, {}, {}, {})
+            for pkg in packages:
+                for label in _get_pkg_labels(pkg.nevra):
+                    snapshot.by_label.setdefault(label, []).append(pkg)
+                snapshot.by_fingerprint.setdefault(pkg.fingerprint, []).append(pkg)
+                snapshot.by_vendor.setdefault(pkg.vendor, []).append(pkg)
+
+            # The state from before the query, so that a change made while we
+            # were reading is picked up on the next lookup.
+            self._rpmdb_state = rpmdb_state
+            self._snapshot = snapshot
+            return snapshot
+
+    @property
+    def packages(self):
+        """All the installed packages, in the order they are stored in the rpmdb.
+
+        :rtype: list[PackageInformation]
+        """
+        return list(self._load().packages)
+
+    def find(self, pattern="*"):
+        """Find installed packages the same way ``rpm -q``/``rpm -qa`` would.
+
+        :param pattern: Name, name.arch, NVR, NVRA, NEVR or NEVRA of a
+            package. Shell-style wildcards are accepted.
+        :type pattern: str
+        :return: The matching packages.
+        :rtype: list[PackageInformation]
+        """
+        snapshot = self._load()
+
+        if pattern == "*":
+            return list(snapshot.packages)
+
+        if not _is_pkg_glob(pattern):
+            return list(snapshot.by_label.get(pattern, []))
+
+        matched = []
+        for pkg in snapshot.packages:
+            if any(fnmatch.fnmatchcase(label, pattern) for label in _get_pkg_labels(pkg.nevra)):
+                matched.append(pkg)
+
+        return matched
+
+    def find_all(self, patterns):
+        """Find the installed packages matching each of the patterns in a single pass.
+
+        The same as calling :meth:`find` for every pattern, but the patterns
+        with wildcards are compiled once and matched together while walking
+        the installed packages once. A package is only matched against the
+        patterns whose literal prefix, the part before the first wildcard,
+        agrees with the package name.
+
+        :param patterns: Patterns as accepted by :meth:`find`.
+        :type patterns: list[str]
+        :return: The matching packages per pattern.
+        :rtype: dict[str, list[PackageInformation]]
+        """
+        snapshot = self._load()
+
+        matched = {}
+        globs = []
+        for pattern in patterns:
+            if pattern in matched:
+                continue
+
+            if pattern == "*":
+                matched[pattern] = list(snapshot.packages)
+            elif not _is_pkg_glob(pattern):
+                matched[pattern] = list(snapshot.by_label.get(pattern, []))
+            else:
+                matched[pattern] = []
+                prefix = re.split(r"[*?\[]", pattern, 1)[0]
+                globs.append((matched[pattern], prefix, re.compile(fnmatch.translate(pattern)).match))
+
+        if not globs:
+            return matched
+
+        for pkg in snapshot.packages:
+            name = pkg.nevra.name
+            labels = None
+            for pkgs, prefix, match in globs:
+                # Every label starts with the package name
+                if not (name.startswith(prefix) or prefix.startswith(name)):
+                    continue
+
+                if labels is None:
+                    labels = _get_pkg_labels(pkg.nevra)
+                if any(match(label) for label in labels):
+                    pkgs.append(pkg)
+
+        return matched
+
+    def by_name_arch(self, name, arch):
+        """Return the installed packages with the given name and architecture.
+
+        :rtype: list[PackageInformation]
+        """
+        return list(self._load().by_label.get("%s.%s" % (name, arch), []))
+
+    def by_fingerprint(self, fingerprint):
+        """Return the installed packages signed by the key with the given fingerprint.
+
+        :rtype: list[PackageInformation]
+        """
+        return list(self._load().by_fingerprint.get(fingerprint, []))
+
+    def by_vendor(self, vendor):
+        """Return the installed packages built by the given vendor.
+
+        :rtype: list[PackageInformation]
+        """
+        return list(self._load().by_vendor.get(vendor, []))
+
+
+installed_packages = InstalledPackageInventory()  # pylint: disable=C0103
+utils.register_cache(installed_packages.invalidate)
+
+
 def get_installed_pkg_information(pkg_name="*"):
     """
     Get information about a package, such as signature from the RPM database,
     packager, vendor, NEVRA and fingerprint.
 
+    The information is served from the :data:`installed_packages` snapshot so
+    the rpmdb is only queried again once it has changed.
+
+    :param pkg_name: Full name of a package to check their signature.  If not given, information about all installed packages is returned.
+    :type pkg_obj: str
+    :return: Return the package signature.
+    :rtype: list[PackageInformation]
+    """
+    return installed_packages.find(pkg_name)
+
+
+def _query_installed_pkg_information(pkg_name="*"):
+    """
+    Query the rpmdb for information about a package, such as signature,
+    packager, vendor, NEVRA and fingerprint.
+
     :param pkg_name: Full name of a package to check their signature.  If not given, information about all installed packages is returned.
     :type pkg_obj: str
     :return: Return the package signature.
@@ -393,7 +652,8 @@ def get_installed_pkg_information(pkg_name="*"):
     cmd = [
         "rpm",
         "--qf",
-        "C2R %{PACKAGER}&%{VENDOR}&%{NAME}-%|EPOCH?{%{EPOCH}}:{0}|:%{VERSION}-%{RELEASE}.%{ARCH}&%|DSAHEADER?{%{DSAHEADER:pgpsig}}:{%|RSAHEADER?{%{RSAHEADER:pgpsig}}:{%|SIGGPG?{%{SIGGPG:pgpsig}}:{%|SIGPGP?{%{SIGPGP:pgpsig}}:{(none)}|}|}|}|\n",
+        "C2R %%{PACKAGER}&%%{VENDOR}&%%{NAME}-%%|EPOCH?{%%{EPOCH}}:{0}|:%%{VERSION}-%%{RELEASE}.%%{ARCH}&%s\n"
+        % _PKG_SIGNATURE_QUERYFORMAT,
     ]
 
     if "*" in pkg_name:
@@ -437,6 +697,85 @@ def get_installed_pkg_information(pkg_name="*"):
     return normalized_list
 
 
+def _read_installed_pkg_information_from_rpmdb(pkg_name="*"):
+    """
+    Read information about installed packages straight from the rpmdb
+    headers instead of parsing the output of the rpm command.
+
+    The rpmdb is read in a child process so that the signal handlers
+    installed by the rpm library don't leak into the main process. When
+    already running inside such a child process, the rpmdb is read directly
+    as daemonic processes can't spawn children of their own.
+
+    :param pkg_name: Full name of a package to check their signature.  If not given, information about all installed packages is returned.
+    :type pkg_name: str
+    :return: The same information :func:`_query_installed_pkg_information` returns.
+    :rtype: list[PackageInformation]
+    """
+    if multiprocessing.current_process().daemon:
+        return _get_pkg_information_from_rpmdb(pkg_name)
+
+    return utils.run_as_child_process(_get_pkg_information_from_rpmdb)(pkg_name)
+
+
+def _decode_rpm_tag(value):
+    """Return the value of an rpm header tag as a native string.
+
+    Older rpm python bindings return the string tags as bytes on Python 3.
+    """
+    if value is None:
+        return None
+
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return value.decode("utf-8", "replace")
+
+    return value
+
+
+def _get_pkg_information_from_rpmdb(pkg_name="*"):
+    """Walk the rpmdb headers and turn them into PackageInformation.
+
+    .. note::
+        Meant to be called through :func:`_read_installed_pkg_information_from_rpmdb`.
+
+    :param pkg_name: Name, label or shell-style pattern of the package name.
+    :type pkg_name: str
+    :rtype: list[PackageInformation]
+    """
+    ts = rpm.TransactionSet()
+    if pkg_name == "*":
+        headers = ts.dbMatch()
+    elif "*" in pkg_name:
+        headers = ts.dbMatch()
+        headers.pattern("name", rpm.RPMMIRE_GLOB, pkg_name)
+    else:
+        headers = ts.dbMatch(rpm.RPMDBI_LABEL, pkg_name)
+
+    pkgs = []
+    for hdr in headers:
+        epoch = hdr[rpm.RPMTAG_EPOCH]
+        signature = _decode_rpm_tag(hdr.sprintf(_PKG_SIGNATURE_QUERYFORMAT))
+
+        pkgs.append(
+            PackageInformation(
+                (_decode_rpm_tag(hdr[rpm.RPMTAG_PACKAGER]) or "(none)").strip(),
+                _decode_rpm_tag(hdr[rpm.RPMTAG_VENDOR]) or "(none)",
+                PackageNevra(
+                    _decode_rpm_tag(hdr[rpm.RPMTAG_NAME]),
+                    str(epoch) if epoch is not None else "0",
+                    _decode_rpm_tag(hdr[rpm.RPMTAG_VERSION]),
+                    _decode_rpm_tag(hdr[rpm.RPMTAG_RELEASE]),
+                    # The gpg-pubkey packages have no arch
+                    _decode_rpm_tag(hdr[rpm.RPMTAG_ARCH]),
+                ),
+                _get_pkg_fingerprint(signature),
+                signature,
+            )
+        )
+
+    return pkgs
+
+
 def get_rpm_header(pkg_obj):
     """The dnf python API does not provide the package rpm header:
       https://bugzilla.redhat.com/show_bug.cgi?id=1876606.
@@ -456,6 +795,11 @@ def get_rpm_header(pkg_obj):
         loggerinst.critical("Unable to find package '%s' in the rpm database." % pkg_obj.name)
 
 
+# Key of the package manager session base object with just the installed
+# packages loaded
+_INSTALLED_PKGS_SESSION_KEY = ("installed",)
+
+
 def get_installed_pkg_objects(name=None, version=None, release=None, arch=None):
     """Return list with installed package objects. The packages can be
     optionally filtered by name.
@@ -467,33 +811,39 @@ def get_installed_pkg_objects(name=None, version=None, release=None, arch=None):
 
 
 def _get_installed_pkg_objects_yum(name=None, version=None, release=None, arch=None):
-    yum_base = pkgmanager.YumBase()
-    # Disable plugins (when kept enabled yum outputs useless text every call)
-    yum_base.doConfigSetup(init_plugins=False)
+    yum_base = session.get_base(_INSTALLED_PKGS_SESSION_KEY, _create_installed_pkgs_yum_base)
 
-    if name:
-        pattern = name
-        if version:
-            pattern += "-%s" % version
+    try:
+        if name:
+            pattern = name
+            if version:
+                pattern += "-%s" % version
 
-        if release:
-            pattern += "-%s" % release
+            if release:
+                pattern += "-%s" % release
 
-        if arch:
-            pattern += ".%s" % arch
+            if arch:
+                pattern += ".%s" % arch
 
-        return yum_base.rpmdb.returnPackages(patterns=[pattern])
+            return yum_base.rpmdb.returnPackages(patterns=[pattern])
 
-    installed_packages = yum_base.rpmdb.returnPackages()
-    yum_base.close()
-    del yum_base
-    return installed_packages
+        return yum_base.rpmdb.returnPackages()
+    finally:
+        # Don't keep the rpmdb open, it's opened again for the next query
+        session.release_base(_INSTALLED_PKGS_SESSION_KEY)
+
+
+def _create_installed_pkgs_yum_base():
+    yum_base = pkgmanager.YumBase()
+    # Disable plugins (when kept enabled yum outputs useless text every call)
+    yum_base.doConfigSetup(init_plugins=False)
+    return yum_base
 
 
 def _get_installed_pkg_objects_dnf(name=None, version=None, release=None, arch=None):
-    dnf_base = pkgmanager.Base()
-    dnf_base.conf.module_platform_id = "platform:el8"
-    dnf_base.fill_sack(load_system_repo=True, load_available_repos=False)
+    dnf_base = session.get_base(
+        _INSTALLED_PKGS_SESSION_KEY, _create_installed_pkgs_dnf_base, load_available_repos=False
+    )
     query = dnf_base.sack.query()
     installed = query.installed()
 
@@ -523,6 +873,13 @@ def _get_installed_pkg_objects_dnf(name=None, version=None, release=None, arch=N
     return list(installed)
 
 
+def _create_installed_pkgs_dnf_base():
+    dnf_base = pkgmanager.Base()
+    dnf_base.conf.module_platform_id = "platform:el8"
+    dnf_base.fill_sack(load_system_repo=True, load_available_repos=False)
+    return dnf_base
+
+
 def get_third_party_pkgs():
     """
     Get all the third party packages (non-Red Hat and non-original OS-signed)
@@ -546,24 +903,48 @@ def get_installed_pkgs_w_different_fingerprint(fingerprints, name="*"):
     if not fingerprints:
         return []
 
-    pkgs_w_fingerprints = get_installed_pkg_information(name)
+    return _filter_pkgs_w_different_fingerprint(get_installed_pkg_information(name), fingerprints)
+
 
+def _filter_pkgs_w_different_fingerprint(pkgs, fingerprints):
+    """Keep only the packages not signed by any of the keys with the fingerprints, the gpg-pubkeys excluded.
+
+    :type pkgs: list[PackageInformation]
+    :type fingerprints: list[str]
+    :rtype: list[PackageInformation]
+    """
+    return [pkg for pkg in pkgs if pkg.fingerprint not in fingerprints and pkg.nevra.name != "gpg-pubkey"]
+
+
+@utils.run_as_child_process
+def _get_pkg_packagers(pkgs):
+    """Get the vendor of the packages, or the packager of those without a vendor.
+
+    :param pkgs: List of packages
+    :type pkgs: list[PackageInformation] | list[RPMInstalledPackage]
+    :return: Tuple of the package NEVRA and its vendor or packager for every package.
+    :rtype: list[tuple[str, str]]
+    """
     return [
-        pkg for pkg in pkgs_w_fingerprints if pkg.fingerprint not in fingerprints and pkg.nevra.name != "gpg-pubkey"
+        (
+            get_pkg_nevra(pkg, include_zero_epoch=True),
+            get_vendor(pkg) if pkg.vendor != "(none)" else get_packager(pkg),
+        )
+        for pkg in pkgs
     ]
 
 
-@utils.run_as_child_process
 def format_pkg_info(pkgs):
     """Format package information.
 
+    The repositories of the packages are queried in the main process, where
+    the results of the queries are kept for the rest of the run.
+
     :param pkgs: List of packages to be formatted
     :type pkgs: list[PackageInformation] | list[RPMInstalledPackage]
     """
     package_info = {}
-    for pkg in pkgs:
-        nevra = get_pkg_nevra(pkg, include_zero_epoch=True)
-        packager = get_vendor(pkg) if pkg.vendor != "(none)" else get_packager(pkg)
+    for nevra, packager in _get_pkg_packagers(pkgs):
         # Setting repoid as N/A to make it default. Later in the function this
         # value is changed to the actual repoid, if there is one.
         package_info[nevra] = {"packager": packager, "repoid": "N/A"}
@@ -643,32 +1024,22 @@ def _get_package_repositories(pkgs):
     """
     repositories_mapping = {}
 
-    query_format = "C2R %{EPOCH}:%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}&%{REPOID}\n"
-    if system_info.version.major == 8:
-        query_format = "C2R %{NAME}-%{EPOCH}:%{VERSION}-%{RELEASE}.%{ARCH}&%{REPOID}\n"
-
-    output, retcode = utils.run_subprocess(
-        ["repoquery", "--quiet", "-q"] + pkgs + ["--qf", query_format],
-        print_cmd=False,
-        print_output=False,
-    )
-    output = [line for line in output.split("\n") if line]
-
-    # In case of repoquery returning an retcode different from 0, let's log the
-    # output as a debug and return N/A for the caller.
-    if retcode != 0:
-        loggerinst.debug("Repoquery exited with return code %s and with output: %s", retcode, " ".join(output))
+    try:
+        packages = repo_query.query(pkgs, fields=("name", "epoch", "version", "release", "arch", "repoid"))
+    except RepoQueryError as e:
+        # In case of repoquery returning an retcode different from 0, let's log the
+        # output as a debug and return N/A for the caller.
+        loggerinst.debug("Repoquery exited with return code %s and with output: %s", e.returncode, e.output)
         for package in pkgs:
             repositories_mapping[package] = "N/A"
-    else:
-        for line in output:
-            if "C2R" in line:
-                split_output = line.lstrip("C2R ").split("&")
-                nevra = split_output[0]
-                repoid = split_output[1]
-                repositories_mapping[nevra] = repoid if repoid else "N/A"
-            else:
-                loggerinst.debug("Got a line without the C2R identifier: %s", line)
+        return repositories_mapping
+
+    for name, epoch, version, release, arch, repoid in packages:
+        if system_info.version.major == 8:
+            nevra = "%s-%s:%s-%s.%s" % (name, epoch, version, release, arch)
+        else:
+            nevra = "%s:%s-%s-%s.%s" % (epoch, name, version, release, arch)
+        repositories_mapping[nevra] = repoid if repoid else "N/A"
 
     return repositories_mapping
 
@@ -838,13 +1209,22 @@ def get_packages_to_remove(pkgs):
         directly the rpmdb, which in its turn, traps the signal handler and
         prevent the main process to handle the Ctrl + C.
 
-    :param pkgs: List of packages that will be removed
-    :type pkgs: list[PackageInformation]
+    All the patterns are matched against the installed packages at once,
+    see :meth:`InstalledPackageInventory.find_all`.
+
+    :param pkgs: Names or patterns of the packages that will be removed
+    :type pkgs: list[str]
+    :return: The installed packages matching the patterns, not signed by Red Hat
+    :rtype: list[PackageInformation]
     """
+    fingerprints = system_info.fingerprints_rhel
+    # if no fingerprints, skip this check.
+    matched = installed_packages.find_all(pkgs) if fingerprints else {}
+
     pkgs_to_remove = []
     for pkg in pkgs:
         temp = "." * (50 - len(pkg) - 2)
-        pkg_objects = get_installed_pkgs_w_different_fingerprint(system_info.fingerprints_rhel, pkg)
+        pkg_objects = _filter_pkgs_w_different_fingerprint(matched.get(pkg, []), fingerprints)
         pkgs_to_remove.extend(pkg_objects)
         loggerinst.info("%s %s %s" % (pkg, temp, str(len(pkg_objects))))
 
@@ -1321,22 +1701,82 @@ def compare_package_versions(version1, version2):
 
 def parse_pkg_string(pkg):
     """
-    This function takes a version string in NEVRA, NEVR, NVRA, NVR, ENVRA, ENVR and decides whether
-    to parse with a yum/dnf module based on the package manager type of the system.
+    This function takes a version string in NEVRA, NEVR, NVRA, NVR, ENVRA, ENVR and parses it into its fields.
+
+    Unambiguous package strings, which is the vast majority of them, are parsed with a regular expression. The rest
+    is parsed with a yum/dnf module based on the package manager type of the system. The results are cached as the
+    same packages tend to be parsed over and over, e.g. when sorting a list of packages by their versions.
+
     :param pkg: The package to be parsed.
     :type pkg: str
     :return: Return a Return a list containing name, epoch, version, release, arch
     :rtype: list[str | None]
     """
-    if pkgmanager.TYPE == "yum":
-        pkg_ver_components = _parse_pkg_with_yum(pkg)
-    else:
-        pkg_ver_components = _parse_pkg_with_dnf(pkg)
+    with _parsed_pkg_cache_lock:
+        pkg_ver_components = _parsed_pkg_cache.pop(pkg, None)
+        if pkg_ver_components is not None:
+            # Reinsert the package to mark it as the most recently used one
+            _parsed_pkg_cache[pkg] = pkg_ver_components
+            return pkg_ver_components
+
+    # Parse outside of the lock, the yum and dnf parsers are not cheap
+    pkg_ver_components = _parse_pkg_with_regex(pkg)
+    if pkg_ver_components is None:
+        if pkgmanager.TYPE == "yum":
+            pkg_ver_components = _parse_pkg_with_yum(pkg)
+        else:
+            pkg_ver_components = _parse_pkg_with_dnf(pkg)
 
     _validate_parsed_fields(pkg, *pkg_ver_components)
+
+    with _parsed_pkg_cache_lock:
+        # Another thread might have parsed the same package in the meantime
+        _parsed_pkg_cache.pop(pkg, None)
+        if len(_parsed_pkg_cache) >= _PARSED_PKG_CACHE_SIZE:
+            _parsed_pkg_cache.popitem(last=False)
+        _parsed_pkg_cache[pkg] = pkg_ver_components
     return pkg_ver_components
 
 
+def _parse_pkg_with_regex(pkg):
+    """Parse a version string without calling into yum or dnf.
+
+    Only package strings which can be parsed just one way are handled here.
+    The yum and dnf parsers are left to deal with anything else, including
+    invalid package strings, so that they are treated the same as before.
+
+    :param pkg: The package to be parsed.
+    :type pkg: str
+    :return: A tuple containing name, epoch, version, release, arch (may
+        contain None values) or None when the package string is ambiguous.
+    :rtype: tuple[str | None] | None
+    """
+    match = _NEVR_FAST_FORMAT.match(pkg)
+    if not match:
+        return None
+
+    name, leading_epoch, epoch, version, release = match.group("name", "leading_epoch", "epoch", "version", "release")
+    if leading_epoch is not None:
+        # The epoch can't be both at the beginning and in the middle
+        if epoch is not None:
+            return None
+        epoch = leading_epoch
+
+    # dnf normalizes the epoch to an integer, yum doesn't
+    if epoch is not None and len(epoch) > 1 and epoch.startswith("0"):
+        return None
+
+    arch = None
+    release_without_arch, _, arch_candidate = release.rpartition(".")
+    if release_without_arch and arch_candidate in PKG_ARCH:
+        release, arch = release_without_arch, arch_candidate
+    elif release.endswith(PKG_ARCH):
+        # e.g. "1.el8_x86_64", the parsers differ in what is the arch here
+        return None
+
+    return (name, epoch, version, release, arch)
+
+
 def _validate_parsed_fields(package, name, epoch, version, release, arch):
     """
     Validation for each field contained in pkg_ver_components from the package
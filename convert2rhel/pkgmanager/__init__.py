@@ -41,6 +41,7 @@ try:
 except ImportError as e:
 
     import hawkey
+    import libdnf.transaction
 
     from dnf import *  # pylint: disable=import-error
     from dnf.callback import Depsolve, DownloadProgress
@@ -15,16 +15,19 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
+import binascii
 import logging
 
-from convert2rhel import pkgmanager
+from convert2rhel import pkgmanager, timings
 from convert2rhel.pkghandler import get_system_packages_for_replacement
+from convert2rhel.pkgmanager.handlers import plan
 from convert2rhel.pkgmanager.handlers.base import TransactionHandlerBase
 from convert2rhel.pkgmanager.handlers.dnf.callback import (
     DependencySolverProgressIndicatorCallback,
     PackageDownloadCallback,
     TransactionDisplayCallback,
 )
+from convert2rhel.pkgmanager.session import session
 from convert2rhel.systeminfo import system_info
 
 
@@ -109,35 +112,33 @@ class DnfTransactionHandler(TransactionHandlerBase):
 
         This internal method will actually perform three operations in the
         transaction: update, reinstall and downgrade. The downgrade
-        will be executed only when the reinstall step raises
-        `PackagesNotAvailableError`.
+        will be executed only when the installed version of the package is
+        not available in the repositories.
+
+        The packages are classified in bulk against indexes of the sack and
+        added to the transaction as package objects. Passing the package specs
+        to dnf instead would make it parse them and query the sack again for
+        every single package.
         """
         original_os_pkgs = get_system_packages_for_replacement()
-        upgrades = self._base.sack.query().upgrades().latest()
 
         loggerinst.info("Adding %s packages to the dnf transaction set.", system_info.name)
 
-        for pkg in original_os_pkgs:
-            # Splitting the name and arch so we can filter it out in the list
-            # of packages to upgrade.
-            name, arch = tuple(pkg.rsplit(".", 1))
-            upgrade_pkg = next(iter(upgrades.filter(name=name, arch=arch)), None)
-
-            # If a package is marked for update, then we don't need to
-            # proceed with reinstall, and possibly, the downgrade of this
-            # package. This is an inconsistency that could lead to packages
-            # being outdated in the system after the conversion.
-            if upgrade_pkg:
-                self._base.upgrade(pkg_spec=pkg)
-                continue
-
-            try:
-                self._base.reinstall(pkg_spec=pkg)
-            except pkgmanager.exceptions.PackagesNotAvailableError:
-                try:
-                    self._base.downgrade(pkg_spec=pkg)
-                except pkgmanager.exceptions.PackagesNotInstalledError:
-                    loggerinst.warning("Package %s not available in RHEL repositories.", pkg)
+        upgrades, reinstalls, downgrades, unavailable = _classify_packages(self._base.sack, original_os_pkgs)
+
+        # If a package is marked for update, then we don't need to proceed
+        # with reinstall, and possibly, the downgrade of this package. This is
+        # an inconsistency that could lead to packages being outdated in the
+        # system after the conversion.
+        for pkg in upgrades:
+            self._base.package_upgrade(pkg)
+        for pkg in reinstalls:
+            self._base.package_reinstall(pkg)
+        for pkg in downgrades:
+            self._base.package_downgrade(pkg)
+
+        for pkg in unavailable:
+            loggerinst.warning("Package %s not available in RHEL repositories.", pkg)
 
     def _resolve_dependencies(self):
         """Resolve the dependencies for the transaction.
@@ -157,12 +158,16 @@ class DnfTransactionHandler(TransactionHandlerBase):
             loggerinst.critical("Failed to resolve dependencies in the transaction.")
 
         loggerinst.info("Downloading the packages that were added to the dnf transaction set.")
+        download_callback = PackageDownloadCallback()
         try:
-            self._base.download_packages(self._base.transaction.install_set, PackageDownloadCallback())
+            with timings.trace.span("Package download", "pkgmanager"):
+                self._base.download_packages(self._base.transaction.install_set, download_callback)
         except pkgmanager.exceptions.DownloadError as e:
             loggerinst.debug("Got the following exception message: %s" % e)
             loggerinst.critical("Failed to download the transaction packages.")
 
+        download_callback.finish()
+
     def _process_transaction(self, validate_transaction):
         """Internal method that will process the transaction.
 
@@ -172,14 +177,18 @@ class DnfTransactionHandler(TransactionHandlerBase):
         :raises SystemExit: If we can't process the transaction.
         """
 
+        # The base object might have been used for the validation already
+        self._base.conf.tsflags = [flag for flag in self._base.conf.tsflags if flag != "test"]
         if validate_transaction:
             loggerinst.info("Validating the dnf transaction set, no modifications to the system will happen this time.")
             self._base.conf.tsflags.append("test")
         else:
             loggerinst.info("Replacing %s packages. This process may take some time to finish." % system_info.name)
 
+        transaction_callback = TransactionDisplayCallback()
         try:
-            self._base.do_transaction(display=TransactionDisplayCallback())
+            with timings.trace.span("Transaction", "pkgmanager", {"test": validate_transaction}):
+                self._base.do_transaction(display=transaction_callback)
         except (
             pkgmanager.exceptions.Error,
             pkgmanager.exceptions.TransactionCheckError,
@@ -187,6 +196,8 @@ class DnfTransactionHandler(TransactionHandlerBase):
             loggerinst.debug("Got the following exception message: %s", e)
             loggerinst.critical("Failed to validate the dnf transaction.")
 
+        transaction_callback.finish()
+
         if validate_transaction:
             loggerinst.info("Successfully validated the dnf transaction set.")
         else:
@@ -204,18 +215,238 @@ class DnfTransactionHandler(TransactionHandlerBase):
         :type validate_transaction: bool
         :raises SystemExit: If there was any problem during the
         """
-        self._set_up_base()
-        self._enable_repos()
+        # The repository metadata loaded for the validation are reused for the
+        # replacement. Only the installed packages are reloaded in between.
+        session_key = ("transaction", tuple(system_info.get_enabled_rhel_repos()), system_info.releasever)
+        self._base = session.get_base(session_key, self._create_base)
+
+        # The replacement replays the packages of the validated transaction
+        # instead of matching every system package against the repositories
+        # again.
+        if validate_transaction:
+            plan.remove_plan()
+            planned_pkgs = None
+        else:
+            planned_pkgs = plan.load_plan()
+        if not planned_pkgs or not self._replay_plan(planned_pkgs):
+            self._perform_operations()
 
-        self._perform_operations()
         self._resolve_dependencies()
+        if validate_transaction:
+            planned_pkgs = self._get_planned_packages()
         self._process_transaction(validate_transaction)
 
-        # Because we call the same thing multiple times, the rpm database is not
-        # properly closed at the end of it, thus, having the need to call
-        # `self._base.close()` explicitly before we delete the object. If we use
-        # only `del self._base`, it seems that dnf is not able to properly clean
-        # everything in the database. We were seeing some problems in the next
-        # steps with the rpmdb, as the history had changed.
-        self._base.close()
+        if validate_transaction:
+            plan.save_plan(planned_pkgs)
+            # Drop the resolved transaction and the rpm transaction set to
+            # not keep the rpm database open until the replacement.
+            session.release_base(session_key)
+        else:
+            plan.remove_plan()
+            # Because we call the same thing multiple times, the rpm database is not
+            # properly closed at the end of it, thus, having the need to call
+            # `self._base.close()` explicitly before we delete the object. If we use
+            # only `del self._base`, it seems that dnf is not able to properly clean
+            # everything in the database. We were seeing some problems in the next
+            # steps with the rpmdb, as the history had changed.
+            session.close_base(session_key)
         del self._base
+
+    def _get_planned_packages(self):
+        """Get the packages of the resolved transaction.
+
+        :rtype: list[plan.PlannedPackage]
+        """
+        install_set = self._base.transaction.install_set
+        # More versions of the installonly packages, like kernel, can be
+        # installed at the same time
+        installed = {}
+        for pkg in self._base.sack.query().installed():
+            installed.setdefault((pkg.name, pkg.arch), []).append(pkg)
+
+        installonly_names = set()
+        if install_set and self._base.conf.installonlypkgs:
+            installonly_pkgs = self._base.sack.query().filter(
+                name=list(set(pkg.name for pkg in install_set)), provides=self._base.conf.installonlypkgs
+            )
+            installonly_names = set(pkg.name for pkg in installonly_pkgs)
+
+        dependency_reasons = (
+            pkgmanager.libdnf.transaction.TransactionItemReason_DEPENDENCY,
+            pkgmanager.libdnf.transaction.TransactionItemReason_WEAK_DEPENDENCY,
+        )
+        dependencies = set(tsi.pkg for tsi in self._base.transaction if tsi.reason in dependency_reasons)
+
+        planned_pkgs = []
+        for pkg in install_set:
+            installed_pkgs = installed.get((pkg.name, pkg.arch), [])
+            if any(pkg.evr_eq(installed_pkg) for installed_pkg in installed_pkgs):
+                operation = plan.OPERATION_REINSTALL
+            elif not installed_pkgs or pkg.name in installonly_names:
+                # A new version of an installonly package is installed next to the installed ones
+                operation = plan.OPERATION_INSTALL
+            elif all(pkg.evr_gt(installed_pkg) for installed_pkg in installed_pkgs):
+                operation = plan.OPERATION_UPGRADE
+            else:
+                operation = plan.OPERATION_DOWNGRADE
+            reason = plan.REASON_DEPENDENCY if pkg in dependencies else plan.REASON_USER
+            planned_pkgs.append(_create_planned_package(pkg, operation, _get_checksum(pkg), pkg.localPkg(), reason))
+
+        for pkg in self._base.transaction.remove_set:
+            planned_pkgs.append(_create_planned_package(pkg, plan.OPERATION_ERASE))
+
+        return planned_pkgs
+
+    def _replay_plan(self, planned_pkgs):
+        """Add the packages of the validated transaction to the transaction.
+
+        The exact packages of the plan are added, so there's no need to match
+        the system packages against the repositories again. Newly installed
+        dependencies are left to the dependency solver.
+
+        :param planned_pkgs: The packages of the validated transaction.
+        :type planned_pkgs: list[plan.PlannedPackage]
+        :return: False if any of the planned packages is not available anymore. Nothing is added to the transaction
+            in that case.
+        :rtype: bool
+        """
+        loggerinst.info("Adding the packages of the validated transaction to the dnf transaction set.")
+        planned_pkgs = plan.get_pinned_packages(planned_pkgs)
+        names = set(planned.name for planned in planned_pkgs)
+        available = dict((_get_nevra(pkg), pkg) for pkg in self._base.sack.query().available().filter(name=names))
+        installed = dict((_get_nevra(pkg), pkg) for pkg in self._base.sack.query().installed().filter(name=names))
+
+        operations = {
+            plan.OPERATION_INSTALL: lambda pkg: self._base.package_install(pkg, strict=True),
+            plan.OPERATION_UPGRADE: self._base.package_upgrade,
+            plan.OPERATION_REINSTALL: self._base.package_reinstall,
+            plan.OPERATION_DOWNGRADE: self._base.package_downgrade,
+            plan.OPERATION_ERASE: self._base.package_remove,
+        }
+
+        jobs = []
+        for planned in planned_pkgs:
+            nevra = (planned.name, planned.epoch, planned.version, planned.release, planned.arch)
+            if planned.operation == plan.OPERATION_ERASE:
+                pkg = installed.get(nevra)
+            else:
+                pkg = available.get(nevra)
+                if pkg and _get_checksum(pkg) != planned.checksum:
+                    pkg = None
+
+            if not pkg:
+                loggerinst.info("The package %s of the validated transaction is not available." % planned.name)
+                return False
+            jobs.append((operations[planned.operation], pkg))
+
+        for operation, pkg in jobs:
+            operation(pkg)
+
+        return True
+
+    def _create_base(self):
+        """Create the base object with the RHEL repositories loaded.
+
+        :rtype: dnf.Base
+        """
+        self._set_up_base()
+        self._enable_repos()
+        return self._base
+
+
+def _classify_packages(sack, pkgs):
+    """Find out how to replace the installed packages with the available ones.
+
+    :param sack: The sack with the installed and the available packages loaded.
+    :type sack: dnf.sack.Sack
+    :param pkgs: The installed packages to replace, in the "name.arch" form.
+    :type pkgs: list[str]
+    :return: Tuple of the available packages to upgrade to, to reinstall and to downgrade to, followed by the
+        packages from `pkgs` that are not available at all.
+    :rtype: tuple[list[hawkey.Package], list[hawkey.Package], list[hawkey.Package], list[str]]
+    """
+    names = list(set(pkg.rsplit(".", 1)[0] for pkg in pkgs))
+    query = sack.query().filter(name=names)
+
+    latest_upgrades = {}
+    for pkg in query.upgrades().latest():
+        latest_upgrades[(pkg.name, pkg.arch)] = pkg
+
+    installed = {}
+    for pkg in query.installed():
+        installed.setdefault((pkg.name, pkg.arch), []).append(pkg)
+
+    available = {}
+    for pkg in query.available():
+        available.setdefault((pkg.name, pkg.arch), []).append(pkg)
+
+    upgrades, reinstalls, downgrades, unavailable = [], [], [], []
+    for pkg in pkgs:
+        name_arch = tuple(pkg.rsplit(".", 1))
+        if name_arch in latest_upgrades:
+            upgrades.append(latest_upgrades[name_arch])
+            continue
+
+        installed_pkgs = installed.get(name_arch, [])
+        available_pkgs = available.get(name_arch, [])
+
+        # All the installed versions available in the repositories, e.g. of
+        # the installonly packages like kernel. Once per version even if
+        # multiple repositories provide it.
+        same_versions = {}
+        for available_pkg in available_pkgs:
+            if any(available_pkg.evr_eq(installed_pkg) for installed_pkg in installed_pkgs):
+                same_versions.setdefault(available_pkg.evr, available_pkg)
+        if same_versions:
+            reinstalls.extend(same_versions.values())
+            continue
+
+        # The highest version lower than the installed ones
+        lower_versions = [
+            available_pkg
+            for available_pkg in available_pkgs
+            if installed_pkgs and all(available_pkg.evr_lt(installed_pkg) for installed_pkg in installed_pkgs)
+        ]
+        if lower_versions:
+            highest = lower_versions[0]
+            for available_pkg in lower_versions[1:]:
+                if available_pkg.evr_gt(highest):
+                    highest = available_pkg
+            downgrades.append(highest)
+            continue
+
+        unavailable.append(pkg)
+
+    return upgrades, reinstalls, downgrades, unavailable
+
+
+def _get_nevra(pkg):
+    """Get the NEVRA of a package in the form used by the transaction plan.
+
+    :type pkg: hawkey.Package
+    :rtype: tuple[str, str, str, str, str]
+    """
+    return (pkg.name, str(pkg.epoch), pkg.version, pkg.release, pkg.arch)
+
+
+def _get_checksum(pkg):
+    """Get the checksum of a package in the repository metadata.
+
+    :type pkg: hawkey.Package
+    :return: The checksum in the "<type>:<hexdigest>" form, None if unknown.
+    :rtype: str | None
+    """
+    if not pkg.chksum:
+        return None
+
+    checksum_type, checksum = pkg.chksum
+    return "%s:%s" % (pkgmanager.hawkey.chksum_name(checksum_type), binascii.hexlify(checksum).decode("ascii"))
+
+
+def _create_planned_package(pkg, operation, checksum=None, path=None, reason=plan.REASON_USER):
+    """
+    :type pkg: hawkey.Package
+    :rtype: plan.PlannedPackage
+    """
+    name, epoch, version, release, arch = _get_nevra(pkg)
+    return plan.PlannedPackage(name, epoch, version, release, arch, operation, checksum, path, reason)
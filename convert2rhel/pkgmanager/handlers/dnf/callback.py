@@ -60,7 +60,8 @@
 #       https://github.com/rpm-software-management/dnf/blob/4.7.0/dnf/cli/output.py
 import logging
 
-from convert2rhel import pkgmanager
+from convert2rhel import pkgmanager, timings
+from convert2rhel.pkgmanager.handlers.progress import ProgressReporter
 
 
 loggerinst = logging.getLogger(__name__)
@@ -107,10 +108,12 @@ class DependencySolverProgressIndicatorCallback(pkgmanager.Depsolve):
     def start(self):
         """Handle the beginning of the dependency resolution process."""
         loggerinst.info("Starting dependency resolution process.")
+        timings.trace.begin("Dependency resolution", "pkgmanager")
 
     def end(self):
         """Handle the end of the dependency resolution process."""
         loggerinst.info("Finished dependency resolution process.")
+        timings.trace.end("Dependency resolution")
 
 
 class PackageDownloadCallback(pkgmanager.DownloadProgress):
@@ -136,6 +139,7 @@ class PackageDownloadCallback(pkgmanager.DownloadProgress):
         self.total_size = 0
         self.done_files = 0
         self.done_size = 0
+        self._reporter = ProgressReporter("Package download")
 
     def start(self, total_files, total_size, total_drpms=0):
         """Indicate that a new progress metering started.
@@ -215,7 +219,17 @@ class PackageDownloadCallback(pkgmanager.DownloadProgress):
                 message = "(%d/%d): %s" % (self.done_files, self.total_files, package)
 
         if message:
-            loggerinst.info(message)
+            self._reporter.report(
+                message,
+                self._STATUS_MAPPING.get(status, "Unknown") if status else "Downloaded",
+                important=status == pkgmanager.callback.STATUS_FAILED,
+            )
+
+        timings.trace.instant("Downloaded %s" % package, "download", {"size": size, "status": status})
+
+    def finish(self):
+        """Show the summary of the downloads, to be called once all the packages are downloaded."""
+        self._reporter.finish()
 
 
 class TransactionDisplayCallback(pkgmanager.TransactionDisplay):
@@ -225,6 +239,7 @@ class TransactionDisplayCallback(pkgmanager.TransactionDisplay):
         """Constructor for the transaction display progress in DNF."""
         super(TransactionDisplayCallback, self).__init__()
         self.last_package_seen = None
+        self._reporter = ProgressReporter("Transaction")
 
     def progress(self, package, action, ti_done, ti_total, ts_done, ts_total):
         """Process and output the RPM operations in the transaction.
@@ -257,16 +272,25 @@ class TransactionDisplayCallback(pkgmanager.TransactionDisplay):
         # different.
         package = str(package)
 
-        message = "%s: %s [%s/%s]" % (pkgmanager.transaction.ACTIONS.get(action), package, ts_done, ts_total)
+        action_name = pkgmanager.transaction.ACTIONS.get(action)
+        message = "%s: %s [%s/%s]" % (action_name, package, ts_done, ts_total)
 
         # The base API will call this callback class on every package update,
         # no matter if it is the same update or not, so, the below statement
         # prevents the same message being sent more than once to the user.
         if self.last_package_seen != package:
-            loggerinst.info(message)
+            self._reporter.report(message, action_name)
+            # The span of the previous package, including its scriptlets,
+            # ends here. The last one ends with the transaction.
+            timings.trace.end(str(self.last_package_seen))
+            timings.trace.begin(package, "rpm", {"action": action_name})
 
         self.last_package_seen = package
 
+    def finish(self):
+        """Show the summary of the transaction, to be called once the transaction finishes."""
+        self._reporter.finish()
+
     def scriptout(self, msgs):
         """Hook for reporting an rpm scriptlet output.
 
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+import logging
+import os
+
+from collections import namedtuple
+
+from convert2rhel import pkgmanager, utils
+from convert2rhel.pkgmanager.session import get_rpmdb_state
+from convert2rhel.repoquery import get_repomd_revisions
+from convert2rhel.systeminfo import system_info
+
+
+loggerinst = logging.getLogger(__name__)
+
+# The packages of the validated transaction, replayed by the replacement of
+# the packages after the point of no return.
+TRANSACTION_PLAN_FILE = os.path.join(utils.TMP_DIR, "transaction-plan.json")
+
+# To be changed whenever the structure of the plan file changes. Plans of
+# other versions are ignored.
+_TRANSACTION_PLAN_VERSION = 2
+
+# Operations of the planned packages
+OPERATION_INSTALL = "install"
+OPERATION_UPGRADE = "upgrade"
+OPERATION_REINSTALL = "reinstall"
+OPERATION_DOWNGRADE = "downgrade"
+OPERATION_ERASE = "erase"
+
+# Why the planned packages are part of the transaction
+REASON_USER = "user"
+REASON_DEPENDENCY = "dependency"
+
+# Namedtuple that represents a package of the validated transaction.
+#  - operation: One of the OPERATION_* constants
+#  - checksum: "<type>:<hexdigest>" of the package in the repository, None for erased packages
+#  - path: The path of the downloaded package, None for erased packages
+#  - reason: One of the REASON_* constants
+PlannedPackage = namedtuple(
+    "PlannedPackage",
+    (
+        "name",
+        "epoch",
+        "version",
+        "release",
+        "arch",
+        "operation",
+        "checksum",
+        "path",
+        "reason",
+    ),
+)
+
+
+def save_plan(packages, plan_file=None):
+    """Store the packages of a validated transaction.
+
+    The plan records the state of the rpmdb and of the repository metadata
+    next to the packages so that it's not replayed once any of them changes.
+
+    Erasures of packages replaced by a planned package of the same name and
+    architecture are dropped from the plan. They are part of the replacing
+    operation.
+
+    Failing to store the plan is not fatal, the transaction is just going to
+    be resolved again.
+
+    :param packages: The packages of the resolved transaction.
+    :type packages: Iterable[PlannedPackage]
+    :param plan_file: Where to store the plan. Defaults to :data:`TRANSACTION_PLAN_FILE`.
+    :type plan_file: str | None
+    """
+    plan_file = plan_file or TRANSACTION_PLAN_FILE
+    packages = list(packages)
+    replaced = set((planned.name, planned.arch) for planned in packages if planned.operation != OPERATION_ERASE)
+    packages = [
+        planned
+        for planned in packages
+        if planned.operation != OPERATION_ERASE or (planned.name, planned.arch) not in replaced
+    ]
+
+    plan = {
+        "version": _TRANSACTION_PLAN_VERSION,
+        "state": _get_plan_state(),
+        "packages": [planned._asdict() for planned in packages],
+    }
+
+    tmp_file = "%s.tmp" % plan_file
+    try:
+        utils.mkdir_p(os.path.dirname(plan_file))
+        with open(tmp_file, "w") as f:
+            os.chmod(tmp_file, 0o600)
+            json.dump(plan, f)
+        os.rename(tmp_file, plan_file)
+    except (IOError, OSError) as e:
+        loggerinst.debug("Unable to store the transaction plan to %s: %s" % (plan_file, str(e)))
+        return
+
+    loggerinst.debug("Stored the plan of the validated transaction with %d packages." % len(packages))
+
+
+def load_plan(plan_file=None):
+    """Load the packages of the validated transaction.
+
+    :param plan_file: Where the plan is stored. Defaults to :data:`TRANSACTION_PLAN_FILE`.
+    :type plan_file: str | None
+    :return: The planned packages or None if there's no plan or it's outdated, e.g. because the installed packages
+        or the repository metadata changed since the validation.
+    :rtype: list[PlannedPackage] | None
+    """
+    plan_file = plan_file or TRANSACTION_PLAN_FILE
+    try:
+        with open(plan_file) as f:
+            plan = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        loggerinst.debug("Unable to load the transaction plan from %s: %s" % (plan_file, str(e)))
+        return None
+
+    if not isinstance(plan, dict) or plan.get("version") != _TRANSACTION_PLAN_VERSION:
+        loggerinst.debug("Ignoring the transaction plan %s of an unsupported version." % plan_file)
+        return None
+
+    if plan["state"] != _get_plan_state():
+        loggerinst.info("The system or the repositories changed since the validation of the transaction.")
+        return None
+
+    return [PlannedPackage(**planned) for planned in plan["packages"]]
+
+
+def get_pinned_packages(planned_pkgs):
+    """Get the planned packages to add to the transaction explicitly.
+
+    Installs of dependencies are left out. The dependency solver pulls them in
+    again, so the package manager records them as dependencies and not as
+    packages installed by the user.
+
+    :param planned_pkgs: The packages of the validated transaction.
+    :type planned_pkgs: list[PlannedPackage]
+    :rtype: list[PlannedPackage]
+    """
+    return [
+        planned
+        for planned in planned_pkgs
+        if planned.operation != OPERATION_INSTALL or planned.reason != REASON_DEPENDENCY
+    ]
+
+
+def remove_plan(plan_file=None):
+    """Remove the plan once the transaction is done.
+
+    :param plan_file: Where the plan is stored. Defaults to :data:`TRANSACTION_PLAN_FILE`.
+    :type plan_file: str | None
+    """
+    try:
+        os.remove(plan_file or TRANSACTION_PLAN_FILE)
+    except OSError:
+        pass
+
+
+def _get_plan_state():
+    """Get the state of the system the plan is valid for.
+
+    :return: The state, in the form it has after being stored as json.
+    :rtype: dict
+    """
+    state = {
+        "pkgmanager": pkgmanager.TYPE,
+        "enabled_repos": sorted(system_info.get_enabled_rhel_repos() or []),
+        "releasever": system_info.releasever,
+        "rpmdb": get_rpmdb_state(),
+        "repos": get_repomd_revisions(),
+    }
+    return json.loads(json.dumps(state))
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import logging
+import time
+
+from collections import OrderedDict
+
+from convert2rhel import utils
+
+
+loggerinst = logging.getLogger(__name__)
+
+# Maximum number of the progress lines per second shown on the terminal for
+# each phase of a transaction, e.g. 0.2 for a line every five seconds. With 0
+# only the summary of the phase is shown. All the progress lines always go to
+# the log file.
+PROGRESS_RATE_ENVVAR = "CONVERT2RHEL_PROGRESS_RATE"
+
+_DEFAULT_PROGRESS_RATE = 1.0
+
+
+class ProgressReporter:
+    """Show the progress of a package manager phase, e.g. the package downloads, at a limited rate.
+
+    Replacing thousands of packages reports tens of thousands of events.
+    Showing each of them on the terminal slows the transaction down, so every
+    event is written to the log file but only the first one and then at most
+    the configured number of events per second are shown. When the phase
+    finishes, a summary of all its events is shown.
+    """
+
+    def __init__(self, phase, rate=None):
+        """
+        :param phase: Name of the phase shown in the summary, e.g. "Package download".
+        :type phase: str
+        :param rate: Maximum number of the events per second to show. Defaults to :data:`PROGRESS_RATE_ENVVAR`.
+        :type rate: float | None
+        """
+        self.phase = phase
+        rate = _get_progress_rate() if rate is None else rate
+        self._interval = 1.0 / rate if rate > 0 else None
+        self._start = None
+        self._last_shown = None
+        self.counts = OrderedDict()
+
+    def report(self, message, kind, important=False):
+        """Report an event of the phase.
+
+        :param message: Description of the event, e.g. "Installing: bash-4.4.20-4.el8_6.x86_64 [1/100]".
+        :type message: str
+        :param kind: What kind of event it is, to count the events by in the summary, e.g. "Installing".
+        :type kind: str
+        :param important: Whether the event is always shown, e.g. a failed download.
+        :type important: bool
+        """
+        now = time.time()
+        if not self.counts:
+            self._start = now
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+        if important or (
+            self._interval is not None and (self._last_shown is None or now - self._last_shown >= self._interval)
+        ):
+            loggerinst.info(message)
+            self._last_shown = now
+        else:
+            loggerinst.file(message)
+
+    def finish(self):
+        """Show the summary of the events reported since the last summary, if there were any."""
+        if not self.counts:
+            return
+
+        loggerinst.info(
+            "%s finished in %.1f seconds: %s."
+            % (
+                self.phase,
+                time.time() - self._start,
+                ", ".join("%s %d" % (kind, count) for kind, count in self.counts.items()),
+            )
+        )
+        self.counts = OrderedDict()
+        self._last_shown = None
+
+
+def _get_progress_rate():
+    """Get the maximum number of the progress lines per second.
+
+    :rtype: float
+    """
+    return utils.get_env_number(PROGRESS_RATE_ENVVAR, _DEFAULT_PROGRESS_RATE, number_type=float)
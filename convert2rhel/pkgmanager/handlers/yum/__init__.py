@@ -22,9 +22,10 @@ import os
 import re
 import shutil
 
-from convert2rhel import pkgmanager, utils
+from convert2rhel import pkgmanager, timings, utils
 from convert2rhel.backup import remove_pkgs
 from convert2rhel.pkghandler import get_system_packages_for_replacement
+from convert2rhel.pkgmanager.handlers import plan
 from convert2rhel.pkgmanager.handlers.base import TransactionHandlerBase
 from convert2rhel.pkgmanager.handlers.yum.callback import PackageDownloadCallback, TransactionDisplayCallback
 from convert2rhel.systeminfo import system_info
@@ -107,6 +108,13 @@ class YumTransactionHandler(TransactionHandlerBase):
         # class needs to be instantiated through the `_set_up_base()` private
         # method.
         self._base = None
+        # Reports the downloads of all the transactions, see _enable_repos()
+        self._download_callback = PackageDownloadCallback()
+        # The operations added to the transaction, kept to add them again to
+        # a refreshed transaction when the dependency resolution fails.
+        # List of tuples of one of the plan.OPERATION_* constants and the
+        # available package, or the installed one in case of an erasure.
+        self._operations = []
 
     def _close_yum_base(self):
         """Helper method to close the yum object.
@@ -147,7 +155,7 @@ class YumTransactionHandler(TransactionHandlerBase):
         """
         self._base.repos.disableRepo("*")
         # Set the download progress display
-        self._base.repos.setProgressBar(PackageDownloadCallback())
+        self._base.repos.setProgressBar(self._download_callback)
         enabled_repos = system_info.get_enabled_rhel_repos()
         loggerinst.info("Enabling RHEL repositories:\n%s" % "\n".join(enabled_repos))
         try:
@@ -161,9 +169,13 @@ class YumTransactionHandler(TransactionHandlerBase):
         """Perform the necessary operations in the transaction.
 
         This internal method will actually perform three operations in the
-        transaction: downgrade, reinstall and downgrade. The downgrade only
-        will be executed in case of the the reinstall step raises the
-        `ReinstallInstallError`.
+        transaction: update, reinstall and downgrade. The downgrade only
+        will be executed in case the installed version of the package is not
+        available in the repositories.
+
+        The packages are classified in bulk against indexes of the rpmdb and
+        of the available packages, instead of letting yum match every single
+        package pattern against them.
         """
         original_os_pkgs = get_system_packages_for_replacement()
         self._set_up_base()
@@ -172,31 +184,124 @@ class YumTransactionHandler(TransactionHandlerBase):
         loggerinst.info("Adding %s packages to the yum transaction set.", system_info.name)
 
         try:
-            for pkg in original_os_pkgs:
-                can_update = self._base.update(pattern=pkg)
-
-                # If a package is marked for update, then we don't need to
-                # proceed with reinstall, and possibly, the downgrade of this
-                # package. This is an inconsistency that could lead to packages
-                # being outdated in the system after the conversion.
-                if can_update:
-                    continue
-
-                try:
-                    self._base.reinstall(pattern=pkg)
-                except (pkgmanager.Errors.ReinstallInstallError, pkgmanager.Errors.ReinstallRemoveError):
-                    try:
-                        self._base.downgrade(pattern=pkg)
-                    except (
-                        pkgmanager.Errors.ReinstallInstallError,
-                        pkgmanager.Errors.ReinstallRemoveError,
-                        pkgmanager.Errors.DowngradeError,
-                    ):
-                        loggerinst.warning("Package %s not available in RHEL repositories.", pkg)
+            self._operations = self._classify_packages(original_os_pkgs)
         except pkgmanager.Errors.NoMoreMirrorsRepoError as e:
             loggerinst.debug("Got the following exception message: %s", e)
             loggerinst.critical("There are no suitable mirrors available for the loaded repositories.")
 
+        self._add_operations()
+
+    def _classify_packages(self, pkgs):
+        """Find out how to replace the installed packages with the available ones.
+
+        :param pkgs: The installed packages to replace, in the "name.arch" form.
+        :type pkgs: list[str]
+        :return: The operations to add to the transaction.
+        :rtype: list[tuple[str, yum.packages.YumAvailablePackage]]
+        """
+        names = list(set(pkg.rsplit(".", 1)[0] for pkg in pkgs))
+
+        installed = {}
+        for po in self._base.rpmdb.searchNames(names):
+            installed.setdefault((po.name, po.arch), []).append(po)
+
+        available = {}
+        for po in self._base.pkgSack.searchNames(names):
+            available.setdefault((po.name, po.arch), []).append(po)
+
+        # The updates and obsoletes of all the installed packages, computed by
+        # yum at once
+        updates = {}
+        for new, old in self._base.up.getUpdatesTuples() + self._base.up.getObsoletesTuples():
+            updates[(old[0], old[1])] = new
+
+        operations = []
+        for pkg in pkgs:
+            name_arch = tuple(pkg.rsplit(".", 1))
+            installed_pkgs = installed.get(name_arch, [])
+            available_pkgs = available.get(name_arch, [])
+
+            # If a package is marked for update, then we don't need to proceed
+            # with reinstall, and possibly, the downgrade of this package. This
+            # is an inconsistency that could lead to packages being outdated in
+            # the system after the conversion.
+            if name_arch in updates:
+                operations.append((plan.OPERATION_UPGRADE, self._base.getPackageObject(updates[name_arch])))
+                continue
+
+            # All the installed versions available in the repositories, e.g.
+            # of the installonly packages like kernel. Once per version even
+            # if multiple repositories provide it.
+            same_versions = {}
+            for po in available_pkgs:
+                if any(po.verEQ(installed_po) for installed_po in installed_pkgs):
+                    same_versions.setdefault(po.pkgtup, po)
+            if same_versions:
+                operations.extend((plan.OPERATION_REINSTALL, po) for po in same_versions.values())
+                continue
+
+            # The highest version lower than the installed ones
+            lower_versions = [
+                po
+                for po in available_pkgs
+                if installed_pkgs and all(po.verLT(installed_po) for installed_po in installed_pkgs)
+            ]
+            if lower_versions:
+                highest = lower_versions[0]
+                for po in lower_versions[1:]:
+                    if po.verGT(highest):
+                        highest = po
+                operations.append((plan.OPERATION_DOWNGRADE, highest))
+                continue
+
+            loggerinst.warning("Package %s not available in RHEL repositories.", pkg)
+
+        return operations
+
+    def _add_operations(self):
+        """Add the operations to the transaction.
+
+        Operations on packages that are not installed anymore, e.g. removed
+        due to dependency problems, are skipped.
+        """
+        for operation, po in self._operations:
+            try:
+                if operation in (plan.OPERATION_REINSTALL, plan.OPERATION_ERASE):
+                    # yum reinstalls and erases the installed package
+                    installed_pkgs = self._base.rpmdb.searchPkgTuple(po.pkgtup)
+                    if not installed_pkgs:
+                        continue
+                    if operation == plan.OPERATION_REINSTALL:
+                        self._base.reinstall(po=installed_pkgs[0])
+                    else:
+                        self._base.remove(po=installed_pkgs[0])
+                elif operation == plan.OPERATION_UPGRADE:
+                    self._base.update(po=po)
+                elif operation == plan.OPERATION_DOWNGRADE:
+                    if not self._base.rpmdb.contains(name=po.name, arch=po.arch):
+                        continue
+                    self._base.downgrade(po=po)
+                else:
+                    self._base.install(po=po)
+            except (
+                pkgmanager.Errors.ReinstallInstallError,
+                pkgmanager.Errors.ReinstallRemoveError,
+                pkgmanager.Errors.DowngradeError,
+            ):
+                loggerinst.warning("Package %s.%s not available in RHEL repositories.", po.name, po.arch)
+
+    def _refresh_transaction(self):
+        """Add the operations again to an empty transaction with the installed packages reloaded.
+
+        Used after the dependency resolution failed, possibly having removed
+        the problematic packages from the system. The YumBase with the loaded
+        repository metadata and the classified operations are kept.
+        """
+        # Drops the transaction set and the installed packages, they are
+        # reloaded on the next access
+        self._base.closeRpmDB()
+        self._add_operations()
+
     def _resolve_dependencies(self, validate_transaction):
         """Try to resolve the transaction dependencies.
 
@@ -230,7 +335,8 @@ class YumTransactionHandler(TransactionHandlerBase):
         :rtype: bool
         """
         loggerinst.info("Resolving the dependencies of the packages in the yum transaction set.")
-        ret_code, msg = self._base.resolveDeps()
+        with timings.trace.span("Dependency resolution", "pkgmanager"):
+            ret_code, msg = self._base.resolveDeps()
 
         if ret_code == 1:
             # For the return code 1, yum can output two kinds of error, one being
@@ -273,10 +379,13 @@ class YumTransactionHandler(TransactionHandlerBase):
                 system_info.name,
             )
 
+        transaction_callback = TransactionDisplayCallback()
         try:
-            self._base.processTransaction(
-                rpmDisplay=TransactionDisplayCallback(),
-            )
+            # The packages are downloaded as a part of the transaction
+            with timings.trace.span("Transaction", "pkgmanager", {"test": validate_transaction}):
+                self._base.processTransaction(
+                    rpmDisplay=transaction_callback,
+                )
         except pkgmanager.Errors.YumBaseError as e:
             # We are catching only `pkgmanager.Errors.YumBaseError` as the base
             # exception here because all of the other exceptions that can be
@@ -294,11 +403,87 @@ class YumTransactionHandler(TransactionHandlerBase):
             loggerinst.debug("Got the following exception message: %s", e)
             loggerinst.critical("Failed to validate the yum transaction.")
 
+        self._download_callback.finish()
+        transaction_callback.finish()
+
         if validate_transaction:
             loggerinst.info("Successfully validated the yum transaction set.")
         else:
             loggerinst.info("System packages replaced successfully.")
 
+    def _get_planned_packages(self):
+        """Get the packages of the resolved transaction.
+
+        :rtype: list[plan.PlannedPackage]
+        """
+        planned_pkgs = []
+        for txmbr in self._base.tsInfo.getMembers():
+            if txmbr.output_state in pkgmanager.TS_INSTALL_STATES:
+                if txmbr.reinstall:
+                    operation = plan.OPERATION_REINSTALL
+                elif txmbr.downgrades:
+                    operation = plan.OPERATION_DOWNGRADE
+                elif txmbr.output_state == pkgmanager.TS_UPDATE:
+                    operation = plan.OPERATION_UPGRADE
+                else:
+                    operation = plan.OPERATION_INSTALL
+                checksum = "%s:%s" % txmbr.po.returnIdSum()
+                reason = plan.REASON_DEPENDENCY if txmbr.isDep else plan.REASON_USER
+                planned_pkgs.append(_create_planned_package(txmbr.po, operation, checksum, txmbr.po.localPkg(), reason))
+            elif txmbr.output_state == pkgmanager.TS_ERASE:
+                planned_pkgs.append(_create_planned_package(txmbr.po, plan.OPERATION_ERASE))
+
+        return planned_pkgs
+
+    def _replay_plan(self, planned_pkgs):
+        """Add the packages of the validated transaction to the transaction.
+
+        The exact packages of the plan are added, so there's no need to match
+        the system packages against the repositories again. Newly installed
+        dependencies are left to the dependency solver.
+
+        :param planned_pkgs: The packages of the validated transaction.
+        :type planned_pkgs: list[plan.PlannedPackage]
+        :return: False if any of the planned packages is not available anymore.
+        :rtype: bool
+        """
+        self._set_up_base()
+        self._enable_repos()
+
+        loggerinst.info("Adding the packages of the validated transaction to the yum transaction set.")
+        operations = []
+        try:
+            for planned in plan.get_pinned_packages(planned_pkgs):
+                nevra = {
+                    "name": planned.name,
+                    "epoch": planned.epoch,
+                    "ver": planned.version,
+                    "rel": planned.release,
+                    "arch": planned.arch,
+                }
+                if planned.operation in (plan.OPERATION_ERASE, plan.OPERATION_REINSTALL):
+                    # yum reinstalls the installed package
+                    pkgs = self._base.rpmdb.searchNevra(**nevra)
+                else:
+                    pkgs = [
+                        pkg
+                        for pkg in self._base.pkgSack.searchNevra(**nevra)
+                        if "%s:%s" % pkg.returnIdSum() == planned.checksum
+                    ]
+
+                if not pkgs:
+                    loggerinst.info("The package %s of the validated transaction is not available." % planned.name)
+                    return False
+
+                operations.append((planned.operation, pkgs[0]))
+        except pkgmanager.Errors.YumBaseError as e:
+            loggerinst.debug("Got the following exception message: %s", e)
+            return False
+
+        self._operations = operations
+        self._add_operations()
+        return True
+
     @utils.run_as_child_process
     def run_transaction(self, validate_transaction=False):
         """Run the yum transaction.
@@ -324,23 +509,17 @@ class YumTransactionHandler(TransactionHandlerBase):
             this, we need to loop through a couple of times until we know that
             all of the dependencies are resolved without problems.
 
-            You might wonder "why not remove the packages that caused a
-            failure and loop through the dep solving again?" Well. Since
-            we are removing the problematic packages using `rpm` and not some
-            specific method in the transaction itself, yum doesn't know that
-            something has changed (The resolveDeps() function doesn't refresh
-            if something else happens outside the transaction), in order to
-            make sure that we won't have any problems with our transaction, it
-            is easier to loop through everything again and just recreate the
-            transaction, so yum will keep track of what's changed.
+            Since we are removing the problematic packages using `rpm` and
+            not some specific method in the transaction itself, yum doesn't
+            know that something has changed (The resolveDeps() function
+            doesn't refresh if something else happens outside the
+            transaction). Before every retry, the installed packages are
+            reloaded and the operations added again to an empty transaction,
+            skipping the packages that are not installed anymore. The
+            YumBase with the loaded repository metadata is kept.
 
             This function should loop max 3 times to get to the point where our
-            transaction doesn't have any problematic packages in there, and the
-            subsequent transactions are "faster" because of some yum internal
-            cache mechanism.
-
-            This might be optimized in the future, but for now, it's somewhat
-            reliable.
+            transaction doesn't have any problematic packages in there.
 
         :param vaidate_transaction: Determines if the transaction needs to be
             validated or not.
@@ -350,13 +529,25 @@ class YumTransactionHandler(TransactionHandlerBase):
         resolve_deps_finished = False
         # Do not allow this to loop until eternity.
         attempts = 0
+        # The replacement replays the packages of the validated transaction
+        # instead of matching every system package against the repositories
+        # again.
+        if validate_transaction:
+            plan.remove_plan()
+            planned_pkgs = None
+        else:
+            planned_pkgs = plan.load_plan()
         try:
-            while attempts <= MAX_NUM_OF_ATTEMPTS_TO_RESOLVE_DEPS:
+            if not planned_pkgs or not self._replay_plan(planned_pkgs):
                 self._perform_operations()
+
+            while attempts <= MAX_NUM_OF_ATTEMPTS_TO_RESOLVE_DEPS:
                 resolved = self._resolve_dependencies(validate_transaction)
                 if not resolved:
                     loggerinst.info("Retrying to resolve dependencies %s", attempts)
                     attempts += 1
+                    if attempts <= MAX_NUM_OF_ATTEMPTS_TO_RESOLVE_DEPS:
+                        self._refresh_transaction()
                 else:
                     resolve_deps_finished = True
                     break
@@ -364,6 +555,23 @@ class YumTransactionHandler(TransactionHandlerBase):
             if not resolve_deps_finished:
                 loggerinst.critical("Failed to resolve dependencies in the transaction.")
 
+            if validate_transaction:
+                planned_pkgs = self._get_planned_packages()
             self._process_transaction(validate_transaction)
+
+            if validate_transaction:
+                plan.save_plan(planned_pkgs)
+            else:
+                plan.remove_plan()
         finally:
             self._close_yum_base()
+
+
+def _create_planned_package(pkg, operation, checksum=None, path=None, reason=plan.REASON_USER):
+    """
+    :type pkg: yum.packages.YumAvailablePackage | yum.rpmsack.RPMInstalledPackage
+    :rtype: plan.PlannedPackage
+    """
+    return plan.PlannedPackage(
+        pkg.name, pkg.epoch, pkg.version, pkg.release, pkg.arch, operation, checksum, path, reason
+    )
@@ -58,7 +58,8 @@
 #
 import logging
 
-from convert2rhel import pkgmanager
+from convert2rhel import pkgmanager, timings
+from convert2rhel.pkgmanager.handlers.progress import ProgressReporter
 
 
 loggerinst = logging.getLogger(__name__)
@@ -80,6 +81,7 @@ class PackageDownloadCallback(pkgmanager.DownloadProgress, object):
         # hold the last package name to not print it twice, avoiding
         # spamming msgs.
         self.last_package_seen = None
+        self._reporter = ProgressReporter("Package download")
 
     def updateProgress(self, name, frac, fread, ftime):
         """Update and output the message that we sent to the user.
@@ -104,12 +106,17 @@ class PackageDownloadCallback(pkgmanager.DownloadProgress, object):
         if self.last_package_seen != name:
             # Metadata download abut repositories will be sent to this class too.
             if name.endswith(".rpm"):
-                loggerinst.info("Downloading package: %s", name)
+                self._reporter.report("Downloading package: %s" % name, "Downloaded")
             else:
                 loggerinst.debug("Downloading repository metadata: %s", name)
+            timings.trace.instant("Downloading %s" % name, "download")
 
         self.last_package_seen = name
 
+    def finish(self):
+        """Show the summary of the downloads, to be called once all the packages are downloaded."""
+        self._reporter.finish()
+
 
 class TransactionDisplayCallback(pkgmanager.TransactionDisplay, object):
     """Transaction display callback for YUM transaction."""
@@ -120,6 +127,7 @@ class TransactionDisplayCallback(pkgmanager.TransactionDisplay, object):
         # Hold the last package name to not print it twice, avoiding
         # spamming msgs.
         self.last_package_seen = None
+        self._reporter = ProgressReporter("Transaction")
 
     def event(self, package, action, te_current, te_total, ts_current, ts_total):
         """Process and output the RPM operations in the transaction.
@@ -160,10 +168,18 @@ class TransactionDisplayCallback(pkgmanager.TransactionDisplay, object):
         # not matter if it is the same update or not, so, the below statement
         # prevents the same message being sent more than once to the user.
         if self.last_package_seen != package:
-            loggerinst.info(message)
+            self._reporter.report(message, self.action[action])
+            # The span of the previous package, including its scriptlets,
+            # ends here. The last one ends with the transaction.
+            timings.trace.end(str(self.last_package_seen))
+            timings.trace.begin(package, "rpm", {"action": self.action[action]})
 
         self.last_package_seen = package
 
+    def finish(self):
+        """Show the summary of the transaction, to be called once the transaction finishes."""
+        self._reporter.finish()
+
     def scriptout(self, package, msgs):
         """Hook for reporting output from an rpm scriptlet.
 
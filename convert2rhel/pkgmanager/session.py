@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import logging
+import os
+
+from convert2rhel import pkgmanager, utils
+
+
+loggerinst = logging.getLogger(__name__)
+
+# Directory holding the rpm database
+RPMDB_PATH = "/var/lib/rpm"
+
+# Files in the rpmdb directory which are modified on every rpm transaction
+# (bdb, sqlite and ndb backends). The environment and lock files are left out
+# on purpose as they change on plain reads as well.
+_RPMDB_FILES = ("Packages", "Packages.db", "rpmdb.sqlite", "rpmdb.sqlite-wal")
+
+
+def get_rpmdb_state(rpmdb_path=RPMDB_PATH):
+    """Return a value that changes whenever the rpmdb is modified.
+
+    :param rpmdb_path: The directory holding the rpm database.
+    :type rpmdb_path: str
+    :return: Tuple of the inode, mtime and size of the rpmdb files or None
+        if none of them could be found.
+    :rtype: tuple | None
+    """
+    state = []
+    for filename in _RPMDB_FILES:
+        try:
+            stat = os.stat(os.path.join(rpmdb_path, filename))
+        except OSError:
+            continue
+        state.append((filename, stat.st_ino, stat.st_mtime, stat.st_size))
+
+    return tuple(state) or None
+
+
+class _ManagedBase:
+    """A yum/dnf base object kept by :class:`PackageManagerSession`."""
+
+    def __init__(self, base, load_available_repos):
+        self.base = base
+        self.load_available_repos = load_available_repos
+        self.system_repo_stale = False
+
+
+class PackageManagerSession:
+    """Keep yum/dnf base objects loaded across the conversion.
+
+    Creating a base object and loading the repository metadata into it is
+    expensive, especially with big repositories like the RHEL ones. The
+    session keeps one base object per repository configuration so that the
+    metadata is loaded once and reused by every following query or
+    transaction with the same configuration.
+
+    Only the installed packages (the @System repository) are reloaded once
+    the rpmdb changes, either when it's detected on disk or after an explicit
+    :meth:`refresh_system_repo` call.
+    """
+
+    def __init__(self, rpmdb_path=RPMDB_PATH):
+        self.rpmdb_path = rpmdb_path
+        self._bases = {}
+        self._rpmdb_state = None
+
+    def get_base(self, key, create, load_available_repos=True):
+        """Get the base object of a repository configuration.
+
+        :param key: Identifies the repository configuration, e.g. the enabled repositories and the releasever.
+        :type key: Hashable
+        :param create: Called when there's no base object of the configuration yet. Returns a new base object with
+            the configuration applied and, in case of dnf, the sack filled.
+        :type create: Callable[[], yum.YumBase | dnf.Base]
+        :param load_available_repos: Whether the sack of the base object contains the available repositories or just
+            the installed packages. Used to reload the sack the same way when the rpmdb changes.
+        :type load_available_repos: bool
+        :return: The base object, ready for a new query or transaction.
+        :rtype: yum.YumBase | dnf.Base
+        """
+        self._check_rpmdb()
+
+        managed = self._bases.get(key)
+        if managed is None:
+            managed = _ManagedBase(create(), load_available_repos)
+            self._bases[key] = managed
+        elif managed.system_repo_stale:
+            loggerinst.debug("Reloading the installed packages into the loaded %s metadata." % pkgmanager.TYPE)
+            _reload_system_repo(managed)
+
+        managed.system_repo_stale = False
+        return managed.base
+
+    def release_base(self, key):
+        """Release the rpmdb handles a base object holds after a query or a transaction.
+
+        The loaded repository metadata is kept for the next :meth:`get_base` call.
+
+        :param key: The key the base object was got with.
+        :type key: Hashable
+        """
+        managed = self._bases.get(key)
+        if managed is None:
+            return
+
+        if pkgmanager.TYPE == "yum":
+            managed.base.closeRpmDB()
+        else:
+            # Drop the resolved goal and the rpm transaction set. A new one is
+            # created with the current tsflags by the next transaction.
+            managed.base.reset(goal=True)
+            del managed.base._ts
+
+    def refresh_system_repo(self):
+        """Reload the installed packages on the next use of every base object.
+
+        To be called after anything changes the rpmdb, e.g. a package removal.
+        """
+        for managed in self._bases.values():
+            managed.system_repo_stale = True
+
+    def close_base(self, key):
+        """Close a base object and forget it.
+
+        :param key: The key the base object was got with.
+        :type key: Hashable
+        """
+        managed = self._bases.pop(key, None)
+        if managed is not None:
+            managed.base.close()
+
+    def close(self):
+        """Close all the base objects."""
+        for key in list(self._bases):
+            self.close_base(key)
+        self._rpmdb_state = None
+
+    def _check_rpmdb(self):
+        """Mark the installed packages of every base object as stale if the rpmdb changed on disk."""
+        rpmdb_state = get_rpmdb_state(self.rpmdb_path)
+        if rpmdb_state != self._rpmdb_state:
+            if self._rpmdb_state is not None:
+                self.refresh_system_repo()
+            self._rpmdb_state = rpmdb_state
+
+
+def _reload_system_repo(managed):
+    """Reload the installed packages of a base object, keeping the loaded repository metadata.
+
+    :type managed: _ManagedBase
+    """
+    base = managed.base
+    if pkgmanager.TYPE == "yum":
+        # The rpmdb is opened again on the next access. The metadata of the
+        # available repositories (the pkgSack) stays loaded.
+        base.closeRpmDB()
+        return
+
+    # The repositories stay set up and their metadata are read from the solv
+    # cache dnf wrote on the first load. Only the @System repository is read
+    # from the rpmdb again.
+    base.reset(sack=True, goal=True)
+    base.fill_sack(load_system_repo=True, load_available_repos=managed.load_available_repos)
+
+
+session = PackageManagerSession()  # pylint: disable=C0103
+utils.register_cache(session.close)
@@ -0,0 +1,378 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+from convert2rhel import utils
+
+
+loggerinst = logging.getLogger(__name__)
+
+# Results of the previous queries, shared between the convert2rhel runs.
+REPOQUERY_CACHE_FILE = os.path.join(utils.TMP_DIR, "repoquery-cache.json")
+
+# To be changed whenever the structure of the cache file changes. Caches of
+# other versions are ignored.
+_REPOQUERY_CACHE_VERSION = 1
+
+# Number of seconds the results stored in REPOQUERY_CACHE_FILE are reused
+# for. The on-disk cache is used only when this is set to a positive number.
+REPOQUERY_CACHE_TTL_ENVVAR = "CONVERT2RHEL_REPOQUERY_CACHE_TTL"
+
+# The repomd.xml files of the repositories in the yum and dnf caches. Their
+# revision changes with every update of the repository metadata.
+_REPOMD_GLOBS = (
+    "/var/cache/dnf/*/repodata/repomd.xml",
+    "/var/cache/yum/*/*/*/repomd.xml",
+)
+_REPOMD_REVISION = re.compile(r"<revision>\s*([^<\s]*)\s*</revision>")
+
+# Every record printed by repoquery starts with the marker so that it can be
+# told apart from anything else repoquery prints out, e.g. the warnings about
+# unavailable repositories. The fields are separated by tabs.
+_RECORD_MARKER = "C2R"
+_FIELD_SEPARATOR = "\t"
+
+
+class RepoQueryError(Exception):
+    """Raised when repoquery fails."""
+
+    def __init__(self, message, output="", returncode=None):
+        super(RepoQueryError, self).__init__(message)
+        self.output = output
+        self.returncode = returncode
+
+
+class RepoQuery:
+    """Run repoquery queries and keep their results.
+
+    Every query is identified by the repository configuration (reposdir,
+    enabled and disabled repositories, releasever and options) together with
+    the query arguments and the requested fields. The results are kept for the
+    rest of the run, optionally also on disk, see
+    :data:`REPOQUERY_CACHE_TTL_ENVVAR`.
+
+    Loading the repository metadata is what makes repoquery slow. Once a query
+    with a repository configuration succeeds, the metadata of its repositories
+    is in the yum/dnf cache so the following queries with the same
+    configuration are run from the cache (``-C``) instead of checking the
+    repositories for updated metadata again.
+
+    The queries can be run from several threads, e.g. by the system checks
+    running in parallel. They run one at a time.
+    """
+
+    def __init__(self, cache_file=REPOQUERY_CACHE_FILE):
+        self.cache_file = cache_file
+        self._lock = threading.Lock()
+        self._results = {}
+        self._warm_repo_configs = set()
+
+    def query(
+        self,
+        args,
+        fields=None,
+        reposdir=None,
+        enable_repos=None,
+        disable_repos=None,
+        repoids=None,
+        releasever=None,
+        setopts=None,
+    ):
+        """Run a repoquery query.
+
+        :param args: The query, e.g. ``["kernel"]`` or ``["-l", "kernel-core"]``.
+        :type args: list[str]
+        :param fields: Names of the package tags to return for every package, e.g. ``("name", "repoid")``. When not
+            given, the lines of the repoquery output are returned, e.g. the file paths of a ``-l`` query.
+        :type fields: Sequence[str] | None
+        :param reposdir: The directory with the repofiles to use instead of the system ones.
+        :type reposdir: str | None
+        :param enable_repos: Repositories to enable.
+        :type enable_repos: Sequence[str] | None
+        :param disable_repos: Repositories to disable.
+        :type disable_repos: Sequence[str] | None
+        :param repoids: Query only these repositories.
+        :type repoids: Sequence[str] | None
+        :param releasever: The $releasever to use in the repofiles.
+        :type releasever: str | None
+        :param setopts: Additional yum/dnf options, e.g. ``("exclude=",)``.
+        :type setopts: Sequence[str] | None
+        :raises RepoQueryError: When repoquery fails.
+        :return: A tuple of the values of the fields for every package found, or the output lines when no fields
+            were requested.
+        :rtype: list[tuple[str, ...]] | list[str]
+        """
+        repo_config = (
+            reposdir,
+            tuple(enable_repos or ()),
+            tuple(disable_repos or ()),
+            tuple(repoids or ()),
+            releasever,
+            tuple(setopts or ()),
+        )
+        key = repo_config + (tuple(args), tuple(fields) if fields else None)
+        with self._lock:
+            return list(self._query(key, repo_config, args, fields))
+
+    def _query(self, key, repo_config, args, fields):
+        """Get the result of a query, from the results kept so far or by running repoquery. Expects the lock to be held.
+
+        :raises RepoQueryError: When repoquery fails.
+        :rtype: list[tuple[str, ...]] | list[str]
+        """
+        if key in self._results:
+            return self._results[key]
+
+        result = self._load_cached_result(key)
+        if result is None:
+            cmd = _get_repoquery_cmd(repo_config, args, fields)
+            if repo_config in self._warm_repo_configs:
+                try:
+                    result = self._run(cmd[:1] + ["-C"] + cmd[1:], fields)
+                except RepoQueryError as e:
+                    loggerinst.debug("Querying the cached repository metadata failed: %s" % str(e))
+
+            if result is None:
+                result = self._run(cmd, fields)
+                self._warm_repo_configs.add(repo_config)
+
+            self._store_cached_result(key, result)
+
+        self._results[key] = result
+        return result
+
+    def clear(self):
+        """Forget the results of the queries run so far, e.g. after the repositories changed."""
+        with self._lock:
+            self._results.clear()
+            self._warm_repo_configs.clear()
+
+    def _run(self, cmd, fields):
+        """Run repoquery and parse its output.
+
+        :raises RepoQueryError: When repoquery fails.
+        :rtype: list[tuple[str, ...]] | list[str]
+        """
+        output, returncode = utils.run_subprocess(cmd, print_output=False)
+        if returncode != 0:
+            raise RepoQueryError(
+                "repoquery exited with return code %s." % returncode, output=output, returncode=returncode
+            )
+
+        if not fields:
+            return [line.strip() for line in output.splitlines() if line.strip()]
+
+        records = []
+        for line in output.splitlines():
+            values = line.lstrip().split(_FIELD_SEPARATOR)
+            if values[0] != _RECORD_MARKER or len(values) != len(fields) + 1:
+                # Mainly for debugging purposes, anything else repoquery printed out
+                loggerinst.debug("Got a line without the %s identifier: %s" % (_RECORD_MARKER, line))
+                continue
+            records.append(tuple(values[1:]))
+
+        return records
+
+    def _load_cached_result(self, key):
+        """Get the result of a query stored in the on-disk cache.
+
+        :return: The result, or None if the cache is disabled or has no valid result of the query.
+        :rtype: list | None
+        """
+        ttl = _get_cache_ttl()
+        if not ttl:
+            return None
+
+        entry = _load_cache(self.cache_file)["queries"].get(_serialize_key(key))
+        if not entry:
+            return None
+
+        if time.time() - entry["time"] > ttl or entry["revisions"] != get_repomd_revisions():
+            loggerinst.debug("The cached result of the repoquery query is outdated.")
+            return None
+
+        loggerinst.debug("Using the cached result of the repoquery query.")
+        return [tuple(item) if isinstance(item, list) else item for item in entry["result"]]
+
+    def _store_cached_result(self, key, result):
+        """Store the result of a query in the on-disk cache, if enabled.
+
+        The results which are not valid anymore are dropped from the cache.
+        """
+        ttl = _get_cache_ttl()
+        if not ttl:
+            return
+
+        now = time.time()
+        # Read after the query as repoquery might have just updated the metadata
+        revisions = get_repomd_revisions()
+        cache = _load_cache(self.cache_file)
+        for serialized_key, entry in list(cache["queries"].items()):
+            if now - entry["time"] > ttl or entry["revisions"] != revisions:
+                del cache["queries"][serialized_key]
+
+        cache["queries"][_serialize_key(key)] = {"time": now, "revisions": revisions, "result": result}
+        _save_cache(self.cache_file, cache)
+
+
+def _get_repoquery_cmd(repo_config, args, fields):
+    """Assemble the repoquery command.
+
+    :rtype: list[str]
+    """
+    reposdir, enable_repos, disable_repos, repoids, releasever, setopts = repo_config
+
+    cmd = ["repoquery", "--quiet"]
+    for repo in disable_repos:
+        cmd.append("--disablerepo=%s" % repo)
+    for repo in enable_repos:
+        cmd.append("--enablerepo=%s" % repo)
+    for repoid in repoids:
+        cmd.extend(("--repoid", repoid))
+    if releasever:
+        cmd.append("--releasever=%s" % releasever)
+    if reposdir:
+        cmd.append("--setopt=reposdir=%s" % reposdir)
+    for setopt in setopts:
+        cmd.append("--setopt=%s" % setopt)
+
+    if fields:
+        # yum and dnf repoquery both expand the \t escape sequence
+        query_format = "\\t".join([_RECORD_MARKER] + ["%%{%s}" % field.upper() for field in fields])
+        cmd.extend(("--qf", query_format))
+
+    cmd.extend(args)
+    return cmd
+
+
+def _get_cache_ttl():
+    """Get the number of seconds the on-disk results are valid for.
+
+    :return: The number of seconds. 0 when the on-disk cache is disabled.
+    :rtype: int
+    """
+    return utils.get_env_number(REPOQUERY_CACHE_TTL_ENVVAR, 0)
+
+
+def get_repomd_revisions():
+    """Get the revisions of the repository metadata in the yum and dnf caches.
+
+    :return: Mapping of the paths of the repomd.xml files to their revisions. The mtime is used for the files without
+        a revision.
+    :rtype: dict[str, str]
+    """
+    revisions = {}
+    for pattern in _REPOMD_GLOBS:
+        for path in glob.glob(pattern):
+            try:
+                match = _REPOMD_REVISION.search(utils.get_file_content(path))
+                revisions[path] = match.group(1) if match else str(os.stat(path).st_mtime)
+            except (IOError, OSError):
+                continue
+
+    return revisions
+
+
+def _serialize_key(key):
+    """Serialize the key of a query for the on-disk cache.
+
+    The reposdir is represented by the content of its repofiles rather than
+    by its path. The reposdirs with a downloaded repofile are temporary
+    directories with a different path on every run.
+
+    :rtype: str
+    """
+    reposdir = key[0]
+    if reposdir:
+        key = (_get_repofiles_digest(reposdir),) + tuple(key[1:])
+    return json.dumps(key)
+
+
+def _get_repofiles_digest(reposdir):
+    """Get a digest of the names and the content of the repofiles in a directory.
+
+    :return: The digest. The path of the directory when the repofiles can't be read.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    try:
+        for path in sorted(glob.glob(os.path.join(reposdir, "*.repo"))):
+            digest.update(json.dumps(os.path.basename(path)).encode("ascii"))
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    except (IOError, OSError) as e:
+        loggerinst.debug("Unable to read the repofiles in %s: %s" % (reposdir, str(e)))
+        return reposdir
+
+    return "repofiles:%s" % digest.hexdigest()
+
+
+def _load_cache(cache_file):
+    """Load the on-disk cache.
+
+    :return: The cache. An empty one if there's no usable cache file.
+    :rtype: dict
+    """
+    empty_cache = {"version": _REPOQUERY_CACHE_VERSION, "queries": {}}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        loggerinst.debug("Unable to load the repoquery cache from %s: %s" % (cache_file, str(e)))
+        return empty_cache
+
+    if not isinstance(cache, dict) or cache.get("version") != _REPOQUERY_CACHE_VERSION:
+        loggerinst.debug("Ignoring the repoquery cache %s of an unsupported version." % cache_file)
+        return empty_cache
+
+    return cache
+
+
+def _save_cache(cache_file, cache):
+    """Store the on-disk cache.
+
+    Failing to store the cache is not fatal, the queries are just going to be
+    run again the next time.
+    """
+    cache_dir = os.path.dirname(cache_file)
+    tmp_file = None
+    try:
+        utils.mkdir_p(cache_dir)
+        # Unique, another convert2rhel process might be storing the cache at the same time. Created with 0600.
+        fd, tmp_file = tempfile.mkstemp(prefix="%s." % os.path.basename(cache_file), suffix=".tmp", dir=cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        loggerinst.debug("Unable to store the repoquery cache to %s: %s" % (cache_file, str(e)))
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+repo_query = RepoQuery()  # pylint: disable=C0103
+utils.register_cache(repo_query.clear)
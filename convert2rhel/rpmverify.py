@@ -0,0 +1,507 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+import rpm
+
+from convert2rhel import utils
+
+
+loggerinst = logging.getLogger(__name__)
+
+# Results of the previous package verification. Used to verify only the
+# packages that changed since then.
+RPM_VA_CACHE_FILE = os.path.join(utils.TMP_DIR, "rpm-va-cache.json")
+
+# To be changed whenever the structure of the cache file changes. Caches of
+# other versions are ignored.
+_RPM_VA_CACHE_VERSION = 3
+
+# When more than this ratio of the installed packages changed, e.g. right
+# after the conversion, one `rpm -Va` is faster than passing all of them to
+# `rpm -V`.
+_FULL_VERIFICATION_RATIO = 0.5
+
+# Number of the `rpm -V` processes to verify the packages with. Defaults to the
+# number of CPUs. Set to 1 to verify all the packages with a single `rpm -Va`.
+RPM_VA_JOBS_ENVVAR = "CONVERT2RHEL_RPM_VA_JOBS"
+
+# The packages are split into more shards than there are processes so that
+# a shard with large packages doesn't leave the other processes idle.
+_SHARDS_PER_JOB = 4
+
+# Verification of the files of the changed packages. Their dependencies and
+# %verify scriptlets are checked for all the packages by _VERIFY_NOFILES_CMD,
+# as those can change without the package itself changing.
+_VERIFY_FILES_CMD = ("rpm", "-V", "--nodeps", "--noscripts")
+_VERIFY_NOFILES_CMD = ("rpm", "-Va", "--nofiles")
+
+# Label passed to `rpm -V`. The gpg-pubkey packages have no arch.
+_PKG_LABEL_QUERYFORMAT = "%{NAME}-%{VERSION}-%{RELEASE}%|ARCH?{.%{ARCH}}|"
+# Anything that changes in the rpmdb header of a package, including the
+# digests of its files, changes the header digest. The install transaction id
+# covers reinstalls of the very same package.
+_PKG_HEADER_ID_QUERYFORMAT = "%{SHA1HEADER}:%{INSTALLTID}"
+
+# A problem with a file of a package, e.g.:
+#   S.5....T.  c /etc/yum.conf
+#   missing     /usr/share/doc/foo/README
+_RPM_VERIFY_FILE_LINE = re.compile(r"^(?:[SM5DLUGTP.?]{8,9}|missing)\s+(?:[cdglr]\s+)?(/.*)$")
+
+
+def generate_rpm_va(output_file, cache_file=None):
+    """Verify the installed packages and write the output of the verification in the `rpm -Va` format.
+
+    The header id of every package, a digest of the stat of its files and its
+    verification output are stored in a cache file. On the following runs, only the
+    packages that were installed or updated since then, or that have a file
+    whose size, mtime, ctime, inode, mode or owner changed, have their files
+    verified with `rpm -V`. The output of the rest of the packages is taken
+    from the cache. The dependencies and the %verify scriptlets of all the
+    packages are checked on every run, removing a package breaks the
+    dependencies of other, unchanged, packages.
+
+    All the packages are verified when there's no usable cache or when most
+    of the packages changed. The packages to verify are split into shards
+    verified by parallel `rpm -V` processes, see :data:`RPM_VA_JOBS_ENVVAR`.
+    The output is assigned to the packages line by line as the rpm processes
+    print it and written in the rpmdb order, the same order `rpm -Va` prints
+    it in. The cache file is only rewritten when something changed.
+
+    :param output_file: Path to the file to write the output to.
+    :type output_file: str
+    :param cache_file: Path to the cache of the previous verification. Defaults to :data:`RPM_VA_CACHE_FILE`.
+    :type cache_file: str | None
+    """
+    cache_file = cache_file or RPM_VA_CACHE_FILE
+    try:
+        installed_pkgs = _read_installed_pkg_files()
+    except (rpm.error, utils.UnableToSerialize) as e:
+        loggerinst.debug("Unable to read the rpmdb, verifying all the packages: %s" % str(e))
+        utils.StreamedSubprocess(["rpm", "-Va"], print_output=False, output_file=output_file).wait()
+        return
+
+    cache = _load_cache(cache_file)
+    cached_pkgs = cache["packages"]
+
+    pkgs_to_verify = []
+    files_digest = {}
+    for label, header_id, paths in installed_pkgs:
+        files_digest[label] = _get_files_digest(paths)
+        cached = cached_pkgs.get(label)
+        if not cached or cached["header"] != header_id or cached["files"] != files_digest[label]:
+            pkgs_to_verify.append(label)
+
+    pkgs_files = dict((label, paths) for label, _, paths in installed_pkgs)
+    jobs = _get_rpm_va_jobs()
+    verify_all = not cache["complete"] or len(pkgs_to_verify) > len(installed_pkgs) * _FULL_VERIFICATION_RATIO
+    streamed = False
+    if verify_all:
+        loggerinst.debug("Verifying all the installed packages.")
+        pkgs_to_verify = [label for label, _, _ in installed_pkgs]
+        if jobs > 1 and len(pkgs_to_verify) > 1:
+            pkgs_output, other_output = _verify_pkgs(pkgs_to_verify, pkgs_files, jobs)
+        else:
+            # The output of rpm -Va is written to the output file as is while it's being assigned to the packages
+            output = _run_rpm_verify(["rpm", "-Va"], output_file)
+            pkgs_output, other_output = _assign_output_to_pkgs(output, pkgs_to_verify, pkgs_files)
+            streamed = True
+    else:
+        loggerinst.debug(
+            "Verifying %d changed packages, reusing the cached results of the other %d packages."
+            % (len(pkgs_to_verify), len(installed_pkgs) - len(pkgs_to_verify))
+        )
+        pkgs_output, other_output = {}, []
+        if pkgs_to_verify:
+            pkgs_output, other_output = _verify_pkgs(pkgs_to_verify, pkgs_files, jobs, cmd=_VERIFY_FILES_CMD)
+        other_output = list(_run_rpm_verify(list(_VERIFY_NOFILES_CMD))) + other_output
+
+    # The lines about the dependencies and the scriptlets are not cached, only
+    # the lines about files not owned by any of the packages make the cache
+    # unusable
+    complete = not any(_RPM_VERIFY_FILE_LINE.match(line) for line in other_output)
+    new_cache = {"version": _RPM_VA_CACHE_VERSION, "complete": complete, "packages": {}}
+    for label, header_id, _ in installed_pkgs:
+        new_cache["packages"][label] = {
+            "header": header_id,
+            "files": files_digest[label],
+            "output": pkgs_output[label] if label in pkgs_output else cached_pkgs[label]["output"],
+        }
+
+    if not streamed:
+        # The output of the files is in the order rpm -Va would print it in
+        with open(output_file, "w") as f:
+            for line in other_output:
+                f.write("%s\n" % line)
+            for label, _, _ in installed_pkgs:
+                for line in new_cache["packages"][label]["output"]:
+                    f.write("%s\n" % line)
+
+    if new_cache != cache:
+        _save_cache(cache_file, new_cache)
+
+
+def diff_rpm_va(pre_output_file, post_output_file):
+    """Compare the rpm -Va outputs from before and after the conversion.
+
+    The lines are matched by the path of the file they are about, other lines,
+    e.g. about unsatisfied dependencies, by their whole content. Only the
+    output from before the conversion is held in memory, the output from after
+    the conversion is streamed through.
+
+    :param pre_output_file: Path to the rpm -Va output from before the conversion.
+    :type pre_output_file: str
+    :param post_output_file: Path to the rpm -Va output from after the conversion.
+    :type post_output_file: str
+    :return: The lines only in the output from after the conversion ("added"), only in the output from before the
+        conversion ("removed") and the pairs of the lines from before and after the conversion of the files whose
+        verification flags changed ("changed"). All sorted by the file path.
+    :rtype: dict[str, list]
+    """
+    pre_lines = {}
+    for line in _read_rpm_va_output(pre_output_file):
+        pre_lines.setdefault(_get_rpm_va_line_key(line), []).append(line)
+
+    post_only_lines = {}
+    for line in _read_rpm_va_output(post_output_file):
+        key = _get_rpm_va_line_key(line)
+        same_key_lines = pre_lines.get(key, ())
+        if line in same_key_lines:
+            same_key_lines.remove(line)
+            # Only the differing lines are left in the end
+            if not same_key_lines:
+                del pre_lines[key]
+        else:
+            post_only_lines.setdefault(key, []).append(line)
+
+    diff = {"added": [], "removed": [], "changed": []}
+    for key in sorted(set(pre_lines) | set(post_only_lines)):
+        removed = pre_lines.get(key, [])
+        added = post_only_lines.get(key, [])
+        # A file owned by multiple packages is reported once for each of them
+        changed = min(len(removed), len(added))
+        diff["changed"].extend(zip(removed[:changed], added[:changed]))
+        diff["removed"].extend(removed[changed:])
+        diff["added"].extend(added[changed:])
+
+    return diff
+
+
+def format_rpm_va_diff(diff, fromfile, tofile):
+    """Render the comparison of the rpm -Va outputs in the unified diff format.
+
+    The hunk headers are left out, the lines are ordered by the file path
+    rather than by their position in the outputs.
+
+    :param diff: The comparison, see :func:`diff_rpm_va`.
+    :type diff: dict[str, list]
+    :param fromfile: Name of the rpm -Va output from before the conversion.
+    :type fromfile: str
+    :param tofile: Name of the rpm -Va output from after the conversion.
+    :type tofile: str
+    :return: The rendered comparison. An empty string when the outputs don't differ.
+    :rtype: str
+    """
+    entries = [(_get_rpm_va_line_key(line), ["-%s" % line]) for line in diff["removed"]]
+    entries.extend((_get_rpm_va_line_key(line), ["+%s" % line]) for line in diff["added"])
+    entries.extend((_get_rpm_va_line_key(before), ["-%s" % before, "+%s" % after]) for before, after in diff["changed"])
+    if not entries:
+        return ""
+
+    entries.sort(key=lambda entry: entry[0])
+    lines = ["--- %s" % fromfile, "+++ %s" % tofile]
+    for _, entry_lines in entries:
+        lines.extend(entry_lines)
+
+    return "\n".join(lines)
+
+
+def _read_rpm_va_output(output_file):
+    """Iterate over the non-empty lines of an rpm -Va output. A missing output has no lines.
+
+    :rtype: Iterator[str]
+    """
+    if not os.path.exists(output_file):
+        return
+
+    with open(output_file) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def _get_rpm_va_line_key(line):
+    """Get the path of the file a line of the rpm -Va output is about, or the whole line for the other lines."""
+    match = _RPM_VERIFY_FILE_LINE.match(line)
+    if match:
+        return match.group(1)
+
+    return line
+
+
+def _read_installed_pkg_files():
+    """Read the label, header id and file paths of all the installed packages from the rpmdb.
+
+    The rpmdb is read in a child process, see
+    :func:`convert2rhel.pkghandler._read_installed_pkg_information_from_rpmdb`.
+
+    :return: Tuples of the label, header id and file paths of the packages, in the rpmdb order.
+    :rtype: list[tuple[str, str, list[str]]]
+    """
+    if multiprocessing.current_process().daemon:
+        return _get_installed_pkg_files()
+
+    return utils.run_as_child_process(_get_installed_pkg_files)()
+
+
+def _get_installed_pkg_files():
+    """Walk the rpmdb headers and collect the files of every package.
+
+    .. note::
+        Meant to be called through :func:`_read_installed_pkg_files`.
+
+    :rtype: list[tuple[str, str, list[str]]]
+    """
+    ts = rpm.TransactionSet()
+    pkgs = []
+    for hdr in ts.dbMatch():
+        pkgs.append(
+            (
+                _decode(hdr.sprintf(_PKG_LABEL_QUERYFORMAT)),
+                _decode(hdr.sprintf(_PKG_HEADER_ID_QUERYFORMAT)),
+                [_decode(path) for path in hdr[rpm.RPMTAG_FILENAMES] or []],
+            )
+        )
+
+    return pkgs
+
+
+def _decode(value):
+    """Older rpm python bindings return the string tags as bytes on Python 3."""
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return value.decode("utf-8", "replace")
+
+    return value
+
+
+def _get_files_digest(paths):
+    """Get a digest of the stat of the files, see :func:`_get_file_stat`.
+
+    Only the digest is stored in the cache, not the stat of every file.
+
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        # The JSON of the stat is ASCII only and self-delimiting
+        digest.update(json.dumps(_get_file_stat(path)).encode("ascii"))
+
+    return digest.hexdigest()
+
+
+def _get_file_stat(path):
+    """Return the parts of the file stat that change when the file is modified.
+
+    The ctime covers the changes which keep the mtime, e.g. a file restored
+    with its original timestamps.
+
+    :return: Size, mtime, ctime, inode, mode, uid and gid of the file. None if the file doesn't exist.
+    :rtype: list[int | float] | None
+    """
+    try:
+        stat = os.lstat(path)
+    except OSError:
+        return None
+
+    return [stat.st_size, stat.st_mtime, stat.st_ctime, stat.st_ino, stat.st_mode, stat.st_uid, stat.st_gid]
+
+
+def _get_rpm_va_jobs():
+    """Get the number of the parallel rpm -V processes.
+
+    :rtype: int
+    """
+    jobs = utils.get_env_number(RPM_VA_JOBS_ENVVAR, None, minimum=1)
+    if jobs is not None:
+        return jobs
+
+    # Defaults to the number of CPUs
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+def _verify_pkgs(labels, pkgs_files, jobs, cmd=("rpm", "-V")):
+    """Verify the packages with parallel rpm -V processes.
+
+    The packages are split into consecutive shards which are verified in a
+    pool of threads. Each thread assigns the output of its rpm process to the
+    packages of its shard as the lines are printed. As rpm verifies the
+    packages in the order they are passed in, joining the lines not assigned
+    to any package keeps the order of the labels.
+
+    :param labels: Labels of the packages to verify.
+    :type labels: list[str]
+    :param pkgs_files: The paths of the files of the packages, by the package label.
+    :type pkgs_files: dict[str, list[str]]
+    :param jobs: Maximum number of the parallel rpm processes.
+    :type jobs: int
+    :param cmd: The rpm verification command, without the packages.
+    :type cmd: Sequence[str]
+    :return: The output lines of each package and the lines not assigned to any package, see
+        :func:`_assign_output_to_pkgs`.
+    :rtype: tuple[dict[str, list[str]], list[str]]
+    """
+    if jobs <= 1 or len(labels) <= 1:
+        return _assign_output_to_pkgs(_run_rpm_verify(list(cmd) + list(labels)), labels, pkgs_files)
+
+    shard_count = min(len(labels), jobs * _SHARDS_PER_JOB)
+    shard_size = -(-len(labels) // shard_count)
+    shards = [labels[i : i + shard_size] for i in range(0, len(labels), shard_size)]
+    loggerinst.debug(
+        "Verifying %d packages in %d shards with up to %d parallel '%s' processes."
+        % (len(labels), len(shards), jobs, " ".join(cmd))
+    )
+
+    def verify_shard(shard):
+        return _assign_output_to_pkgs(_run_rpm_verify(list(cmd) + shard, print_cmd=False), shard, pkgs_files)
+
+    pool = ThreadPool(min(jobs, len(shards)))
+    try:
+        shards_output = pool.map(verify_shard, shards)
+    finally:
+        pool.close()
+        pool.join()
+
+    pkgs_output = {}
+    unassigned_output = []
+    for shard_pkgs_output, shard_unassigned_output in shards_output:
+        pkgs_output.update(shard_pkgs_output)
+        unassigned_output.extend(shard_unassigned_output)
+
+    return pkgs_output, unassigned_output
+
+
+def _run_rpm_verify(cmd, output_file=None, print_cmd=True):
+    """Run the rpm verification and iterate over its output lines as they are printed.
+
+    :param cmd: The rpm command to run.
+    :type cmd: list[str]
+    :param output_file: Path to a file to write the output to as well.
+    :type output_file: str | None
+    :param print_cmd: Log the command.
+    :type print_cmd: bool
+    :rtype: Iterator[str]
+    """
+    process = utils.StreamedSubprocess(cmd, print_cmd=print_cmd, print_output=False, output_file=output_file)
+    return (line.rstrip("\n") for line in process)
+
+
+def _assign_output_to_pkgs(output, labels, pkgs_files):
+    """Split the output of the rpm verification by package.
+
+    The lines about a file are assigned to the package owning the file. When
+    more packages own the same file, rpm prints the line for each of them, in
+    the rpmdb order. Other lines, like the unsatisfied dependencies or the
+    output of the %verify scriptlets, can't be reliably assigned.
+
+    The output is consumed line by line, it's never held in memory as a whole.
+
+    :param output: Lines of the rpm verification output.
+    :type output: Iterable[str]
+    :param labels: Labels of the packages the output is for, in the rpmdb order.
+    :type labels: list[str]
+    :param pkgs_files: The paths of the files of the packages, by the package label.
+    :type pkgs_files: dict[str, list[str]]
+    :return: The output lines of each verified package and the lines not assigned to any package.
+    :rtype: tuple[dict[str, list[str]], list[str]]
+    """
+    owners = {}
+    for label in labels:
+        for path in pkgs_files[label]:
+            owners.setdefault(path, []).append(label)
+
+    pkgs_output = dict((label, []) for label in labels)
+    unassigned_output = []
+    seen = {}
+    for line in output:
+        match = _RPM_VERIFY_FILE_LINE.match(line)
+        path = match.group(1) if match else None
+        if path not in owners:
+            unassigned_output.append(line)
+            continue
+
+        occurrence = seen.get(path, 0)
+        seen[path] = occurrence + 1
+        pkgs_output[owners[path][min(occurrence, len(owners[path]) - 1)]].append(line)
+
+    return pkgs_output, unassigned_output
+
+
+def _load_cache(cache_file):
+    """Load the cache of the previous verification.
+
+    :return: The cache. An empty one if there's no usable cache file.
+    :rtype: dict
+    """
+    empty_cache = {"version": _RPM_VA_CACHE_VERSION, "complete": False, "packages": {}}
+    try:
+        with open(cache_file) as f:
+            cache = json.load(f)
+    except (IOError, OSError, ValueError) as e:
+        loggerinst.debug("Unable to load the rpm verification cache from %s: %s" % (cache_file, str(e)))
+        return empty_cache
+
+    if not isinstance(cache, dict) or cache.get("version") != _RPM_VA_CACHE_VERSION:
+        loggerinst.debug("Ignoring the rpm verification cache %s of an unsupported version." % cache_file)
+        return empty_cache
+
+    return cache
+
+
+def _save_cache(cache_file, cache):
+    """Store the cache for the next verification.
+
+    Failing to store the cache is not fatal, the next verification is just
+    going to verify all the packages.
+    """
+    cache_dir = os.path.dirname(cache_file)
+    tmp_file = None
+    try:
+        utils.mkdir_p(cache_dir)
+        # Unique, another convert2rhel process might be storing the cache at the same time. Created with 0600.
+        fd, tmp_file = tempfile.mkstemp(prefix="%s." % os.path.basename(cache_file), suffix=".tmp", dir=cache_dir)
+        with os.fdopen(fd, "w") as f:
+            json.dump(cache, f)
+        os.rename(tmp_file, cache_file)
+    except (IOError, OSError) as e:
+        loggerinst.debug("Unable to store the rpm verification cache to %s: %s" % (cache_file, str(e)))
+        if tmp_file and os.path.exists(tmp_file):
+            os.remove(tmp_file)
@@ -14,7 +14,6 @@
 #
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <https://www.gnu.org/licenses/>.
-import difflib
 import logging
 import os
 import re
@@ -24,7 +23,7 @@ from collections import namedtuple
 
 from six.moves import configparser, urllib
 
-from convert2rhel import logger, utils
+from convert2rhel import logger, rpmverify, utils
 from convert2rhel.toolopts import POST_RPM_VA_LOG_FILENAME, PRE_RPM_VA_LOG_FILENAME, tool_opts
 from convert2rhel.utils import run_subprocess
 
@@ -290,9 +289,9 @@ class SystemInfo(object):
             " minutes. It can be disabled by using the"
             " --no-rpm-va option."
         )
-        rpm_va, _ = utils.run_subprocess(["rpm", "-Va"], print_output=False)
         output_file = os.path.join(logger.LOG_DIR, log_filename)
-        utils.store_content_to_file(output_file, rpm_va)
+        # Only the packages that changed since the last run are verified again
+        rpmverify.generate_rpm_va(output_file)
         self.logger.info("The 'rpm -Va' output has been stored in the %s file." % output_file)
 
     def modified_rpm_files_diff(self):
@@ -303,23 +302,15 @@ class SystemInfo(object):
         if not os.path.exists(pre_rpm_va_log_path):
             self.logger.info("Skipping comparison of the 'rpm -Va' output from before and after the conversion.")
             return
-        pre_rpm_va = utils.get_file_content(pre_rpm_va_log_path, True)
         post_rpm_va_log_path = os.path.join(logger.LOG_DIR, POST_RPM_VA_LOG_FILENAME)
-        post_rpm_va = utils.get_file_content(post_rpm_va_log_path, True)
-        modified_rpm_files_diff = "\n".join(
-            difflib.unified_diff(
-                pre_rpm_va,
-                post_rpm_va,
-                fromfile=pre_rpm_va_log_path,
-                tofile=post_rpm_va_log_path,
-                n=0,
-                lineterm="",
-            )
-        )
+        diff = rpmverify.diff_rpm_va(pre_rpm_va_log_path, post_rpm_va_log_path)
+        modified_rpm_files_diff = rpmverify.format_rpm_va_diff(diff, pre_rpm_va_log_path, post_rpm_va_log_path)
 
         if modified_rpm_files_diff:
             self.logger.info(
-                "Comparison of modified rpm files from before and after the conversion:\n%s" % modified_rpm_files_diff
+                "Comparison of modified rpm files from before and after the conversion"
+                " (%d added, %d removed, %d with changed flags):\n%s"
+                % (len(diff["added"]), len(diff["removed"]), len(diff["changed"]), modified_rpm_files_diff)
             )
 
     @staticmethod
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import contextlib
+import copy
+import json
+import logging
+import multiprocessing.util
+import os
+import resource
+import threading
+import time
+
+
+loggerinst = logging.getLogger(__name__)
+
+# The Actions might run in threads. Where the platform supports it, the CPU
+# time is measured for the thread running the Action only.
+_RUSAGE_CPU = getattr(resource, "RUSAGE_THREAD", resource.RUSAGE_SELF)
+
+
+class Timings:
+    """Where the time of the analysis goes.
+
+    Records the wall time, CPU time and the increase of the peak memory usage
+    of every Action and the duration, exit code and output size of every
+    external command, attributed to the Action which ran it.
+
+    .. note::
+        The commands run in the child processes of
+        :func:`convert2rhel.utils.run_as_child_process` are recorded in the
+        child process and are not part of the timings.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        multiprocessing.util.register_after_fork(self, _recreate_lock)
+        # The Action running in the current thread
+        self._local = threading.local()
+        self._actions = {}
+        self._commands = []
+
+    def reset(self):
+        """Drop everything recorded so far."""
+        with self._lock:
+            self._actions = {}
+            self._commands = []
+
+    @contextlib.contextmanager
+    def measure_action(self, action_id):
+        """Measure an Action, and the commands it runs, for the duration of the context.
+
+        :param action_id: The id of the Action.
+        :type action_id: str
+        """
+        record = {"wall_time": 0.0, "cpu_time": 0.0, "max_rss_delta_kb": 0, "commands": []}
+        with self._lock:
+            self._actions[action_id] = record
+
+        previous_action_id = getattr(self._local, "action_id", None)
+        self._local.action_id = action_id
+        start_cpu_time = _get_cpu_time()
+        start_max_rss = _get_max_rss()
+        start = time.time()
+        try:
+            yield
+        finally:
+            record["wall_time"] = time.time() - start
+            record["cpu_time"] = _get_cpu_time() - start_cpu_time
+            record["max_rss_delta_kb"] = _get_max_rss() - start_max_rss
+            self._local.action_id = previous_action_id
+
+    def record_command(self, cmd, duration, returncode, output_size, show_cmd=True):
+        """Record an external command that has finished.
+
+        :param cmd: The command with its arguments.
+        :type cmd: list[str]
+        :param duration: How long the command ran, in seconds.
+        :type duration: float
+        :param returncode: The exit code of the command.
+        :type returncode: int | None
+        :param output_size: Number of characters the command printed out.
+        :type output_size: int
+        :param show_cmd: Whether the arguments of the command can be recorded. Commands which are not logged, e.g.
+            because they contain a password, are recorded by the name of the executable only.
+        :type show_cmd: bool
+        """
+        command = {
+            "command": " ".join(cmd) if show_cmd else cmd[0],
+            "duration": duration,
+            "returncode": returncode,
+            "output_size": output_size,
+        }
+        trace.complete(command["command"], "subprocess", time.time() - duration, duration, {"returncode": returncode})
+
+        action_id = getattr(self._local, "action_id", None)
+        with self._lock:
+            if action_id in self._actions:
+                self._actions[action_id]["commands"].append(command)
+            else:
+                self._commands.append(command)
+
+    def to_dict(self):
+        """Get everything recorded so far.
+
+        .. note:: The returned data looks like the following
+            {
+                "actions": {
+                    "$Action_id": {
+                        "wall_time": float,
+                        "cpu_time": float,
+                        "max_rss_delta_kb": int,
+                        "commands": [
+                            {
+                                "command": "$command",
+                                "duration": float,
+                                "returncode": int,
+                                "output_size": int,
+                            },
+                        ],
+                    },
+                },
+                "commands": [
+                    # The commands run outside of any Action
+                ],
+            }
+
+        :rtype: dict
+        """
+        with self._lock:
+            return copy.deepcopy({"actions": self._actions, "commands": self._commands})
+
+
+class Trace:
+    """Timeline of a convert2rhel run in the Chrome Trace Event format.
+
+    The timeline is hierarchical: the process phases contain the Stages, the
+    Stages the Actions, and those the external commands, the child process
+    calls and the phases of the package manager callbacks. The written file
+    opens in Perfetto (https://ui.perfetto.dev), chrome://tracing or
+    speedscope.
+
+    Nothing is recorded until :meth:`enable` is called.
+
+    The spans are recorded as begin and end events per thread. Ending a span
+    ends all the spans started in it which are still open, e.g. the package
+    being installed when the transaction finishes.
+
+    The events recorded in the child processes of
+    :func:`convert2rhel.utils.run_as_child_process` are passed to the main
+    process through a spool file next to the trace file, see
+    :meth:`start_child_process` and :meth:`flush_child_process`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        multiprocessing.util.register_after_fork(self, _recreate_lock)
+        self.path = None
+        self._events = []
+        # The names of the open spans, per thread
+        self._open_spans = {}
+        self._phase = None
+
+    @property
+    def enabled(self):
+        return self.path is not None
+
+    @property
+    def _spool_path(self):
+        return "%s.children" % self.path
+
+    def enable(self, path):
+        """Start recording the timeline.
+
+        :param path: Where to write the trace file to.
+        :type path: str
+        """
+        self.path = path
+        self._events = []
+        self._open_spans = {}
+        self._phase = None
+        # Left behind by an interrupted run
+        if os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+        self._add_event({"ph": "M", "name": "process_name", "args": {"name": "convert2rhel"}}, timestamp=False)
+
+    def begin(self, name, category, args=None):
+        """Start a span in the current thread.
+
+        :param name: Name of the span, to end it with.
+        :type name: str
+        :param category: Kind of the span, e.g. "action" or "subprocess".
+        :type category: str
+        :param args: Additional details of the span.
+        :type args: dict | None
+        """
+        if not self.enabled:
+            return
+
+        event = {"ph": "B", "name": name, "cat": category}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._open_spans.setdefault(threading.current_thread().ident, []).append(name)
+            self._add_event(event)
+
+    def end(self, name):
+        """End the span of the current thread, together with all the spans open in it.
+
+        Nothing happens if there is no such open span.
+
+        :param name: Name of the span.
+        :type name: str
+        """
+        if not self.enabled:
+            return
+
+        with self._lock:
+            open_spans = self._open_spans.get(threading.current_thread().ident, [])
+            if name not in open_spans:
+                return
+
+            while open_spans:
+                open_name = open_spans.pop()
+                self._add_event({"ph": "E", "name": open_name})
+                if open_name == name:
+                    break
+
+    @contextlib.contextmanager
+    def span(self, name, category, args=None):
+        """Record a span for the duration of the context.
+
+        See :meth:`begin` for the parameters.
+        """
+        self.begin(name, category, args)
+        try:
+            yield
+        finally:
+            self.end(name)
+
+    def complete(self, name, category, start, duration, args=None):
+        """Record a span that has already finished.
+
+        :param start: When the span started, in seconds since the epoch.
+        :type start: float
+        :param duration: Duration of the span in seconds.
+        :type duration: float
+
+        See :meth:`begin` for the other parameters.
+        """
+        if not self.enabled:
+            return
+
+        event = {
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "ts": _to_microseconds(start),
+            "dur": _to_microseconds(duration),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._add_event(event, timestamp=False)
+
+    def instant(self, name, category, args=None):
+        """Record a point in time, e.g. a downloaded package.
+
+        See :meth:`begin` for the parameters.
+        """
+        if not self.enabled:
+            return
+
+        event = {"ph": "i", "name": name, "cat": category, "s": "t"}
+        if args:
+            event["args"] = args
+        with self._lock:
+            self._add_event(event)
+
+    def set_phase(self, name):
+        """End the current process phase span and start a new one.
+
+        :param name: Name of the new phase, e.g. "PRE_PONR_CHANGES".
+        :type name: str
+        """
+        if self._phase:
+            self.end(self._phase)
+        self._phase = "Phase: %s" % name
+        self.begin(self._phase, "phase")
+
+    def start_child_process(self):
+        """Drop the events inherited from the parent process in a newly forked child process."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self._events = []
+            self._open_spans = {}
+            self._phase = None
+        self._add_event(
+            {"ph": "M", "name": "process_name", "args": {"name": "convert2rhel child process"}}, timestamp=False
+        )
+
+    def flush_child_process(self):
+        """Pass the events recorded in a child process to the main process."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            events = self._events
+            self._events = []
+
+        try:
+            with open(self._spool_path, "a") as f:
+                f.write("".join("%s\n" % json.dumps(event) for event in events))
+        except (IOError, OSError) as e:
+            loggerinst.debug("Unable to pass the trace events to the main process: %s" % str(e))
+
+    def write(self):
+        """Write the trace file, ending all the spans still open."""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            for tid, open_spans in self._open_spans.items():
+                while open_spans:
+                    self._add_event({"ph": "E", "name": open_spans.pop()}, tid=tid)
+            self._phase = None
+            events = list(self._events)
+
+        try:
+            if os.path.exists(self._spool_path):
+                with open(self._spool_path) as f:
+                    events.extend(json.loads(line) for line in f if line.strip())
+                os.remove(self._spool_path)
+
+            with open(self.path, "w") as f:
+                json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        except (IOError, OSError, ValueError) as e:
+            loggerinst.warning("Unable to write the profile trace to %s: %s" % (self.path, str(e)))
+            return
+
+        loggerinst.info("Profile trace written to %s." % self.path)
+
+    def _add_event(self, event, timestamp=True, tid=None):
+        """Add an event of the current process and thread. Expects the lock to be held, if needed."""
+        event["pid"] = os.getpid()
+        event["tid"] = tid if tid is not None else threading.current_thread().ident
+        if timestamp:
+            event["ts"] = _to_microseconds(time.time())
+        self._events.append(event)
+
+
+def _recreate_lock(obj):
+    """Replace the lock of an object in a newly forked child process.
+
+    Another thread of the parent process might have held the lock while
+    forking, which would leave it locked in the child process for good.
+
+    :param obj: The object with the lock, :class:`Timings` or :class:`Trace`.
+    :type obj: Timings | Trace
+    """
+    obj._lock = threading.Lock()
+
+
+def _to_microseconds(seconds):
+    return int(seconds * 1000000)
+
+
+def _get_cpu_time():
+    """Get the user and system CPU time of the current thread, or of the whole process, in seconds."""
+    usage = resource.getrusage(_RUSAGE_CPU)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _get_max_rss():
+    """Get the peak memory usage of the process in kilobytes."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+timings = Timings()  # pylint: disable=C0103
+trace = Trace()  # pylint: disable=C0103
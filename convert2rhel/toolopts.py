@@ -86,6 +86,7 @@ class ToolOpts(object):
         self.arch = None
         self.no_rpm_va = False
         self.activity = None
+        self.profile_trace = None
 
     def set_opts(self, supported_opts):
         """Set ToolOpts data using dict with values from config file.
@@ -183,6 +184,13 @@ class CLI(object):
             " to show you what rpm files have been affected by the conversion."
             % (PRE_RPM_VA_LOG_FILENAME, POST_RPM_VA_LOG_FILENAME),
         )
+        self._shared_options_parser.add_argument(
+            "--profile-trace",
+            metavar="PATH",
+            help="Record a timeline of the run, down to the external commands and the package manager transaction"
+            " steps, and write it to PATH in the Chrome Trace Event format. Open it in https://ui.perfetto.dev or"
+            " https://www.speedscope.app to see where the time goes.",
+        )
         self._shared_options_parser.add_argument(
             "--enablerepo",
             metavar="repoidglob",
@@ -381,6 +389,9 @@ class CLI(object):
         if parsed_opts.no_rpm_va:
             tool_opts.no_rpm_va = True
 
+        if parsed_opts.profile_trace:
+            tool_opts.profile_trace = os.path.abspath(parsed_opts.profile_trace)
+
         if parsed_opts.username:
             tool_opts.username = parsed_opts.username
 
@@ -381,6 +381,36 @@ class RunSubprocessMocked(MockFunctionObject):
         return super(RunSubprocessMocked, self).__call__(cmd, *args, **kwargs)
 
 
+class DummyPopenOutput(MockFunction):
+    """Replacement for subprocess.Popen returning the given lines as the output."""
+
+    def __init__(self, output, returncode=0):
+        self.call_count = 0
+        self.output = output
+        self.returncode = returncode
+        self.args = None
+
+    def __call__(self, args, stdout, stderr, bufsize):
+        self.args = args
+        return self
+
+    @property
+    def stdout(self):
+        return self
+
+    def readline(self):
+        try:
+            next_line = self.output[self.call_count]
+        except IndexError:
+            return b""
+
+        self.call_count += 1
+        return next_line
+
+    def communicate(self):
+        pass
+
+
 class RemovePkgsMocked(MockFunctionObject):
     """
     Mock for the remove_pkgs function.
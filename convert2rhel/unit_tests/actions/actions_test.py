@@ -17,8 +17,12 @@
 
 __metaclass__ = type
 
+import logging
 import os.path
 import re
+import sys
+import threading
+import time
 
 from collections import defaultdict
 
@@ -29,7 +33,7 @@ import six
 six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
 from six.moves import mock
 
-from convert2rhel import actions
+from convert2rhel import actions, timings
 from convert2rhel.actions import STATUS_CODE, ActionMessage, ActionMessageBase, ActionResult, InvalidMessageError
 from convert2rhel.main import level_for_raw_action_data
 
@@ -388,6 +392,175 @@ class TestStage:
         assert sorted(action.id for action in actual.failures) == sorted(expected[1])
         assert sorted(action.id for action in actual.skips) == sorted(expected[2])
 
+    @pytest.mark.parametrize(
+        ("stage_dirs", "expected"),
+        (
+            (
+                ("good_deps1",),
+                (("REALTEST", "SECONDTEST", "THIRDTEST", "FOURTHTEST"), (), ()),
+            ),
+            (
+                ("all_status_actions",),
+                (
+                    ("SUCCESSTEST", "WARNINGTEST"),
+                    ("ERRORTEST", "OVERRIDABLETEST"),
+                    ("SKIPSINGLETEST", "SKIPMULTIPLETEST"),
+                ),
+            ),
+            (
+                ("action_exceptions",),
+                (("SUCCESSTEST",), ("DIVIDEBYZEROTEST", "LOGCRITICALTEST"), ()),
+            ),
+            (
+                ("parallel_actions",),
+                (("AFTERSLOWTEST", "FASTTEST", "SERIALTEST", "SLOWTEST"), ("FAILINGTEST",), ("AFTERFAILINGTEST",)),
+            ),
+        ),
+    )
+    def test_run_parallel(self, stage_actions, stage_dirs, expected):
+        stage = actions.Stage(stage_dirs[0], max_parallel_actions=4)
+
+        actual = stage.run()
+
+        assert sorted(action.id for action in actual.successes) == sorted(expected[0])
+        assert sorted(action.id for action in actual.failures) == sorted(expected[1])
+        assert sorted(action.id for action in actual.skips) == sorted(expected[2])
+
+    def test_run_parallel_same_order_and_logs_as_serial(self, stage_actions):
+        records = []
+        handler = logging.Handler()
+        handler.emit = lambda record: records.append(record.getMessage())
+        convert2rhel_logger = logging.getLogger("convert2rhel")
+        convert2rhel_logger.addHandler(handler)
+        try:
+            results = []
+            messages = []
+            for max_parallel_actions in (1, 4):
+                del records[:]
+                results.append(actions.Stage("parallel_actions", max_parallel_actions=max_parallel_actions).run())
+                messages.append(list(records))
+        finally:
+            convert2rhel_logger.removeHandler(handler)
+
+        for serial_actions, parallel_actions in zip(*results):
+            assert [action.id for action in serial_actions] == [action.id for action in parallel_actions]
+        # The messages of the Actions running at the same time are not interleaved
+        assert messages[0] == messages[1]
+
+    def test_action_log_buffer(self):
+        records = []
+        handlers = []
+        for level in (logging.DEBUG, logging.INFO):
+            handler = logging.Handler(level)
+            handler.emit = records.append
+            handlers.append(handler)
+        log_buffer = actions._ActionLogBuffer(handlers)
+        convert2rhel_logger = logging.getLogger("convert2rhel")
+        for handler in handlers:
+            handler.addFilter(log_buffer)
+            convert2rhel_logger.addHandler(handler)
+        logger = logging.getLogger("convert2rhel.actions.test")
+        try:
+            log_buffer.start_buffering()
+            logger.warning("buffered")
+            # Logged from a thread which is not holding back its records
+            thread = threading.Thread(target=logger.warning, args=("passed through",))
+            thread.start()
+            thread.join()
+            buffered = log_buffer.stop_buffering()
+
+            assert [record.getMessage() for record in records] == ["passed through", "passed through"]
+            assert [record.getMessage() for record in buffered] == ["buffered"]
+
+            del records[:]
+            log_buffer.emit_records(buffered)
+            assert [record.getMessage() for record in records] == ["buffered", "buffered"]
+        finally:
+            for handler in handlers:
+                convert2rhel_logger.removeHandler(handler)
+
+    def test_run_parallel_concurrency(self, stage_actions):
+        stage = actions.Stage("parallel_actions", max_parallel_actions=4)
+        test_module = sys.modules["convert2rhel.unit_tests.actions.data.stage_tests.parallel_actions.test"]
+        test_module.running_at_start.clear()
+
+        stage.run()
+
+        # FASTTEST starts while the slower FAILINGTEST, which is before it in the order, runs
+        assert test_module.running_at_start["FASTTEST"] == set(["FAILINGTEST"])
+        # Serial-only Actions run alone
+        assert test_module.running_at_start["SERIALTEST"] == set()
+        assert all("SERIALTEST" not in running for running in test_module.running_at_start.values())
+        # Actions whose dependency failed don't run
+        assert "AFTERFAILINGTEST" not in test_module.running_at_start
+
+    def test_run_parallel_serial_action_waits(self, stage_actions):
+        events = []
+        instances = []
+
+        class RecordingAction(actions.Action):
+            duration = 0
+
+            def __init__(self):
+                super(RecordingAction, self).__init__()
+                instances.append(self.id)
+
+            def run(self):
+                super(RecordingAction, self).run()
+                events.append(("start", self.id))
+                time.sleep(self.duration)
+                events.append(("finish", self.id))
+
+        class Slow(RecordingAction):
+            id = "SLOW"
+            duration = 0.2
+
+        class Serial(RecordingAction):
+            id = "SERIAL"
+            serial_only = True
+
+        class AfterSerial(RecordingAction):
+            id = "AFTERSERIAL"
+
+        stage = actions.Stage("parallel_actions", max_parallel_actions=4)
+        reported = []
+
+        stage._run_actions_in_parallel([Slow, Serial, AfterSerial], lambda action, skipped: reported.append(action.id))
+
+        # The Action after the waiting serial-only one starts right away
+        assert events.index(("start", "AFTERSERIAL")) < events.index(("finish", "SLOW"))
+        assert events.index(("start", "SERIAL")) > events.index(("finish", "SLOW"))
+        # The Actions are created only when they start, the waiting doesn't create new ones
+        assert sorted(instances) == ["AFTERSERIAL", "SERIAL", "SLOW"]
+        assert reported == ["SLOW", "SERIAL", "AFTERSERIAL"]
+
+    @pytest.mark.parametrize(("max_parallel_actions",), ((1,), (4,)))
+    def test_run_records_timings(self, stage_actions, max_parallel_actions):
+        actions.Stage("parallel_actions", max_parallel_actions=max_parallel_actions).run()
+
+        action_timings = timings.timings.to_dict()["actions"]
+        # Skipped Actions don't run
+        assert sorted(action_timings) == ["AFTERSLOWTEST", "FAILINGTEST", "FASTTEST", "SERIALTEST", "SLOWTEST"]
+        assert action_timings["SLOWTEST"]["wall_time"] >= 0.3
+        assert action_timings["FASTTEST"]["wall_time"] < action_timings["SLOWTEST"]["wall_time"]
+
+    @pytest.mark.parametrize(
+        ("envvar", "expected"),
+        (
+            (None, 1),
+            ("4", 4),
+            ("0", 1),
+            ("all", 1),
+        ),
+    )
+    def test_get_max_parallel_actions(self, envvar, expected, monkeypatch):
+        if envvar is None:
+            monkeypatch.delenv(actions.PARALLEL_ACTIONS_ENVVAR, raising=False)
+        else:
+            monkeypatch.setenv(actions.PARALLEL_ACTIONS_ENVVAR, envvar)
+
+        assert actions.get_max_parallel_actions() == expected
+
     def test_stages_cannot_be_run_twice(self, stage_actions):
         """Test that an Action can only be run once."""
         stage = actions.Stage("good_deps1")
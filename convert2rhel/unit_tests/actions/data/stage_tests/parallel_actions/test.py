@@ -0,0 +1,80 @@
+import logging
+import threading
+import time
+
+from convert2rhel import actions
+
+
+logger = logging.getLogger(__name__)
+
+#: Ids of the Actions running at the moment
+running = set()
+#: Ids of the Actions running at the moment each Action started, by the Action id
+running_at_start = {}
+_lock = threading.Lock()
+
+
+def _record_run(action_id, duration=0):
+    """Record which Actions run at the same time and log from the middle of the run."""
+    with _lock:
+        running_at_start[action_id] = set(running)
+        running.add(action_id)
+
+    logger.info("%s started" % action_id)
+    time.sleep(duration)
+    logger.info("%s finished" % action_id)
+
+    with _lock:
+        running.remove(action_id)
+
+
+class SlowTest(actions.Action):
+    id = "SLOWTEST"
+
+    def run(self):
+        super(SlowTest, self).run()
+        _record_run(self.id, 0.3)
+
+
+class FastTest(actions.Action):
+    id = "FASTTEST"
+
+    def run(self):
+        super(FastTest, self).run()
+        _record_run(self.id, 0.05)
+
+
+class AfterSlowTest(actions.Action):
+    id = "AFTERSLOWTEST"
+    dependencies = ("SLOWTEST",)
+
+    def run(self):
+        super(AfterSlowTest, self).run()
+        _record_run(self.id)
+
+
+class SerialTest(actions.Action):
+    id = "SERIALTEST"
+    serial_only = True
+
+    def run(self):
+        super(SerialTest, self).run()
+        _record_run(self.id, 0.05)
+
+
+class FailingTest(actions.Action):
+    id = "FAILINGTEST"
+
+    def run(self):
+        super(FailingTest, self).run()
+        _record_run(self.id, 0.2)
+        self.set_result(level="ERROR", id="FAILED", title="Failed", description="The Action failed")
+
+
+class AfterFailingTest(actions.Action):
+    id = "AFTERFAILINGTEST"
+    dependencies = ("FAILINGTEST",)
+
+    def run(self):
+        super(AfterFailingTest, self).run()
+        _record_run(self.id)
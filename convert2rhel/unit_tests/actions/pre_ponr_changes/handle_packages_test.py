@@ -278,6 +278,8 @@ def test_remove_repository_files_packages_dependency_order(remove_repository_fil
 
 def test_remove_repository_files_packages_error(remove_repository_files_packages_instance, monkeypatch):
     monkeypatch.setattr(system_info, "repofile_pkgs", [])
+    # Don't read the rpmdb of the host
+    monkeypatch.setattr(pkghandler.installed_packages, "find_all", mock.Mock(return_value={}))
     monkeypatch.setattr(
         pkghandler, "remove_pkgs_unless_from_redhat", mock.Mock(side_effect=SystemExit("Raising SystemExit"))
     )
@@ -27,6 +27,7 @@ from convert2rhel.actions.pre_ponr_changes.kernel_modules import (
     EnsureKernelModulesCompatibility,
     RHELKernelModuleNotFound,
 )
+from convert2rhel.kmodindex import KmodIndexError
 from convert2rhel.systeminfo import system_info
 from convert2rhel.unit_tests import assert_actions_result, run_subprocess_side_effect
 from convert2rhel.unit_tests.conftest import centos7, centos8
@@ -58,31 +59,18 @@ HOST_MODULES_STUB_BAD = frozenset(
     )
 )
 
-REPOQUERY_F_STUB_GOOD = (
-    "kernel-core-0:4.18.0-240.10.1.el8_3.x86_64\n"
-    "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64\n"
-    "kernel-debug-core-0:4.18.0-240.10.1.el8_3.x86_64\n"
-    "kernel-debug-core-0:4.18.0-240.15.1.el8_3.x86_64\n"
-)
-REPOQUERY_F_STUB_BAD = (
-    "kernel-idontexpectyou-core-sdsdsd.ell8_3.x86_64\n"
-    "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64\n"
-    "kernel-debug-core-0:4.18.0-240.10.1.el8_3.x86_64\n"
-    "kernel-debug-core-0:4.18.0-240.15.1.el8_3.x86_64\n"
-)
-REPOQUERY_L_STUB_GOOD = (
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/b.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/c.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/c.ko\n"
-)
-REPOQUERY_L_STUB_BAD = (
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/d.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/d.ko\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/e.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/f.ko.xz\n"
-    "/lib/modules/5.8.0-7642-generic/kernel/lib/f.ko\n"
+RHEL_KMOD_PKGS_STUB = [
+    "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
+    "kernel-debug-core-0:4.18.0-240.15.1.el8_3.x86_64",
+]
+RHEL_KMODS_STUB = frozenset(
+    (
+        "kernel/lib/a.ko.xz",
+        "kernel/lib/a.ko",
+        "kernel/lib/b.ko.xz",
+        "kernel/lib/c.ko.xz",
+        "kernel/lib/c.ko",
+    )
 )
 
 
@@ -91,6 +79,13 @@ def ensure_kernel_modules_compatibility_instance():
     return kernel_modules.EnsureKernelModulesCompatibility()
 
 
+@pytest.fixture
+def get_rhel_kmods_mocked(monkeypatch):
+    get_rhel_kmods_mocked = mock.Mock(return_value=(RHEL_KMOD_PKGS_STUB, set(RHEL_KMODS_STUB)))
+    monkeypatch.setattr(kernel_modules, "get_rhel_kmods", get_rhel_kmods_mocked)
+    return get_rhel_kmods_mocked
+
+
 @pytest.mark.parametrize(
     (
         "host_kmods",
@@ -118,6 +113,7 @@ def test_ensure_compatibility_of_kmods(
     ensure_kernel_modules_compatibility_instance,
     monkeypatch,
     pretend_os,
+    get_rhel_kmods_mocked,
     caplog,
     host_kmods,
     exception,
@@ -127,18 +123,6 @@ def test_ensure_compatibility_of_kmods(
     monkeypatch.setattr(
         ensure_kernel_modules_compatibility_instance, "_get_loaded_kmods", mock.Mock(return_value=host_kmods)
     )
-    run_subprocess_mock = mock.Mock(
-        side_effect=run_subprocess_side_effect(
-            (("uname",), ("5.8.0-7642-generic\n", 0)),
-            (("repoquery", "-f"), (REPOQUERY_F_STUB_GOOD, 0)),
-            (("repoquery", "-l"), (REPOQUERY_L_STUB_GOOD, 0)),
-        )
-    )
-    monkeypatch.setattr(
-        kernel_modules,
-        "run_subprocess",
-        value=run_subprocess_mock,
-    )
 
     if exception:
         ensure_kernel_modules_compatibility_instance.run()
@@ -166,6 +150,7 @@ def test_ensure_compatibility_of_kmods_check_env_and_message(
     ensure_kernel_modules_compatibility_instance,
     monkeypatch,
     pretend_os,
+    get_rhel_kmods_mocked,
     caplog,
 ):
 
@@ -173,18 +158,6 @@ def test_ensure_compatibility_of_kmods_check_env_and_message(
     monkeypatch.setattr(
         ensure_kernel_modules_compatibility_instance, "_get_loaded_kmods", mock.Mock(return_value=HOST_MODULES_STUB_BAD)
     )
-    run_subprocess_mock = mock.Mock(
-        side_effect=run_subprocess_side_effect(
-            (("uname",), ("5.8.0-7642-generic\n", 0)),
-            (("repoquery", "-f"), (REPOQUERY_F_STUB_GOOD, 0)),
-            (("repoquery", "-l"), (REPOQUERY_L_STUB_GOOD, 0)),
-        )
-    )
-    monkeypatch.setattr(
-        kernel_modules,
-        "run_subprocess",
-        value=run_subprocess_mock,
-    )
 
     ensure_kernel_modules_compatibility_instance.run()
     should_be_in_logs = (
@@ -229,6 +202,7 @@ def test_ensure_compatibility_of_kmods_excluded(
     ensure_kernel_modules_compatibility_instance,
     monkeypatch,
     pretend_os,
+    get_rhel_kmods_mocked,
     caplog,
     unsupported_pkg,
     msg_in_logs,
@@ -243,18 +217,6 @@ def test_ensure_compatibility_of_kmods_excluded(
         ),
     )
     get_unsupported_kmods_mocked = mock.Mock(wraps=ensure_kernel_modules_compatibility_instance._get_unsupported_kmods)
-    run_subprocess_mock = mock.Mock(
-        side_effect=run_subprocess_side_effect(
-            (("uname",), ("5.8.0-7642-generic\n", 0)),
-            (("repoquery", "-f"), (REPOQUERY_F_STUB_GOOD, 0)),
-            (("repoquery", "-l"), (REPOQUERY_L_STUB_GOOD, 0)),
-        )
-    )
-    monkeypatch.setattr(
-        kernel_modules,
-        "run_subprocess",
-        value=run_subprocess_mock,
-    )
     monkeypatch.setattr(
         ensure_kernel_modules_compatibility_instance,
         "_get_unsupported_kmods",
@@ -303,7 +265,11 @@ def test_ensure_compatibility_of_kmods_excluded(
         assert all(msg_not_in_logs not in record.message for record in caplog.records)
 
 
-def test_get_loaded_kmods(ensure_kernel_modules_compatibility_instance, monkeypatch):
+def test_get_loaded_kmods(ensure_kernel_modules_compatibility_instance, monkeypatch, tmpdir):
+    # Neither /proc/modules nor modules.dep are available, the modules are
+    # resolved with lsmod and modinfo
+    monkeypatch.setattr(kernel_modules, "PROC_MODULES_PATH", str(tmpdir.join("modules")))
+    monkeypatch.setattr(kernel_modules, "KERNEL_MODULES_DIR", str(tmpdir))
     run_subprocess_mocked = mock.Mock(
         spec=run_subprocess,
         side_effect=run_subprocess_side_effect(
@@ -341,154 +307,97 @@ def test_get_loaded_kmods(ensure_kernel_modules_compatibility_instance, monkeypa
     )
 
 
-@pytest.mark.parametrize(
-    ("repoquery_f_stub", "repoquery_l_stub"),
-    (
-        (REPOQUERY_F_STUB_GOOD, REPOQUERY_L_STUB_GOOD),
-        (REPOQUERY_F_STUB_BAD, REPOQUERY_L_STUB_GOOD),
-    ),
-)
-@centos8
-def test_get_rhel_supported_kmods(
-    ensure_kernel_modules_compatibility_instance,
-    monkeypatch,
-    pretend_os,
-    repoquery_f_stub,
-    repoquery_l_stub,
-):
-    run_subprocess_mock = mock.Mock(
+def test_get_loaded_kmods_from_modules_dep(ensure_kernel_modules_compatibility_instance, monkeypatch, tmpdir):
+    proc_modules = tmpdir.join("proc_modules")
+    proc_modules.write(
+        "a 81920 4 - Live 0x0000000000000000\n"
+        "b_c 49152 0 - Live 0x0000000000000000\n"
+        "d 40960 1 a, Live 0x0000000000000000\n"
+    )
+    monkeypatch.setattr(kernel_modules, "PROC_MODULES_PATH", str(proc_modules))
+    monkeypatch.setattr(kernel_modules, "KERNEL_MODULES_DIR", str(tmpdir))
+    monkeypatch.setattr(system_info, "booted_kernel", "5.8.0-7642-generic")
+    tmpdir.mkdir("5.8.0-7642-generic").join("modules.dep").write(
+        "kernel/lib/a.ko.xz:\n" "kernel/lib/b-c.ko: kernel/lib/a.ko.xz\n" "kernel/lib/unloaded.ko.xz:\n"
+    )
+    # d is not in modules.dep, it's the only module left for modinfo
+    run_subprocess_mocked = mock.Mock(
+        spec=run_subprocess,
         side_effect=run_subprocess_side_effect(
             (
-                ("repoquery", "-f"),
-                (repoquery_f_stub, 0),
-            ),
-            (
-                ("repoquery", "-l"),
-                (repoquery_l_stub, 0),
+                ("modinfo", "-F", "filename", "d"),
+                ("/lib/modules/5.8.0-7642-generic/extra/d.ko.xz\n", 0),
             ),
-        )
-    )
-    monkeypatch.setattr(
-        kernel_modules,
-        "run_subprocess",
-        value=run_subprocess_mock,
+        ),
     )
+    monkeypatch.setattr(kernel_modules, "run_subprocess", value=run_subprocess_mocked)
 
-    res = ensure_kernel_modules_compatibility_instance._get_rhel_supported_kmods()
-    assert res == set(
-        (
-            "kernel/lib/a.ko",
-            "kernel/lib/a.ko.xz",
-            "kernel/lib/b.ko.xz",
-            "kernel/lib/c.ko.xz",
-            "kernel/lib/c.ko",
-        )
+    assert ensure_kernel_modules_compatibility_instance._get_loaded_kmods() == frozenset(
+        ("kernel/lib/a.ko.xz", "kernel/lib/b-c.ko", "extra/d.ko.xz")
     )
+    run_subprocess_mocked.assert_called_once_with(["modinfo", "-F", "filename", "d"], print_output=False)
 
 
 @pytest.mark.parametrize(
-    ("pkgs", "exp_res"),
+    ("modules_dep", "expected"),
     (
         (
-            (
-                "kernel-core-0:4.18.0-240.10.1.el8_3.x86_64",
-                "kernel-debug-core-0:4.18.0-240.10.1.el8_3.x86_64",
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-                "kernel-debug-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            (
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-                "kernel-debug-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-        ),
-        (
-            (
-                "kmod-core-0:4.18.0-240.10.1.el8_3.x86_64",
-                "kmod-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kmod-core-0:4.18.0-240.15.1.el8_3.x86_64",),
-        ),
-        (
-            (
-                "kmod-core-0:10.18.0-240.10.1.el8_3.x86_64",
-                "kmod-core-0:9.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kmod-core-0:10.18.0-240.10.1.el8_3.x86_64",),
-        ),
-        (
-            (
-                "not-expected-core-0:4.18.0-240.10.1.el8_3.x86_64",
-                "kmod-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kmod-core-0:4.18.0-240.15.1.el8_3.x86_64",),
-        ),
-        (
-            (
-                "kernel-core-0:4.18.0-240.beta5.1.el8_3.x86_64",
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",),
-        ),
-        (
-            (
-                "kernel-core-0:4.18.0-240.15.beta5.1.el8_3.x86_64",
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",),
-        ),
-        (
-            (
-                "kernel-core-0:4.18.0-240.16.beta5.1.el8_3.x86_64",
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            ("kernel-core-0:4.18.0-240.16.beta5.1.el8_3.x86_64",),
+            "kernel/lib/a.ko.xz:\nkernel/lib/b.ko.gz: kernel/lib/a.ko.xz\nkernel/lib/c.ko.zst:\n",
+            {"a": "kernel/lib/a.ko.xz", "b": "kernel/lib/b.ko.gz"},
         ),
-        (("kernel_bad_package:111111",), ("kernel_bad_package:111111",)),
+        # Old depmod versions write absolute paths
         (
-            (
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-                "kernel_bad_package:111111",
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-            ),
-            (
-                "kernel-core-0:4.18.0-240.15.1.el8_3.x86_64",
-                "kernel_bad_package:111111",
-            ),
+            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko:\n",
+            {"a": "kernel/lib/a.ko"},
         ),
+        ("", {}),
     ),
 )
-def test_get_most_recent_unique_kernel_pkgs(pkgs, exp_res, ensure_kernel_modules_compatibility_instance):
-    assert tuple(ensure_kernel_modules_compatibility_instance._get_most_recent_unique_kernel_pkgs(pkgs)) == exp_res
+def test_get_kmod_keys_from_modules_dep(
+    modules_dep, expected, ensure_kernel_modules_compatibility_instance, monkeypatch, tmpdir
+):
+    monkeypatch.setattr(system_info, "booted_kernel", "5.8.0-7642-generic")
+    monkeypatch.setattr(kernel_modules, "KERNEL_MODULES_DIR", str(tmpdir))
+    tmpdir.mkdir("5.8.0-7642-generic").join("modules.dep").write(modules_dep)
+
+    assert ensure_kernel_modules_compatibility_instance._get_kmod_keys_from_modules_dep(["a", "b"]) == expected
+
+
+def test_get_kmod_keys_from_modules_dep_missing_index(
+    ensure_kernel_modules_compatibility_instance, monkeypatch, tmpdir
+):
+    monkeypatch.setattr(system_info, "booted_kernel", "5.8.0-7642-generic")
+    monkeypatch.setattr(kernel_modules, "KERNEL_MODULES_DIR", str(tmpdir))
+
+    assert ensure_kernel_modules_compatibility_instance._get_kmod_keys_from_modules_dep(["a"]) == {}
 
 
+@centos8
+def test_get_rhel_supported_kmods(ensure_kernel_modules_compatibility_instance, pretend_os, get_rhel_kmods_mocked):
+    res = ensure_kernel_modules_compatibility_instance._get_rhel_supported_kmods()
+
+    assert res == RHEL_KMODS_STUB
+    get_rhel_kmods_mocked.assert_called_once_with(system_info.get_enabled_rhel_repos(), system_info.releasever)
+
+
+@centos8
 @pytest.mark.parametrize(
-    ("rhel_kmods_str", "expected"),
+    ("get_rhel_kmods_kwargs", "message"),
     (
+        ({"return_value": ([], set())}, "No packages containing kernel modules available"),
         (
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n",
-            {"kernel/lib/a.ko.xz"},
-        ),
-        (
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/6.1.18-200.fc37.x86_64/kernel/lib/lru_cache.ko.xz\n"
-            "/lib/modules/6.1.18-200.fc37.x86_64/kernel/lib/crc8.ko\n"
-            "/lib/modules/6.1.18-200.fc37.x86_64/kernel/lib/ts_bm.ko\n",
-            {"kernel/lib/a.ko.xz", "kernel/lib/lru_cache.ko.xz", "kernel/lib/crc8.ko", "kernel/lib/ts_bm.ko"},
-        ),
-        (
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n"
-            "/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz\n",
-            {"kernel/lib/a.ko.xz"},
+            {"side_effect": KmodIndexError("Unable to load the metadata")},
+            "Unable to list the kernel modules in the packages available",
         ),
     ),
 )
-def test_get_rhel_kmods_keys(ensure_kernel_modules_compatibility_instance, rhel_kmods_str, expected):
-    result = ensure_kernel_modules_compatibility_instance._get_rhel_kmods_keys(rhel_kmods_str)
-    assert result == expected
+def test_get_rhel_supported_kmods_not_found(
+    ensure_kernel_modules_compatibility_instance, pretend_os, monkeypatch, get_rhel_kmods_kwargs, message
+):
+    monkeypatch.setattr(kernel_modules, "get_rhel_kmods", mock.Mock(**get_rhel_kmods_kwargs))
+
+    with pytest.raises(RHELKernelModuleNotFound, match=message):
+        ensure_kernel_modules_compatibility_instance._get_rhel_supported_kmods()
 
 
 @pytest.mark.parametrize(
@@ -55,7 +55,7 @@ _LONG_MESSAGE = {
                 },
             },
             {
-                "format_version": "1.0",
+                "format_version": "1.1",
                 "actions": {
                     "CONVERT2RHEL_LATEST_VERSION": {
                         "result": dict(level="SUCCESS", id="SUCCESS"),
@@ -90,7 +90,7 @@ _LONG_MESSAGE = {
                 },
             },
             {
-                "format_version": "1.0",
+                "format_version": "1.1",
                 "actions": {
                     "CONVERT2RHEL_LATEST_VERSION": {
                         "result": dict(level="SUCCESS", id="SUCCESS"),
@@ -122,6 +122,50 @@ def test_summary_as_json(results, expected, tmpdir):
     assert file_contents == expected
 
 
+_TIMINGS = {
+    "actions": {
+        "RPM_VA": {
+            "wall_time": 40.5,
+            "cpu_time": 1.25,
+            "max_rss_delta_kb": 2048,
+            "commands": [{"command": "rpm -Va", "duration": 40.0, "returncode": 1, "output_size": 1000}],
+        },
+        "CONVERT2RHEL_LATEST_VERSION": {"wall_time": 0.5, "cpu_time": 0.1, "max_rss_delta_kb": 0, "commands": []},
+    },
+    "commands": [{"command": "subscription-manager", "duration": 2.0, "returncode": 0, "output_size": 10}],
+}
+
+
+def test_summary_as_json_timings(tmpdir):
+    json_report_file = os.path.join(str(tmpdir), "c2r-assessment.json")
+
+    report.summary_as_json({}, json_report_file, timings=_TIMINGS)
+
+    with open(json_report_file, "r") as f:
+        file_contents = json.load(f)
+
+    assert file_contents == {"format_version": "1.1", "actions": {}, "timings": _TIMINGS}
+
+
+def test_format_slowest_steps():
+    lines = report.format_slowest_steps(_TIMINGS, limit=3)
+
+    assert lines[0] == "========== SLOWEST STEPS =========="
+    assert re.match(r"^\s+Wall\s+CPU\s+Max RSS\s+Step$", lines[1])
+    # Sorted by the wall time, the Actions and commands together
+    assert re.match(r"^ 40\.500s\s+1\.250s\s+\+2048K\s+RPM_VA$", lines[2])
+    assert re.match(r"^ 40\.000s\s+RPM_VA: rpm -Va$", lines[3])
+    assert re.match(r"^  2\.000s\s+subscription-manager$", lines[4])
+    assert len(lines) == 5
+
+
+@pytest.mark.parametrize(("timings",), ((None,), (_TIMINGS,)))
+def test_summary_slowest_steps(timings, caplog):
+    report.summary({}, timings=timings, with_colors=False)
+
+    assert ("SLOWEST STEPS" in caplog.records[-1].message) == (timings is not None)
+
+
 @pytest.mark.parametrize(
     ("results", "include_all_reports", "expected_results"),
     (
@@ -61,9 +61,21 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "0.20", "package_version": "C2R convert2rhel-0:0.22-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "0.20", "package_version": "C2R convert2rhel-0:0.22.0-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "0.20.0", "package_version": "C2R convert2rhel-0:0.22-1.el7.noarch", "pmajor": "7"}],
+            [{"local_version": "0.20", "package_version": "C2R\tconvert2rhel\t0\t0.22\t1.el7\tnoarch", "pmajor": "7"}],
+            [
+                {
+                    "local_version": "0.20",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.22.0\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.20.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.22\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -94,11 +106,29 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:0.22-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:1.10-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "1.21.0", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "1.21", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "1.21.1", "package_version": "C2R convert2rhel-0:1.22-1.el7.noarch", "pmajor": "7"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t0.22\t1.el7\tnoarch", "pmajor": "7"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t1.10\t1.el7\tnoarch", "pmajor": "7"}],
+            [
+                {
+                    "local_version": "1.21.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21.1",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.22\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -106,11 +136,8 @@ class TestCheckConvert2rhelLatest:
         convert2rhel_latest_action.run()
 
         local_version, package_version = convert2rhel_latest_version_test
-        if len(package_version) > 36:
-
-            package_version = package_version[19:25]
-        else:
-            package_version = package_version[19:23]
+        # The version of the last package listed by repoquery
+        package_version = package_version.splitlines()[-1].split("\t")[3]
 
         unit_tests.assert_actions_result(
             convert2rhel_latest_action,
@@ -128,11 +155,29 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:0.22-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:1.10-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21.0", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21.1", "package_version": "C2R convert2rhel-0:1.22-1.el7.noarch", "pmajor": "6"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t0.22\t1.el7\tnoarch", "pmajor": "6"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t1.10\t1.el7\tnoarch", "pmajor": "6"}],
+            [
+                {
+                    "local_version": "1.21.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21.1",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.22\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -142,11 +187,8 @@ class TestCheckConvert2rhelLatest:
         convert2rhel_latest_action.run()
 
         local_version, package_version = convert2rhel_latest_version_test
-        if len(package_version) > 36:
-
-            package_version = package_version[19:25]
-        else:
-            package_version = package_version[19:23]
+        # The version of the last package listed by repoquery
+        package_version = package_version.splitlines()[-1].split("\t")[3]
 
         expected = set(
             (
@@ -169,11 +211,29 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:0.22-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "0.21", "package_version": "C2R convert2rhel-0:1.10-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21.0", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21", "package_version": "C2R convert2rhel-0:1.21.1-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "1.21.1", "package_version": "C2R convert2rhel-0:1.22-1.el7.noarch", "pmajor": "6"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t0.22\t1.el7\tnoarch", "pmajor": "6"}],
+            [{"local_version": "0.21", "package_version": "C2R\tconvert2rhel\t0\t1.10\t1.el7\tnoarch", "pmajor": "6"}],
+            [
+                {
+                    "local_version": "1.21.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.21.1\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.21.1",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.22\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -183,11 +243,8 @@ class TestCheckConvert2rhelLatest:
         convert2rhel_latest_action.run()
 
         local_version, package_version = convert2rhel_latest_version_test
-        if len(package_version) > 36:
-
-            package_version = package_version[19:25]
-        else:
-            package_version = package_version[19:23]
+        # The version of the last package listed by repoquery
+        package_version = package_version.splitlines()[-1].split("\t")[3]
 
         expected = set(
             (
@@ -214,7 +271,7 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.18.0",
-                    "package_version": "C2R convert2rhel-0:0.22.0-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.22.0\t1.el7\tnoarch",
                     "pmajor": "6",
                     "enset": "1",
                 }
@@ -222,7 +279,7 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.18.1",
-                    "package_version": "C2R convert2rhel-0:0.22.0-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.22.0\t1.el7\tnoarch",
                     "pmajor": "7",
                     "enset": "1",
                 }
@@ -230,7 +287,7 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.18.3",
-                    "package_version": "C2R convert2rhel-0:0.22.1-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.22.1\t1.el7\tnoarch",
                     "pmajor": "8",
                     "enset": "1",
                 }
@@ -238,7 +295,7 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.18",
-                    "package_version": "C2R convert2rhel-0:1.10.2-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.10.2\t1.el7\tnoarch",
                     "pmajor": "8",
                     "enset": "1",
                 }
@@ -246,7 +303,7 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.18.0",
-                    "package_version": "C2R convert2rhel-0:1.10-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.10\t1.el7\tnoarch",
                     "pmajor": "8",
                     "enset": "1",
                 }
@@ -261,10 +318,8 @@ class TestCheckConvert2rhelLatest:
         convert2rhel_latest_action.run()
 
         local_version, package_version = convert2rhel_latest_version_test
-        if len(package_version) > 36:
-            package_version = package_version[19:25]
-        else:
-            package_version = package_version[19:23]
+        # The version of the last package listed by repoquery
+        package_version = package_version.splitlines()[-1].split("\t")[3]
         log_msg = (
             "You are currently running %s and the latest version of convert2rhel is %s.\n"
             "'CONVERT2RHEL_ALLOW_OLDER_VERSION' environment variable detected, continuing conversion"
@@ -278,14 +333,62 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "0.17.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "0.17.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "0.17.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "8"}],
-            [{"local_version": "0.25.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "6"}],
-            [{"local_version": "0.25.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "7"}],
-            [{"local_version": "0.25.0", "package_version": "C2R convert2rhel-0:0.17.0-1.el7.noarch", "pmajor": "8"}],
-            [{"local_version": "1.10.0", "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch", "pmajor": "8"}],
-            [{"local_version": "1.10.1", "package_version": "C2R convert2rhel-0:1.10.0-1.el7.noarch", "pmajor": "8"}],
+            [
+                {
+                    "local_version": "0.17.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.17.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.17.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.25.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "6",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.25.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "7",
+                }
+            ],
+            [
+                {
+                    "local_version": "0.25.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.10.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.10.1",
+                    "package_version": "C2R\tconvert2rhel\t0\t1.10.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -298,9 +401,27 @@ class TestCheckConvert2rhelLatest:
     @pytest.mark.parametrize(
         ("convert2rhel_latest_version_test",),
         (
-            [{"local_version": "1.10.0", "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch", "pmajor": "8"}],
-            [{"local_version": "1.10", "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch", "pmajor": "8"}],
-            [{"local_version": "1.10.0", "package_version": "C2R convert2rhel-0:0.18-1.el7.noarch", "pmajor": "8"}],
+            [
+                {
+                    "local_version": "1.10.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.10",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
+            [
+                {
+                    "local_version": "1.10.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18\t1.el7\tnoarch",
+                    "pmajor": "8",
+                }
+            ],
         ),
         indirect=True,
     )
@@ -339,21 +460,21 @@ class TestCheckConvert2rhelLatest:
             [
                 {
                     "local_version": "0.19.0",
-                    "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch\nC2R convert2rhel-0:0.17.0-1.el7.noarch\nC2R convert2rhel-0:0.20.0-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.20.0\t1.el7\tnoarch",
                     "pmajor": "8",
                 }
             ],
             [
                 {
                     "local_version": "0.19",
-                    "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch\nC2R convert2rhel-0:0.17.0-1.el7.noarch\nC2R convert2rhel-0:0.20.0-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.17.0\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.20.0\t1.el7\tnoarch",
                     "pmajor": "8",
                 }
             ],
             [
                 {
                     "local_version": "0.19.0",
-                    "package_version": "C2R convert2rhel-0:0.18-1.el7.noarch\nC2R convert2rhel-0:0.17-1.el7.noarch\nC2R convert2rhel-0:0.20-1.el7.noarch",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.17\t1.el7\tnoarch\nC2R\tconvert2rhel\t0\t0.20\t1.el7\tnoarch",
                     "pmajor": "8",
                 }
             ],
@@ -365,10 +486,8 @@ class TestCheckConvert2rhelLatest:
 
         local_version, package_version = convert2rhel_latest_version_test
 
-        if len(package_version) > 110:
-            package_version = package_version[97:103]
-        else:
-            package_version = package_version[93:97]
+        # The version of the last package listed by repoquery
+        package_version = package_version.splitlines()[-1].split("\t")[3]
 
         unit_tests.assert_actions_result(
             convert2rhel_latest_action,
@@ -390,15 +509,27 @@ class TestCheckConvert2rhelLatest:
         ),
         (
             [
-                {"local_version": "0.17.0", "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch", "pmajor": "8"},
+                {
+                    "local_version": "0.17.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                },
                 "0.18.0",
             ],
             [
-                {"local_version": "0.17", "package_version": "C2R convert2rhel-0:0.18.0-1.el7.noarch", "pmajor": "8"},
+                {
+                    "local_version": "0.17",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18.0\t1.el7\tnoarch",
+                    "pmajor": "8",
+                },
                 "0.18.0",
             ],
             [
-                {"local_version": "0.17.0", "package_version": "C2R convert2rhel-0:0.18-1.el7.noarch", "pmajor": "8"},
+                {
+                    "local_version": "0.17.0",
+                    "package_version": "C2R\tconvert2rhel\t0\t0.18\t1.el7\tnoarch",
+                    "pmajor": "8",
+                },
                 "0.18",
             ],
         ),
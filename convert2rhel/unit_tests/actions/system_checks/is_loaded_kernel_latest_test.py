@@ -24,7 +24,7 @@ from collections import namedtuple
 import pytest
 import six
 
-from convert2rhel import actions, pkgmanager, unit_tests
+from convert2rhel import actions, pkgmanager, unit_tests, utils
 from convert2rhel.actions.system_checks import is_loaded_kernel_latest
 from convert2rhel.unit_tests import run_subprocess_side_effect
 from convert2rhel.unit_tests.conftest import centos7, centos8, oracle8
@@ -64,7 +64,7 @@ class TestIsLoadedKernelLatest:
         ),
         (
             (
-                "C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos",
+                "C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos",
                 "3.10.0-1160.42.2.el7.x86_64",
                 0,
                 "kernel-core",
@@ -101,7 +101,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         "--setopt=reposdir=%s" % fake_reposdir_path,
                         package_name,
                     ),
@@ -118,6 +118,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
 
@@ -146,7 +147,7 @@ class TestIsLoadedKernelLatest:
         ),
         (
             (
-                "C2R\t1634146676\t1-1.01-5.02\tbaseos",
+                "C2R\t1634146676\t1-1.01\t5.02\tbaseos",
                 "2-1.01-5.02",
                 0,
                 "kernel-core",
@@ -156,7 +157,7 @@ class TestIsLoadedKernelLatest:
                 None,
             ),
             (
-                "C2R\t1634146676\t1 .01-5.02\tbaseos",
+                "C2R\t1634146676\t1 .01\t5.02\tbaseos",
                 "1 .01-5.03",
                 0,
                 "kernel-core",
@@ -194,7 +195,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         package_name,
                     ),
                     (
@@ -210,6 +211,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
         unit_tests.assert_actions_result(
@@ -235,7 +237,7 @@ class TestIsLoadedKernelLatest:
         ),
         (
             (
-                "C2R\t1634146676\t1-1.01-5.02\tbaseos",
+                "C2R\t1634146676\t1-1.01\t5.02\tbaseos",
                 "2-1.01-5.02",
                 0,
                 "kernel",
@@ -245,7 +247,7 @@ class TestIsLoadedKernelLatest:
                 None,
             ),
             (
-                "C2R\t1634146676\t1 .01-5.02\tbaseos",
+                "C2R\t1634146676\t1 .01\t5.02\tbaseos",
                 "1 .01-5.03",
                 0,
                 "kernel",
@@ -283,7 +285,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         package_name,
                     ),
                     (
@@ -299,6 +301,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
 
@@ -334,12 +337,12 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         "--setopt=reposdir=%s" % fake_reposdir_path,
                         "kernel-core",
                     ),
                     (
-                        "C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos",
+                        "C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos",
                         0,
                     ),
                 ),
@@ -351,6 +354,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
         assert "The currently loaded kernel is at the latest version." in caplog.records[-1].message
@@ -451,7 +455,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         "kernel-core",
                     ),
                     (
@@ -466,6 +470,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
         monkeypatch.setattr(
             os,
             "environ",
@@ -534,7 +539,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         package_name,
                     ),
                     (
@@ -549,6 +554,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
         is_loaded_kernel_latest_action.run()
         diagnosis = diagnosis.format(package_name)
         unit_tests.assert_actions_result(
@@ -572,7 +578,7 @@ class TestIsLoadedKernelLatest:
         ),
         (
             (
-                "C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos",
+                "C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos",
                 "3.10.0-1160.42.2.el7.x86_64",
                 1,
                 8,
@@ -580,7 +586,7 @@ class TestIsLoadedKernelLatest:
                 "Couldn't fetch the list of the most recent kernels available in the repositories.",
             ),
             (
-                "C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos",
+                "C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos",
                 "3.10.0-1160.45.1.el7.x86_64",
                 0,
                 7,
@@ -593,7 +599,7 @@ class TestIsLoadedKernelLatest:
                 Repository updates is listed more than once in the configuration\n
                 Repository extras is listed more than once in the configuration\n
                 Repository centosplus is listed more than once in the configuration\n
-                C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos\n
+                C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos\n
                 Could not retrieve mirrorlist http://mirorlist.centos.org/?release=7&arch=x86_64&repo=os&infra=stock error was\n
                 14: curl#6 - "Could not resolve host: mirorlist.centos.org; Unknown error"\n
                 Repo convert2rhel-for-rhel-7-rpms forced skip_if_unavailable=True due to: /etc/rhsm/ca/redhat-uep.pem\n
@@ -607,7 +613,7 @@ class TestIsLoadedKernelLatest:
             (
                 """
                 gargabe-output before the good line\n
-                C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos\n
+                C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos\n
                 more garbage\n
                 """,
                 "3.10.0-1160.45.1.el7.x86_64",
@@ -651,7 +657,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         package_name,
                     ),
                     (
@@ -667,12 +673,13 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
         assert expected_message in caplog.records[-1].message
 
     def test_is_loaded_kernel_latest_system_exit(self, monkeypatch, caplog, is_loaded_kernel_latest_action):
-        repoquery_version = "C2R\t1634146676\t3.10.0-1160.45.1.el7\tbaseos"
+        repoquery_version = "C2R\t1634146676\t3.10.0\t1160.45.1.el7\tbaseos"
         uname_version = "3.10.0-1160.42.2.el7.x86_64"
 
         # Using the minor version as 99, so the tests should never fail because of a
@@ -696,7 +703,7 @@ class TestIsLoadedKernelLatest:
                         "--setopt=exclude=",
                         "--quiet",
                         "--qf",
-                        "C2R\\t%{BUILDTIME}\\t%{VERSION}-%{RELEASE}\\t%{REPOID}",
+                        "C2R\\t%{BUILDTIME}\\t%{VERSION}\\t%{RELEASE}\\t%{REPOID}",
                         "kernel-core",
                     ),
                     (
@@ -712,6 +719,7 @@ class TestIsLoadedKernelLatest:
             "run_subprocess",
             value=run_subprocess_mocked,
         )
+        monkeypatch.setattr(utils, "run_subprocess", value=run_subprocess_mocked)
 
         is_loaded_kernel_latest_action.run()
         unit_tests.assert_actions_result(
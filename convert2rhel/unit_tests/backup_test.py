@@ -29,33 +29,57 @@ class RunSubprocessMocked(unit_tests.MockFunction):
         return self.output, self.ret_code
 
 
+class RpmMocked(unit_tests.MockFunction):
+    """Stand-in for the rpm -q and rpm -e --nodeps commands run through run_subprocess."""
+
+    def __init__(self, installed, failing):
+        self.installed = set(installed)
+        self.failing = set(failing)
+        self.cmds = []
+
+    def __call__(self, cmd, print_cmd=True, print_output=True):
+        self.cmds.append(cmd)
+        if cmd[:2] == ["rpm", "-q"]:
+            return (
+                "".join(
+                    "%s\n" % pkg if pkg in self.installed else "package %s is not installed\n" % pkg for pkg in cmd[2:]
+                ),
+                0,
+            )
+
+        pkgs = cmd[3:]
+        if not self.installed.issuperset(pkgs):
+            # rpm doesn't remove anything when any of the packages is missing
+            return "error: package is not installed", 1
+        # Packages with a failing scriptlet stay installed, the rest is removed
+        self.installed -= set(pkgs) - self.failing
+        return "", 1 if self.failing.intersection(pkgs) else 0
+
+
 class TestRemovePkgs:
     def test_remove_pkgs_without_backup(self, monkeypatch):
-        monkeypatch.setattr(backup.changed_pkgs_control, "backup_and_track_removed_pkg", mock.Mock())
+        monkeypatch.setattr(backup.changed_pkgs_control, "backup_and_track_removed_pkgs", mock.Mock())
         monkeypatch.setattr(backup, "run_subprocess", RunSubprocessMocked())
         pkgs = ["pkg1", "pkg2", "pkg3"]
 
         backup.remove_pkgs(pkgs, False)
 
-        assert backup.changed_pkgs_control.backup_and_track_removed_pkg.call_count == 0
-        assert backup.run_subprocess.called == len(pkgs)
-
-        rpm_remove_cmd = ["rpm", "-e", "--nodeps"]
-        for cmd, pkg in zip(backup.run_subprocess.cmds, pkgs):
-            assert rpm_remove_cmd + [pkg] == cmd
+        assert backup.changed_pkgs_control.backup_and_track_removed_pkgs.call_count == 0
+        # All the packages are removed in a single transaction
+        assert backup.run_subprocess.cmds == [["rpm", "-q"] + pkgs, ["rpm", "-e", "--nodeps"] + pkgs]
 
     def test_remove_pkgs_with_backup(self, monkeypatch):
-        monkeypatch.setattr(backup.changed_pkgs_control, "backup_and_track_removed_pkg", mock.Mock())
+        monkeypatch.setattr(backup.changed_pkgs_control, "backup_and_track_removed_pkgs", mock.Mock())
         monkeypatch.setattr(backup, "run_subprocess", RunSubprocessMocked())
         pkgs = ["pkg1", "pkg2", "pkg3"]
 
         backup.remove_pkgs(pkgs)
 
-        assert backup.changed_pkgs_control.backup_and_track_removed_pkg.call_count == len(pkgs)
-        assert backup.run_subprocess.called == len(pkgs)
-        rpm_remove_cmd = ["rpm", "-e", "--nodeps"]
-        for cmd, pkg in zip(backup.run_subprocess.cmds, pkgs):
-            assert rpm_remove_cmd + [pkg] == cmd
+        # All the packages are backed up at once
+        backup.changed_pkgs_control.backup_and_track_removed_pkgs.assert_called_once_with(
+            pkgs=pkgs, reposdir=None, set_releasever=False, custom_releasever=None, varsdir=None
+        )
+        assert backup.run_subprocess.cmds == [["rpm", "-q"] + pkgs, ["rpm", "-e", "--nodeps"] + pkgs]
 
     @pytest.mark.parametrize(
         ("pkgs_to_remove", "ret_code", "backup_pkg", "critical", "expected"),
@@ -97,6 +121,28 @@ class TestRemovePkgs:
 
         assert expected.format(pkgs_to_remove[0]) in caplog.records[-1].message
 
+    @pytest.mark.parametrize(
+        ("installed", "failing", "expected_removed", "expected_failed"),
+        (
+            (["pkg1", "pkg2", "pkg3", "pkg4"], [], ["pkg1", "pkg2", "pkg3", "pkg4"], []),
+            (["pkg1", "pkg2", "pkg3", "pkg4"], ["pkg3"], ["pkg1", "pkg2", "pkg4"], ["pkg3"]),
+            (["pkg1", "pkg2", "pkg3", "pkg4"], ["pkg1", "pkg4"], ["pkg2", "pkg3"], ["pkg1", "pkg4"]),
+            (["pkg1", "pkg3", "pkg4"], [], ["pkg1", "pkg3", "pkg4"], ["pkg2"]),
+        ),
+    )
+    def test_remove_pkgs_bisects_failed_transaction(
+        self, installed, failing, expected_removed, expected_failed, monkeypatch, caplog
+    ):
+        rpm = RpmMocked(installed, failing)
+        monkeypatch.setattr(backup, "run_subprocess", rpm)
+
+        removed = backup.remove_pkgs(["pkg1", "pkg2", "pkg3", "pkg4"], backup=False, critical=False)
+
+        assert removed == expected_removed
+        assert rpm.installed == set(expected_failed) & set(installed)
+        if expected_failed:
+            assert "Couldn't remove %s." % ", ".join(expected_failed) in caplog.records[-1].message
+
     def test_remove_pkgs_with_empty_list(self, caplog):
         backup.remove_pkgs([])
         assert "No package to remove" in caplog.messages[-1]
@@ -145,6 +191,18 @@ def test_backup_and_track_removed_pkg(monkeypatch):
     assert len(control.removed_pkgs) == len(pkgs)
 
 
+def test_backup_and_track_removed_pkgs(monkeypatch):
+    monkeypatch.setattr(backup.RestorablePackage, "backup_many", mock.Mock())
+
+    control = backup.ChangedRPMPackagesController()
+    pkgs = ["pkg1", "pkg2", "pkg3"]
+    control.backup_and_track_removed_pkgs(pkgs, reposdir="/reposdir")
+
+    assert backup.RestorablePackage.backup_many.call_count == 1
+    assert [pkg.name for pkg in backup.RestorablePackage.backup_many.call_args[0][0]] == pkgs
+    assert [pkg.name for pkg in control.removed_pkgs] == pkgs
+
+
 def test_track_installed_pkg():
     control = backup.ChangedRPMPackagesController()
     pkgs = ["pkg1", "pkg2", "pkg3"]
@@ -379,6 +437,40 @@ def test_restorable_package_backup(pretend_os, is_eus_system, has_internet_acces
     assert download_pkg_mock.call_count == 1
 
 
+@centos8
+def test_restorable_package_backup_many(pretend_os, monkeypatch, tmpdir):
+    download_pkgs_mock = mock.Mock(return_value=["/backup/pkg-1.rpm", None])
+    monkeypatch.setattr(backup, "download_pkgs", download_pkgs_mock)
+    monkeypatch.setattr(backup, "BACKUP_DIR", str(tmpdir))
+    monkeypatch.setattr(backup.system_info, "corresponds_to_rhel_eus_release", value=lambda: False)
+    backup.system_info.has_internet_access = True
+    restorable_pkgs = [backup.RestorablePackage(pkgname="pkg-1"), backup.RestorablePackage(pkgname="pkg-2")]
+
+    backup.RestorablePackage.backup_many(restorable_pkgs, reposdir="/reposdir", set_releasever=True)
+
+    download_pkgs_mock.assert_called_once_with(
+        ["pkg-1", "pkg-2"],
+        dest=str(tmpdir),
+        set_releasever=True,
+        reposdir="/reposdir",
+        custom_releasever=None,
+        varsdir=None,
+    )
+    # A package that failed to download keeps no path, as with backup()
+    assert [pkg.path for pkg in restorable_pkgs] == ["/backup/pkg-1.rpm", None]
+
+
+def test_restorable_package_backup_many_without_dir(monkeypatch, tmpdir, caplog):
+    backup_dir = str(tmpdir.join("non-existing"))
+    monkeypatch.setattr(backup, "BACKUP_DIR", backup_dir)
+    monkeypatch.setattr(backup, "download_pkgs", mock.Mock())
+
+    backup.RestorablePackage.backup_many([backup.RestorablePackage(pkgname="pkg-1")])
+
+    assert "Can't access %s" % backup_dir in caplog.records[-1].message
+    assert not backup.download_pkgs.called
+
+
 @pytest.fixture
 def backup_controller():
     return backup.BackupController()
@@ -522,10 +614,19 @@ class TestRestorableRpmKey:
         monkeypatch.setattr(utils, "run_subprocess", run_subprocess_fail)
 
         with pytest.raises(
-            utils.ImportGPGKeyError, match="Searching the rpmdb for the gpg key fd431d51 failed: Code 1: Unknown error"
+            utils.ImportGPGKeyError, match="Searching the rpmdb for the gpg keys failed: Code 1: Unknown error"
         ):
             rpm_key.installed
 
+    def test_installed_queried_once(self, run_subprocess_with_empty_rpmdb, rpm_key):
+        utils.run_subprocess(["rpm", "--import", self.gpg_key], print_output=False)
+        legacy_rpm_key = backup.RestorableRpmKey(self.gpg_key.replace("redhat-release", "redhat-legacy-release"))
+        called_previously = len(run_subprocess_with_empty_rpmdb.called_with)
+
+        assert rpm_key.installed is True
+        assert legacy_rpm_key.installed is False
+        assert len(run_subprocess_with_empty_rpmdb.called_with) == called_previously + 1
+
     def test_enable(self, run_subprocess_with_empty_rpmdb, rpm_key):
         rpm_key.enable()
 
@@ -5,8 +5,18 @@ import sys
 import pytest
 import six
 
-from convert2rhel import backup, cert, pkgmanager, redhatrelease, systeminfo, toolopts, utils
+from convert2rhel import (
+    backup,
+    cert,
+    kmodindex,
+    pkgmanager,
+    redhatrelease,
+    systeminfo,
+    toolopts,
+    utils,
+)
 from convert2rhel.logger import setup_logger_handler
+from convert2rhel.pkgmanager.handlers import plan
 from convert2rhel.systeminfo import system_info
 from convert2rhel.toolopts import tool_opts
 from convert2rhel.unit_tests import MinimalRestorable
@@ -109,6 +119,30 @@ def setup_logger(tmpdir):
     setup_logger_handler(log_name="convert2rhel", log_dir=str(tmpdir))
 
 
+@pytest.fixture(autouse=True)
+def reset_caches():
+    """Make sure no test is served anything a previous test left in memory, e.g. the installed packages."""
+    utils.reset_caches()
+    yield
+    utils.reset_caches()
+
+
+@pytest.fixture(autouse=True)
+def transaction_plan_file(tmpdir, monkeypatch):
+    """Keep the plan of the validated transaction in the test's temporary directory."""
+    plan_file = str(tmpdir.join("transaction-plan.json"))
+    monkeypatch.setattr(plan, "TRANSACTION_PLAN_FILE", plan_file)
+    return plan_file
+
+
+@pytest.fixture(autouse=True)
+def kmod_index_file(tmpdir, monkeypatch):
+    """Keep the index of the kernel modules in the repositories in the test's temporary directory."""
+    index_file = str(tmpdir.join("kmod-index.json"))
+    monkeypatch.setattr(kmodindex, "KMOD_INDEX_FILE", index_file)
+    return index_file
+
+
 @pytest.fixture
 def system_cert_with_target_path(monkeypatch, tmpdir, request):
     """
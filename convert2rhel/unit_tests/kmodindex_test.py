@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+
+import pytest
+import six
+
+from convert2rhel import kmodindex, pkgmanager
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+class KmodPackageMock:
+    def __init__(self, name, release, reponame="rhel-8-for-x86_64-baseos-rpms", files=None):
+        self.name = name
+        self.epoch = 0
+        self.version = "4.18.0"
+        self.release = release
+        self.arch = "x86_64"
+        self.reponame = reponame
+        self.files = files or []
+
+    def evr_gt(self, other):
+        return int(self.release) > int(other.release)
+
+
+BASEOS_REPOMD = "/var/cache/dnf/rhel-8-for-x86_64-baseos-rpms-0123456789abcdef/repodata/repomd.xml"
+APPSTREAM_REPOMD = "/var/cache/dnf/rhel-8-for-x86_64-appstream-rpms-0123456789abcdef/repodata/repomd.xml"
+REPOIDS = ["rhel-8-for-x86_64-baseos-rpms", "rhel-8-for-x86_64-appstream-rpms"]
+
+PKGS = [
+    KmodPackageMock(
+        "kernel-core",
+        "240",
+        files=[
+            "/lib/modules/4.18.0-240.el8.x86_64/kernel/lib/a.ko.xz",
+            "/lib/modules/4.18.0-240.el8.x86_64/kernel/lib/old.ko.xz",
+        ],
+    ),
+    KmodPackageMock(
+        "kernel-core",
+        "305",
+        files=[
+            "/lib/modules/4.18.0-305.el8.x86_64/kernel/lib/a.ko.xz",
+            "/lib/modules/4.18.0-305.el8.x86_64/kernel/lib/b.ko",
+            "/lib/modules/4.18.0-305.el8.x86_64/modules.dep",
+            "/boot/vmlinuz-4.18.0-305.el8.x86_64",
+        ],
+    ),
+    KmodPackageMock(
+        "kmod-foo",
+        "1",
+        reponame="rhel-8-for-x86_64-appstream-rpms",
+        files=["/lib/modules/4.18.0-305.el8.x86_64/extra/foo/foo.ko"],
+    ),
+    KmodPackageMock("not-a-kernel", "1", files=["/lib/modules/4.18.0-305.el8.x86_64/extra/bar.ko"]),
+]
+
+
+@pytest.fixture
+def index_file(tmpdir):
+    return str(tmpdir.join("kmod-index.json"))
+
+
+@pytest.fixture
+def revisions(monkeypatch):
+    revisions = {BASEOS_REPOMD: "1", APPSTREAM_REPOMD: "1"}
+    monkeypatch.setattr(kmodindex, "get_repomd_revisions", lambda: dict(revisions))
+    return revisions
+
+
+@pytest.fixture
+def get_base_mocked(monkeypatch):
+    monkeypatch.setattr(pkgmanager, "TYPE", "dnf")
+    base = mock.Mock()
+
+    def _filter(reponame, file__glob):
+        return [pkg for pkg in PKGS if pkg.reponame in reponame]
+
+    base.sack.query.return_value.available.return_value.filter.side_effect = _filter
+    get_base_mocked = mock.Mock(return_value=base)
+    monkeypatch.setattr(kmodindex.session, "get_base", get_base_mocked)
+    return get_base_mocked
+
+
+def test_get_rhel_kmods(index_file, revisions, get_base_mocked):
+    packages, kmods = kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    # Only the most recent kernel packages
+    assert packages == ["kernel-core-0:4.18.0-305.x86_64", "kmod-foo-0:4.18.0-1.x86_64"]
+    assert kmods == set(("kernel/lib/a.ko.xz", "kernel/lib/b.ko", "extra/foo/foo.ko"))
+
+    with open(index_file) as f:
+        index = json.load(f)
+    assert index["repos"]["rhel-8-for-x86_64-baseos-rpms"] == {
+        "releasever": "8.5",
+        "revision": ["1"],
+        "packages": {
+            "kernel-core": {
+                "package": "kernel-core-0:4.18.0-305.x86_64",
+                "evr": ["0", "4.18.0", "305"],
+                "kmods": ["kernel/lib/a.ko.xz", "kernel/lib/b.ko"],
+            }
+        },
+    }
+
+
+def test_get_rhel_kmods_newest_across_repos(index_file, revisions, get_base_mocked, monkeypatch):
+    newer_kernel = KmodPackageMock(
+        "kernel-core",
+        "372",
+        reponame="rhel-8-for-x86_64-appstream-rpms",
+        files=["/lib/modules/4.18.0-372.el8.x86_64/kernel/lib/a.ko.xz"],
+    )
+    monkeypatch.setattr(kmodindex, "rpm", mock.Mock(labelCompare=lambda evr1, evr2: int(evr1[2]) - int(evr2[2])))
+    monkeypatch.setitem(globals(), "PKGS", PKGS + [newer_kernel])
+
+    packages, kmods = kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    # The kernel in the baseos repository is superseded by the one in the
+    # appstream repository
+    assert packages == ["kernel-core-0:4.18.0-372.x86_64", "kmod-foo-0:4.18.0-1.x86_64"]
+    assert kmods == set(("kernel/lib/a.ko.xz", "extra/foo/foo.ko"))
+
+
+def test_get_rhel_kmods_stored_index(index_file, revisions, get_base_mocked):
+    expected = kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+    get_base_mocked.reset_mock()
+
+    assert kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file) == expected
+    # The metadata is loaded to refresh it, the file lists are not read
+    assert get_base_mocked.call_count == 1
+    filter_mock = get_base_mocked.return_value.sack.query.return_value.available.return_value.filter
+    assert filter_mock.call_count == 0
+
+
+def test_get_rhel_kmods_refreshed_metadata(index_file, revisions, get_base_mocked):
+    kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+    filter_mock = get_base_mocked.return_value.sack.query.return_value.available.return_value.filter
+    filter_mock.reset_mock()
+
+    def refresh_metadata(*args):
+        revisions[BASEOS_REPOMD] = "2"
+        return get_base_mocked.return_value
+
+    get_base_mocked.side_effect = refresh_metadata
+
+    kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    filter_mock.assert_called_once_with(
+        reponame=["rhel-8-for-x86_64-baseos-rpms"], file__glob=kmodindex._KMOD_FILE_GLOB
+    )
+
+
+def test_get_rhel_kmods_outdated_repo(index_file, revisions, get_base_mocked):
+    kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+    revisions[APPSTREAM_REPOMD] = "2"
+
+    kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    filter_mock = get_base_mocked.return_value.sack.query.return_value.available.return_value.filter
+    filter_mock.assert_called_with(reponame=["rhel-8-for-x86_64-appstream-rpms"], file__glob=kmodindex._KMOD_FILE_GLOB)
+
+
+@pytest.mark.parametrize(
+    ("stored_releasever", "repomd_revisions"),
+    (
+        ("8.4", {BASEOS_REPOMD: "1", APPSTREAM_REPOMD: "1"}),
+        # No cached metadata to compare the stored revision with
+        ("8.5", {}),
+    ),
+)
+def test_get_rhel_kmods_reindex(index_file, get_base_mocked, monkeypatch, stored_releasever, repomd_revisions):
+    monkeypatch.setattr(kmodindex, "get_repomd_revisions", lambda: repomd_revisions)
+    kmodindex.get_rhel_kmods(REPOIDS, stored_releasever, index_file=index_file)
+    filter_mock = get_base_mocked.return_value.sack.query.return_value.available.return_value.filter
+    filter_mock.reset_mock()
+
+    kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    assert filter_mock.call_count == 1
+
+
+def test_get_rhel_kmods_repo_error(index_file, revisions, get_base_mocked, monkeypatch):
+    close_base_mocked = mock.Mock()
+    monkeypatch.setattr(kmodindex.session, "close_base", close_base_mocked)
+    get_base_mocked.side_effect = pkgmanager.RepoError("Cannot download repomd.xml")
+
+    with pytest.raises(kmodindex.KmodIndexError, match="Cannot download repomd.xml"):
+        kmodindex.get_rhel_kmods(REPOIDS, "8.5", index_file=index_file)
+
+    assert close_base_mocked.call_count == 1
+
+
+def test_get_repo_revisions(monkeypatch):
+    monkeypatch.setattr(
+        kmodindex,
+        "get_repomd_revisions",
+        lambda: {
+            BASEOS_REPOMD: "2",
+            "/var/cache/dnf/rhel-8-for-x86_64-baseos-rpms-fedcba9876543210/repodata/repomd.xml": "1",
+            "/var/cache/yum/x86_64/7Server/rhel-7-server-rpms/repomd.xml": "3",
+        },
+    )
+
+    assert kmodindex._get_repo_revisions() == {
+        "rhel-8-for-x86_64-baseos-rpms": ["1", "2"],
+        "rhel-7-server-rpms": ["3"],
+    }
+
+
+@pytest.mark.parametrize(
+    ("content",),
+    (
+        ("not json",),
+        (json.dumps({"version": 0, "repos": {}}),),
+    ),
+)
+def test_load_index_invalid(index_file, content):
+    with open(index_file, "w") as f:
+        f.write(content)
+
+    assert kmodindex._load_index(index_file) == {"version": kmodindex._KMOD_INDEX_VERSION, "repos": {}}
+
+
+@pytest.mark.parametrize(
+    ("path", "expected"),
+    (
+        ("/lib/modules/5.8.0-7642-generic/kernel/lib/a.ko.xz", "kernel/lib/a.ko.xz"),
+        ("/lib/modules/6.1.18-200.fc37.x86_64/kernel/lib/crc8.ko\n", "kernel/lib/crc8.ko"),
+    ),
+)
+def test_get_kmod_comparison_key(path, expected):
+    assert kmodindex.get_kmod_comparison_key(path) == expected
@@ -17,10 +17,13 @@
 
 import logging
 import os
+import re
+import threading
 
 import pytest
+import six
 
-from convert2rhel import logger as logger_module
+from convert2rhel import logger as logger_module, utils
 
 
 def test_logger_handlers(monkeypatch, tmpdir, caplog, read_std, is_py2, global_tool_opts, clear_loggers):
@@ -29,7 +32,7 @@ def test_logger_handlers(monkeypatch, tmpdir, caplog, read_std, is_py2, global_t
 
     # initializing the logger first
     log_fname = "convert2rhel.log"
-    global_tool_opts.debug = True  # debug entries > stdout if True
+    monkeypatch.setattr(logger_module, "_debug_enabled", True)  # debug entries > stdout if True
     logger_module.setup_logger_handler(log_name=log_fname, log_dir=str(tmpdir))
     logger = logging.getLogger(__name__)
 
@@ -53,7 +56,8 @@ def test_tools_opts_debug(monkeypatch, tmpdir, read_std, is_py2, global_tool_opt
     log_fname = "convert2rhel.log"
     logger_module.setup_logger_handler(log_name=log_fname, log_dir=str(tmpdir))
     logger = logging.getLogger(__name__)
-    global_tool_opts.debug = True
+    monkeypatch.setattr(logger_module, "_debug_enabled", False)
+    logger_module.set_debug(True)
     logger.debug("debug entry 1: %s", "data")
     stdouterr_out, stdouterr_err = read_std()
     # TODO should be in stdout, but this only works when running this test
@@ -67,7 +71,7 @@ def test_tools_opts_debug(monkeypatch, tmpdir, read_std, is_py2, global_tool_opt
             # this workaround is not working for py2 - passing
             pass
 
-    global_tool_opts.debug = False
+    logger_module.set_debug(False)
     logger.debug("debug entry 2: %s", "data")
     stdouterr_out, stdouterr_err = read_std()
     assert "debug entry 2: data" not in stdouterr_out
@@ -125,3 +129,166 @@ def test_archive_old_logger_files(log_name, path_exists, tmpdir, caplog):
 def test_should_disable_color_output(monkeypatch, no_color_value, should_disable_color):
     monkeypatch.setattr(os, "environ", {"NO_COLOR": no_color_value})
     assert logger_module.should_disable_color_output() == should_disable_color
+
+
+def test_buffered_file_handler(tmpdir, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(logger_module.time, "time", lambda: now[0])
+    log_file = tmpdir.join("convert2rhel.log")
+    handler = logger_module.BufferedFileHandler(str(log_file), "a")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+
+    def emit(level, message):
+        handler.handle(logging.LogRecord("convert2rhel", level, __file__, 1, message, None, None))
+
+    emit(logger_module.LogLevelFile.level, "file 1")
+    assert log_file.read() == ""
+
+    now[0] = 1.0
+    emit(logger_module.LogLevelFile.level, "file 2")
+    assert log_file.read() == "file 1\nfile 2\n"
+
+    emit(logger_module.LogLevelFile.level, "file 3")
+    assert log_file.read() == "file 1\nfile 2\n"
+
+    emit(logging.DEBUG, "debug")
+    assert log_file.read() == "file 1\nfile 2\nfile 3\ndebug\n"
+
+    emit(logger_module.LogLevelFile.level, "file 4")
+    handler.close()
+    assert log_file.read() == "file 1\nfile 2\nfile 3\ndebug\nfile 4\n"
+
+
+@pytest.mark.parametrize(
+    ("async_logging", "handler_class"),
+    (("0", logging.FileHandler), ("1", logger_module.BufferedFileHandler)),
+)
+def test_setup_logger_handler_file_handler(
+    async_logging, handler_class, tmpdir, monkeypatch, global_tool_opts, clear_loggers
+):
+    monkeypatch.setenv(logger_module.ASYNC_LOGGING_ENVVAR, async_logging)
+    logger_module.setup_logger_handler(log_name="convert2rhel.log", log_dir=str(tmpdir))
+
+    assert type(logger_module._output_handlers[1]) is handler_class
+
+
+@pytest.mark.parametrize(
+    ("level", "color_disabled", "expected"),
+    (
+        (logging.INFO, False, "Some message"),
+        (logging.WARNING, True, "WARNING - Some message"),
+        (logging.WARNING, False, "\033[93mWARNING - Some message\033[0m"),
+        (logging.ERROR, False, "\033[91mERROR - Some message\033[0m"),
+        (logging.CRITICAL, True, "CRITICAL - Some message"),
+    ),
+)
+def test_custom_formatter(level, color_disabled, expected):
+    formatter = logger_module.CustomFormatter("%(message)s")
+    formatter.disable_colors(color_disabled)
+    record = logging.LogRecord("convert2rhel", level, __file__, 1, "Some %s", ("message",), None)
+
+    assert formatter.format(record) == expected
+
+
+def test_custom_formatter_timestamped_levels():
+    logging.addLevelName(logger_module.LogLevelTask.level, logger_module.LogLevelTask.label)
+    logging.addLevelName(logger_module.LogLevelFile.level, logger_module.LogLevelFile.label)
+    formatter = logger_module.CustomFormatter("%(message)s")
+    formatter.disable_colors(True)
+
+    def format_record(level, message):
+        return formatter.format(logging.LogRecord("convert2rhel", level, __file__, 1, message, None, None))
+
+    task = format_record(logger_module.LogLevelTask.level, "Some task")
+    assert re.match(r"^\n\[[0-9T:+-]+\] TASK - \[Some task\] \*{56}$", task)
+    assert re.match(r"^\[[0-9T:+-]+\] DEBUG - Some debug$", format_record(logging.DEBUG, "Some debug"))
+    assert re.match(r"^\[[0-9T:+-]+\] DEBUG - Some file$", format_record(logger_module.LogLevelFile.level, "Some file"))
+
+
+def test_queue_handler(tmpdir, monkeypatch, global_tool_opts, clear_loggers):
+    monkeypatch.setenv(logger_module.ASYNC_LOGGING_ENVVAR, "1")
+    log_fname = "convert2rhel.log"
+    logger_module.setup_logger_handler(log_name=log_fname, log_dir=str(tmpdir))
+    logger = logging.getLogger(__name__)
+    data = ["data"]
+
+    logger.task("Some task")
+    logger.info("Test info: %s", data)
+    # The arguments are merged into the message when the record is logged
+    data.append("changed")
+    logger.file("Test file")
+    try:
+        raise ValueError("Test exception")
+    except ValueError:
+        logger.warning("Test warning", exc_info=True)
+    with pytest.raises(SystemExit):
+        logger.critical("Critical error")
+
+    # Critical flushes the queue before exiting
+    log = tmpdir.join(log_fname).read()
+    assert "TASK - [Some task]" in log
+    assert "Test info: ['data']\n" in log
+    assert "DEBUG - Test file\n" in log
+    assert "WARNING - Test warning\nTraceback" in log
+    assert "ValueError: Test exception\n" in log
+    assert log.endswith("CRITICAL - Critical error\n")
+
+
+def test_queue_handler_child_process(tmpdir, monkeypatch):
+    stream = six.StringIO()
+    handler = logging.StreamHandler(stream)
+    queue_handler = logger_module.QueueHandler([handler])
+    # Pretend the record is logged in a forked child process
+    monkeypatch.setattr(logger_module.os, "getpid", lambda: -1)
+
+    queue_handler.handle(logging.LogRecord("convert2rhel", logging.INFO, __file__, 1, "Child %s", ("data",), None))
+
+    assert stream.getvalue() == "Child data\n"
+    assert queue_handler._queue.empty()
+
+
+@pytest.mark.parametrize("async_logging", ("0", "1"))
+def test_child_process_logging(async_logging, tmpdir, monkeypatch, global_tool_opts, clear_loggers):
+    monkeypatch.setenv(logger_module.ASYNC_LOGGING_ENVVAR, async_logging)
+    log_fname = "convert2rhel.log"
+    logger_module.setup_logger_handler(log_name=log_fname, log_dir=str(tmpdir))
+    logger = logging.getLogger(__name__)
+    file_handler = logger_module._output_handlers[1]
+
+    @utils.run_as_child_process
+    def log_in_child():
+        logger.file("Child record")
+        return id(file_handler.lock)
+
+    # Held back by the BufferedFileHandler when forking with async logging
+    logger.file("Parent record")
+    child_lock_id = log_in_child()
+    logger_module.flush()
+
+    # The child doesn't inherit the lock the parent held while forking
+    assert child_lock_id != id(file_handler.lock)
+    # The child wrote its record before exiting, the parent record is written just once
+    log = tmpdir.join(log_fname).read()
+    assert log.count("DEBUG - Parent record\n") == 1
+    assert log.count("DEBUG - Child record\n") == 1
+
+
+def test_prepared_for_fork(tmpdir, monkeypatch, global_tool_opts, clear_loggers):
+    monkeypatch.setenv(logger_module.ASYNC_LOGGING_ENVVAR, "1")
+    log_fname = "convert2rhel.log"
+    logger_module.setup_logger_handler(log_name=log_fname, log_dir=str(tmpdir))
+    logging.getLogger(__name__).file("Queued record")
+    acquired = []
+
+    def try_acquire():
+        for handler in logger_module._output_handlers:
+            acquired.append(handler.lock.acquire(False))
+
+    with logger_module.prepared_for_fork():
+        # The queue is drained and no other thread can write a record
+        assert "Queued record" in tmpdir.join(log_fname).read()
+        thread = threading.Thread(target=try_acquire)
+        thread.start()
+        thread.join()
+
+    assert acquired == [False, False]
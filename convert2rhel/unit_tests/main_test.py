@@ -127,11 +127,13 @@ def test_main(monkeypatch, tmp_path):
     check_kernel_boot_files_mock = mock.Mock()
     update_rhsm_custom_facts_mock = mock.Mock()
     summary_as_json_mock = mock.Mock()
+    set_debug_mock = mock.Mock()
 
     monkeypatch.setattr(applock, "_DEFAULT_LOCK_DIR", str(tmp_path))
     monkeypatch.setattr(utils, "require_root", require_root_mock)
     monkeypatch.setattr(main, "initialize_logger", initialize_logger_mock)
     monkeypatch.setattr(toolopts, "CLI", toolopts_cli_mock)
+    monkeypatch.setattr(main.logger_module, "set_debug", set_debug_mock)
     monkeypatch.setattr(main, "show_eula", show_eula_mock)
     monkeypatch.setattr(breadcrumbs, "print_data_collection", print_data_collection_mock)
     monkeypatch.setattr(system_info, "resolve_system_info", resolve_system_info_mock)
@@ -157,6 +159,7 @@ def test_main(monkeypatch, tmp_path):
     assert require_root_mock.call_count == 1
     assert initialize_logger_mock.call_count == 1
     assert toolopts_cli_mock.call_count == 1
+    set_debug_mock.assert_called_once_with(toolopts.tool_opts.debug)
     assert show_eula_mock.call_count == 1
     assert print_data_collection_mock.call_count == 1
     assert resolve_system_info_mock.call_count == 1
@@ -175,6 +178,16 @@ def test_main(monkeypatch, tmp_path):
     assert check_kernel_boot_files_mock.call_count == 1
     assert update_rhsm_custom_facts_mock.call_count == 1
     assert summary_as_json_mock.call_count == 1
+    # The timings are only part of the report when debugging
+    assert summary_as_json_mock.call_args[1]["timings"] is None
+
+
+@pytest.mark.parametrize(("debug", "expected"), ((False, None), (True, {"actions": {}, "commands": []})))
+def test_get_report_timings(debug, expected, global_tool_opts, monkeypatch):
+    global_tool_opts.debug = debug
+    monkeypatch.setattr(main.timings.timings, "to_dict", mock.Mock(return_value={"actions": {}, "commands": []}))
+
+    assert main._get_report_timings() == expected
 
 
 class TestRollbackFromMain:
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import base64
+import os
+
+import pytest
+
+from convert2rhel import openpgp
+
+
+GPG_KEYS_DIR = os.path.realpath(os.path.join(os.path.dirname(__file__), "../data/version-independent/gpg-keys"))
+
+# A v4 public key packet body: version, creation time, algorithm and the key material
+KEY_BODY = b"\x04\x5d\xad\xbb\xc1\x01" + b"\x00\x08\xff" + b"\x00\x01\x01"
+
+
+def _armor(data):
+    return "\n".join(
+        [
+            "-----BEGIN PGP PUBLIC KEY BLOCK-----",
+            "Version: GnuPG v1",
+            "",
+            base64.b64encode(data).decode("ascii"),
+            "=abcd",
+            "-----END PGP PUBLIC KEY BLOCK-----",
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    ("keyfile", "fingerprint"),
+    (
+        ("RPM-GPG-KEY-redhat-release", "567e347ad0044ade55ba8a5f199e2f91fd431d51"),
+        ("RPM-GPG-KEY-redhat-legacy-release", "47db287789b21722b6d95dde5326810137017186"),
+    ),
+)
+def test_get_fingerprint(keyfile, fingerprint):
+    assert openpgp.get_fingerprint(os.path.join(GPG_KEYS_DIR, keyfile)) == fingerprint
+
+
+@pytest.mark.parametrize(
+    ("data",),
+    (
+        # New format packet header, one octet length
+        (b"\xc6" + bytes(bytearray([len(KEY_BODY)])) + KEY_BODY,),
+        # Old format packet header, one octet length
+        (b"\x98" + bytes(bytearray([len(KEY_BODY)])) + KEY_BODY,),
+        # Old format packet header, two octet length
+        (b"\x99\x00" + bytes(bytearray([len(KEY_BODY)])) + KEY_BODY,),
+        # Preceded by a user ID packet
+        (b"\xcd\x03abc\xc6" + bytes(bytearray([len(KEY_BODY)])) + KEY_BODY,),
+    ),
+)
+def test_get_fingerprint_packet_formats(data, tmpdir):
+    keyfile = tmpdir.join("key")
+    keyfile.write(_armor(data))
+
+    assert openpgp.get_fingerprint(str(keyfile)) == "b8a0a272f4aadacb87e55087b6f27e5839467330"
+
+
+@pytest.mark.parametrize(
+    ("content", "message"),
+    (
+        ("not a key", "No ASCII armored public key block found."),
+        ("-----BEGIN PGP PUBLIC KEY BLOCK-----\n\nxsBNBF", "The ASCII armored public key block is not terminated."),
+        (_armor(b"\x04\x00"), "Invalid OpenPGP packet header at offset 0."),
+        (_armor(b"\xc6\x10\x04"), "Truncated OpenPGP packet at offset 2."),
+        (_armor(b"\xc6\xe0\x04"), "Unsupported partial OpenPGP packet length at offset 1."),
+        (_armor(b"\xc6\x02\x03\x00"), "Unsupported OpenPGP public key version 3."),
+        (_armor(b"\xcd\x03abc"), "No public key found in"),
+    ),
+)
+def test_get_fingerprint_invalid(content, message, tmpdir):
+    keyfile = tmpdir.join("key")
+    keyfile.write(content)
+
+    with pytest.raises(openpgp.OpenPGPError, match=message):
+        openpgp.get_fingerprint(str(keyfile))
+
+
+def test_get_keyid():
+    assert openpgp.get_keyid("567E347AD0044ADE55BA8A5F199E2F91FD431D51") == "fd431d51"
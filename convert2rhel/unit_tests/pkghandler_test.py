@@ -20,6 +20,7 @@ __metaclass__ = type
 import glob
 import os
 import re
+import threading
 
 from collections import namedtuple
 
@@ -753,6 +754,8 @@ class TestRestorablePackageSet:
         global_system_info.version = Version(*rhel_major_version)
         monkeypatch.setattr(pkghandler, "system_info", global_system_info)
 
+        # Nothing is downloaded at once, the packages are downloaded one by one
+        monkeypatch.setattr(utils, "_download_pkgs_at_once", mock.Mock(return_value=set()))
         monkeypatch.setattr(utils, "download_pkg", self.fake_download_pkg)
         monkeypatch.setattr(pkghandler, "call_yum_cmd", CallYumCmdMocked())
         monkeypatch.setattr(utils, "get_package_name_from_rpm", self.fake_get_pkg_name_from_rpm)
@@ -778,6 +781,8 @@ class TestRestorablePackageSet:
         monkeypatch.setattr(
             pkghandler, "get_installed_pkg_information", mock.Mock(side_effect=(["sbscription-manager"], [], []))
         )
+        # Nothing is downloaded at once, the packages are downloaded one by one
+        monkeypatch.setattr(utils, "_download_pkgs_at_once", mock.Mock(return_value=set()))
         monkeypatch.setattr(utils, "download_pkg", self.fake_download_pkg)
 
         yum_cmd = CallYumCmdMocked(return_code=1)
@@ -969,8 +974,9 @@ PACKAGE_FORMATS = (
 
 @pytest.mark.skipif(pkgmanager.TYPE == "yum", reason="cannot test dnf backend if dnf is not present")
 def test_parse_pkg_string_dnf_called(monkeypatch):
-    package = "kernel-core-0:4.18.0-240.10.1.el8_3.i86"
-    parse_pkg_with_dnf_mock = mock.Mock(return_value=("kernel-core", "0", "4.18.0", "240.10.1.el8_3", "i86"))
+    # The epoch with a leading zero is too ambiguous for the regex parser
+    package = "kernel-core-00:4.18.0-240.10.1.el8_3.i86"
+    parse_pkg_with_dnf_mock = mock.Mock(return_value=("kernel-core", "00", "4.18.0", "240.10.1.el8_3", "i86"))
     monkeypatch.setattr(pkghandler, "_parse_pkg_with_dnf", value=parse_pkg_with_dnf_mock)
     pkghandler.parse_pkg_string(package)
     parse_pkg_with_dnf_mock.assert_called_once()
@@ -978,13 +984,93 @@ def test_parse_pkg_string_dnf_called(monkeypatch):
 
 @pytest.mark.skipif(pkgmanager.TYPE == "dnf", reason="cannot test yum backend if yum is not present")
 def test_parse_pkg_string_yum_called(monkeypatch):
-    package = "kernel-core-0:4.18.0-240.10.1.el8_3.i86"
-    parse_pkg_with_yum_mock = mock.Mock(return_value=("kernel-core", "0", "4.18.0", "240.10.1.el8_3", "i86"))
+    # The epoch with a leading zero is too ambiguous for the regex parser
+    package = "kernel-core-00:4.18.0-240.10.1.el8_3.i86"
+    parse_pkg_with_yum_mock = mock.Mock(return_value=("kernel-core", "00", "4.18.0", "240.10.1.el8_3", "i86"))
     monkeypatch.setattr(pkghandler, "_parse_pkg_with_yum", value=parse_pkg_with_yum_mock)
     pkghandler.parse_pkg_string(package)
     parse_pkg_with_yum_mock.assert_called_once()
 
 
+def test_parse_pkg_string_unambiguous(monkeypatch):
+    monkeypatch.setattr(pkghandler, "_parse_pkg_with_yum", mock.Mock())
+    monkeypatch.setattr(pkghandler, "_parse_pkg_with_dnf", mock.Mock())
+
+    assert pkghandler.parse_pkg_string("kernel-core-0:4.18.0-240.10.1.el8_3.i86") == (
+        "kernel-core",
+        "0",
+        "4.18.0",
+        "240.10.1.el8_3",
+        "i86",
+    )
+    assert not pkghandler._parse_pkg_with_yum.called
+    assert not pkghandler._parse_pkg_with_dnf.called
+
+
+def test_parse_pkg_string_cached(monkeypatch):
+    monkeypatch.setattr(pkghandler, "_parse_pkg_with_regex", mock.Mock(wraps=pkghandler._parse_pkg_with_regex))
+
+    for _ in range(3):
+        pkghandler.parse_pkg_string("kernel-core-0:4.18.0-240.10.1.el8_3.i86")
+
+    pkghandler._parse_pkg_with_regex.assert_called_once_with("kernel-core-0:4.18.0-240.10.1.el8_3.i86")
+
+
+def test_parse_pkg_string_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(pkghandler, "_PARSED_PKG_CACHE_SIZE", 2)
+
+    pkghandler.parse_pkg_string("kernel-0:4.18.0-1.el8.x86_64")
+    pkghandler.parse_pkg_string("kernel-0:4.18.0-2.el8.x86_64")
+    # Makes the first package the most recently used one
+    pkghandler.parse_pkg_string("kernel-0:4.18.0-1.el8.x86_64")
+    pkghandler.parse_pkg_string("kernel-0:4.18.0-3.el8.x86_64")
+
+    assert list(pkghandler._parsed_pkg_cache) == ["kernel-0:4.18.0-1.el8.x86_64", "kernel-0:4.18.0-3.el8.x86_64"]
+
+
+def test_parse_pkg_string_cache_threads(monkeypatch):
+    monkeypatch.setattr(pkghandler, "_PARSED_PKG_CACHE_SIZE", 4)
+    pkgs = ["kernel-0:4.18.0-%s.el8.x86_64" % release for release in range(20)]
+    results = {}
+
+    def parse(pkg):
+        for _ in range(50):
+            results[pkg] = pkghandler.parse_pkg_string(pkg)
+
+    threads = [threading.Thread(target=parse, args=(pkg,)) for pkg in pkgs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(pkghandler._parsed_pkg_cache) == 4
+    for release, pkg in enumerate(pkgs):
+        assert results[pkg] == ("kernel", "0", "4.18.0", "%s.el8" % release, "x86_64")
+
+
+@pytest.mark.parametrize(
+    ("package", "expected"),
+    (PACKAGE_FORMATS),
+)
+def test_parse_pkg_with_regex(package, expected):
+    assert pkghandler._parse_pkg_with_regex(package) == expected
+
+
+@pytest.mark.parametrize(
+    ("package"),
+    (
+        pytest.param("notavalidpackage", id="no dashes"),
+        pytest.param("foo-15.x86_64", id="single dash"),
+        pytest.param("0:Network Manager-1.1.1-82.aarch64", id="whitespace"),
+        pytest.param("1:kernel-0:4.18.0-1.el8.x86_64", id="two epochs"),
+        pytest.param("kernel-01:4.18.0-1.el8.x86_64", id="epoch with a leading zero"),
+        pytest.param("kernel-4.18.0-1.el8_x86_64", id="arch not separated by a dot"),
+    ),
+)
+def test_parse_pkg_with_regex_ambiguous(package):
+    assert pkghandler._parse_pkg_with_regex(package) is None
+
+
 @pytest.mark.skipif(pkgmanager.TYPE == "dnf", reason="cannot test yum backend if yum is not present")
 @pytest.mark.parametrize(
     ("package", "expected"),
@@ -1688,9 +1774,9 @@ def test_format_pkg_info_yum(pretend_os, monkeypatch):
         mock.Mock(
             return_value=(
                 """\
-C2R 0:pkg1-0.1-1.x86_64&anaconda
-C2R 0:pkg2-0.1-1.x86_64&
-C2R 0:gpg-pubkey-0.1-1.x86_64&test
+C2R\tpkg1\t0\t0.1\t1\tx86_64\tanaconda
+C2R\tpkg2\t0\t0.1\t1\tx86_64\t
+C2R\tgpg-pubkey\t0\t0.1\t1\tx86_64\ttest
     """,
                 0,
             )
@@ -1716,6 +1802,26 @@ C2R 0:gpg-pubkey-0.1-1.x86_64&test
     )
 
 
+@centos8
+def test_format_pkg_info_repositories_queried_once(pretend_os, monkeypatch):
+    monkeypatch.setattr(
+        pkghandler, "_get_pkg_packagers", mock.Mock(return_value=[("pkg1-0:0.1-1.x86_64", "Red Hat, Inc.")])
+    )
+    monkeypatch.setattr(
+        utils,
+        "run_subprocess",
+        mock.Mock(return_value=("C2R\tpkg1\t0\t0.1\t1\tx86_64\tbaseos\n", 0)),
+    )
+
+    result = pkghandler.format_pkg_info(["pkg1"])
+
+    assert re.search(r"^pkg1-0:0\.1-1\.x86_64\s+Red Hat, Inc\.\s+baseos$", result, re.MULTILINE)
+    # The repositories are queried in the main process, the result of the
+    # query is kept for the rest of the run
+    assert pkghandler.format_pkg_info(["pkg1"]) == result
+    assert utils.run_subprocess.call_count == 1
+
+
 @pytest.mark.skipif(
     pkgmanager.TYPE != "dnf",
     reason="No dnf module detected on the system, skipping it.",
@@ -1760,9 +1866,9 @@ def test_format_pkg_info_dnf(pretend_os, monkeypatch):
         mock.Mock(
             return_value=(
                 """\
-C2R pkg1-0:0.1-1.x86_64&anaconda
-C2R pkg2-0:0.1-1.x86_64&@@System
-C2R gpg-pubkey-0:0.1-1.x86_64&test
+C2R\tpkg1\t0\t0.1\t1\tx86_64\tanaconda
+C2R\tpkg2\t0\t0.1\t1\tx86_64\t@@System
+C2R\tgpg-pubkey\t0\t0.1\t1\tx86_64\ttest
     """,
                 0,
             )
@@ -1784,36 +1890,30 @@ C2R gpg-pubkey-0:0.1-1.x86_64&test
     )
 
 
-class GetInstalledPkgObjectsWDiffFingerprintMocked(unit_tests.MockFunction):
-    def __call__(self, fingerprints, name=""):
-        if name and name != "installed_pkg":
-            return []
-        if "rhel_fingerprint" in fingerprints:
-            pkg_obj = create_pkg_information(
-                packager="Oracle", vendor=None, name="installed_pkg", version="0.1", release="1", arch="x86_64"
-            )
-        else:
-            pkg_obj = create_pkg_information(
-                packager="Red Hat",
-                name="installed_pkg",
-                version="0.1",
-                release="1",
-                arch="x86_64",
-            )
-        return [pkg_obj]
-
-
-def testget_packages_to_remove(monkeypatch):
+def testget_packages_to_remove(monkeypatch, caplog):
     monkeypatch.setattr(system_info, "fingerprints_rhel", ["rhel_fingerprint"])
     monkeypatch.setattr(
-        pkghandler, "get_installed_pkgs_w_different_fingerprint", GetInstalledPkgObjectsWDiffFingerprintMocked()
+        pkghandler,
+        "_read_installed_pkg_information_from_rpmdb",
+        mock.Mock(
+            return_value=[
+                create_pkg_information(name="installed_pkg", fingerprint="centos_fingerprint"),
+                create_pkg_information(name="installed_pkg-rhel", fingerprint="rhel_fingerprint"),
+                create_pkg_information(name="gpg-pubkey", fingerprint="none"),
+            ]
+        ),
     )
     original_func = pkghandler.get_packages_to_remove.__wrapped__
     monkeypatch.setattr(pkghandler, "get_packages_to_remove", mock_decorator(original_func))
 
-    result = pkghandler.get_packages_to_remove(["installed_pkg", "not_installed_pkg"])
+    result = pkghandler.get_packages_to_remove(["installed_pkg*", "not_installed_pkg", "gpg-pubkey"])
+
     assert len(result) == 1
     assert result[0].nevra.name == "installed_pkg"
+    # The number of packages found is logged per pattern
+    messages = [record.message for record in caplog.records]
+    assert any(re.match(r"installed_pkg\* \.+ 1$", message) for message in messages)
+    assert any(re.match(r"not_installed_pkg \.+ 0$", message) for message in messages)
 
 
 def test_remove_pkgs_with_confirm(monkeypatch):
@@ -2231,32 +2331,253 @@ def test_install_additional_rhel_kernel_pkgs(monkeypatch):
         ),
     ),
 )
-def test_get_installed_pkg_information(package_name, subprocess_output, expected, expected_command, monkeypatch):
+def test_query_installed_pkg_information(package_name, subprocess_output, expected, expected_command, monkeypatch):
     monkeypatch.setattr(utils, "run_subprocess", RunSubprocessMocked(return_string=subprocess_output))
 
-    result = pkghandler.get_installed_pkg_information(package_name)
+    result = pkghandler._query_installed_pkg_information(package_name)
     assert utils.run_subprocess.cmd == expected_command
     assert result == expected
 
 
-def test_get_installed_pkg_information_value_error(monkeypatch, caplog):
+def test_query_installed_pkg_information_value_error(monkeypatch, caplog):
     output = "C2R Fedora Project&Fedora Project&fonts-filesystem-a:aabb.d.1-l.fc37.noarch&RSA/SHA256, Tue 23 Aug 2022 08:06:00 -03, Key ID f55ad3fb5323552a"
     monkeypatch.setattr(utils, "run_subprocess", RunSubprocessMocked(return_string=output))
 
-    result = pkghandler.get_installed_pkg_information()
+    result = pkghandler._query_installed_pkg_information()
     assert not result
     assert "Failed to parse a package" in caplog.records[-1].message
 
 
+_INVENTORY_PKGS = [
+    create_pkg_information(
+        name="kernel", epoch="0", version="3.10.0", release="1160.el7", arch="x86_64", fingerprint="24c6a8a7f4a80eb5"
+    ),
+    create_pkg_information(
+        name="kernel-tools", version="3.10.0", release="1160.el7", arch="x86_64", fingerprint="24c6a8a7f4a80eb5"
+    ),
+    create_pkg_information(
+        name="json-c", version="0.11", release="4.el7_0", arch="i686", fingerprint="199e2f91fd431d51", vendor="Red Hat"
+    ),
+]
+
+
+@pytest.mark.parametrize(
+    ("pattern", "expected_names"),
+    (
+        ("*", ["kernel", "kernel-tools", "json-c"]),
+        ("kernel", ["kernel"]),
+        ("kernel*", ["kernel", "kernel-tools"]),
+        ("kernel-3.10.0-1160.el7.x86_64", ["kernel"]),
+        ("kernel-0:3.10.0-1160.el7.x86_64", ["kernel"]),
+        ("json-c.i686", ["json-c"]),
+        ("json-c.x86_64", []),
+        ("not-installed", []),
+        ("", []),
+    ),
+)
+def test_installed_package_inventory_find(pattern, expected_names, monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        pkghandler, "_read_installed_pkg_information_from_rpmdb", mock.Mock(return_value=_INVENTORY_PKGS)
+    )
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    assert [pkg.nevra.name for pkg in inventory.find(pattern)] == expected_names
+
+
+def test_installed_package_inventory_find_all(monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        pkghandler, "_read_installed_pkg_information_from_rpmdb", mock.Mock(return_value=_INVENTORY_PKGS)
+    )
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+    patterns = [
+        "*",
+        "kernel",
+        "kernel*",
+        "kernel-3.10.0-*",
+        "kernel-?:3.10.0-1160.el7.x86_64",
+        "*-tools",
+        "json-c.[ix]686",
+        "json*.x86_64",
+        "not-installed*",
+        "kernel",
+    ]
+
+    matched = inventory.find_all(patterns)
+
+    assert sorted(matched) == sorted(set(patterns))
+    for pattern in patterns:
+        assert matched[pattern] == inventory.find(pattern), pattern
+
+
+def test_installed_package_inventory_indexes(monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        pkghandler, "_read_installed_pkg_information_from_rpmdb", mock.Mock(return_value=_INVENTORY_PKGS)
+    )
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    assert inventory.by_name_arch("json-c", "i686") == [_INVENTORY_PKGS[2]]
+    assert inventory.by_fingerprint("24c6a8a7f4a80eb5") == _INVENTORY_PKGS[:2]
+    assert inventory.by_vendor("Red Hat") == [_INVENTORY_PKGS[2]]
+    assert inventory.packages == _INVENTORY_PKGS
+
+
+def test_installed_package_inventory_loaded_once(monkeypatch, tmpdir):
+    tmpdir.join("Packages").write("rpmdb")
+    query = mock.Mock(return_value=_INVENTORY_PKGS)
+    monkeypatch.setattr(pkghandler, "_read_installed_pkg_information_from_rpmdb", query)
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    inventory.find("kernel")
+    inventory.find("json-c")
+    inventory.by_fingerprint("24c6a8a7f4a80eb5")
+
+    assert query.call_count == 1
+
+
+def test_installed_package_inventory_reloaded_on_rpmdb_change(monkeypatch, tmpdir):
+    rpmdb = tmpdir.join("Packages")
+    rpmdb.write("rpmdb")
+    query = mock.Mock(return_value=_INVENTORY_PKGS)
+    monkeypatch.setattr(pkghandler, "_read_installed_pkg_information_from_rpmdb", query)
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    inventory.find("kernel")
+    rpmdb.write("rpmdb changed by a transaction")
+    inventory.find("kernel")
+
+    assert query.call_count == 2
+
+
+def test_installed_package_inventory_invalidate(monkeypatch, tmpdir):
+    tmpdir.join("Packages").write("rpmdb")
+    query = mock.Mock(return_value=_INVENTORY_PKGS)
+    monkeypatch.setattr(pkghandler, "_read_installed_pkg_information_from_rpmdb", query)
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    inventory.find("kernel")
+    inventory.invalidate()
+    inventory.find("kernel")
+
+    assert query.call_count == 2
+
+
+class RpmdbHeaderMocked(dict):
+    """Header from the rpmdb, indexed by the rpm tags."""
+
+    def __init__(self, tags, signature):
+        super(RpmdbHeaderMocked, self).__init__(tags)
+        self.signature = signature
+
+    def sprintf(self, queryformat):
+        return self.signature
+
+
+@pytest.mark.parametrize(
+    ("pkg_name", "expected_match"),
+    (
+        ("*", ()),
+        ("kernel*", ("name", rpm.RPMMIRE_GLOB, "kernel*")),
+        ("kernel", (rpm.RPMDBI_LABEL, "kernel")),
+    ),
+)
+def test_get_pkg_information_from_rpmdb(pkg_name, expected_match, monkeypatch):
+    headers = [
+        RpmdbHeaderMocked(
+            {
+                rpm.RPMTAG_PACKAGER: "CentOS BuildSystem <http://bugs.centos.org> ",
+                rpm.RPMTAG_VENDOR: "CentOS",
+                rpm.RPMTAG_NAME: "kernel",
+                rpm.RPMTAG_EPOCH: None,
+                rpm.RPMTAG_VERSION: "3.10.0",
+                rpm.RPMTAG_RELEASE: "1160.el7",
+                rpm.RPMTAG_ARCH: "x86_64",
+            },
+            "RSA/SHA256, Mon 01 Jan 2021 00:00:00 UTC, Key ID 24c6a8a7f4a80eb5",
+        ),
+        RpmdbHeaderMocked(
+            {
+                rpm.RPMTAG_PACKAGER: None,
+                rpm.RPMTAG_VENDOR: None,
+                rpm.RPMTAG_NAME: b"gpg-pubkey",
+                rpm.RPMTAG_EPOCH: None,
+                rpm.RPMTAG_VERSION: b"f4a80eb5",
+                rpm.RPMTAG_RELEASE: b"53a7ff4b",
+                rpm.RPMTAG_ARCH: None,
+            },
+            "(none)",
+        ),
+    ]
+    match_iterator = mock.MagicMock()
+    match_iterator.__iter__.return_value = iter(headers)
+    transaction_set = mock.Mock()
+    transaction_set.dbMatch.return_value = match_iterator
+    monkeypatch.setattr(rpm, "TransactionSet", mock.Mock(return_value=transaction_set))
+
+    result = pkghandler._get_pkg_information_from_rpmdb(pkg_name)
+
+    assert result == [
+        PackageInformation(
+            "CentOS BuildSystem <http://bugs.centos.org>",
+            "CentOS",
+            PackageNevra("kernel", "0", "3.10.0", "1160.el7", "x86_64"),
+            "24c6a8a7f4a80eb5",
+            "RSA/SHA256, Mon 01 Jan 2021 00:00:00 UTC, Key ID 24c6a8a7f4a80eb5",
+        ),
+        PackageInformation(
+            "(none)",
+            "(none)",
+            PackageNevra("gpg-pubkey", "0", "f4a80eb5", "53a7ff4b", None),
+            "none",
+            "(none)",
+        ),
+    ]
+    if pkg_name == "kernel*":
+        transaction_set.dbMatch.assert_called_once_with()
+        match_iterator.pattern.assert_called_once_with(*expected_match)
+    else:
+        transaction_set.dbMatch.assert_called_once_with(*expected_match)
+
+
+def test_read_installed_pkg_information_from_rpmdb_in_child_process(monkeypatch):
+    # Child processes spawned by run_as_child_process are daemonic and can't
+    # spawn another process, the rpmdb has to be read in place
+    monkeypatch.setattr(pkghandler.multiprocessing, "current_process", mock.Mock(return_value=mock.Mock(daemon=True)))
+    monkeypatch.setattr(pkghandler, "_get_pkg_information_from_rpmdb", mock.Mock(return_value=_INVENTORY_PKGS))
+    run_as_child_process = mock.Mock()
+    monkeypatch.setattr(utils, "run_as_child_process", run_as_child_process)
+
+    assert pkghandler._read_installed_pkg_information_from_rpmdb("kernel") == _INVENTORY_PKGS
+    pkghandler._get_pkg_information_from_rpmdb.assert_called_once_with("kernel")
+    assert not run_as_child_process.called
+
+
+def test_installed_package_inventory_falls_back_to_rpm_command(monkeypatch, tmpdir):
+    monkeypatch.setattr(
+        pkghandler, "_read_installed_pkg_information_from_rpmdb", mock.Mock(side_effect=rpm.error("rpmdb open failed"))
+    )
+    monkeypatch.setattr(pkghandler, "_query_installed_pkg_information", mock.Mock(return_value=_INVENTORY_PKGS))
+    inventory = pkghandler.InstalledPackageInventory(rpmdb_path=str(tmpdir))
+
+    assert inventory.packages == _INVENTORY_PKGS
+    pkghandler._query_installed_pkg_information.assert_called_once_with()
+
+
+def test_get_installed_pkg_information_served_from_inventory(monkeypatch):
+    monkeypatch.setattr(pkghandler.installed_packages, "find", mock.Mock(return_value=_INVENTORY_PKGS[:1]))
+
+    assert pkghandler.get_installed_pkg_information("kernel") == _INVENTORY_PKGS[:1]
+    pkghandler.installed_packages.find.assert_called_once_with("kernel")
+
+
 @pytest.mark.parametrize(
     ("packages", "subprocess_output", "expected_result"),
     (
         (
             ["0:eog-44.1-1.fc38.x86_64", "0:gnome-backgrounds-44.0-1.fc38.noarch", "0:gnome-maps-44.1-1.fc38.x86_64"],
             """\
-                C2R 0:eog-44.1-1.fc38.x86_64&updates
-                C2R 0:gnome-backgrounds-44.0-1.fc38.noarch&fedora
-                C2R 0:gnome-maps-44.1-1.fc38.x86_64&updates
+                C2R\teog\t0\t44.1\t1.fc38\tx86_64\tupdates
+                C2R\tgnome-backgrounds\t0\t44.0\t1.fc38\tnoarch\tfedora
+                C2R\tgnome-maps\t0\t44.1\t1.fc38\tx86_64\tupdates
             """,
             {
                 "0:eog-44.1-1.fc38.x86_64": "updates",
@@ -2267,9 +2588,9 @@ def test_get_installed_pkg_information_value_error(monkeypatch, caplog):
         (
             ["0:eog-44.1-1.fc38.x86_64", "0:gnome-backgrounds-44.0-1.fc38.noarch", "0:gnome-maps-44.1-1.fc38.x86_64"],
             """\
-                C2R 0:eog-44.1-1.fc38.x86_64&updates
-                C2R 0:gnome-backgrounds-44.0-1.fc38.noarch&fedora
-                C2R 0:gnome-maps-44.1-1.fc38.x86_64&updates
+                C2R\teog\t0\t44.1\t1.fc38\tx86_64\tupdates
+                C2R\tgnome-backgrounds\t0\t44.0\t1.fc38\tnoarch\tfedora
+                C2R\tgnome-maps\t0\t44.1\t1.fc38\tx86_64\tupdates
                 test line without identifier
             """,
             {
@@ -222,6 +222,16 @@ class TestDnfTransactionDisplayCallback:
         assert len(caplog.records) == 1
         assert "Running scriptlet: libicu-60.3-2.el8_1.x86_64.rpm [1/1]" in caplog.records[-1].message
 
+    def test_finish(self, caplog):
+        instance = TransactionDisplayCallback()
+        packages = ["libicu-60.3-2.el8_1.x86_64.rpm", "breeze-icon-theme-5.102.0-1.fc37.noarch"]
+        for package in packages:
+            instance.progress(package=package, action=103, ti_done=1, ti_total=1, ts_done=1, ts_total=2)
+        instance.finish()
+
+        assert "Transaction finished in" in caplog.records[-1].message
+        assert caplog.records[-1].message.endswith(": Running scriptlet 2.")
+
     def test_no_action_and_package(self, caplog):
         TransactionDisplayCallback().progress(None, None, None, None, None, None)
         assert "No action or package was provided in the callback." in caplog.records[-1].message
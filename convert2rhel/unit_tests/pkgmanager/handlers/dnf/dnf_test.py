@@ -44,7 +44,33 @@ class RepoDict:
         self.disabled = False
 
 
+class PackageMock:
+    def __init__(self, name, version, arch="x86_64", installed=False):
+        self.name = name
+        self.version = version
+        self.arch = arch
+        self.evr = "%s-1" % version
+        self.installed = installed
+
+    def _version(self):
+        return tuple(int(part) for part in self.version.split("."))
+
+    def evr_eq(self, other):
+        return self._version() == other._version()
+
+    def evr_gt(self, other):
+        return self._version() > other._version()
+
+    def evr_lt(self, other):
+        return self._version() < other._version()
+
+    def __repr__(self):
+        return "%s-%s.%s" % (self.name, self.evr, self.arch)
+
+
 class SackMock:
+    """Sack with the queries used by the transaction handler."""
+
     def __init__(self, packages=None):
         if not packages:
             packages = []
@@ -54,17 +80,47 @@ class SackMock:
     def __call__(self, *args, **kwds):
         return self
 
+    def __iter__(self):
+        return iter(self.packages)
+
     def query(self):
         return self
 
+    def installed(self):
+        return SackMock([pkg for pkg in self.packages if pkg.installed])
+
+    def available(self):
+        return SackMock([pkg for pkg in self.packages if not pkg.installed])
+
     def upgrades(self):
-        return self
+        # Newer than the highest installed version, like libsolv does it
+        installed = self.installed().packages
+        return SackMock(
+            [
+                pkg
+                for pkg in self.available()
+                if any(pkg.name == other.name and pkg.arch == other.arch for other in installed)
+                and all(pkg.evr_gt(other) for other in installed if pkg.name == other.name and pkg.arch == other.arch)
+            ]
+        )
 
     def latest(self):
-        return self
-
-    def filter(self, *args, **kwargs):
-        return self.packages
+        latest = {}
+        for pkg in self.packages:
+            if (pkg.name, pkg.arch) not in latest or pkg.evr_gt(latest[(pkg.name, pkg.arch)]):
+                latest[(pkg.name, pkg.arch)] = pkg
+        return SackMock(list(latest.values()))
+
+    def filter(self, name=None, provides=None, **kwargs):
+        names = name if isinstance(name, (list, set)) else [name]
+        # The packages provide just their name
+        return SackMock(
+            [
+                pkg
+                for pkg in self.packages
+                if (name is None or pkg.name in names) and (provides is None or pkg.name in provides)
+            ]
+        )
 
 
 SYSTEM_PACKAGES = [
@@ -118,6 +174,9 @@ class TestDnfTransactionHandler:
         monkeypatch.setattr(pkgmanager.Base, "upgrade", value=mock.Mock())
         monkeypatch.setattr(pkgmanager.Base, "reinstall", value=mock.Mock())
         monkeypatch.setattr(pkgmanager.Base, "downgrade", value=mock.Mock())
+        monkeypatch.setattr(pkgmanager.Base, "package_upgrade", value=mock.Mock())
+        monkeypatch.setattr(pkgmanager.Base, "package_reinstall", value=mock.Mock())
+        monkeypatch.setattr(pkgmanager.Base, "package_downgrade", value=mock.Mock())
         monkeypatch.setattr(pkgmanager.Base, "resolve", value=mock.Mock())
         monkeypatch.setattr(pkgmanager.Base, "download_packages", value=mock.Mock())
         monkeypatch.setattr(pkgmanager.Base, "do_transaction", value=mock.Mock())
@@ -215,69 +274,50 @@ class TestDnfTransactionHandler:
 
     @centos8
     def test_perform_operations(self, pretend_os, _mock_dnf_api_calls, caplog, monkeypatch):
-        monkeypatch.setattr(
-            pkghandler,
-            "get_installed_pkg_information",
-            value=lambda: SYSTEM_PACKAGES,
-        )
-        instance = DnfTransactionHandler()
-        instance._set_up_base()
-        instance._perform_operations()
-
-        assert pkgmanager.Base.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.Base.downgrade.call_count == 0
-
-    @centos8
-    def test_package_marked_for_update(self, pretend_os, _mock_dnf_api_calls, monkeypatch):
-        """
-        Test that if a package is marked for update, we won't call reinstall or
-        downgrade after that.
-
-        This comes from: https://issues.redhat.com/browse/RHELC-899
-        """
         monkeypatch.setattr(pkghandler, "get_installed_pkg_information", value=lambda: SYSTEM_PACKAGES)
-        monkeypatch.setattr(pkgmanager.Base, "sack", value=SackMock(packages=SYSTEM_PACKAGES))
+        reinstall_pkg = PackageMock("pkg-1", "1.0.0")
+        upgrade_pkg = PackageMock("pkg-2", "1.1.0")
+        downgrade_pkg = PackageMock("pkg-3", "0.9.0")
+        sack = SackMock(
+            [
+                PackageMock("pkg-1", "1.0.0", installed=True),
+                PackageMock("pkg-2", "1.0.0", installed=True),
+                PackageMock("pkg-3", "1.0.0", installed=True),
+                reinstall_pkg,
+                upgrade_pkg,
+                # If a package can be upgraded, it's not reinstalled
+                PackageMock("pkg-2", "1.0.0"),
+                downgrade_pkg,
+                PackageMock("pkg-3", "0.8.0"),
+                PackageMock("pkg-3", "1.0.0", arch="i686"),
+            ]
+        )
+        monkeypatch.setattr(pkgmanager.Base, "sack", value=sack)
         instance = DnfTransactionHandler()
         instance._set_up_base()
         instance._perform_operations()
 
-        assert pkgmanager.Base.upgrade.call_count == len(SYSTEM_PACKAGES)
+        pkgmanager.Base.package_upgrade.assert_called_once_with(upgrade_pkg)
+        pkgmanager.Base.package_reinstall.assert_called_once_with(reinstall_pkg)
+        pkgmanager.Base.package_downgrade.assert_called_once_with(downgrade_pkg)
+        # No per-package string specs
+        assert pkgmanager.Base.upgrade.call_count == 0
         assert pkgmanager.Base.reinstall.call_count == 0
         assert pkgmanager.Base.downgrade.call_count == 0
 
     @centos8
-    def test_perform_operations_reinstall_exception(self, pretend_os, _mock_dnf_api_calls, caplog, monkeypatch):
-        monkeypatch.setattr(
-            pkghandler,
-            "get_installed_pkg_information",
-            value=lambda: SYSTEM_PACKAGES,
-        )
-        pkgmanager.Base.reinstall.side_effect = pkgmanager.exceptions.PackagesNotAvailableError
-        instance = DnfTransactionHandler()
-        instance._set_up_base()
-        instance._perform_operations()
-
-        assert pkgmanager.Base.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.Base.downgrade.call_count == len(SYSTEM_PACKAGES)
-        assert "not available in RHEL repositories" not in caplog.records[-1].message
-
-    @centos8
-    def test_perform_operations_downgrade_exception(self, pretend_os, _mock_dnf_api_calls, caplog, monkeypatch):
-        monkeypatch.setattr(
-            pkghandler,
-            "get_installed_pkg_information",
-            value=lambda: SYSTEM_PACKAGES,
-        )
-        pkgmanager.Base.reinstall.side_effect = pkgmanager.exceptions.PackagesNotAvailableError
-        pkgmanager.Base.downgrade.side_effect = pkgmanager.exceptions.PackagesNotInstalledError
-
+    def test_perform_operations_not_available(self, pretend_os, _mock_dnf_api_calls, caplog, monkeypatch):
+        monkeypatch.setattr(pkghandler, "get_installed_pkg_information", value=lambda: SYSTEM_PACKAGES)
+        sack = SackMock([PackageMock(pkg.nevra.name, "1.0.0", installed=True) for pkg in SYSTEM_PACKAGES])
+        monkeypatch.setattr(pkgmanager.Base, "sack", value=sack)
         instance = DnfTransactionHandler()
         instance._set_up_base()
         instance._perform_operations()
 
-        assert pkgmanager.Base.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.Base.downgrade.call_count == len(SYSTEM_PACKAGES)
-        assert "not available in RHEL repositories" in caplog.records[-1].message
+        assert pkgmanager.Base.package_upgrade.call_count == 0
+        assert pkgmanager.Base.package_reinstall.call_count == 0
+        assert pkgmanager.Base.package_downgrade.call_count == 0
+        assert "Package pkg-3.x86_64 not available in RHEL repositories." in caplog.records[-1].message
 
     @centos8
     def test_resolve_dependencies(self, pretend_os, _mock_dnf_api_calls, caplog, monkeypatch):
@@ -356,6 +396,8 @@ class TestDnfTransactionHandler:
         monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_perform_operations", mock.Mock())
         monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_resolve_dependencies", mock.Mock())
         monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_process_transaction", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_get_planned_packages", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.plan, "save_plan", mock.Mock())
         instance = DnfTransactionHandler()
 
         instance.run_transaction(validate_transaction=validate_transaction)
@@ -364,3 +406,97 @@ class TestDnfTransactionHandler:
         assert instance._perform_operations.call_count == 1
         assert instance._resolve_dependencies.call_count == 1
         assert instance._process_transaction.call_count == 1
+
+    @centos8
+    def test_run_transaction_reuses_base(self, pretend_os, _mock_dnf_api_calls, monkeypatch):
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_enable_repos", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_perform_operations", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_resolve_dependencies", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_get_planned_packages", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.plan, "save_plan", mock.Mock())
+        monkeypatch.setattr(pkgmanager.Base, "close", mock.Mock())
+
+        DnfTransactionHandler().run_transaction(validate_transaction=True)
+        DnfTransactionHandler().run_transaction(validate_transaction=False)
+
+        # The repositories are loaded once, for the validation
+        assert DnfTransactionHandler._enable_repos.call_count == 1
+        assert pkgmanager.Base.do_transaction.call_count == 2
+        assert pkgmanager.Base.close.call_count == 1
+
+    @centos8
+    @pytest.mark.parametrize(("replayed", "perform_operations_count"), ((True, 0), (False, 1)))
+    def test_run_transaction_replays_plan(
+        self, pretend_os, replayed, perform_operations_count, _mock_dnf_api_calls, monkeypatch
+    ):
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_enable_repos", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_perform_operations", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_resolve_dependencies", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.dnf.DnfTransactionHandler, "_process_transaction", mock.Mock())
+        monkeypatch.setattr(
+            pkgmanager.handlers.dnf.DnfTransactionHandler, "_replay_plan", mock.Mock(return_value=replayed)
+        )
+        monkeypatch.setattr(pkgmanager.handlers.dnf.plan, "load_plan", mock.Mock(return_value=[mock.Mock()]))
+        monkeypatch.setattr(pkgmanager.handlers.dnf.plan, "remove_plan", mock.Mock())
+
+        DnfTransactionHandler().run_transaction(validate_transaction=False)
+
+        assert DnfTransactionHandler._replay_plan.call_count == 1
+        assert DnfTransactionHandler._perform_operations.call_count == perform_operations_count
+        pkgmanager.handlers.dnf.plan.remove_plan.assert_called_once_with()
+
+
+def test_classify_packages_installonly():
+    installed = [PackageMock("kernel", "4.18.0", installed=True), PackageMock("kernel", "4.18.1", installed=True)]
+    available = [PackageMock("kernel", "4.18.0"), PackageMock("kernel", "4.18.0"), PackageMock("kernel", "4.18.1")]
+
+    upgrades, reinstalls, downgrades, unavailable = pkgmanager.handlers.dnf._classify_packages(
+        SackMock(installed + available), ["kernel.x86_64"]
+    )
+
+    # Every installed version once
+    assert sorted(pkg.version for pkg in reinstalls) == ["4.18.0", "4.18.1"]
+    assert upgrades == downgrades == unavailable == []
+
+
+def test_get_planned_packages_installonly(monkeypatch):
+    installed = [
+        PackageMock("kernel-core", "4.18.0", installed=True),
+        PackageMock("kernel-core", "4.18.1", installed=True),
+        PackageMock("bash", "4.4", installed=True),
+        PackageMock("tar", "1.30", installed=True),
+    ]
+    install_set = [
+        PackageMock("kernel-core", "4.18.1"),
+        # Older than the newest installed kernel, still not a downgrade
+        PackageMock("kernel-core", "4.18.0.5"),
+        PackageMock("bash", "4.5"),
+        PackageMock("tar", "1.29"),
+        PackageMock("zsh", "5.5"),
+    ]
+    handler = DnfTransactionHandler()
+    handler._base = mock.Mock()
+    handler._base.sack = SackMock(installed + install_set)
+    handler._base.transaction = mock.MagicMock(install_set=install_set, remove_set=[])
+    handler._base.transaction.__iter__.return_value = iter(
+        [mock.Mock(pkg=pkg, reason=pkgmanager.libdnf.transaction.TransactionItemReason_USER) for pkg in install_set[:4]]
+        + [mock.Mock(pkg=install_set[4], reason=pkgmanager.libdnf.transaction.TransactionItemReason_DEPENDENCY)]
+    )
+    handler._base.conf.installonlypkgs = ["kernel-core"]
+    monkeypatch.setattr(pkgmanager.handlers.dnf, "_get_checksum", mock.Mock(return_value="sha256:1"))
+    monkeypatch.setattr(
+        pkgmanager.handlers.dnf,
+        "_create_planned_package",
+        mock.Mock(side_effect=lambda pkg, operation, checksum, path, reason: (repr(pkg), operation, reason)),
+    )
+    for pkg in install_set:
+        pkg.localPkg = mock.Mock(return_value="/var/cache/%r.rpm" % pkg)
+
+    plan = pkgmanager.handlers.dnf.plan
+    assert handler._get_planned_packages() == [
+        ("kernel-core-4.18.1-1.x86_64", plan.OPERATION_REINSTALL, plan.REASON_USER),
+        ("kernel-core-4.18.0.5-1.x86_64", plan.OPERATION_INSTALL, plan.REASON_USER),
+        ("bash-4.5-1.x86_64", plan.OPERATION_UPGRADE, plan.REASON_USER),
+        ("tar-1.29-1.x86_64", plan.OPERATION_DOWNGRADE, plan.REASON_USER),
+        ("zsh-5.5-1.x86_64", plan.OPERATION_INSTALL, plan.REASON_DEPENDENCY),
+    ]
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import pytest
+import six
+
+from convert2rhel.pkgmanager.handlers import plan
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+PLANNED_PKGS = [
+    plan.PlannedPackage(
+        "bash",
+        "0",
+        "4.4.20",
+        "4.el8",
+        "x86_64",
+        plan.OPERATION_REINSTALL,
+        "sha256:aa",
+        "/var/cache/bash.rpm",
+        plan.REASON_USER,
+    ),
+    plan.PlannedPackage(
+        "kernel",
+        "0",
+        "4.18.0",
+        "477.el8",
+        "x86_64",
+        plan.OPERATION_UPGRADE,
+        "sha256:bb",
+        "/var/cache/kernel.rpm",
+        plan.REASON_USER,
+    ),
+    plan.PlannedPackage(
+        "kernel", "0", "4.18.0", "425.el8", "x86_64", plan.OPERATION_ERASE, None, None, plan.REASON_USER
+    ),
+    plan.PlannedPackage(
+        "centos-logos", "0", "85.8", "1.el8", "x86_64", plan.OPERATION_ERASE, None, None, plan.REASON_USER
+    ),
+    plan.PlannedPackage(
+        "libfoo",
+        "0",
+        "1.0",
+        "1.el8",
+        "x86_64",
+        plan.OPERATION_INSTALL,
+        "sha256:cc",
+        "/var/cache/libfoo.rpm",
+        plan.REASON_DEPENDENCY,
+    ),
+]
+
+
+@pytest.fixture
+def plan_state(monkeypatch):
+    plan_state = {"rpmdb": [["Packages", 1, 2, 3]], "repos": {"baseos": "1690000000"}}
+    monkeypatch.setattr(plan, "_get_plan_state", mock.Mock(side_effect=lambda: dict(plan_state)))
+    return plan_state
+
+
+def test_save_and_load_plan(plan_state, transaction_plan_file):
+    plan.save_plan(PLANNED_PKGS)
+
+    # The erasure of the upgraded kernel is a part of the upgrade
+    assert plan.load_plan() == [PLANNED_PKGS[0], PLANNED_PKGS[1], PLANNED_PKGS[3], PLANNED_PKGS[4]]
+    assert plan.load_plan(transaction_plan_file) == plan.load_plan()
+
+
+@pytest.mark.parametrize(("changed_key",), (("rpmdb",), ("repos",)))
+def test_load_plan_outdated(changed_key, plan_state):
+    plan.save_plan(PLANNED_PKGS)
+
+    plan_state[changed_key] = "changed"
+
+    assert plan.load_plan() is None
+
+
+@pytest.mark.parametrize(
+    ("content",),
+    (
+        ("not json",),
+        ('{"version": 0, "state": {}, "packages": []}',),
+        # Plans without the install reasons
+        ('{"version": 1, "state": {}, "packages": []}',),
+    ),
+)
+def test_load_plan_unusable(content, plan_state, transaction_plan_file):
+    with open(transaction_plan_file, "w") as f:
+        f.write(content)
+
+    assert plan.load_plan() is None
+
+
+def test_load_plan_missing(plan_state):
+    assert plan.load_plan() is None
+
+
+def test_get_pinned_packages():
+    # The installed dependency is left to the dependency solver
+    assert plan.get_pinned_packages(PLANNED_PKGS) == PLANNED_PKGS[:4]
+
+
+def test_remove_plan(plan_state, transaction_plan_file):
+    plan.save_plan(PLANNED_PKGS)
+
+    plan.remove_plan()
+    # Nothing to remove anymore
+    plan.remove_plan()
+
+    assert plan.load_plan() is None
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import logging
+
+import pytest
+
+from convert2rhel.logger import LogLevelFile
+from convert2rhel.pkgmanager.handlers import progress
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(progress.time, "time", lambda: now[0])
+    return now
+
+
+def _shown(caplog):
+    return [record.message for record in caplog.records if record.levelno == logging.INFO]
+
+
+def test_report_throttled(clock, caplog):
+    reporter = progress.ProgressReporter("Transaction", rate=2)
+
+    for i in range(10):
+        reporter.report("Installing: pkg-%d [%d/10]" % (i, i + 1), "Installing")
+        clock[0] += 0.2
+
+    # Every event goes to the log file, the first one and then at most two per second to the terminal as well
+    assert len(caplog.records) == 10
+    assert _shown(caplog) == [
+        "Installing: pkg-0 [1/10]",
+        "Installing: pkg-3 [4/10]",
+        "Installing: pkg-6 [7/10]",
+        "Installing: pkg-9 [10/10]",
+    ]
+    assert all(record.levelno == LogLevelFile.level for record in caplog.records if record.levelno != logging.INFO)
+
+
+def test_report_important(clock, caplog):
+    reporter = progress.ProgressReporter("Package download", rate=0)
+
+    reporter.report("(1/2): pkg-1.rpm", "Downloaded")
+    reporter.report("(1/2) [FAILED]: pkg-2.rpm", "FAILED", important=True)
+
+    assert _shown(caplog) == ["(1/2) [FAILED]: pkg-2.rpm"]
+
+
+def test_finish(clock, caplog):
+    reporter = progress.ProgressReporter("Transaction", rate=0)
+    reporter.finish()
+    assert not caplog.records
+
+    reporter.report("Installing: pkg-1 [1/3]", "Installing")
+    clock[0] += 1.5
+    reporter.report("Installing: pkg-2 [2/3]", "Installing")
+    reporter.report("Cleanup: pkg-0 [3/3]", "Cleanup")
+    reporter.finish()
+
+    assert caplog.records[-1].message == "Transaction finished in 1.5 seconds: Installing 2, Cleanup 1."
+
+    # Only the events since the last summary
+    clock[0] += 10
+    reporter.report("Installing: pkg-3 [1/1]", "Installing")
+    reporter.finish()
+
+    assert caplog.records[-1].message == "Transaction finished in 0.0 seconds: Installing 1."
+
+
+@pytest.mark.parametrize(
+    ("envvar", "expected"),
+    (
+        (None, 1.0),
+        ("5", 5.0),
+        ("0.2", 0.2),
+        ("0", 0.0),
+        ("-1", 1.0),
+        ("many", 1.0),
+    ),
+)
+def test_get_progress_rate(envvar, expected, monkeypatch):
+    if envvar is None:
+        monkeypatch.delenv(progress.PROGRESS_RATE_ENVVAR, raising=False)
+    else:
+        monkeypatch.setenv(progress.PROGRESS_RATE_ENVVAR, envvar)
+
+    assert progress._get_progress_rate() == expected
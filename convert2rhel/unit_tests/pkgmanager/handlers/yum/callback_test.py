@@ -79,6 +79,16 @@ class TestTransactionDisplayCallback(object):
 
         assert len(caplog.records) == 2
 
+    def test_finish(self, caplog):
+        instance = TransactionDisplayCallback()
+        packages = ["libicu-60.3-2.el8_1.x86_64.rpm", "breeze-icon-theme-5.102.0-1.fc37.noarch"]
+        for package in packages:
+            instance.event(package=package, action=20, te_current=1, te_total=1, ts_current=1, ts_total=2)
+        instance.finish()
+
+        assert "Transaction finished in" in caplog.records[-1].message
+        assert caplog.records[-1].message.endswith(": Installing 2.")
+
     @pytest.mark.parametrize(
         ("package", "msgs", "expected"),
         (
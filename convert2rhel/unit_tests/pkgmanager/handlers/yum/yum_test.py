@@ -47,6 +47,29 @@ class YumResolveDepsMocked(unit_tests.MockFunction):
             return False
 
 
+class YumPackageMock:
+    def __init__(self, name, version, arch="x86_64"):
+        self.name = name
+        self.version = version
+        self.arch = arch
+        self.pkgtup = (name, arch, "0", version, "1")
+
+    def _version(self):
+        return tuple(int(part) for part in self.version.split("."))
+
+    def verEQ(self, other):
+        return self._version() == other._version()
+
+    def verGT(self, other):
+        return self._version() > other._version()
+
+    def verLT(self, other):
+        return self._version() < other._version()
+
+    def __repr__(self):
+        return "%s-%s-1.%s" % (self.name, self.version, self.arch)
+
+
 SYSTEM_PACKAGES = [
     create_pkg_information(
         packager="test",
@@ -134,51 +157,103 @@ class TestYumTransactionHandler(object):
 
         assert pkgmanager.RepoStorage.disableRepo.called_once()
 
-    @centos7
-    def test_perform_operations(self, pretend_os, _mock_yum_api_calls, caplog, monkeypatch):
+    @pytest.fixture
+    def _mock_yum_packages(self, monkeypatch):
+        """Mocks the installed and the available packages of the SYSTEM_PACKAGES.
+
+        - pkg-1: the installed version is available
+        - pkg-2: an update is available
+        - pkg-3: only an older version is available
+        """
         monkeypatch.setattr(pkghandler, "get_installed_pkg_information", lambda: SYSTEM_PACKAGES)
+        installed = [YumPackageMock(pkg.nevra.name, "1.0.0") for pkg in SYSTEM_PACKAGES]
+        available = {
+            "pkg-1": YumPackageMock("pkg-1", "1.0.0"),
+            "pkg-2": YumPackageMock("pkg-2", "1.1.0"),
+            "pkg-3": YumPackageMock("pkg-3", "0.9.0"),
+            "pkg-3-older": YumPackageMock("pkg-3", "0.8.0"),
+        }
+        rpmdb = mock.Mock()
+        rpmdb.searchNames.return_value = installed
+        rpmdb.searchPkgTuple.side_effect = lambda pkgtup: [po for po in installed if po.pkgtup == pkgtup]
+        rpmdb.contains.return_value = True
+        pkg_sack = mock.Mock()
+        pkg_sack.searchNames.return_value = list(available.values())
+        updates = mock.Mock()
+        updates.getUpdatesTuples.return_value = [(available["pkg-2"].pkgtup, installed[1].pkgtup)]
+        updates.getObsoletesTuples.return_value = []
+
+        monkeypatch.setattr(pkgmanager.YumBase, "rpmdb", rpmdb)
+        monkeypatch.setattr(pkgmanager.YumBase, "pkgSack", pkg_sack)
+        monkeypatch.setattr(pkgmanager.YumBase, "up", updates)
+        monkeypatch.setattr(pkgmanager.YumBase, "getPackageObject", mock.Mock(return_value=available["pkg-2"]))
+        return installed, available
+
+    @centos7
+    def test_perform_operations(self, pretend_os, _mock_yum_api_calls, _mock_yum_packages, caplog):
+        installed, available = _mock_yum_packages
         instance = YumTransactionHandler()
 
         instance._perform_operations()
 
-        assert pkgmanager.YumBase.update.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.YumBase.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.YumBase.downgrade.call_count == 0
+        # If a package is marked for update, we won't call reinstall or
+        # downgrade after that, https://issues.redhat.com/browse/RHELC-899
+        pkgmanager.YumBase.update.assert_called_once_with(po=available["pkg-2"])
+        pkgmanager.YumBase.reinstall.assert_called_once_with(po=installed[0])
+        pkgmanager.YumBase.downgrade.assert_called_once_with(po=available["pkg-3"])
+        assert "not available in RHEL repositories" not in caplog.text
 
     @centos7
-    def test_perform_operations_reinstall_exception(self, pretend_os, _mock_yum_api_calls, caplog, monkeypatch):
-        monkeypatch.setattr(pkghandler, "get_installed_pkg_information", lambda: SYSTEM_PACKAGES)
-        pkgmanager.YumBase.reinstall.side_effect = pkgmanager.Errors.ReinstallInstallError
+    def test_perform_operations_not_available(self, pretend_os, _mock_yum_api_calls, _mock_yum_packages, caplog):
+        pkgmanager.YumBase.pkgSack.searchNames.return_value = []
+        pkgmanager.YumBase.up.getUpdatesTuples.return_value = []
         instance = YumTransactionHandler()
 
         instance._perform_operations()
 
-        assert pkgmanager.YumBase.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.YumBase.downgrade.call_count == len(SYSTEM_PACKAGES)
-        assert "not available in RHEL repositories" not in caplog.records[-1].message
+        assert pkgmanager.YumBase.update.call_count == 0
+        assert pkgmanager.YumBase.reinstall.call_count == 0
+        assert pkgmanager.YumBase.downgrade.call_count == 0
+        assert "Package pkg-3.x86_64 not available in RHEL repositories." in caplog.records[-1].message
 
     @centos7
-    def test_perform_operations_downgrade_exception(self, pretend_os, _mock_yum_api_calls, caplog, monkeypatch):
-        monkeypatch.setattr(pkghandler, "get_installed_pkg_information", lambda: SYSTEM_PACKAGES)
-        pkgmanager.YumBase.reinstall.side_effect = pkgmanager.Errors.ReinstallInstallError
-        pkgmanager.YumBase.downgrade.side_effect = pkgmanager.Errors.ReinstallRemoveError
+    def test_perform_operations_downgrade_exception(self, pretend_os, _mock_yum_api_calls, _mock_yum_packages, caplog):
+        pkgmanager.YumBase.downgrade.side_effect = pkgmanager.Errors.DowngradeError
         instance = YumTransactionHandler()
 
         instance._perform_operations()
 
-        assert pkgmanager.YumBase.reinstall.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.YumBase.downgrade.call_count == len(SYSTEM_PACKAGES)
-        assert "not available in RHEL repositories." in caplog.records[-1].message
+        assert pkgmanager.YumBase.downgrade.call_count == 1
+        assert "Package pkg-3.x86_64 not available in RHEL repositories." in caplog.records[-1].message
 
     @centos7
-    def test_perform_operations_no_more_mirrors_repo_exception(self, pretend_os, _mock_yum_api_calls, monkeypatch):
-        monkeypatch.setattr(pkghandler, "get_installed_pkg_information", lambda: SYSTEM_PACKAGES)
-        pkgmanager.YumBase.update.side_effect = pkgmanager.Errors.NoMoreMirrorsRepoError
+    def test_perform_operations_no_more_mirrors_repo_exception(
+        self, pretend_os, _mock_yum_api_calls, _mock_yum_packages
+    ):
+        pkgmanager.YumBase.pkgSack.searchNames.side_effect = pkgmanager.Errors.NoMoreMirrorsRepoError
         instance = YumTransactionHandler()
 
         with pytest.raises(SystemExit, match="There are no suitable mirrors available for the loaded repositories."):
             instance._perform_operations()
 
+    @centos7
+    def test_refresh_transaction(self, pretend_os, _mock_yum_api_calls, _mock_yum_packages, monkeypatch):
+        installed, available = _mock_yum_packages
+        monkeypatch.setattr(pkgmanager.YumBase, "closeRpmDB", mock.Mock())
+        instance = YumTransactionHandler()
+        instance._perform_operations()
+
+        # pkg-1 was removed due to dependency problems
+        del installed[0]
+        instance._refresh_transaction()
+
+        assert pkgmanager.YumBase.closeRpmDB.call_count == 1
+        # Not classified again
+        assert pkgmanager.YumBase.rpmdb.searchNames.call_count == 1
+        assert pkgmanager.YumBase.reinstall.call_count == 1
+        assert pkgmanager.YumBase.update.call_count == 2
+        assert pkgmanager.YumBase.downgrade.call_count == 2
+
     @centos7
     @pytest.mark.parametrize(
         ("ret_code", "message", "validate_transaction", "expected"),
@@ -262,18 +337,45 @@ class TestYumTransactionHandler(object):
         assert pkgmanager.handlers.yum.YumTransactionHandler._perform_operations.call_count == 1
         assert pkgmanager.handlers.yum.YumTransactionHandler._process_transaction.call_count == 1
 
+    @centos7
+    @pytest.mark.parametrize(("replayed", "perform_operations_count"), ((True, 0), (False, 1)))
+    def test_run_transaction_replays_plan(
+        self, pretend_os, replayed, perform_operations_count, _mock_yum_api_calls, monkeypatch
+    ):
+        monkeypatch.setattr(pkgmanager.handlers.yum.YumTransactionHandler, "_perform_operations", mock.Mock())
+        monkeypatch.setattr(
+            pkgmanager.handlers.yum.YumTransactionHandler, "_resolve_dependencies", YumResolveDepsMocked(loop_until=0)
+        )
+        monkeypatch.setattr(pkgmanager.handlers.yum.YumTransactionHandler, "_process_transaction", mock.Mock())
+        monkeypatch.setattr(
+            pkgmanager.handlers.yum.YumTransactionHandler, "_replay_plan", mock.Mock(return_value=replayed)
+        )
+        monkeypatch.setattr(pkgmanager.handlers.yum.plan, "load_plan", mock.Mock(return_value=[mock.Mock()]))
+        # Save original function as we need to override the decorator that is in place for `run_transaction`
+        original_func = pkgmanager.handlers.yum.YumTransactionHandler.run_transaction.__wrapped__
+        monkeypatch.setattr(
+            pkgmanager.handlers.yum.YumTransactionHandler, "run_transaction", mock_decorator(original_func)
+        )
+        instance = YumTransactionHandler()
+        instance._set_up_base()
+        instance.run_transaction(validate_transaction=False)
+
+        assert pkgmanager.handlers.yum.YumTransactionHandler._replay_plan.call_count == 1
+        assert pkgmanager.handlers.yum.YumTransactionHandler._perform_operations.call_count == perform_operations_count
+
     @centos7
     @pytest.mark.parametrize(
         ("start_at", "loop_until", "expected_count"),
         (
-            (0, 99, (4, 4)),
-            (4, 99, (4, 8)),
+            (0, 99, (1, 4)),
+            (4, 99, (1, 8)),
         ),
     )
     def test_run_transaction_resolve_dependencies_loop(
         self, pretend_os, start_at, loop_until, expected_count, _mock_yum_api_calls, monkeypatch
     ):
         monkeypatch.setattr(pkgmanager.handlers.yum.YumTransactionHandler, "_perform_operations", mock.Mock())
+        monkeypatch.setattr(pkgmanager.handlers.yum.YumTransactionHandler, "_refresh_transaction", mock.Mock())
         monkeypatch.setattr(
             pkgmanager.handlers.yum.YumTransactionHandler,
             "_resolve_dependencies",
@@ -293,26 +395,11 @@ class TestYumTransactionHandler(object):
         perform_operations_count, resolve_dependencies_count = expected_count
         assert pkgmanager.handlers.yum.YumTransactionHandler._perform_operations.call_count == perform_operations_count
         assert pkgmanager.handlers.yum.YumTransactionHandler._resolve_dependencies.called == resolve_dependencies_count
-
-    @centos7
-    def test_package_marked_for_update(self, pretend_os, _mock_yum_api_calls, monkeypatch):
-        """
-        Test that if a package is marked for update, we won't call reinstall or
-        downgrade after that.
-
-        This comes from: https://issues.redhat.com/browse/RHELC-899
-        """
-        monkeypatch.setattr(pkghandler, "get_installed_pkg_information", lambda: SYSTEM_PACKAGES)
-        pkgmanager.YumBase.update.return_value = [
-            "something"
-        ]  # We don't care about the value, only that if has something.
-
-        instance = YumTransactionHandler()
-        instance._perform_operations()
-
-        assert pkgmanager.YumBase.update.call_count == len(SYSTEM_PACKAGES)
-        assert pkgmanager.YumBase.reinstall.call_count == 0
-        assert pkgmanager.YumBase.downgrade.call_count == 0
+        # The transaction is refreshed before every retry instead of starting from scratch
+        assert (
+            pkgmanager.handlers.yum.YumTransactionHandler._refresh_transaction.call_count
+            == pkgmanager.handlers.yum.MAX_NUM_OF_ATTEMPTS_TO_RESOLVE_DEPS
+        )
 
 
 @centos7
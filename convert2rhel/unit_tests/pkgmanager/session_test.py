@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import pytest
+import six
+
+from convert2rhel import pkgmanager
+from convert2rhel.pkgmanager import session
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+@pytest.fixture
+def rpmdb(tmpdir):
+    rpmdb = tmpdir.join("Packages")
+    rpmdb.write("rpmdb")
+    return rpmdb
+
+
+@pytest.fixture
+def pkgmanager_session(tmpdir):
+    return session.PackageManagerSession(rpmdb_path=str(tmpdir))
+
+
+def test_get_base_created_once(pkgmanager_session, rpmdb):
+    create = mock.Mock()
+
+    first = pkgmanager_session.get_base(("transaction",), create)
+    second = pkgmanager_session.get_base(("transaction",), create)
+    pkgmanager_session.get_base(("installed",), create)
+
+    assert first is second
+    assert create.call_count == 2
+    assert not first.fill_sack.called
+
+
+@pytest.mark.parametrize(("load_available_repos",), ((True,), (False,)))
+def test_get_base_reloads_system_repo_dnf(load_available_repos, pkgmanager_session, rpmdb, monkeypatch):
+    monkeypatch.setattr(pkgmanager, "TYPE", "dnf")
+    base = pkgmanager_session.get_base(("transaction",), mock.Mock, load_available_repos=load_available_repos)
+
+    rpmdb.write("rpmdb changed by a transaction")
+    assert pkgmanager_session.get_base(("transaction",), mock.Mock) is base
+
+    base.reset.assert_called_once_with(sack=True, goal=True)
+    base.fill_sack.assert_called_once_with(load_system_repo=True, load_available_repos=load_available_repos)
+
+    # Reloaded only once per change
+    pkgmanager_session.get_base(("transaction",), mock.Mock)
+    assert base.fill_sack.call_count == 1
+
+
+def test_get_base_reloads_system_repo_yum(pkgmanager_session, rpmdb, monkeypatch):
+    monkeypatch.setattr(pkgmanager, "TYPE", "yum")
+    base = pkgmanager_session.get_base(("installed",), mock.Mock)
+
+    pkgmanager_session.refresh_system_repo()
+    pkgmanager_session.get_base(("installed",), mock.Mock)
+
+    base.closeRpmDB.assert_called_once_with()
+
+
+def test_release_base_dnf(pkgmanager_session, rpmdb, monkeypatch):
+    monkeypatch.setattr(pkgmanager, "TYPE", "dnf")
+    base = pkgmanager_session.get_base(("transaction",), mock.Mock)
+    base._ts = mock.Mock()
+
+    pkgmanager_session.release_base(("transaction",))
+    pkgmanager_session.release_base(("unknown",))
+
+    base.reset.assert_called_once_with(goal=True)
+    assert "_ts" not in vars(base)
+    assert pkgmanager_session.get_base(("transaction",), mock.Mock) is base
+
+
+def test_close(pkgmanager_session, rpmdb):
+    base = pkgmanager_session.get_base(("transaction",), mock.Mock)
+
+    pkgmanager_session.close()
+
+    base.close.assert_called_once_with()
+    assert pkgmanager_session.get_base(("transaction",), mock.Mock) is not base
+
+
+def test_get_rpmdb_state(tmpdir):
+    assert session.get_rpmdb_state(str(tmpdir)) is None
+
+    tmpdir.join("rpmdb.sqlite").write("rpmdb")
+    state = session.get_rpmdb_state(str(tmpdir))
+
+    assert [item[0] for item in state] == ["rpmdb.sqlite"]
+    tmpdir.join("rpmdb.sqlite").write("rpmdb changed by a transaction")
+    assert session.get_rpmdb_state(str(tmpdir)) != state
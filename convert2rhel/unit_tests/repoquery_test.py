@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+import threading
+import time
+
+import pytest
+import six
+
+from convert2rhel import repoquery, utils
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+KERNEL_OUTPUT = (
+    "Repository base is listed more than once in the configuration\n"
+    "C2R\tkernel\t0\t3.10.0\t1160.45.1.el7\tx86_64\tupdates\n"
+    "C2R\tkernel\t0\t3.10.0\t1160.el7\tx86_64\tbase\n"
+)
+KERNEL_FIELDS = ("name", "epoch", "version", "release", "arch", "repoid")
+
+
+@pytest.fixture
+def service(tmpdir, monkeypatch):
+    monkeypatch.setattr(repoquery, "_REPOMD_GLOBS", (str(tmpdir.join("cache", "*", "repomd.xml")),))
+    monkeypatch.delenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, raising=False)
+    return repoquery.RepoQuery(cache_file=str(tmpdir.join("repoquery-cache.json")))
+
+
+@pytest.fixture
+def run_subprocess_mocked(monkeypatch):
+    run_subprocess_mocked = mock.Mock(spec=utils.run_subprocess, return_value=(KERNEL_OUTPUT, 0))
+    monkeypatch.setattr(utils, "run_subprocess", run_subprocess_mocked)
+    return run_subprocess_mocked
+
+
+def _write_repomd(tmpdir, revision):
+    repomd = tmpdir.join("cache", "base", "repomd.xml")
+    repomd.ensure()
+    repomd.write("<repomd><revision>%s</revision></repomd>" % revision)
+
+
+def test_query(service, run_subprocess_mocked):
+    result = service.query(
+        ["kernel"],
+        fields=KERNEL_FIELDS,
+        reposdir="/usr/share/convert2rhel/repos/centos-7.9",
+        disable_repos=["*"],
+        enable_repos=["base", "updates"],
+        releasever="7Server",
+        setopts=("exclude=",),
+    )
+
+    assert result == [
+        ("kernel", "0", "3.10.0", "1160.45.1.el7", "x86_64", "updates"),
+        ("kernel", "0", "3.10.0", "1160.el7", "x86_64", "base"),
+    ]
+    run_subprocess_mocked.assert_called_once_with(
+        [
+            "repoquery",
+            "--quiet",
+            "--disablerepo=*",
+            "--enablerepo=base",
+            "--enablerepo=updates",
+            "--releasever=7Server",
+            "--setopt=reposdir=/usr/share/convert2rhel/repos/centos-7.9",
+            "--setopt=exclude=",
+            "--qf",
+            "C2R\\t%{NAME}\\t%{EPOCH}\\t%{VERSION}\\t%{RELEASE}\\t%{ARCH}\\t%{REPOID}",
+            "kernel",
+        ],
+        print_output=False,
+    )
+
+
+def test_query_without_fields(service, run_subprocess_mocked):
+    run_subprocess_mocked.return_value = ("/lib/modules/a.ko.xz\n\n/lib/modules/b.ko.xz\n", 0)
+
+    result = service.query(["-l", "kernel-core"], repoids=["rhel-8-for-x86_64-baseos-rpms"])
+
+    assert result == ["/lib/modules/a.ko.xz", "/lib/modules/b.ko.xz"]
+    run_subprocess_mocked.assert_called_once_with(
+        ["repoquery", "--quiet", "--repoid", "rhel-8-for-x86_64-baseos-rpms", "-l", "kernel-core"],
+        print_output=False,
+    )
+
+
+def test_query_failure(service, run_subprocess_mocked):
+    run_subprocess_mocked.return_value = ("Cannot retrieve repository metadata", 1)
+
+    with pytest.raises(repoquery.RepoQueryError) as err:
+        service.query(["kernel"], fields=KERNEL_FIELDS)
+
+    assert err.value.output == "Cannot retrieve repository metadata"
+    assert err.value.returncode == 1
+
+    # Failures are not remembered
+    run_subprocess_mocked.return_value = (KERNEL_OUTPUT, 0)
+    assert len(service.query(["kernel"], fields=KERNEL_FIELDS)) == 2
+
+
+def test_query_results_are_reused(service, run_subprocess_mocked):
+    first = service.query(["kernel"], fields=KERNEL_FIELDS)
+    first.append("modified by the caller")
+
+    assert service.query(["kernel"], fields=KERNEL_FIELDS) == first[:-1]
+    assert run_subprocess_mocked.call_count == 1
+
+    service.clear()
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+    assert run_subprocess_mocked.call_count == 2
+
+
+def test_query_from_threads(service, run_subprocess_mocked):
+    def slow_repoquery(cmd, print_output):
+        time.sleep(0.05)
+        return KERNEL_OUTPUT, 0
+
+    run_subprocess_mocked.side_effect = slow_repoquery
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(service.query(["kernel"], fields=KERNEL_FIELDS)))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The threads wait for the query running in the first one instead of running it again
+    assert run_subprocess_mocked.call_count == 1
+    assert len(results) == 4
+    assert all(result == results[0] for result in results)
+
+
+def test_query_same_repo_config_from_cache(service, run_subprocess_mocked):
+    service.query(["kernel"], fields=KERNEL_FIELDS, releasever="8")
+    service.query(["kernel-core"], fields=KERNEL_FIELDS, releasever="8")
+    service.query(["kernel-core"], fields=KERNEL_FIELDS, releasever="9")
+
+    cmds = [call[0][0] for call in run_subprocess_mocked.call_args_list]
+    assert "-C" not in cmds[0]
+    assert cmds[1][:2] == ["repoquery", "-C"]
+    assert "-C" not in cmds[2]
+
+
+def test_query_same_repo_config_from_cache_failure(service, run_subprocess_mocked):
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+    run_subprocess_mocked.side_effect = [("Cache-only enabled but no cache for 'base'", 1), (KERNEL_OUTPUT, 0)]
+
+    assert len(service.query(["kernel-core"], fields=KERNEL_FIELDS)) == 2
+
+    cmds = [call[0][0] for call in run_subprocess_mocked.call_args_list]
+    assert "-C" in cmds[1]
+    assert "-C" not in cmds[2]
+
+
+def test_query_on_disk_cache(service, run_subprocess_mocked, tmpdir, monkeypatch):
+    monkeypatch.setenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, "3600")
+    _write_repomd(tmpdir, "1690000000")
+    expected = service.query(["kernel"], fields=KERNEL_FIELDS)
+
+    # A new convert2rhel run
+    service = repoquery.RepoQuery(cache_file=service.cache_file)
+    assert service.query(["kernel"], fields=KERNEL_FIELDS) == expected
+    assert run_subprocess_mocked.call_count == 1
+
+    # The repository metadata changed
+    _write_repomd(tmpdir, "1690000001")
+    service = repoquery.RepoQuery(cache_file=service.cache_file)
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+    assert run_subprocess_mocked.call_count == 2
+
+
+def test_query_on_disk_cache_expired(service, run_subprocess_mocked, monkeypatch):
+    monkeypatch.setenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, "60")
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+
+    monkeypatch.setattr(repoquery.time, "time", mock.Mock(return_value=repoquery.time.time() + 120))
+    service = repoquery.RepoQuery(cache_file=service.cache_file)
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+
+    assert run_subprocess_mocked.call_count == 2
+
+
+def test_query_on_disk_cache_drops_expired(service, run_subprocess_mocked, monkeypatch, tmpdir):
+    monkeypatch.setenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, "60")
+    service.query(["kernel"], fields=KERNEL_FIELDS)
+
+    monkeypatch.setattr(repoquery.time, "time", mock.Mock(return_value=repoquery.time.time() + 120))
+    service.query(["kernel-core"], fields=KERNEL_FIELDS)
+
+    queries = repoquery._load_cache(service.cache_file)["queries"]
+    assert [json.loads(key)[-2] for key in queries] == [["kernel-core"]]
+    # No temporary file is left behind
+    assert tmpdir.listdir(lambda path: path.basename.startswith("repoquery-cache")) == [
+        tmpdir.join("repoquery-cache.json")
+    ]
+
+
+def test_query_on_disk_cache_temporary_reposdir(service, run_subprocess_mocked, monkeypatch, tmpdir):
+    monkeypatch.setenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, "3600")
+    for reposdir in ("repos1", "repos2", "repos3"):
+        tmpdir.join(reposdir, "convert2rhel.repo").write("[convert2rhel]\nbaseurl=https://example.com\n", ensure=True)
+    tmpdir.join("repos3", "convert2rhel.repo").write("[convert2rhel]\nbaseurl=https://example.org\n")
+    service.query(["convert2rhel"], fields=KERNEL_FIELDS, reposdir=str(tmpdir.join("repos1")))
+
+    # A new convert2rhel run with the same repofile in a new temporary directory
+    service = repoquery.RepoQuery(cache_file=service.cache_file)
+    service.query(["convert2rhel"], fields=KERNEL_FIELDS, reposdir=str(tmpdir.join("repos2")))
+    assert run_subprocess_mocked.call_count == 1
+
+    # A different repofile
+    service.query(["convert2rhel"], fields=KERNEL_FIELDS, reposdir=str(tmpdir.join("repos3")))
+    assert run_subprocess_mocked.call_count == 2
+
+
+@pytest.mark.parametrize(
+    ("envvar", "expected"),
+    (
+        (None, 0),
+        ("", 0),
+        ("600", 600),
+        ("-1", 0),
+        ("forever", 0),
+    ),
+)
+def test_get_cache_ttl(envvar, expected, monkeypatch):
+    if envvar is None:
+        monkeypatch.delenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, raising=False)
+    else:
+        monkeypatch.setenv(repoquery.REPOQUERY_CACHE_TTL_ENVVAR, envvar)
+
+    assert repoquery._get_cache_ttl() == expected
@@ -0,0 +1,383 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+import os
+import time
+
+import pytest
+import rpm
+import six
+
+from convert2rhel import rpmverify, utils
+from convert2rhel.unit_tests import DummyPopenOutput
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+@pytest.fixture(autouse=True)
+def single_rpm_va_job(monkeypatch):
+    monkeypatch.setenv(rpmverify.RPM_VA_JOBS_ENVVAR, "1")
+
+
+@pytest.fixture
+def installed_pkgs(tmpdir, monkeypatch):
+    """Three packages, each owning one file in tmpdir. The second and the third one share a file."""
+    for name in ("foo.conf", "bar.conf", "shared.conf"):
+        tmpdir.join(name).write(name)
+
+    pkgs = [
+        ("foo-1.0-1.el8.x86_64", "sha1-foo:1", [str(tmpdir.join("foo.conf"))]),
+        ("bar-1.0-1.el8.noarch", "sha1-bar:1", [str(tmpdir.join("bar.conf")), str(tmpdir.join("shared.conf"))]),
+        ("baz-1.0-1.el8.noarch", "sha1-baz:1", [str(tmpdir.join("shared.conf"))]),
+    ]
+    monkeypatch.setattr(rpmverify, "_read_installed_pkg_files", mock.Mock(return_value=pkgs))
+    return pkgs
+
+
+class PopenByCommand:
+    """Replacement for subprocess.Popen returning a separate output for the rpm -Va --nofiles command."""
+
+    def __init__(self, output, nofiles_output):
+        self.output = output
+        self.nofiles_output = nofiles_output
+        self.calls = []
+
+    def __call__(self, args, **kwargs):
+        self.calls.append(args)
+        output = self.nofiles_output if "--nofiles" in args else self.output
+        return DummyPopenOutput([line.encode("utf-8") for line in output])(args, **kwargs)
+
+
+def _run(monkeypatch, tmpdir, output, nofiles_output=()):
+    popen = PopenByCommand(output, nofiles_output)
+    monkeypatch.setattr(utils.subprocess, "Popen", popen)
+    output_file = str(tmpdir.join("rpm_va.log"))
+    rpmverify.generate_rpm_va(output_file, cache_file=str(tmpdir.join("cache.json")))
+    return popen.calls, utils.get_file_content(output_file)
+
+
+def test_generate_rpm_va_without_cache(installed_pkgs, monkeypatch, tmpdir):
+    output = [
+        "S.5....T.  c %s\n" % installed_pkgs[0][2][0],
+        ".M.......    %s\n" % installed_pkgs[1][2][1],
+        ".M.......    %s\n" % installed_pkgs[1][2][1],
+    ]
+
+    calls, content = _run(monkeypatch, tmpdir, output)
+
+    assert calls == [["rpm", "-Va"]]
+    assert content == "".join(output)
+    with open(str(tmpdir.join("cache.json"))) as f:
+        cache = json.load(f)
+    assert cache["complete"]
+    # Only a digest of the stat of the files is stored
+    assert cache["packages"]["foo-1.0-1.el8.x86_64"]["files"] == rpmverify._get_files_digest(installed_pkgs[0][2])
+    assert cache["packages"]["foo-1.0-1.el8.x86_64"]["output"] == [output[0].rstrip("\n")]
+    # The line of the shared file is printed once for every owning package
+    assert cache["packages"]["bar-1.0-1.el8.noarch"]["output"] == [output[1].rstrip("\n")]
+    assert cache["packages"]["baz-1.0-1.el8.noarch"]["output"] == [output[2].rstrip("\n")]
+
+
+def test_generate_rpm_va_reuses_cache(installed_pkgs, monkeypatch, tmpdir):
+    foo_line = "S.5....T.  c %s\n" % installed_pkgs[0][2][0]
+    _run(monkeypatch, tmpdir, [foo_line])
+
+    # Only the file of bar changed
+    tmpdir.join("bar.conf").write("modified content")
+    bar_line = "S.5....T.    %s\n" % installed_pkgs[1][2][0]
+    calls, content = _run(monkeypatch, tmpdir, [bar_line])
+
+    assert calls == [["rpm", "-V", "--nodeps", "--noscripts", "bar-1.0-1.el8.noarch"], ["rpm", "-Va", "--nofiles"]]
+    assert content == foo_line + bar_line
+
+
+def test_generate_rpm_va_nothing_changed(installed_pkgs, monkeypatch, tmpdir):
+    foo_line = "S.5....T.  c %s\n" % installed_pkgs[0][2][0]
+    _run(monkeypatch, tmpdir, [foo_line])
+    save_cache = mock.Mock()
+    monkeypatch.setattr(rpmverify, "_save_cache", save_cache)
+
+    calls, content = _run(monkeypatch, tmpdir, [])
+
+    assert calls == [["rpm", "-Va", "--nofiles"]]
+    assert content == foo_line
+    # The cache is the same, it's not rewritten
+    assert save_cache.call_count == 0
+
+
+def test_generate_rpm_va_header_changed(installed_pkgs, monkeypatch, tmpdir):
+    _run(monkeypatch, tmpdir, [])
+
+    installed_pkgs[2] = ("baz-1.0-1.el8.noarch", "sha1-baz:2", installed_pkgs[2][2])
+    calls, _ = _run(monkeypatch, tmpdir, [])
+
+    assert calls[0] == ["rpm", "-V", "--nodeps", "--noscripts", "baz-1.0-1.el8.noarch"]
+
+
+def test_generate_rpm_va_most_packages_changed(installed_pkgs, monkeypatch, tmpdir):
+    _run(monkeypatch, tmpdir, [])
+
+    tmpdir.join("foo.conf").write("modified content")
+    tmpdir.join("shared.conf").write("modified content")
+    calls, _ = _run(monkeypatch, tmpdir, [])
+
+    assert calls == [["rpm", "-Va"]]
+
+
+def test_generate_rpm_va_dependencies(installed_pkgs, monkeypatch, tmpdir):
+    foo_line = "S.5....T.  c %s\n" % installed_pkgs[0][2][0]
+    _run(monkeypatch, tmpdir, ["Unsatisfied dependencies for foo-1.0-1.el8.x86_64:\n", "\tlibold.so.1\n", foo_line])
+
+    # None of the packages changed, yet the dependencies of foo are checked again
+    nofiles_output = ["Unsatisfied dependencies for foo-1.0-1.el8.x86_64:\n", "\tlibbar.so.1 is needed by foo\n"]
+    calls, content = _run(monkeypatch, tmpdir, [], nofiles_output)
+
+    assert calls == [["rpm", "-Va", "--nofiles"]]
+    assert content == "".join(nofiles_output) + foo_line
+
+
+def test_generate_rpm_va_unassigned_output(installed_pkgs, monkeypatch, tmpdir):
+    output = ["S.5....T.    /not/owned/by/any/package\n"]
+    _run(monkeypatch, tmpdir, output)
+
+    # The output which can't be reused means the next run verifies everything again
+    calls, content = _run(monkeypatch, tmpdir, output)
+
+    assert calls == [["rpm", "-Va"]]
+    assert content == "".join(output)
+
+
+def test_generate_rpm_va_unreadable_rpmdb(monkeypatch, tmpdir):
+    monkeypatch.setattr(rpmverify, "_read_installed_pkg_files", mock.Mock(side_effect=rpm.error("db error")))
+
+    calls, content = _run(monkeypatch, tmpdir, ["rpmva\n"])
+
+    assert calls == [["rpm", "-Va"]]
+    assert content == "rpmva\n"
+    assert not os.path.exists(str(tmpdir.join("cache.json")))
+
+
+def test_generate_rpm_va_parallel(installed_pkgs, monkeypatch, tmpdir):
+    monkeypatch.setenv(rpmverify.RPM_VA_JOBS_ENVVAR, "2")
+    output = {
+        "foo-1.0-1.el8.x86_64": ["S.5....T.  c %s" % installed_pkgs[0][2][0]],
+        "bar-1.0-1.el8.noarch": [],
+        "baz-1.0-1.el8.noarch": [".M.......    %s" % installed_pkgs[2][2][0]],
+    }
+    run_rpm_verify = mock.Mock(side_effect=lambda cmd, print_cmd: output[cmd[-1]])
+    monkeypatch.setattr(rpmverify, "_run_rpm_verify", run_rpm_verify)
+    output_file = str(tmpdir.join("rpm_va.log"))
+
+    rpmverify.generate_rpm_va(output_file, cache_file=str(tmpdir.join("cache.json")))
+
+    assert run_rpm_verify.call_count == 3
+    assert utils.get_file_content(output_file) == "%s\n%s\n" % (
+        output["foo-1.0-1.el8.x86_64"][0],
+        output["baz-1.0-1.el8.noarch"][0],
+    )
+
+
+def test_verify_pkgs_keeps_order(monkeypatch):
+    labels = ["pkg%d" % i for i in range(20)]
+    pkgs_files = dict((label, ["/%s" % label]) for label in labels)
+
+    def run_rpm_verify(cmd, print_cmd):
+        # The first shards finish last
+        time.sleep(0.01 * (20 - int(cmd[2][3:])) / 10.0)
+        for label in cmd[2:]:
+            yield "S.5....T.    /%s" % label
+            yield "Unsatisfied dependencies for %s:" % label
+
+    monkeypatch.setattr(rpmverify, "_run_rpm_verify", run_rpm_verify)
+
+    pkgs_output, unassigned_output = rpmverify._verify_pkgs(labels, pkgs_files, 3)
+
+    assert pkgs_output == dict((label, ["S.5....T.    /%s" % label]) for label in labels)
+    assert unassigned_output == ["Unsatisfied dependencies for %s:" % label for label in labels]
+
+
+def test_verify_pkgs_shards(monkeypatch):
+    run_rpm_verify = mock.Mock(return_value=[])
+    monkeypatch.setattr(rpmverify, "_run_rpm_verify", run_rpm_verify)
+    labels = ["pkg%d" % i for i in range(10)]
+
+    rpmverify._verify_pkgs(labels, dict((label, []) for label in labels), 2)
+
+    shards = sorted(call[0][0][2:] for call in run_rpm_verify.call_args_list)
+    assert len(shards) == 5
+    assert sorted(label for shard in shards for label in shard) == sorted(labels)
+
+
+def test_verify_pkgs_single_job(monkeypatch):
+    run_rpm_verify = mock.Mock(return_value=["output"])
+    monkeypatch.setattr(rpmverify, "_run_rpm_verify", run_rpm_verify)
+
+    assert rpmverify._verify_pkgs(["foo", "bar"], {"foo": [], "bar": []}, 1) == ({"foo": [], "bar": []}, ["output"])
+    run_rpm_verify.assert_called_once_with(["rpm", "-V", "foo", "bar"])
+
+
+def test_assign_output_to_pkgs():
+    pkgs_files = {"foo": ["/etc/foo.conf", "/usr/lib/shared"], "bar": ["/usr/lib/shared"], "baz": ["/etc/baz.conf"]}
+    output = iter(
+        [
+            "S.5....T.  c /etc/foo.conf",
+            ".M.......    /usr/lib/shared",
+            "Unsatisfied dependencies for bar:",
+            ".M.......    /usr/lib/shared",
+            "missing     /not/owned",
+        ]
+    )
+
+    pkgs_output, unassigned_output = rpmverify._assign_output_to_pkgs(output, ["foo", "bar"], pkgs_files)
+
+    assert pkgs_output == {
+        "foo": ["S.5....T.  c /etc/foo.conf", ".M.......    /usr/lib/shared"],
+        "bar": [".M.......    /usr/lib/shared"],
+    }
+    assert unassigned_output == ["Unsatisfied dependencies for bar:", "missing     /not/owned"]
+
+
+@pytest.mark.parametrize(
+    ("envvar", "expected"),
+    (
+        ("4", 4),
+        ("1", 1),
+        ("0", 16),
+        ("many", 16),
+        (None, 16),
+    ),
+)
+def test_get_rpm_va_jobs(envvar, expected, monkeypatch):
+    monkeypatch.setattr(rpmverify.multiprocessing, "cpu_count", mock.Mock(return_value=16))
+    if envvar is None:
+        monkeypatch.delenv(rpmverify.RPM_VA_JOBS_ENVVAR)
+    else:
+        monkeypatch.setenv(rpmverify.RPM_VA_JOBS_ENVVAR, envvar)
+
+    assert rpmverify._get_rpm_va_jobs() == expected
+
+
+@pytest.mark.parametrize(
+    ("content",),
+    (
+        ("not json",),
+        ('{"version": 0, "complete": true, "packages": {}}',),
+    ),
+)
+def test_load_cache_unusable(content, tmpdir):
+    cache_file = tmpdir.join("cache.json")
+    cache_file.write(content)
+
+    assert rpmverify._load_cache(str(cache_file)) == {
+        "version": rpmverify._RPM_VA_CACHE_VERSION,
+        "complete": False,
+        "packages": {},
+    }
+
+
+def test_get_file_stat(tmpdir):
+    path = tmpdir.join("file")
+    path.write("content")
+
+    assert rpmverify._get_file_stat(str(path))[0] == len("content")
+    assert rpmverify._get_file_stat(str(tmpdir.join("missing"))) is None
+
+
+def test_get_files_digest(tmpdir):
+    path = tmpdir.join("file")
+    path.write("content")
+    digest = rpmverify._get_files_digest([str(path)])
+
+    assert rpmverify._get_files_digest([str(path)]) == digest
+    path.write("modified content")
+    assert rpmverify._get_files_digest([str(path)]) != digest
+
+
+@pytest.fixture
+def rpm_va_outputs(tmpdir):
+    def write_outputs(pre_output, post_output):
+        pre_output_file = tmpdir.join("rpm_va.log")
+        pre_output_file.write("".join("%s\n" % line for line in pre_output))
+        post_output_file = tmpdir.join("rpm_va_after_conversion.log")
+        post_output_file.write("".join("%s\n" % line for line in post_output))
+        return str(pre_output_file), str(post_output_file)
+
+    return write_outputs
+
+
+def test_diff_rpm_va(rpm_va_outputs):
+    pre_output_file, post_output_file = rpm_va_outputs(
+        [
+            "S.5....T.  c /etc/yum.conf",
+            "missing     /usr/share/doc/foo/README",
+            ".M.......  g /var/lib/foo",
+            "Unsatisfied dependencies for foo-1.0-1.noarch:",
+            # Owned by two packages
+            ".M.......    /usr/lib/debug",
+            ".M.......    /usr/lib/debug",
+        ],
+        [
+            "S.5....T.  c /etc/dnf/dnf.conf",
+            "..5....T.  c /etc/yum.conf",
+            ".M.......  g /var/lib/foo",
+            ".M.......    /usr/lib/debug",
+            "",
+        ],
+    )
+
+    assert rpmverify.diff_rpm_va(pre_output_file, post_output_file) == {
+        "added": ["S.5....T.  c /etc/dnf/dnf.conf"],
+        "removed": [
+            ".M.......    /usr/lib/debug",
+            "missing     /usr/share/doc/foo/README",
+            "Unsatisfied dependencies for foo-1.0-1.noarch:",
+        ],
+        "changed": [("S.5....T.  c /etc/yum.conf", "..5....T.  c /etc/yum.conf")],
+    }
+
+
+def test_diff_rpm_va_missing_output(rpm_va_outputs, tmpdir):
+    pre_output_file, _ = rpm_va_outputs(["S.5....T.  c /etc/yum.conf"], [])
+
+    diff = rpmverify.diff_rpm_va(pre_output_file, str(tmpdir.join("missing")))
+
+    assert diff == {"added": [], "removed": ["S.5....T.  c /etc/yum.conf"], "changed": []}
+
+
+def test_format_rpm_va_diff():
+    diff = {
+        "added": ["S.5....T.  c /etc/dnf/dnf.conf"],
+        "removed": ["missing     /usr/share/doc/foo/README"],
+        "changed": [("S.5....T.  c /etc/yum.conf", "..5....T.  c /etc/yum.conf")],
+    }
+
+    assert rpmverify.format_rpm_va_diff(diff, "pre.log", "post.log") == "\n".join(
+        [
+            "--- pre.log",
+            "+++ post.log",
+            "+S.5....T.  c /etc/dnf/dnf.conf",
+            "-S.5....T.  c /etc/yum.conf",
+            "+..5....T.  c /etc/yum.conf",
+            "-missing     /usr/share/doc/foo/README",
+        ]
+    )
+    assert rpmverify.format_rpm_va_diff({"added": [], "removed": [], "changed": []}, "pre.log", "post.log") == ""
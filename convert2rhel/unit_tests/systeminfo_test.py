@@ -22,10 +22,10 @@ import time
 import pytest
 import six
 
-from convert2rhel import logger, systeminfo, unit_tests, utils  # Imports unit_tests/__init__.py
+from convert2rhel import logger, rpmverify, systeminfo, unit_tests, utils  # Imports unit_tests/__init__.py
 from convert2rhel.systeminfo import RELEASE_VER_MAPPING, Version, system_info
-from convert2rhel.toolopts import tool_opts
-from convert2rhel.unit_tests import is_rpm_based_os
+from convert2rhel.toolopts import POST_RPM_VA_LOG_FILENAME, PRE_RPM_VA_LOG_FILENAME, tool_opts
+from convert2rhel.unit_tests import DummyPopenOutput, is_rpm_based_os
 from convert2rhel.unit_tests.conftest import all_systems, centos8
 
 
@@ -45,49 +45,59 @@ class TestRPMFilesDiff:
         monkeypatch.setattr(tool_opts, "no_rpm_va", mock.Mock(return_value=True))
         assert system_info.modified_rpm_files_diff() is None
 
-    def test_modified_rpm_files_diff_without_differences_after_conversion(
-        self, register_system_info_logger, monkeypatch
-    ):
+    @pytest.fixture
+    def rpm_va_logs(self, monkeypatch, tmpdir):
         monkeypatch.setattr(system_info, "generate_rpm_va", mock.Mock())
-        monkeypatch.setattr(utils, "get_file_content", mock.Mock(side_effect=(["rpm1", "rpm2"], ["rpm1", "rpm2"])))
+        monkeypatch.setattr(logger, "LOG_DIR", str(tmpdir))
+        monkeypatch.setattr(tool_opts, "no_rpm_va", False)
 
-        assert system_info.modified_rpm_files_diff() is None
+        def write_rpm_va_logs(pre_rpm_va, post_rpm_va):
+            tmpdir.join(PRE_RPM_VA_LOG_FILENAME).write("".join("%s\n" % line for line in pre_rpm_va))
+            tmpdir.join(POST_RPM_VA_LOG_FILENAME).write("".join("%s\n" % line for line in post_rpm_va))
 
-    def test_modified_rpm_files_diff_with_differences_after_conversion(self, monkeypatch, caplog):
-        monkeypatch.setattr(system_info, "generate_rpm_va", mock.Mock())
-        monkeypatch.setattr(os.path, "exists", mock.Mock(return_value=True))
-        monkeypatch.setattr(tool_opts, "no_rpm_va", False)
-        monkeypatch.setattr(
-            utils,
-            "get_file_content",
-            mock.Mock(
-                side_effect=(
-                    [".M.......  g /etc/pki/ca-trust/extracted/java/cacerts"],
-                    [
-                        ".M.......  g /etc/pki/ca-trust/extracted/java/cacerts",
-                        "S.5....T.  c /etc/yum.conf",
-                    ],
-                )
-            ),
+        return write_rpm_va_logs
+
+    def test_modified_rpm_files_diff_without_differences_after_conversion(self, rpm_va_logs, caplog):
+        rpm_va_logs(["rpm1", "rpm2"], ["rpm1", "rpm2"])
+
+        assert system_info.modified_rpm_files_diff() is None
+        assert not any("Comparison of modified rpm files" in record.message for record in caplog.records)
+
+    def test_modified_rpm_files_diff_with_differences_after_conversion(self, rpm_va_logs, caplog):
+        rpm_va_logs(
+            [
+                ".M.......  g /etc/pki/ca-trust/extracted/java/cacerts",
+                "S.5....T.  c /etc/dnf/dnf.conf",
+            ],
+            [
+                ".M.......  g /etc/pki/ca-trust/extracted/java/cacerts",
+                "S.5....T.  c /etc/yum.conf",
+                "..5....T.  c /etc/dnf/dnf.conf",
+            ],
         )
 
         system_info.modified_rpm_files_diff()
 
-        assert any("S.5....T.  c /etc/yum.conf" in elem.message for elem in caplog.records if elem.levelname == "INFO")
+        message = caplog.records[-1].message
+        assert "(1 added, 0 removed, 1 with changed flags)" in message
+        assert message.endswith(
+            "\n-S.5....T.  c /etc/dnf/dnf.conf\n+..5....T.  c /etc/dnf/dnf.conf\n+S.5....T.  c /etc/yum.conf"
+        )
 
 
 class TestGenerateRPMVA:
     def test_generate_rpm_va(self, global_tool_opts, monkeypatch, tmpdir):
         global_tool_opts.no_rpm_va = False
         monkeypatch.setattr(systeminfo, "tool_opts", global_tool_opts)
-        monkeypatch.setattr(utils, "run_subprocess", mock.Mock(return_value=("rpmva\n", 0)))
+        monkeypatch.setattr(utils.subprocess, "Popen", DummyPopenOutput([b"rpmva\n"]))
+        monkeypatch.setattr(rpmverify, "_read_installed_pkg_files", mock.Mock(return_value=[]))
+        monkeypatch.setattr(rpmverify, "RPM_VA_CACHE_FILE", str(tmpdir / "rpm-va-cache.json"))
         monkeypatch.setattr(logger, "LOG_DIR", str(tmpdir))
         rpmva_output_file = str(tmpdir / "rpm_va.log")
         system_info.generate_rpm_va()
 
         # Check that rpm -Va is executed (default)
-        assert utils.run_subprocess.called
-        assert utils.run_subprocess.call_args_list[0][0][0] == ["rpm", "-Va"]
+        assert utils.subprocess.Popen.args == ["rpm", "-Va"]
 
         # Check that the output was stored into the specific file.
         assert os.path.isfile(rpmva_output_file)
@@ -96,14 +106,14 @@ class TestGenerateRPMVA:
     def test_generate_rpm_va_skip(self, global_tool_opts, monkeypatch, tmpdir):
         global_tool_opts.no_rpm_va = True
         monkeypatch.setattr(systeminfo, "tool_opts", global_tool_opts)
-        monkeypatch.setattr(utils, "run_subprocess", mock.Mock())
+        monkeypatch.setattr(utils.subprocess, "Popen", mock.Mock())
         monkeypatch.setattr(logger, "LOG_DIR", str(tmpdir))
         rpmva_output_file = str(tmpdir / "rpm_va.log")
 
         system_info.generate_rpm_va()
 
         # Check that rpm -Va is not called when the --no-rpm-va option is used.
-        assert not utils.run_subprocess.called
+        assert not utils.subprocess.Popen.called
         assert not os.path.exists(rpmva_output_file)
 
 
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+#
+# Copyright(C) 2023 Red Hat, Inc.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+__metaclass__ = type
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+
+import pytest
+import six
+
+from convert2rhel import timings, utils
+
+
+six.add_move(six.MovedModule("mock", "mock", "unittest.mock"))
+from six.moves import mock
+
+
+@pytest.fixture
+def recorder():
+    return timings.Timings()
+
+
+def test_measure_action(recorder):
+    with recorder.measure_action("ACTION"):
+        time.sleep(0.05)
+        recorder.record_command(["rpm", "-Va"], 0.01, 1, 100)
+
+    action = recorder.to_dict()["actions"]["ACTION"]
+    assert action["wall_time"] >= 0.05
+    assert action["cpu_time"] >= 0
+    assert action["max_rss_delta_kb"] >= 0
+    assert action["commands"] == [{"command": "rpm -Va", "duration": 0.01, "returncode": 1, "output_size": 100}]
+
+
+def test_measure_action_exception(recorder):
+    with pytest.raises(ZeroDivisionError):
+        with recorder.measure_action("ACTION"):
+            1 / 0
+
+    recorder.record_command(["true"], 0.01, 0, 0)
+
+    assert "ACTION" in recorder.to_dict()["actions"]
+    # Not attributed to the Action anymore
+    assert recorder.to_dict()["commands"][0]["command"] == "true"
+
+
+def test_record_command_hidden(recorder):
+    recorder.record_command(["subscription-manager", "register", "--password", "secret"], 1.0, 0, 10, show_cmd=False)
+
+    assert recorder.to_dict()["commands"] == [
+        {"command": "subscription-manager", "duration": 1.0, "returncode": 0, "output_size": 10}
+    ]
+
+
+def test_record_command_in_threads(recorder):
+    def run(action_id):
+        with recorder.measure_action(action_id):
+            recorder.record_command([action_id.lower()], 0.01, 0, 0)
+
+    threads = [threading.Thread(target=run, args=(action_id,)) for action_id in ("FIRST", "SECOND")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    actions = recorder.to_dict()["actions"]
+    assert [command["command"] for command in actions["FIRST"]["commands"]] == ["first"]
+    assert [command["command"] for command in actions["SECOND"]["commands"]] == ["second"]
+
+
+def test_reset(recorder):
+    with recorder.measure_action("ACTION"):
+        recorder.record_command(["true"], 0.01, 0, 0)
+
+    recorder.reset()
+
+    assert recorder.to_dict() == {"actions": {}, "commands": []}
+
+
+def test_run_subprocess_recorded():
+    with timings.timings.measure_action("ACTION"):
+        utils.run_subprocess(["echo", "output"], print_output=False)
+
+    commands = timings.timings.to_dict()["actions"]["ACTION"]["commands"]
+    assert len(commands) == 1
+    assert commands[0]["command"] == "echo output"
+    assert commands[0]["returncode"] == 0
+    assert commands[0]["output_size"] == len("output\n")
+
+
+@pytest.fixture
+def trace(tmpdir):
+    trace = timings.Trace()
+    trace.enable(str(tmpdir.join("trace.json")))
+    return trace
+
+
+def _read_events(trace):
+    with open(trace.path) as f:
+        return json.load(f)["traceEvents"]
+
+
+def test_trace_disabled(monkeypatch):
+    trace = timings.Trace()
+    open_mock = mock.mock_open()
+    monkeypatch.setattr(six.moves.builtins, "open", open_mock)
+
+    with trace.span("Stage", "stage"):
+        trace.instant("Downloaded", "download")
+    trace.write()
+
+    assert not trace.enabled
+    assert trace._events == []
+    assert open_mock.call_count == 0
+
+
+def test_trace_spans(trace):
+    trace.set_phase("INIT")
+    with trace.span("Stage", "stage"):
+        with trace.span("ACTION", "action", {"id": 1}):
+            trace.complete("rpm -Va", "subprocess", time.time() - 1, 1, {"returncode": 0})
+            trace.instant("Downloaded", "download")
+    trace.set_phase("POST_CLI")
+    trace.write()
+
+    events = [(event["ph"], event["name"]) for event in _read_events(trace)]
+    assert events == [
+        ("M", "process_name"),
+        ("B", "Phase: INIT"),
+        ("B", "Stage"),
+        ("B", "ACTION"),
+        ("X", "rpm -Va"),
+        ("i", "Downloaded"),
+        ("E", "ACTION"),
+        ("E", "Stage"),
+        ("E", "Phase: INIT"),
+        ("B", "Phase: POST_CLI"),
+        # Ended when writing the trace
+        ("E", "Phase: POST_CLI"),
+    ]
+
+
+def test_trace_end_nested_spans(trace):
+    with trace.span("Transaction", "pkgmanager"):
+        trace.begin("pkg-1", "rpm")
+        trace.end("pkg-1")
+        trace.begin("pkg-2", "rpm")
+        # Never started
+        trace.end("pkg-3")
+    trace.write()
+
+    events = [(event["ph"], event["name"]) for event in _read_events(trace)]
+    assert events[1:] == [
+        ("B", "Transaction"),
+        ("B", "pkg-1"),
+        ("E", "pkg-1"),
+        ("B", "pkg-2"),
+        ("E", "pkg-2"),
+        ("E", "Transaction"),
+    ]
+
+
+def test_trace_child_process(trace):
+    @utils.run_as_child_process
+    def child():
+        with timings.trace.span("In child", "test"):
+            pass
+
+    timings.trace.enable(trace.path)
+    try:
+        child()
+        timings.trace.write()
+    finally:
+        timings.trace.path = None
+
+    events = _read_events(trace)
+    child_events = [event for event in events if event["pid"] != os.getpid()]
+    assert [(event["ph"], event["name"]) for event in child_events] == [
+        ("M", "process_name"),
+        ("B", "child"),
+        ("B", "In child"),
+        ("E", "In child"),
+        ("E", "child"),
+    ]
+    assert ("B", "Child process: child") in [(event["ph"], event["name"]) for event in events]
+    assert not os.path.exists("%s.children" % trace.path)
+
+
+def _start_and_flush_child_process():
+    timings.trace.start_child_process()
+    timings.trace.flush_child_process()
+
+
+def test_trace_child_process_lock_held(trace):
+    timings.trace.enable(trace.path)
+    # Held by another thread of the main process while forking
+    timings.trace._lock.acquire()
+    try:
+        process = multiprocessing.Process(target=_start_and_flush_child_process)
+        process.start()
+        process.join(10)
+    finally:
+        timings.trace._lock.release()
+        timings.trace.path = None
+
+    if process.is_alive():
+        process.terminate()
+    assert process.exitcode == 0
+
+
+def test_trace_write_error(trace, tmpdir, caplog):
+    trace.path = str(tmpdir.join("missing", "trace.json"))
+
+    trace.write()
+
+    assert "Unable to write the profile trace" in caplog.records[-1].message
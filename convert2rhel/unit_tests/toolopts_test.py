@@ -62,6 +62,12 @@ class TestTooloptsParseFromCLI(object):
         assert global_tool_opts.enablerepo == ["foo"]
         assert global_tool_opts.disablerepo == ["*"]
 
+    def test_cmdline_profile_trace(self, monkeypatch, global_tool_opts, tmpdir):
+        monkeypatch.chdir(str(tmpdir))
+        monkeypatch.setattr(sys, "argv", mock_cli_arguments(["analyze", "--profile-trace", "trace.json"]))
+        convert2rhel.toolopts.CLI()
+        assert global_tool_opts.profile_trace == os.path.join(str(tmpdir), "trace.json")
+
     #
     # Parsing of serverurl
     #
@@ -18,6 +18,7 @@ import getpass
 import json
 import logging
 import os
+import pickle
 import shutil
 import sys
 
@@ -25,6 +26,7 @@ from pickle import PicklingError
 
 import pexpect
 import pytest
+import rpm
 import six
 
 from convert2rhel.utils import prompt_user
@@ -35,9 +37,11 @@ from collections import namedtuple
 
 from six.moves import mock
 
-from convert2rhel import systeminfo, toolopts, unit_tests, utils  # Imports unit_tests/__init__.py
+from convert2rhel import openpgp, pkghandler, systeminfo, toolopts, unit_tests, utils  # Imports unit_tests/__init__.py
+from convert2rhel import logger as logger_module
+from convert2rhel.pkgmanager import session
 from convert2rhel.systeminfo import system_info
-from convert2rhel.unit_tests import is_rpm_based_os
+from convert2rhel.unit_tests import DummyPopenOutput, is_rpm_based_os
 
 
 DOWNLOADED_RPM_NVRA = "kernel-4.18.0-193.28.1.el8_2.x86_64"
@@ -68,6 +72,20 @@ class RunSubprocessMocked(unit_tests.MockFunction):
         return self.output, self.ret_code
 
 
+class YumdownloaderMocked(RunSubprocessMocked):
+    """Mock for run_cmd_in_pty running a yumdownloader call which writes the rpms to dest."""
+
+    def __init__(self, dest, rpms, ret_code=0):
+        super(YumdownloaderMocked, self).__init__(ret_code=ret_code)
+        self.dest = dest
+        self.rpms = rpms
+
+    def __call__(self, cmd, print_cmd=True, print_output=True):
+        for rpm_file in self.rpms:
+            self.dest.join(rpm_file).write("downloaded")
+        return super(YumdownloaderMocked, self).__call__(cmd, print_cmd, print_output)
+
+
 def test_is_rpm_based_os():
     """This is testing a unit test function?"""
     assert is_rpm_based_os() in (True, False)
@@ -111,8 +129,8 @@ def test_run_cmd_in_pty_expect_script(capfd):
         (False, False),
     ),
 )
-def test_run_cmd_in_pty_quiet_options(print_cmd, print_output, global_tool_opts, caplog, capfd):
-    global_tool_opts.debug = True
+def test_run_cmd_in_pty_quiet_options(print_cmd, print_output, caplog, capfd, monkeypatch):
+    monkeypatch.setattr(logger_module, "_debug_enabled", True)
     caplog.set_level(logging.DEBUG)
 
     with capfd.disabled():
@@ -286,11 +304,46 @@ class TestFindKeys:
     def test_find_keyid(self):
         assert utils.find_keyid(self.gpg_key) == "fd431d51"
 
+    def test_find_keyid_without_gpg(self, monkeypatch):
+        run_subprocess_mock = mock.Mock()
+        monkeypatch.setattr(utils, "run_subprocess", run_subprocess_mock)
+
+        assert utils.find_keyid(self.gpg_key) == "fd431d51"
+        assert run_subprocess_mock.call_count == 0
+
+    def test_find_keyid_cached(self, monkeypatch, tmpdir):
+        gpg_key = str(tmpdir.join("gpg-key"))
+        shutil.copy(self.gpg_key, gpg_key)
+        get_fingerprint = mock.Mock(wraps=openpgp.get_fingerprint)
+        monkeypatch.setattr(openpgp, "get_fingerprint", get_fingerprint)
+
+        assert utils.find_keyid(gpg_key) == "fd431d51"
+        assert utils.find_keyid(gpg_key) == "fd431d51"
+        assert get_fingerprint.call_count == 1
+
+        # A different key in the same file
+        shutil.copy(self.gpg_key.replace("redhat-release", "redhat-legacy-release"), gpg_key)
+        os.utime(gpg_key, (0, 0))
+
+        assert utils.find_keyid(gpg_key) == "37017186"
+        assert get_fingerprint.call_count == 2
+
+    def test_find_keyid_unsupported_key(self, monkeypatch):
+        monkeypatch.setattr(openpgp, "get_fingerprint", mock.Mock(side_effect=openpgp.OpenPGPError("v3 key")))
+        find_keyid_with_gpg = mock.Mock(return_value="fd431d51")
+        monkeypatch.setattr(utils, "_find_keyid_with_gpg", find_keyid_with_gpg)
+
+        assert utils.find_keyid(self.gpg_key) == "fd431d51"
+        find_keyid_with_gpg.assert_called_once_with(self.gpg_key)
+
+    def test_find_keyid_with_gpg(self):
+        assert utils._find_keyid_with_gpg(self.gpg_key) == "fd431d51"
+
     def test_find_keyid_race_in_gpg_cleanup(self, monkeypatch):
         real_rmtree = shutil.rmtree
         monkeypatch.setattr(shutil, "rmtree", self.MockedRmtree(OSError(2, "File not found"), real_rmtree))
 
-        assert utils.find_keyid(self.gpg_key) == "fd431d51"
+        assert utils._find_keyid_with_gpg(self.gpg_key) == "fd431d51"
 
     def test_find_keyid_bad_file(self, tmpdir):
         gpg_key = os.path.join(str(tmpdir), "badkeyfile")
@@ -321,7 +374,7 @@ class TestFindKeys:
         with pytest.raises(
             utils.ImportGPGKeyError, match="Failed to read the temporary keyring with the rpm gpg key:.*"
         ):
-            utils.find_keyid(self.gpg_key)
+            utils._find_keyid_with_gpg(self.gpg_key)
 
     def test_find_keyid_gpg_bad_keyring_and_race_deleting_tmp_dir(self, monkeypatch):
         class MockedRunSubProcess(object):
@@ -345,7 +398,7 @@ class TestFindKeys:
         with pytest.raises(
             utils.ImportGPGKeyError, match="Failed to read the temporary keyring with the rpm gpg key:.*"
         ):
-            utils.find_keyid(self.gpg_key)
+            utils._find_keyid_with_gpg(self.gpg_key)
 
     def test_find_keyid_no_gpg_output(self, monkeypatch):
         class MockedRunSubProcess(object):
@@ -366,7 +419,7 @@ class TestFindKeys:
         with pytest.raises(
             utils.ImportGPGKeyError, match="Unable to determine the gpg keyid for the rpm key file: %s" % self.gpg_key
         ):
-            utils.find_keyid(self.gpg_key)
+            utils._find_keyid_with_gpg(self.gpg_key)
 
     @pytest.mark.parametrize(
         ("exception", "exception_msg"),
@@ -380,7 +433,7 @@ class TestFindKeys:
         monkeypatch.setattr(shutil, "rmtree", self.MockedRmtree(exception, real_rmtree))
 
         with pytest.raises(exception.__class__, match=exception_msg):
-            utils.find_keyid(self.gpg_key)
+            utils._find_keyid_with_gpg(self.gpg_key)
 
 
 @pytest.mark.parametrize("dir_name", ("/existing", "/nonexisting", None))
@@ -403,16 +456,22 @@ def test_remove_tmp_dir(monkeypatch, dir_name, caplog, tmpdir):
 
 
 class TestDownload_pkg:
-    def test_download_pkgs(self, monkeypatch):
+    def test_download_pkgs(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(system_info, "version", systeminfo.Version(8, 0))
         monkeypatch.setattr(
             utils,
-            "download_pkg",
-            lambda pkg, dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir: "/filepath/",
+            "run_cmd_in_pty",
+            YumdownloaderMocked(
+                tmpdir,
+                ["pkg1-1.0-1.el8.x86_64.rpm", "pkg2-1.0-1.el8.noarch.rpm", "pkg3-2.0-1.el8.x86_64.rpm"],
+            ),
         )
+        monkeypatch.setattr(utils, "download_pkg", mock.Mock())
+        dest = str(tmpdir)
 
         paths = utils.download_pkgs(
-            pkgs=["pkg1", "pkg2"],
-            dest="/dest/",
+            pkgs=["pkg1-1.0-1.el8.x86_64", "pkg2-1:1.0-1.el8.noarch", "1:pkg3-2.0-1.el8.x86_64"],
+            dest=dest,
             reposdir="/reposdir/",
             enable_repos=["repo1"],
             disable_repos=["repo2"],
@@ -421,7 +480,100 @@ class TestDownload_pkg:
             varsdir="/tmp",
         )
 
-        assert paths == ["/filepath/", "/filepath/"]
+        assert paths == [
+            os.path.join(dest, "pkg1-1.0-1.el8.x86_64.rpm"),
+            os.path.join(dest, "pkg2-1.0-1.el8.noarch.rpm"),
+            os.path.join(dest, "pkg3-2.0-1.el8.x86_64.rpm"),
+        ]
+        assert utils.run_cmd_in_pty.called == 1
+        assert utils.run_cmd_in_pty.cmd == [
+            "yumdownloader",
+            "-v",
+            "--destdir=%s" % dest,
+            "--setopt=reposdir=/reposdir/",
+            "--disablerepo=repo2",
+            "--enablerepo=repo1",
+            "--setopt=varsdir=/tmp",
+            "--setopt=module_platform_id=platform:el8",
+            "pkg1-1.0-1.el8.x86_64",
+            "pkg2-1:1.0-1.el8.noarch",
+            "1:pkg3-2.0-1.el8.x86_64",
+        ]
+        assert not utils.download_pkg.called
+
+    def test_download_pkgs_falls_back_to_one_by_one(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(system_info, "version", systeminfo.Version(8, 0))
+        monkeypatch.setattr(
+            utils, "run_cmd_in_pty", YumdownloaderMocked(tmpdir, ["pkg1-1.0-1.el8.x86_64.rpm"], ret_code=1)
+        )
+        monkeypatch.setattr(utils, "download_pkg", mock.Mock(return_value=None))
+        dest = str(tmpdir)
+
+        paths = utils.download_pkgs(
+            pkgs=["pkg1-1.0-1.el8.x86_64", "pkg2-1.0-1.el8.x86_64"], dest=dest, set_releasever=False
+        )
+
+        # The package missing after the batch download is left to download_pkg
+        # which reports the failure the usual way
+        assert paths == [os.path.join(dest, "pkg1-1.0-1.el8.x86_64.rpm"), None]
+        utils.download_pkg.assert_called_once_with("pkg2-1.0-1.el8.x86_64", dest, None, None, None, False, None, None)
+
+    def test_download_pkgs_stale_rpm(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(system_info, "version", systeminfo.Version(8, 0))
+        # The call fails and writes nothing
+        monkeypatch.setattr(utils, "run_cmd_in_pty", YumdownloaderMocked(tmpdir, [], ret_code=1))
+        monkeypatch.setattr(utils, "download_pkg", mock.Mock(return_value=None))
+        dest = str(tmpdir)
+        # Left behind by an earlier run
+        tmpdir.join("pkg1-1.0-1.el8.x86_64.rpm").write("stale")
+
+        paths = utils.download_pkgs(
+            pkgs=["pkg1-1.0-1.el8.x86_64", "pkg2-1.0-1.el8.x86_64"], dest=dest, set_releasever=False
+        )
+
+        assert paths == [None, None]
+        assert utils.download_pkg.call_count == 2
+
+    def test_download_pkgs_bare_names(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(system_info, "version", systeminfo.Version(8, 0))
+        rpms = {
+            "subscription-manager-1.28.36-1.el8.x86_64.rpm": ("subscription-manager", "x86_64"),
+            "python3-subscription-manager-rhsm-1.28.36-1.el8.x86_64.rpm": (
+                "python3-subscription-manager-rhsm",
+                "x86_64",
+            ),
+            "json-c-0.13.1-3.el8.i686.rpm": ("json-c", "i686"),
+        }
+        monkeypatch.setattr(utils, "run_cmd_in_pty", YumdownloaderMocked(tmpdir, list(rpms)))
+        headers = dict(
+            (str(tmpdir.join(rpm_file)), {rpm.RPMTAG_NAME: name, rpm.RPMTAG_ARCH: arch})
+            for rpm_file, (name, arch) in rpms.items()
+        )
+        monkeypatch.setattr(utils, "get_rpm_header", lambda path: headers[path])
+        monkeypatch.setattr(utils, "download_pkg", mock.Mock())
+        dest = str(tmpdir)
+
+        paths = utils.download_pkgs(
+            pkgs=["subscription-manager", "python3-subscription-manager-rhsm", "json-c.i686"],
+            dest=dest,
+            set_releasever=False,
+        )
+
+        assert paths == [
+            os.path.join(dest, "subscription-manager-1.28.36-1.el8.x86_64.rpm"),
+            os.path.join(dest, "python3-subscription-manager-rhsm-1.28.36-1.el8.x86_64.rpm"),
+            os.path.join(dest, "json-c-0.13.1-3.el8.i686.rpm"),
+        ]
+        # Nothing is downloaded twice
+        assert utils.run_cmd_in_pty.called == 1
+        assert utils.download_pkg.call_count == 0
+
+    def test_download_pkgs_single_pkg(self, monkeypatch):
+        monkeypatch.setattr(utils, "run_cmd_in_pty", RunSubprocessMocked(ret_code=0))
+        monkeypatch.setattr(utils, "download_pkg", mock.Mock(return_value="/dest/pkg1.rpm"))
+
+        assert utils.download_pkgs(pkgs=["pkg1"], dest="/dest/") == ["/dest/pkg1.rpm"]
+        assert utils.run_cmd_in_pty.called == 0
 
     def test_download_pkg_success_with_all_params(self, monkeypatch):
         monkeypatch.setattr(system_info, "version", systeminfo.Version(8, 0))
@@ -819,35 +971,6 @@ def test_write_json_object_to_file(data, expected, tmpdir):
     assert oct(os.stat(json_file_path).st_mode)[-4:].endswith("00")
 
 
-class DummyPopenOutput(unit_tests.MockFunction):
-    def __init__(self, output):
-        self.call_count = 0
-        self.output = output
-
-    def __call__(self, args, stdout, stderr, bufsize):
-        return self
-
-    @property
-    def stdout(self):
-        return self
-
-    def readline(self):
-        try:
-            next_line = self.output[self.call_count]
-        except IndexError:
-            return b""
-
-        self.call_count += 1
-        return next_line
-
-    def communicate(self):
-        pass
-
-    @property
-    def returncode(self):
-        return 0
-
-
 class TestRunSubprocess:
     @pytest.mark.parametrize(
         ("command", "expected"),
@@ -877,6 +1000,54 @@ class TestRunSubprocess:
         assert 0 == rc
 
 
+class TestStreamedSubprocess:
+    def test_lines_are_streamed(self):
+        process = utils.StreamedSubprocess(["printf", "a\\nb\\nc\\n"], print_output=False)
+
+        assert list(process) == ["a\n", "b\n", "c\n"]
+        assert process.returncode == 0
+
+    def test_cmd_must_be_a_list(self):
+        with pytest.raises(TypeError, match="cmd should be a list, not a str"):
+            utils.StreamedSubprocess("echo foobar")
+
+    def test_returncode(self):
+        process = utils.StreamedSubprocess(["sh", "-c", "echo failed; exit 56"], print_output=False)
+
+        assert process.wait() == 56
+        assert process.returncode == 56
+
+    def test_line_callback_and_tail(self, monkeypatch):
+        lines = [("line %d\n" % i).encode("utf-8") for i in range(10)]
+        monkeypatch.setattr(utils.subprocess, "Popen", DummyPopenOutput(lines, returncode=1))
+        callback = mock.Mock()
+
+        process = utils.StreamedSubprocess(["cmd"], print_output=False, line_callback=callback, tail_size=3)
+
+        assert process.wait() == 1
+        assert callback.call_args_list == [mock.call(line.decode("utf-8")) for line in lines]
+        assert list(process.tail) == ["line 7\n", "line 8\n", "line 9\n"]
+
+    def test_output_file(self, monkeypatch, tmpdir):
+        monkeypatch.setattr(utils.subprocess, "Popen", DummyPopenOutput([b"foo\n", b"bar\n"]))
+        output_file = str(tmpdir.join("output.log"))
+
+        process = utils.StreamedSubprocess(["cmd"], print_output=False, output_file=output_file)
+        process.wait()
+
+        assert utils.get_file_content(output_file) == "foo\nbar\n"
+        # No tail is kept unless asked for
+        assert not process.tail
+
+    def test_print_output(self, monkeypatch, caplog):
+        monkeypatch.setattr(utils.subprocess, "Popen", DummyPopenOutput([b"foo\n"]))
+
+        utils.StreamedSubprocess(["cmd"]).wait()
+
+        assert "Calling command 'cmd'" in caplog.text
+        assert caplog.records[-1].message == "foo"
+
+
 class DummyGetUID(unit_tests.MockFunction):
     def __init__(self, uid):
         self.uid = uid
@@ -885,6 +1056,58 @@ class DummyGetUID(unit_tests.MockFunction):
         return self.uid
 
 
+def test_reset_caches(monkeypatch):
+    reset = mock.Mock()
+    monkeypatch.setattr(utils, "_cache_resets", [])
+    utils.register_cache(reset)
+
+    utils.reset_caches()
+
+    reset.assert_called_once_with()
+
+
+def test_reset_caches_registered_caches():
+    utils._keyid_cache["/path/to/key"] = (0, ["keyid"])
+    pkghandler._parsed_pkg_cache["pkg-1.0-1.noarch"] = ["pkg", None, "1.0", "1", "noarch"]
+
+    utils.reset_caches()
+
+    assert not utils._keyid_cache
+    assert not pkghandler._parsed_pkg_cache
+
+
+@pytest.mark.parametrize(("value", "expected"), ((None, False), ("", False), ("0", False), ("1", True), ("yes", True)))
+def test_get_env_flag(value, expected, monkeypatch):
+    if value is None:
+        monkeypatch.delenv("CONVERT2RHEL_TEST_FLAG", raising=False)
+    else:
+        monkeypatch.setenv("CONVERT2RHEL_TEST_FLAG", value)
+
+    assert utils.get_env_flag("CONVERT2RHEL_TEST_FLAG") == expected
+
+
+@pytest.mark.parametrize(
+    ("value", "minimum", "number_type", "expected", "warned"),
+    (
+        (None, 0, int, 5, False),
+        ("", 0, int, 5, False),
+        ("3", 0, int, 3, False),
+        ("0", 1, int, 5, True),
+        ("many", 0, int, 5, True),
+        ("0.5", 0, float, 0.5, False),
+        ("-0.5", 0, float, 5, True),
+    ),
+)
+def test_get_env_number(value, minimum, number_type, expected, warned, monkeypatch, caplog):
+    if value is None:
+        monkeypatch.delenv("CONVERT2RHEL_TEST_NUMBER", raising=False)
+    else:
+        monkeypatch.setenv("CONVERT2RHEL_TEST_NUMBER", value)
+
+    assert utils.get_env_number("CONVERT2RHEL_TEST_NUMBER", 5, minimum=minimum, number_type=number_type) == expected
+    assert ("invalid value" in caplog.text) == warned
+
+
 def test_require_root_is_not_root(monkeypatch, capsys):
     monkeypatch.setattr(os, "geteuid", DummyGetUID(1000))
     with pytest.raises(SystemExit):
@@ -901,6 +1124,10 @@ def test_require_root_is_root(monkeypatch):
     assert exit_mock.call_count == 0
 
 
+Nevra = namedtuple("Nevra", ("name", "epoch", "version", "release", "arch"))
+PackageRecord = namedtuple("PackageRecord", ("nevra", "vendor", "files"))
+
+
 class RunAsChildProcessFunctions:
     """Map methods as static to re-use in the run_as_child_process tests."""
 
@@ -932,6 +1159,46 @@ class RunAsChildProcessFunctions:
     def raise_pickling_error_exception():
         raise PicklingError("pickling error")
 
+    @staticmethod
+    def return_large_value():
+        # Way bigger than the pipe buffer
+        return ["x" * 100] * 100000
+
+    @staticmethod
+    def return_large_records():
+        return [
+            PackageRecord(Nevra("pkg%s" % i, "0", "1.0", "1.el8", "x86_64"), "Red Hat", ["/usr/bin/pkg%s" % i])
+            for i in range(200000)
+        ]
+
+    @staticmethod
+    def return_large_string():
+        return "x" * 16 * 1024 * 1024
+
+    @staticmethod
+    def return_large_file_lists():
+        return [("pkg%s" % i, ["/usr/share/pkg%s/file%s" % (i, j) for j in range(1000)]) for i in range(100)]
+
+    @staticmethod
+    def return_unpicklable_list():
+        return [1] * 100000 + [lambda: 1]
+
+    @staticmethod
+    def return_pid():
+        return os.getpid()
+
+    @staticmethod
+    def return_shared_state():
+        return system_info.releasever
+
+    @staticmethod
+    def call_parameter(func):
+        return func()
+
+    @staticmethod
+    def exit_process():
+        os._exit(1)
+
 
 @pytest.mark.parametrize(
     ("func", "args", "kwargs", "expected"),
@@ -970,6 +1237,85 @@ def test_run_as_child_process(func, args, kwargs, expected):
     assert decorated.__wrapped__ == func
 
 
+@pytest.mark.parametrize(
+    ("func",),
+    (
+        (RunAsChildProcessFunctions.return_large_value,),
+        (RunAsChildProcessFunctions.return_large_records,),
+        (RunAsChildProcessFunctions.return_large_string,),
+        (RunAsChildProcessFunctions.return_large_file_lists,),
+    ),
+)
+def test_run_as_child_process_large_result(func):
+    decorated = utils.run_as_child_process(func)
+
+    assert decorated() == func()
+
+
+def test_run_as_child_process_unpicklable_result():
+    decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_unpicklable_list)
+
+    # Python 2 raises PicklingError for the lambda, Python 3 AttributeError
+    with pytest.raises((PicklingError, AttributeError)):
+        decorated()
+
+
+class ConnectionMock:
+    """Records the frames sent over a connection and replays them."""
+
+    def __init__(self):
+        self.frames = []
+
+    def send_bytes(self, data):
+        self.frames.append(bytes(data))
+
+    def recv_bytes(self):
+        return self.frames.pop(0)
+
+
+@pytest.mark.parametrize(
+    ("value",),
+    (
+        (None,),
+        ("string",),
+        ((1, "tuple", [2, (3,)]),),
+        ([PackageRecord(Nevra("pkg", "0", "1.0", "1.el8", "x86_64"), None, ["/usr/bin/pkg"])] * 3,),
+        ({"dict": Nevra("pkg", "0", "1.0", "1.el8", "x86_64")},),
+        (RunAsChildProcessFunctions.return_large_records(),),
+        (RunAsChildProcessFunctions.return_large_string(),),
+    ),
+)
+def test_send_result(value):
+    conn = ConnectionMock()
+
+    utils._send_result(conn, "result", value)
+
+    assert all(len(frame) <= utils._CHILD_PROCESS_CHUNK_SIZE + 1024 for frame in conn.frames)
+    assert utils._receive_result(conn) == ("result", value)
+    assert not conn.frames
+
+
+def test_send_result_aborted():
+    conn = ConnectionMock()
+
+    with pytest.raises((PicklingError, AttributeError)):
+        utils._send_result(conn, "result", RunAsChildProcessFunctions.return_unpicklable_list())
+
+    assert conn.frames[-1] == utils._FRAME_ABORT
+    with pytest.raises(utils._ResultAborted):
+        utils._receive_result(conn)
+
+
+def test_encode_record():
+    value = [PackageRecord(Nevra("pkg%s" % i, "0", "1.0", "1.el8", "x86_64"), "Red Hat", []) for i in range(100)]
+
+    encoded = utils._encode_record(value, {})
+
+    assert type(encoded[0]) is tuple
+    assert utils._decode_record(encoded, {}) == value
+    assert len(pickle.dumps(encoded, pickle.HIGHEST_PROTOCOL)) < len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+
 @pytest.mark.parametrize(
     ("func", "args", "kwargs", "expected_exception"),
     (
@@ -1016,3 +1362,135 @@ def test_run_as_child_process_with_keyboard_interrupt(monkeypatch):
     decorated = utils.run_as_child_process(RunAsChildProcessFunctions.raise_keyboard_interrupt_exception)
     with pytest.raises(KeyboardInterrupt):
         decorated((), {})
+
+
+class TestChildProcessWorker:
+    @pytest.fixture(autouse=True)
+    def child_process_worker(self, monkeypatch):
+        monkeypatch.setenv(utils.CHILD_PROCESS_WORKER_ENVVAR, "1")
+        self.rpmdb_state = "state"
+        monkeypatch.setattr(session, "get_rpmdb_state", lambda: self.rpmdb_state)
+        yield
+        utils.stop_child_process_workers()
+
+    def test_reuses_worker(self):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_pid)
+
+        pid = decorated()
+
+        assert pid != os.getpid()
+        assert pid == utils.get_child_process_worker().pid
+        assert decorated() == pid
+
+    @pytest.mark.parametrize(
+        ("func", "args", "kwargs", "expected"),
+        (
+            (RunAsChildProcessFunctions.return_value, (), {}, 1),
+            (RunAsChildProcessFunctions.without_return, (), {}, None),
+            (
+                RunAsChildProcessFunctions.return_with_both_args_and_kwargs,
+                ("Test from args",),
+                {"kwargs": "Test from kwargs"},
+                "Test from args, Test from kwargs",
+            ),
+            (RunAsChildProcessFunctions.return_large_value, (), {}, ["x" * 100] * 100000),
+            (
+                RunAsChildProcessFunctions.return_large_records,
+                (),
+                {},
+                RunAsChildProcessFunctions.return_large_records(),
+            ),
+            (RunAsChildProcessFunctions.return_large_string, (), {}, RunAsChildProcessFunctions.return_large_string()),
+        ),
+    )
+    def test_run_as_child_process(self, func, args, kwargs, expected):
+        assert utils.run_as_child_process(func)(*args, **kwargs) == expected
+
+    def test_unpicklable_result(self):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_unpicklable_list)
+        pid = utils.run_as_child_process(RunAsChildProcessFunctions.return_pid)()
+
+        with pytest.raises(utils.UnableToSerialize):
+            decorated()
+
+        # The rest of the aborted result is not taken for the next one
+        assert utils.run_as_child_process(RunAsChildProcessFunctions.return_pid)() == pid
+
+    @pytest.mark.parametrize(
+        ("func", "expected_exception"),
+        (
+            (RunAsChildProcessFunctions.raise_bare_system_exit_exception, SystemExit),
+            (RunAsChildProcessFunctions.raise_pickling_error_exception, PicklingError),
+        ),
+    )
+    def test_exceptions(self, func, expected_exception):
+        decorated = utils.run_as_child_process(func)
+        pid = utils.run_as_child_process(RunAsChildProcessFunctions.return_pid)()
+
+        with pytest.raises(expected_exception):
+            decorated()
+
+        # The worker survives exceptions
+        assert utils.get_child_process_worker().pid == pid
+
+    def test_shared_state(self, monkeypatch):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_shared_state)
+        monkeypatch.setattr(system_info, "releasever", "8.5")
+        assert decorated() == "8.5"
+
+        monkeypatch.setattr(system_info, "releasever", "8.6")
+        assert decorated() == "8.6"
+
+    def test_shared_state_sent_when_changed(self, monkeypatch):
+        sent_states = []
+        get_changed_shared_state = utils._get_changed_shared_state
+        monkeypatch.setattr(
+            utils,
+            "_get_changed_shared_state",
+            lambda *args: sent_states.append(get_changed_shared_state(*args)) or sent_states[-1],
+        )
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_shared_state)
+        monkeypatch.setattr(system_info, "releasever", "8.5")
+
+        assert decorated() == "8.5"
+        assert "releasever" in sent_states[-1]["system_info"]
+
+        assert decorated() == "8.5"
+        assert sent_states[-1]["system_info"] == {}
+
+        monkeypatch.setattr(system_info, "releasever", "8.6")
+        assert decorated() == "8.6"
+        # Other attributes might be pickled along with the system_info
+        assert "releasever" in sent_states[-1]["system_info"]
+
+    def test_recycled_after_rpmdb_change(self):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_pid)
+        pid = decorated()
+
+        self.rpmdb_state = "changed"
+
+        assert decorated() != pid
+
+    def test_unpicklable_arguments(self):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.call_parameter)
+
+        # Run in a new child process instead
+        assert decorated(lambda: 5) == 5
+        assert utils.get_child_process_worker().pid is None
+
+    def test_keyboard_interrupt(self, monkeypatch):
+        monkeypatch.setattr(utils.ChildProcessWorker, "_receive", mock.Mock(side_effect=KeyboardInterrupt))
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.return_value)
+
+        with pytest.raises(KeyboardInterrupt):
+            decorated()
+
+        assert utils.get_child_process_worker().pid is None
+
+    def test_worker_exited(self):
+        decorated = utils.run_as_child_process(RunAsChildProcessFunctions.exit_process)
+
+        with pytest.raises(utils.ChildProcessWorkerError, match="exited with code 1"):
+            decorated()
+
+        assert utils.run_as_child_process(RunAsChildProcessFunctions.return_value)() == 1
@@ -17,9 +17,12 @@
 
 __metaclass__ = type
 
+import collections
 import errno
 import fcntl
 import getpass
+import glob
+import importlib
 import inspect
 import json
 import logging
@@ -32,6 +35,7 @@ import subprocess
 import sys
 import tempfile
 import termios
+import time
 import traceback
 
 from functools import wraps
@@ -41,7 +45,17 @@ import rpm
 
 from six import moves
 
-from convert2rhel import i18n
+from convert2rhel import i18n, logger, openpgp, timings
+
+
+try:
+    import cPickle as pickle
+
+    from cStringIO import StringIO as BytesIO
+except ImportError:
+    import pickle
+
+    from io import BytesIO
 
 
 loggerinst = logging.getLogger(__name__)
@@ -74,6 +88,43 @@ TMP_DIR = "/var/lib/convert2rhel/"
 BACKUP_DIR = os.path.join(TMP_DIR, "backup")
 
 
+# How often (in seconds) to check whether a child process spawned by
+# run_as_child_process() is still alive while waiting for its result
+_CHILD_PROCESS_POLL_INTERVAL = 0.1
+
+# Size of the chunks the results of the run_as_child_process() functions are
+# sent to the main process in. Neither of the processes needs a buffer of the
+# size of the whole result.
+_CHILD_PROCESS_CHUNK_SIZE = 256 * 1024
+
+# Frames of the result channel, see _send_result(). Every frame is one message
+# on the pipe, starting with its type.
+_FRAME_HEADER = b"H"
+_FRAME_BATCH = b"B"
+_FRAME_DATA = b"D"
+_FRAME_END = b"E"
+_FRAME_ABORT = b"A"
+
+# Environment variable to opt in to running the run_as_child_process()
+# functions in a long-lived worker process instead of a new child process per
+# call, see ChildProcessWorker.
+CHILD_PROCESS_WORKER_ENVVAR = "CONVERT2RHEL_CHILD_PROCESS_WORKER"
+
+# The functions decorated with run_as_child_process(), for the worker process
+# to look them up by the key the parent sends.
+_CHILD_PROCESS_FUNCTIONS = {}
+
+# The running worker processes, one per package manager type
+_child_process_workers = {}  # pylint: disable=C0103
+
+# The rpm keyids of the gpg key files by the path, together with the mtime of the file
+_keyid_cache = {}  # pylint: disable=C0103
+
+# The functions dropping what the modules keep in memory for the rest of the
+# run, see register_cache()
+_cache_resets = []  # pylint: disable=C0103
+
+
 class UnableToSerialize(Exception):
     """
     Internal class that is used to declare that a object was not able to be
@@ -121,11 +172,6 @@ class Process(multiprocessing.Process):
         # is to catch `SystemExit` *and* any `Exception` that shows up as we do
         # a lot of logger.critical() and they do raise `SystemExit`.
         except (Exception, SystemExit) as e:
-            try:
-                import cPickle as pickle
-            except ImportError:
-                import pickle
-
             try:
                 self._cconn.send(e)
             except pickle.PicklingError:
@@ -138,6 +184,475 @@ class Process(multiprocessing.Process):
         return self._exception
 
 
+class ChildProcessWorkerError(Exception):
+    """Raised when the worker process exits without returning the result of a call."""
+
+
+class ChildProcessWorker:
+    """A long-lived child process running the run_as_child_process() functions.
+
+    Just like the child processes run_as_child_process() spawns per call, the
+    worker keeps the signal handlers the rpm library installs out of the main
+    process. Being started once, it keeps the yum/dnf state it loaded, e.g.
+    the base objects of the package manager session, warm for the following
+    calls.
+
+    The function and its arguments are pickled and sent to the worker with
+    every call, so they have to be picklable. Functions are sent by their
+    module and name, the worker looks them up on its side. The shared state of
+    the main process (:data:`convert2rhel.systeminfo.system_info` and
+    :data:`convert2rhel.toolopts.tool_opts`) is sent along only as far as it
+    changed since the previous call.
+
+    The worker is recycled, i.e. stopped and started again on the next call,
+    whenever the rpmdb changes, either by the call itself or by anything else
+    between two calls, so that no state derived from the installed packages
+    outlives them.
+    """
+
+    def __init__(self):
+        self._process = None
+        self._conn = None
+        self._rpmdb_state = None
+        # The shared state the worker process got so far
+        self._shared_state = {}
+
+    @property
+    def pid(self):
+        """The pid of the worker process or None if it's not running."""
+        return self._process.pid if self._process else None
+
+    def call(self, func, args, kwargs):
+        """Run a function in the worker process.
+
+        :param func: The function decorated with :func:`run_as_child_process`.
+        :type func: Callable
+        :param args: Arguments tied to the function
+        :type args: tuple
+        :param kwargs: Named arguments tied to the function
+        :type kwargs: dict
+        :raises pickle.PicklingError: When the function or its arguments can't be sent to the worker.
+        :raises KeyboardInterrupt: When a SIGINT is caught while waiting for the result. The worker is terminated.
+        :raises ChildProcessWorkerError: When the worker exits during the call.
+        :raises Exception: Any exception raised by the function.
+        :return: The value returned by the function.
+        :rtype: Any
+        """
+        # Imported here to avoid a circular import
+        from convert2rhel.pkgmanager.session import get_rpmdb_state
+
+        try:
+            call = pickle.dumps((_get_function_key(func), args, kwargs), pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            raise pickle.PicklingError("Unable to send %s to the worker process: %s" % (func.__name__, str(e)))
+
+        rpmdb_state = get_rpmdb_state()
+        if self._process and (rpmdb_state != self._rpmdb_state or not self._process.is_alive()):
+            loggerinst.debug("Recycling the child process worker with pid %s.", self._process.pid)
+            self.stop()
+
+        if not self._process:
+            self._start()
+
+        shared_state = _get_shared_state()
+        request = pickle.dumps(
+            (call, _get_changed_shared_state(self._shared_state, shared_state)), pickle.HIGHEST_PROTOCOL
+        )
+
+        try:
+            self._conn.send_bytes(request)
+            self._shared_state = shared_state
+            status, value = self._receive()
+        except KeyboardInterrupt:
+            loggerinst.warning("Terminating child process...")
+            self.stop()
+            raise
+
+        self._rpmdb_state = get_rpmdb_state()
+        if self._rpmdb_state != rpmdb_state:
+            # Nothing loaded before the rpmdb-mutating operation is valid
+            # anymore
+            self.stop()
+
+        if status == "exception":
+            raise value
+
+        return value
+
+    def stop(self):
+        """Stop the worker process."""
+        if not self._process:
+            return
+
+        self._conn.close()
+        if self._process.is_alive():
+            self._process.terminate()
+        self._process.join()
+        loggerinst.debug("Child process worker with pid %s exited.", self._process.pid)
+        self._process = None
+        self._conn = None
+        self._shared_state = {}
+
+    def _start(self):
+        self._conn, child_conn = multiprocessing.Pipe()
+        # Being a daemon, the worker is terminated together with the main
+        # process and the functions it runs know they run in a child process.
+        self._process = multiprocessing.Process(target=_serve_child_process_worker, args=(child_conn, self._conn))
+        self._process.daemon = True
+        with logger.prepared_for_fork():
+            self._process.start()
+        child_conn.close()
+        loggerinst.debug("Started a child process worker with pid %s.", self._process.pid)
+
+    def _receive(self):
+        """Wait for the result of a call.
+
+        :return: Tuple of the status, "result" or "exception", and the value.
+        :rtype: tuple[str, Any]
+        """
+        while True:
+            if self._conn.poll(_CHILD_PROCESS_POLL_INTERVAL):
+                try:
+                    return _receive_result(self._conn)
+                except _ResultAborted:
+                    # The worker sends the reason right after
+                    continue
+                except EOFError:
+                    break
+            if not self._process.is_alive():
+                break
+
+        self._process.join()
+        exitcode = self._process.exitcode
+        self.stop()
+        raise ChildProcessWorkerError("The child process worker exited with code %s." % exitcode)
+
+
+def _serve_child_process_worker(conn, parent_conn):
+    """Run the requested functions until the main process closes the connection.
+
+    :param conn: The worker end of the pipe to the main process.
+    :type conn: multiprocessing.connection.Connection
+    :param parent_conn: The main process end of the pipe, inherited with the fork. Closed so that the worker sees
+        the end of the connection once the main process is gone.
+    :type parent_conn: multiprocessing.connection.Connection
+    """
+    parent_conn.close()
+    timings.trace.start_child_process()
+
+    while True:
+        try:
+            request = conn.recv_bytes()
+        except (EOFError, IOError):
+            return
+        except KeyboardInterrupt:
+            # The Ctrl + C is handled by the main process. A worker
+            # interrupted while idle is started again on the next call.
+            return
+
+        # Here, `SystemExit` inherits from `BaseException`, see Process.run().
+        try:
+            call, shared_state = pickle.loads(request)
+            _restore_shared_state(shared_state)
+            key, args, kwargs = pickle.loads(call)
+            with timings.trace.span(key[1], "child_process"):
+                reply = ("result", _get_child_process_function(key)(*args, **kwargs))
+        except (Exception, SystemExit) as e:
+            reply = ("exception", e)
+        except KeyboardInterrupt:
+            # The main process terminates the worker once it gets the
+            # KeyboardInterrupt too
+            return
+        finally:
+            timings.trace.flush_child_process()
+            logger.flush()
+
+        try:
+            _send_result(conn, *reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            _send_result(
+                conn, "exception", UnableToSerialize("Child process returned %s: %s" % (type(reply[1]), str(e)))
+            )
+
+
+class _ResultAborted(Exception):
+    """Raised when the sending process failed to serialize the rest of a result."""
+
+
+def _send_result(conn, status, value):
+    """Send the result of a function to the main process in bounded chunks.
+
+    The result starts with a header frame. The items of a list are pickled in
+    batches of about :data:`_CHILD_PROCESS_CHUNK_SIZE`, each sent as a batch
+    frame and followed by an end frame, so the receiving side unpickles them
+    one batch at a time. Any other value is pickled at once and sent in data
+    frames of at most :data:`_CHILD_PROCESS_CHUNK_SIZE`.
+
+    Namedtuples, e.g. the package records, are sent as plain tuples, see
+    :func:`_encode_record`.
+
+    :param conn: The connection to send the result over.
+    :type conn: multiprocessing.connection.Connection
+    :param status: "result" or "exception".
+    :type status: str
+    :param value: The value returned or the exception raised by the function.
+    :type value: Any
+    :raises pickle.PicklingError: When the value can't be pickled. An abort frame is sent so that the receiving side
+        drops what it got so far.
+    """
+    try:
+        if type(value) is list:
+            conn.send_bytes(_FRAME_HEADER + pickle.dumps(("list", status, None), pickle.HIGHEST_PROTOCOL))
+            tags = {}
+            batch = None
+            for item in value:
+                if batch is None:
+                    batch = BytesIO()
+                    pickler = pickle.Pickler(batch, pickle.HIGHEST_PROTOCOL)
+                pickler.dump(_encode_record(item, tags))
+                if batch.tell() >= _CHILD_PROCESS_CHUNK_SIZE:
+                    conn.send_bytes(_FRAME_BATCH + batch.getvalue())
+                    batch = None
+            if batch is not None:
+                conn.send_bytes(_FRAME_BATCH + batch.getvalue())
+            conn.send_bytes(_FRAME_END)
+            return
+
+        data = pickle.dumps(_encode_record(value, {}), pickle.HIGHEST_PROTOCOL)
+        conn.send_bytes(_FRAME_HEADER + pickle.dumps(("value", status, len(data)), pickle.HIGHEST_PROTOCOL))
+        for offset in range(0, len(data), _CHILD_PROCESS_CHUNK_SIZE):
+            conn.send_bytes(_FRAME_DATA + data[offset : offset + _CHILD_PROCESS_CHUNK_SIZE])
+    except (pickle.PicklingError, TypeError, AttributeError):
+        conn.send_bytes(_FRAME_ABORT)
+        raise
+
+
+def _receive_result(conn):
+    """Receive a result sent by :func:`_send_result`.
+
+    :param conn: The connection to receive the result from.
+    :type conn: multiprocessing.connection.Connection
+    :raises _ResultAborted: When the sending side failed to serialize the result.
+    :raises EOFError: When the sending side closed the connection before sending the whole result.
+    :return: Tuple of the status, "result" or "exception", and the value.
+    :rtype: tuple[str, Any]
+    """
+    frame = conn.recv_bytes()
+    if frame[:1] != _FRAME_HEADER:
+        raise _ResultAborted()
+    kind, status, size = pickle.loads(frame[1:])
+
+    classes = {}
+    if kind == "list":
+        result = []
+        while True:
+            frame = conn.recv_bytes()
+            frame_type = frame[:1]
+            if frame_type == _FRAME_END:
+                return status, result
+            if frame_type != _FRAME_BATCH:
+                raise _ResultAborted()
+
+            batch = BytesIO(frame)
+            batch.seek(1)
+            unpickler = pickle.Unpickler(batch)
+            while batch.tell() < len(frame):
+                result.append(_decode_record(unpickler.load(), classes))
+
+    data = bytearray(size)
+    offset = 0
+    while offset < size:
+        frame = conn.recv_bytes()
+        if frame[:1] != _FRAME_DATA:
+            raise _ResultAborted()
+        data[offset : offset + len(frame) - 1] = frame[1:]
+        offset += len(frame) - 1
+
+    # Python 2 can unpickle only strings
+    return status, _decode_record(pickle.loads(data if sys.version_info[0] >= 3 else bytes(data)), classes)
+
+
+def _encode_record(value, tags):
+    """Turn the namedtuples in a value into compact plain tuples.
+
+    Lists and tuples are walked recursively. Every tuple is sent with a tag
+    as its first item:
+
+    - 0 for a plain tuple
+    - (module, name) of the class for a namedtuple, the same object for every
+      namedtuple of a class so that pickle stores it once per batch
+    - -1 for any other tuple subclass, sent as it is
+
+    :param tags: The tags of the namedtuple classes encoded so far.
+    :type tags: dict[type, tuple[str, str]]
+    """
+    value_type = type(value)
+    if value_type is list:
+        return [_encode_record(item, tags) if isinstance(item, (list, tuple)) else item for item in value]
+
+    if not isinstance(value, tuple):
+        return value
+
+    if value_type is tuple:
+        tag = 0
+    elif hasattr(value_type, "_fields"):
+        tag = tags.get(value_type)
+        if tag is None:
+            tag = tags[value_type] = (value_type.__module__, value_type.__name__)
+    else:
+        return (-1, value)
+
+    return (tag,) + tuple(_encode_record(item, tags) if isinstance(item, (list, tuple)) else item for item in value)
+
+
+def _decode_record(value, classes):
+    """Turn the plain tuples from :func:`_encode_record` back into the original values.
+
+    :param classes: The namedtuple classes looked up so far, by their tag.
+    :type classes: dict[tuple[str, str], type]
+    """
+    value_type = type(value)
+    if value_type is list:
+        return [_decode_record(item, classes) if isinstance(item, (list, tuple)) else item for item in value]
+
+    if value_type is not tuple:
+        return value
+
+    tag = value[0]
+    if tag == -1:
+        return value[1]
+
+    items = tuple(_decode_record(item, classes) if isinstance(item, (list, tuple)) else item for item in value[1:])
+    if tag == 0:
+        return items
+
+    cls = classes.get(tag)
+    if cls is None:
+        cls = classes[tag] = getattr(importlib.import_module(tag[0]), tag[1])
+    return cls(*items)
+
+
+def _get_function_key(func):
+    """Get the key the worker process looks up a function by.
+
+    :rtype: tuple[str, str]
+    """
+    return func.__module__, getattr(func, "__qualname__", func.__name__)
+
+
+def _get_child_process_function(key):
+    """Look up the function to run in the worker process.
+
+    The functions decorated at import time are registered already. Other ones
+    are looked up by their name in their module and unwrapped.
+
+    :param key: The key from :func:`_get_function_key`.
+    :type key: tuple[str, str]
+    :rtype: Callable
+    """
+    if key not in _CHILD_PROCESS_FUNCTIONS:
+        module_name, name = key
+        # Importing the module registers the functions it decorates
+        func = importlib.import_module(module_name)
+        if key not in _CHILD_PROCESS_FUNCTIONS:
+            for attr in name.split("."):
+                func = getattr(func, attr)
+            _CHILD_PROCESS_FUNCTIONS[key] = getattr(func, "__wrapped__", func)
+
+    return _CHILD_PROCESS_FUNCTIONS[key]
+
+
+def _get_shared_objects():
+    """Get the global objects of the main process the functions run in the worker process may read.
+
+    :rtype: dict[str, object]
+    """
+    # Imported here to avoid a circular import
+    from convert2rhel.systeminfo import system_info
+    from convert2rhel.toolopts import tool_opts
+
+    return {"system_info": system_info, "tool_opts": tool_opts}
+
+
+def _get_shared_state():
+    """Get the current state of the shared objects of the main process.
+
+    Attributes that can't be pickled, e.g. loggers on Python 2, are left out.
+
+    :return: The pickled attributes of every shared object.
+    :rtype: dict[str, dict[str, bytes]]
+    """
+    state = {}
+    for name, obj in _get_shared_objects().items():
+        state[name] = {}
+        for attr, value in vars(obj).items():
+            try:
+                state[name][attr] = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+            except (pickle.PicklingError, TypeError, AttributeError):
+                continue
+    return state
+
+
+def _get_changed_shared_state(previous_state, state):
+    """Get the attributes of the shared objects that changed since the previous state.
+
+    :param previous_state: The state from :func:`_get_shared_state` the worker process got last time.
+    :type previous_state: dict[str, dict[str, bytes]]
+    :param state: The current state from :func:`_get_shared_state`.
+    :type state: dict[str, dict[str, bytes]]
+    :return: The changed pickled attributes of every shared object.
+    :rtype: dict[str, dict[str, bytes]]
+    """
+    changed_state = {}
+    for name, attrs in state.items():
+        previous_attrs = previous_state.get(name, {})
+        changed_state[name] = dict((attr, value) for attr, value in attrs.items() if previous_attrs.get(attr) != value)
+    return changed_state
+
+
+def _restore_shared_state(state):
+    """Apply the state of the shared objects of the main process in the worker process.
+
+    :param state: The state from :func:`_get_changed_shared_state`.
+    :type state: dict[str, dict[str, bytes]]
+    """
+    objects = _get_shared_objects()
+    for name, attrs in state.items():
+        for attr, value in attrs.items():
+            setattr(objects[name], attr, pickle.loads(value))
+
+
+def _use_child_process_worker():
+    """Whether the run_as_child_process() functions run in the worker process.
+
+    :rtype: bool
+    """
+    if multiprocessing.current_process().daemon:
+        # Already running in a child process
+        return False
+    return get_env_flag(CHILD_PROCESS_WORKER_ENVVAR)
+
+
+def get_child_process_worker():
+    """Get the worker process of the package manager in use.
+
+    :rtype: ChildProcessWorker
+    """
+    # Imported here to avoid a circular import
+    from convert2rhel import pkgmanager
+
+    if pkgmanager.TYPE not in _child_process_workers:
+        _child_process_workers[pkgmanager.TYPE] = ChildProcessWorker()
+    return _child_process_workers[pkgmanager.TYPE]
+
+
+def stop_child_process_workers():
+    """Stop all the worker processes."""
+    for worker in _child_process_workers.values():
+        worker.stop()
+    _child_process_workers.clear()
+
+
 def run_as_child_process(func):
     """Decorator to execute functions as child process.
 
@@ -163,6 +678,12 @@ def run_as_child_process(func):
         handling that is initiated by python itself (or, whatever signal is
         registered when the conversion starts as well).
 
+    .. note::
+        When the :data:`CHILD_PROCESS_WORKER_ENVVAR` environment variable is
+        set, the function runs in a long-lived worker process instead, see
+        :class:`ChildProcessWorker`. If the function or its arguments can't be
+        pickled, a new child process is spawned for the call as usual.
+
     .. important::
         It is important to know that if a function is using this decorator,
         then it won't be possible for that function to spawn new child
@@ -192,10 +713,9 @@ def run_as_child_process(func):
     :rtype: Callable
     """
 
-    @wraps(func)
-    def wrapper(*args, **kwargs):
+    def run_in_child_process(*args, **kwargs):
         """
-        Wrapper function to execute and control the function attached to the
+        Function to execute and control the function attached to the
         decorator.
 
         :arg args: Arguments tied to the function
@@ -209,15 +729,15 @@ def run_as_child_process(func):
         :raises Exception: Raise any general exception that can occur during
             the execution of the child process.
 
-        :return: If the Queue is not empty, return anything in it, otherwise,
-            return `None`.
+        :return: The value returned by the function or `None` if the child
+            process exited before sending it.
         :rtype: Any
         """
 
         def inner_wrapper(*args, **kwargs):
             """
             Inner function wrapper to execute decorated functions without the
-            need to modify them to have a queue parameter.
+            need to modify them to have a connection parameter.
 
             :param args: Arguments tied to the function
             :type args: tuple
@@ -225,12 +745,25 @@ def run_as_child_process(func):
             :type kwargs: dict
             """
             func = kwargs.pop("func")
-            queue = kwargs.pop("queue")
-            result = func(*args, **kwargs)
-            queue.put(result)
+            conn = kwargs.pop("conn")
+            timings.trace.start_child_process()
+            try:
+                with timings.trace.span(func.__name__, "child_process"):
+                    result = func(*args, **kwargs)
+            finally:
+                timings.trace.flush_child_process()
+                # The child exits without running the atexit handlers
+                logger.flush()
+            _send_result(conn, "result", result)
+
+        if _use_child_process_worker():
+            try:
+                return get_child_process_worker().call(func, args, kwargs)
+            except pickle.PicklingError as e:
+                loggerinst.debug("%s Running it in a new child process." % str(e))
 
-        queue = multiprocessing.Queue()
-        kwargs.update({"func": func, "queue": queue})
+        result_conn, child_conn = multiprocessing.Pipe(duplex=False)
+        kwargs.update({"func": func, "conn": child_conn})
         process = Process(target=inner_wrapper, args=args, kwargs=kwargs)
 
         # Running the process as a daemon prevents it from hanging if a SIGINT
@@ -238,7 +771,33 @@ def run_as_child_process(func):
         # https://docs.python.org/2.7/library/multiprocessing.html#multiprocessing.Process.daemon
         process.daemon = True
         try:
-            process.start()
+            with logger.prepared_for_fork():
+                process.start()
+            # Only the child writes to the pipe. Closing our copy of its end
+            # lets us know when the child exits in the middle of a result.
+            child_conn.close()
+
+            # The result has to be read while the child sends it, in chunks,
+            # before joining the child process. The child blocks as soon as
+            # the result doesn't fit into the pipe buffer (e.g. information
+            # about all the installed packages).
+            result = None
+            while True:
+                # The child might have sent the result right before exiting
+                exited = process.exception or not process.is_alive()
+                if result_conn.poll(0 if exited else _CHILD_PROCESS_POLL_INTERVAL):
+                    try:
+                        _, result = _receive_result(result_conn)
+                    except (_ResultAborted, EOFError):
+                        # The child failed to send the result, the reason is
+                        # in process.exception
+                        pass
+                    break
+
+                if exited:
+                    break
+
+            result_conn.close()
             process.join()
 
             if process.exception:
@@ -249,13 +808,7 @@ def run_as_child_process(func):
                 # terminate it.
                 process.terminate()
 
-            if not queue.empty():
-                # We don't need to block the I/O as we are mostly done with
-                # the child process and no exception was raised, so we can
-                # instantly retrieve the item that was in the queue.
-                return queue.get(block=False)
-
-            return None
+            return result
         except KeyboardInterrupt:
             # We have to check if the process if alive, and if it is (most
             # probably it will be), then we can call for termination. On
@@ -274,13 +827,89 @@ def run_as_child_process(func):
             # being executed, let's just re-raise it to the stack and move on.
             raise
 
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        """
+        Wrapper function recording the call in the timeline, see
+        run_in_child_process().
+        """
+        # The events of the function itself are in the timeline of the child
+        # process
+        with timings.trace.span("Child process: %s" % func.__name__, "child_process"):
+            return run_in_child_process(*args, **kwargs)
+
     # Python2 and Python3 < 3.2 compatibility
     if not hasattr(wrapper, "__wrapped__"):
         wrapper.__wrapped__ = func
 
+    _CHILD_PROCESS_FUNCTIONS[_get_function_key(func)] = func
+
     return wrapper
 
 
+def register_cache(reset):
+    """Register a function dropping what a module keeps in memory for the rest of the run.
+
+    :param reset: Function to call, without arguments, from :func:`reset_caches`.
+    :type reset: Callable[[], None]
+    """
+    _cache_resets.append(reset)
+
+
+def reset_caches():
+    """Drop everything the modules keep in memory for the rest of the run.
+
+    The caches of the installed packages, the repoquery results, the loaded
+    yum/dnf base objects and the recorded timings, among others, see
+    :func:`register_cache`.
+    """
+    for reset in _cache_resets:
+        reset()
+
+
+def get_env_flag(name):
+    """Whether an opt-in environment variable is set, i.e. to anything but "0".
+
+    :param name: Name of the environment variable, e.g. "CONVERT2RHEL_ASYNC_LOGGING".
+    :type name: str
+    :rtype: bool
+    """
+    return os.environ.get(name, "0") not in ("", "0")
+
+
+def get_env_number(name, default, minimum=0, number_type=int):
+    """Get the number an environment variable is set to.
+
+    The default is used when the variable is not set or is empty. An invalid
+    value is reported with a warning and the default is used instead.
+
+    :param name: Name of the environment variable, e.g. "CONVERT2RHEL_PARALLEL_ACTIONS".
+    :type name: str
+    :param default: The number to use when the variable doesn't hold a valid one.
+    :type default: int | float | None
+    :param minimum: The lowest valid number.
+    :type minimum: int | float
+    :param number_type: The type of the number, int or float.
+    :type number_type: type
+    :rtype: int | float | None
+    """
+    value = os.environ.get(name)
+    if not value:
+        return default
+
+    try:
+        number = number_type(value)
+        if number < minimum:
+            raise ValueError(value)
+        return number
+    except ValueError:
+        loggerinst.warning(
+            "Ignoring the invalid value '%s' of the %s environment variable, it has to be a number of at least %s."
+            % (value, name, minimum)
+        )
+        return default
+
+
 def get_executable_name():
     """Get name of the executable file passed to the python interpreter."""
 
@@ -342,6 +971,110 @@ def restart_system():
         loggerinst.warning("In order to boot the RHEL kernel, restart of the system is needed.")
 
 
+class StreamedSubprocess(object):
+    """Run a command and stream its output line by line.
+
+    Iterating over the instance yields the decoded lines of the combined
+    stdout and stderr of the command as soon as they are printed, so the
+    output never has to be held in memory as a whole. Optionally, every
+    line can be passed to a callback, written to a file and kept in a
+    bounded buffer with the last lines of the output which is handy for
+    error reporting.
+
+    The return code of the command is available in :attr:`returncode` once
+    the output has been consumed.
+
+    Example::
+
+        process = StreamedSubprocess(["rpm", "-Va"], print_output=False, output_file="/var/log/rpm_va.log")
+        returncode = process.wait()
+    """
+
+    def __init__(self, cmd, print_cmd=True, print_output=True, line_callback=None, output_file=None, tail_size=0):
+        """
+        :param cmd: The command to execute, including the options as a list, e.g. ["ls", "-al"]
+        :type cmd: list
+        :param print_cmd: Log the command (to both logfile and stdout)
+        :type print_cmd: bool
+        :param print_output: Log the output of the executed command (to both logfile and stdout)
+        :type print_output: bool
+        :param line_callback: Function called with every line of the output.
+        :type line_callback: Callable[[str], None] | None
+        :param output_file: Path to a file the output is written to.
+        :type output_file: str | None
+        :param tail_size: Number of lines from the end of the output to keep in :attr:`tail`.
+        :type tail_size: int
+        """
+        # This check is here because we passed in strings in the past and changed to a list
+        # for security hardening.  Remove this once everyone is comfortable with using a list
+        # instead.
+        if isinstance(cmd, str):
+            raise TypeError("cmd should be a list, not a str")
+
+        self.cmd = cmd
+        self.print_output = print_output
+        self.line_callback = line_callback
+        self.output_file = output_file
+        self.tail = collections.deque(maxlen=tail_size)
+        self.returncode = None
+        self._print_cmd = print_cmd
+        self._output_size = 0
+
+        if print_cmd:
+            loggerinst.debug("Calling command '%s'" % " ".join(cmd))
+
+        self._start_time = time.time()
+
+        self._process = subprocess.Popen(
+            cmd,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            bufsize=1,
+        )
+
+    def __iter__(self):
+        if self.returncode is not None:
+            return
+
+        output_file = open(self.output_file, "w") if self.output_file else None
+        try:
+            for line in iter(self._process.stdout.readline, b""):
+                line = line.decode("utf8")
+                self._output_size += len(line)
+                if output_file:
+                    output_file.write(line)
+                if self.tail.maxlen:
+                    self.tail.append(line)
+                if self.line_callback:
+                    self.line_callback(line)
+                if self.print_output:
+                    loggerinst.info(line.rstrip("\n"))
+
+                yield line
+        finally:
+            if output_file:
+                output_file.close()
+
+        # Call communicate() to wait for the process to terminate so that we can
+        # get the return code.
+        self._process.communicate()
+        self.returncode = self._process.returncode
+        timings.timings.record_command(
+            self.cmd, time.time() - self._start_time, self.returncode, self._output_size, show_cmd=self._print_cmd
+        )
+
+    def wait(self):
+        """Consume the rest of the output and wait for the command to finish.
+
+        :return: The return code of the command.
+        :rtype: int
+        """
+        for _ in self:
+            pass
+
+        return self.returncode
+
+
 def run_subprocess(cmd, print_cmd=True, print_output=True):
     """Call the passed command and optionally log the called command (print_cmd=True) and its
     output (print_output=True). Switching off printing the command can be useful in case it contains
@@ -349,34 +1082,16 @@ def run_subprocess(cmd, print_cmd=True, print_output=True):
 
     The cmd is specified as a list starting with the command and followed by a list of arguments.
     Example: ["dnf", "repoquery", "kernel"]
-    """
-    # This check is here because we passed in strings in the past and changed to a list
-    # for security hardening.  Remove this once everyone is comfortable with using a list
-    # instead.
-    if isinstance(cmd, str):
-        raise TypeError("cmd should be a list, not a str")
 
-    if print_cmd:
-        loggerinst.debug("Calling command '%s'" % " ".join(cmd))
-
-    process = subprocess.Popen(
-        cmd,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        bufsize=1,
-    )
-    output = ""
-    for line in iter(process.stdout.readline, b""):
-        line = line.decode("utf8")
-        output += line
-        if print_output:
-            loggerinst.info(line.rstrip("\n"))
+    For commands with a large output, consider using :class:`StreamedSubprocess` directly to
+    process the output line by line instead of keeping all of it in memory.
+    """
+    process = StreamedSubprocess(cmd, print_cmd=print_cmd, print_output=print_output)
 
-    # Call communicate() to wait for the process to terminate so that we can
-    # get the return code.
-    process.communicate()
+    # Joining a list is linear while concatenating strings in a loop may be quadratic.
+    output = [line for line in process]
 
-    return output, process.returncode
+    return "".join(output), process.returncode
 
 
 def run_cmd_in_pty(cmd, expect_script=(), print_cmd=True, print_output=True, columns=150):
@@ -417,6 +1132,7 @@ def run_cmd_in_pty(cmd, expect_script=(), print_cmd=True, print_output=True, col
     if print_cmd:
         loggerinst.debug("Calling command '%s'" % " ".join(cmd))
 
+    start_time = time.time()
     process = PexpectSpawnWithDimensions(
         cmd[0],
         cmd[1:],
@@ -447,6 +1163,7 @@ def run_cmd_in_pty(cmd, expect_script=(), print_cmd=True, print_output=True, col
     return_code = process.exitstatus
 
     output = process.before.decode()
+    timings.timings.record_command(cmd, time.time() - start_time, return_code, len(output), show_cmd=print_cmd)
     if print_output:
         loggerinst.info(output.rstrip("\n"))
 
@@ -553,6 +1270,8 @@ def prompt_user(question, password=False):
     """
     color_question = Color.BOLD + question + Color.END
 
+    # The messages leading up to the question have to be shown before it
+    logger.flush()
     if password:
         response = getpass.getpass(color_question)
     else:
@@ -612,20 +1331,200 @@ def download_pkgs(
     custom_releasever=None,
     varsdir=None,
 ):
-    """A wrapper for the download_pkg function allowing to download multiple packages."""
-    return [
-        download_pkg(
-            pkg,
-            dest,
-            reposdir,
-            enable_repos,
-            disable_repos,
-            set_releasever,
-            custom_releasever,
-            varsdir,
+    """Download multiple rpms using yumdownloader and return their filepaths.
+
+    All the packages are downloaded with a single yumdownloader call so that the repository metadata is loaded just
+    once. The rpms written by the call are matched to the packages by their file name for the NEVRAs and by the name
+    and arch in their header for the bare names, e.g. "subscription-manager". The packages that call did not download, e.g. because one of the packages is not available and dnf then
+    refuses to download any of them, are downloaded one by one with :func:`download_pkg` which also takes care of
+    reporting the failures. So are the packages whose rpm was already in dest before the call, e.g. left there by an
+    earlier run, and was not written by it.
+
+    The parameters are the same as for :func:`download_pkg`.
+
+    :param pkgs: The NEVRAs or the names, optionally with the arch, of the packages to download.
+    :type pkgs: list[str]
+    :return: The filepaths of the downloaded packages, in the same order as pkgs. None for the packages that couldn't
+        be downloaded.
+    :rtype: list[str | None]
+    """
+    pkgs = list(pkgs)
+    downloaded = set()
+    if len(pkgs) > 1:
+        downloaded = _download_pkgs_at_once(
+            pkgs, dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir
         )
-        for pkg in pkgs
-    ]
+
+    downloaded = _match_downloaded_rpms(pkgs, downloaded)
+    paths = []
+    for pkg in pkgs:
+        path = downloaded.get(pkg)
+        if path:
+            loggerinst.info("Successfully downloaded the %s package." % pkg)
+            loggerinst.debug("Path of the downloaded package: %s" % path)
+        else:
+            path = download_pkg(
+                pkg,
+                dest,
+                reposdir,
+                enable_repos,
+                disable_repos,
+                set_releasever,
+                custom_releasever,
+                varsdir,
+            )
+        paths.append(path)
+
+    return paths
+
+
+def _download_pkgs_at_once(
+    pkgs, dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir
+):
+    """Download the packages with a single yumdownloader call.
+
+    See :func:`download_pkg` for the description of the parameters.
+
+    :return: The paths of the rpms the call wrote to dest. The rpms which were there before the call and were left
+        untouched, e.g. by an earlier run, are not included.
+    :rtype: set[str]
+    """
+    loggerinst.debug("Downloading the %s packages." % ", ".join(pkgs))
+    before = _get_rpm_files_state(dest)
+
+    cmd = _get_yumdownloader_cmd(
+        dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir
+    )
+    cmd.extend(pkgs)
+    output, ret_code = run_cmd_in_pty(cmd, print_output=False)
+    if ret_code != 0:
+        loggerinst.debug("Output from the yumdownloader call:\n%s" % output)
+        loggerinst.info("Couldn't download all the packages at once. Downloading them one by one.")
+
+    after = _get_rpm_files_state(dest)
+    return set(path for path, state in after.items() if before.get(path) != state)
+
+
+def _match_downloaded_rpms(pkgs, paths):
+    """Match the downloaded rpms to the packages they were downloaded for.
+
+    A NEVRA matches the rpm of the same file name. A name, or a name.arch,
+    matches the single rpm of that name, and arch, in its header.
+
+    :param pkgs: The NEVRAs or the names of the packages.
+    :type pkgs: list[str]
+    :param paths: The paths of the downloaded rpms.
+    :type paths: set[str]
+    :return: The paths of the rpms by the packages. The packages without a matching rpm are left out.
+    :rtype: dict[str, str]
+    """
+    by_filename = dict((os.path.basename(path), path) for path in paths)
+    matched = {}
+    unmatched = []
+    for pkg in pkgs:
+        path = by_filename.get(_get_rpm_filename(pkg))
+        if path:
+            matched[pkg] = path
+        else:
+            unmatched.append(pkg)
+
+    if not unmatched:
+        return matched
+
+    # Only the headers of the rpms not matched by the file name are read
+    by_name = {}
+    for path in paths - set(matched.values()):
+        try:
+            hdr = get_rpm_header(path)
+        except (rpm.error, IOError, OSError) as e:
+            loggerinst.debug("Unable to read the header of %s: %s" % (path, str(e)))
+            continue
+        name, arch = [_decode_header_value(hdr[tag]) for tag in (rpm.RPMTAG_NAME, rpm.RPMTAG_ARCH)]
+        by_name.setdefault(name, []).append(path)
+        by_name.setdefault("%s.%s" % (name, arch), []).append(path)
+
+    for pkg in unmatched:
+        candidates = by_name.get(pkg, [])
+        # More rpms of the same name, e.g. of two arches, are left to download_pkg
+        if len(candidates) == 1:
+            matched[pkg] = candidates[0]
+
+    return matched
+
+
+def _decode_header_value(value):
+    """Older rpm python bindings return the string tags as bytes on Python 3."""
+    if isinstance(value, bytes) and not isinstance(value, str):
+        return value.decode("utf-8", "replace")
+    return value
+
+
+def _get_rpm_files_state(directory):
+    """Get the identity and the modification time of every rpm in a directory.
+
+    :return: The (inode, size, mtime) of the rpm files by their paths.
+    :rtype: dict[str, tuple[int, int, float]]
+    """
+    states = {}
+    for path in glob.glob(os.path.join(directory, "*.rpm")):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        states[path] = (stat.st_ino, stat.st_size, stat.st_mtime)
+    return states
+
+
+def _get_rpm_filename(pkg):
+    """Return the file name of the rpm of a package given as a NEVRA string.
+
+    The epoch is printed differently by yum and dnf but it is never part of the file name:
+      yum - epoch before name: "7:oraclelinux-release-7.9-1.0.9.el7.x86_64"
+      dnf - epoch before version: "oraclelinux-release-8:8.2-1.0.8.el8.x86_64"
+    """
+    nvra = re.sub(r"^\d+:", "", pkg)
+    nvra = re.sub(r"-\d+:", "-", nvra)
+    return "%s.rpm" % nvra
+
+
+def _get_yumdownloader_cmd(dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir):
+    """Assemble the yumdownloader command, without the packages to download.
+
+    See :func:`download_pkg` for the description of the parameters.
+
+    :rtype: list[str]
+    """
+    from convert2rhel.systeminfo import system_info
+
+    # On RHEL 7, it's necessary to invoke yumdownloader with -v, otherwise there's no output to stdout.
+    cmd = ["yumdownloader", "-v", "--destdir=%s" % dest]
+    if reposdir:
+        cmd.append("--setopt=reposdir=%s" % reposdir)
+
+    if isinstance(disable_repos, list):
+        for repo in disable_repos:
+            cmd.append("--disablerepo=%s" % repo)
+
+    if isinstance(enable_repos, list):
+        for repo in enable_repos:
+            cmd.append("--enablerepo=%s" % repo)
+
+    if set_releasever:
+        if not custom_releasever and not system_info.releasever:
+            raise AssertionError("custom_releasever or system_info.releasever must be set.")
+
+        if custom_releasever:
+            cmd.append("--releasever=%s" % custom_releasever)
+        else:
+            cmd.append("--releasever=%s" % system_info.releasever)
+
+    if varsdir:
+        cmd.append("--setopt=varsdir=%s" % varsdir)
+
+    if system_info.version.major == 8:
+        cmd.append("--setopt=module_platform_id=platform:el8")
+
+    return cmd
 
 
 def download_pkg(
@@ -667,34 +1566,9 @@ def download_pkg(
 
     loggerinst.debug("Downloading the %s package." % pkg)
 
-    # On RHEL 7, it's necessary to invoke yumdownloader with -v, otherwise there's no output to stdout.
-    cmd = ["yumdownloader", "-v", "--destdir=%s" % dest]
-    if reposdir:
-        cmd.append("--setopt=reposdir=%s" % reposdir)
-
-    if isinstance(disable_repos, list):
-        for repo in disable_repos:
-            cmd.append("--disablerepo=%s" % repo)
-
-    if isinstance(enable_repos, list):
-        for repo in enable_repos:
-            cmd.append("--enablerepo=%s" % repo)
-
-    if set_releasever:
-        if not custom_releasever and not system_info.releasever:
-            raise AssertionError("custom_releasever or system_info.releasever must be set.")
-
-        if custom_releasever:
-            cmd.append("--releasever=%s" % custom_releasever)
-        else:
-            cmd.append("--releasever=%s" % system_info.releasever)
-
-    if varsdir:
-        cmd.append("--setopt=varsdir=%s" % varsdir)
-
-    if system_info.version.major == 8:
-        cmd.append("--setopt=module_platform_id=platform:el8")
-
+    cmd = _get_yumdownloader_cmd(
+        dest, reposdir, enable_repos, disable_repos, set_releasever, custom_releasever, varsdir
+    )
     cmd.append(pkg)
 
     output, ret_code = run_cmd_in_pty(cmd, print_output=False)
@@ -814,11 +1688,42 @@ def find_keyid(keyfile):
     """
     Find the keyid as used by rpm from a gpg key file.
 
+    The key file is read in-process. Only when it contains a key that
+    :mod:`convert2rhel.openpgp` doesn't understand, gpg is used instead. The
+    keyid is cached until the file changes.
+
     :arg keyfile: The filename that contains the gpg key.
 
     .. note:: rpm doesn't use the full gpg fingerprint so don't use that even though it would be
         more secure.
     """
+    try:
+        mtime = os.stat(keyfile).st_mtime
+    except OSError:
+        mtime = None
+
+    cached = _keyid_cache.get(keyfile)
+    if cached and mtime is not None and cached[0] == mtime:
+        return cached[1]
+
+    try:
+        keyid = openpgp.get_keyid(openpgp.get_fingerprint(keyfile))
+    except (openpgp.OpenPGPError, IOError, OSError) as e:
+        loggerinst.debug("Unable to read the gpg key file %s, falling back to gpg: %s" % (keyfile, str(e)))
+        keyid = _find_keyid_with_gpg(keyfile)
+
+    if mtime is not None:
+        _keyid_cache[keyfile] = (mtime, keyid)
+
+    return keyid
+
+
+def _find_keyid_with_gpg(keyfile):
+    """
+    Find the keyid as used by rpm from a gpg key file by importing it into a temporary gpg keyring.
+
+    :arg keyfile: The filename that contains the gpg key.
+    """
     # Newer gpg versions have several easier ways to do this:
     # gpg --with-colons --show-keys keyfile (Can pipe keyfile)
     # gpg --with-colons --import-options show-only --import keyfile  (Can pipe keyfile)
@@ -1056,3 +1961,7 @@ def write_json_object_to_file(path, data, mode=0o600):
     with open(path, mode="w") as handler:
         os.chmod(path, mode)
         json.dump(data, handler, indent=4)
+
+
+register_cache(_keyid_cache.clear)
+register_cache(timings.timings.reset)
@@ -0,0 +1,74 @@
+"""Compare logging the output of a command line by line directly and through the background writer thread.
+
+``utils.run_subprocess(print_output=True)`` logs every line the command
+prints. A command printing a transaction-like output is run through it with
+the handlers ``logger.setup_logger_handler()`` sets up, first writing to the
+terminal and the log file in the logging call, then with the
+``CONVERT2RHEL_ASYNC_LOGGING`` environment variable set, which leaves the
+writing to a background thread. Each is timed until everything is written.
+
+The terminal output goes to /dev/null, run it from the root of the repository:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/async_logging.py --lines 100000
+```
+"""
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from convert2rhel import logger as logger_module
+from convert2rhel import utils
+
+
+COMMAND = "for i in range(%d): print('Installing : package-%%d-1.0-1.el8.x86_64    %%d' %% (i, i))"
+
+
+def run_command(workdir: str, lines: int, async_logging: bool) -> None:
+    os.environ.pop(logger_module.ASYNC_LOGGING_ENVVAR, None)
+    if async_logging:
+        os.environ[logger_module.ASYNC_LOGGING_ENVVAR] = "1"
+
+    logger = logging.getLogger("convert2rhel")
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+        handler.close()
+    logger_module.setup_logger_handler("convert2rhel.log", workdir)
+
+    utils.run_subprocess([sys.executable, "-c", COMMAND % lines], print_output=True)
+    logger_module.flush()
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed), file=sys.stderr)
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100000, help="Number of the lines the command prints.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="c2r-async-logging-bench.")
+    stdout = sys.stdout
+    try:
+        with open(os.devnull, "w") as devnull:
+            sys.stdout = devnull
+            sync_time, _ = timed("direct", lambda: run_command(workdir, args.lines, False))
+            async_time, _ = timed("background writer", lambda: run_command(workdir, args.lines, True))
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(workdir)
+
+    print("{0:<30} {1:7.2f}x".format("speedup", sync_time / async_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare running the run_as_child_process() functions in a new child process per call and in the worker.
+
+Reads the rpmdb headers of a few packages, the way
+``pkghandler._read_installed_pkg_information_from_rpmdb()`` does, repeatedly
+through ``utils.run_as_child_process()``. First with a new child process
+spawned for every call, then with the long-lived worker process enabled
+through the ``CONVERT2RHEL_CHILD_PROCESS_WORKER`` environment variable.
+
+Run it on an rpm based system, from the root of the repository:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/child_process_worker.py --calls 200 --package bash
+```
+"""
+import argparse
+import os
+import time
+
+from convert2rhel import pkghandler, utils
+
+
+def read_rpmdb(package: str, calls: int) -> list:
+    results = []
+    for _ in range(calls):
+        results.append(utils.run_as_child_process(pkghandler._get_pkg_information_from_rpmdb)(package))
+    return results
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed))
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=200, help="Number of calls of the function.")
+    parser.add_argument("--package", default="bash", help="Name of an installed package to read.")
+    args = parser.parse_args()
+
+    os.environ.pop(utils.CHILD_PROCESS_WORKER_ENVVAR, None)
+    per_call_time, expected = timed("child process per call", lambda: read_rpmdb(args.package, args.calls))
+
+    os.environ[utils.CHILD_PROCESS_WORKER_ENVVAR] = "1"
+    try:
+        first_call_time, _ = timed("worker, first call", lambda: read_rpmdb(args.package, 1))
+        worker_time, result = timed("worker", lambda: read_rpmdb(args.package, args.calls))
+    finally:
+        utils.stop_child_process_workers()
+
+    if result != expected:
+        print("Warning: the results differ")
+    print("{0:<30} {1:8.2f}ms".format("per call, child process", per_call_time / args.calls * 1000))
+    print("{0:<30} {1:8.2f}ms".format("per call, worker", worker_time / args.calls * 1000))
+    print("{0:<30} {1:7.1f}x".format("speedup", per_call_time / worker_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""Compare adding the system packages to the dnf transaction one spec at a time with the bulk classification.
+
+Builds a set of empty synthetic noarch packages with rpmbuild and installs
+them into a fresh rpmdb in a chroot directory. Then generates the metadata of
+a repository where a quarter of the packages has the installed version
+available, a quarter has a newer version, a quarter has only an older
+version and a quarter is missing. Both of them are loaded into a dnf sack,
+and the following are timed:
+
+* the previous implementation, calling ``upgrade``/``reinstall``/``downgrade``
+  with a ``name.arch`` spec for every package
+* ``DnfTransactionHandler._perform_operations()``
+
+The resolved transactions of both are checked to be the same.
+
+Run it as root, from the root of the repository, on a system with dnf and
+rpm-build:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/dnf_perform_operations.py --packages 4000
+```
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import time
+
+import dnf
+
+from convert2rhel.pkgmanager.handlers import dnf as dnf_handler
+
+
+SPEC_HEADER = textwrap.dedent(
+    """\
+    Name: c2r-synthetic
+    Version: 1.0
+    Release: 1
+    Summary: Synthetic packages for benchmarking the dnf transaction
+    License: GPLv3+
+    BuildArch: noarch
+
+    %description
+    Synthetic packages for benchmarking the dnf transaction.
+    """
+)
+
+SUBPACKAGE_TEMPLATE = textwrap.dedent(
+    """\
+
+    %package -n {name}
+    Summary: Synthetic package {name}
+
+    %description -n {name}
+    Synthetic package {name}.
+
+    %files -n {name}
+    """
+)
+
+PRIMARY_PACKAGE_TEMPLATE = textwrap.dedent(
+    """\
+    <package type="rpm">
+      <name>{name}</name>
+      <arch>noarch</arch>
+      <version epoch="0" ver="{version}" rel="1"/>
+      <checksum type="sha256" pkgid="YES">{checksum}</checksum>
+      <summary>Synthetic package {name}</summary>
+      <description>Synthetic package {name}.</description>
+      <packager/>
+      <url/>
+      <time file="0" build="0"/>
+      <size package="0" installed="0" archive="0"/>
+      <location href="Packages/{name}-{version}-1.noarch.rpm"/>
+      <format>
+        <rpm:license>GPLv3+</rpm:license>
+        <rpm:provides>
+          <rpm:entry name="{name}" flags="EQ" epoch="0" ver="{version}" rel="1"/>
+        </rpm:provides>
+      </format>
+    </package>
+    """
+)
+
+REPOMD_TEMPLATE = textwrap.dedent(
+    """\
+    <?xml version="1.0" encoding="UTF-8"?>
+    <repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">
+      <revision>1</revision>
+      <data type="primary">
+        <checksum type="sha256">{checksum}</checksum>
+        <open-checksum type="sha256">{open_checksum}</open-checksum>
+        <location href="repodata/primary.xml.gz"/>
+        <timestamp>1</timestamp>
+        <size>{size}</size>
+        <open-size>{open_size}</open-size>
+      </data>
+    </repomd>
+    """
+)
+
+# The versions available in the repository for every quarter of the packages
+SCENARIOS = (
+    ("1.0",),  # reinstall
+    ("1.0", "1.1"),  # upgrade
+    ("0.9",),  # downgrade
+    (),  # not available
+)
+
+
+def package_name(index: int) -> str:
+    return "c2r-synthetic-%05d" % index
+
+
+def build_and_install_packages(workdir: str, root: str, count: int) -> None:
+    spec = os.path.join(workdir, "synthetic.spec")
+    with open(spec, "w") as f:
+        f.write(SPEC_HEADER)
+        for index in range(count):
+            f.write(SUBPACKAGE_TEMPLATE.format(name=package_name(index)))
+
+    topdir = os.path.join(workdir, "rpmbuild")
+    subprocess.check_call(
+        ["rpmbuild", "--quiet", "--define", "_topdir %s" % topdir, "-bb", spec],
+        stdout=subprocess.DEVNULL,
+    )
+
+    rpms_dir = os.path.join(topdir, "RPMS", "noarch")
+    rpms = sorted(os.path.join(rpms_dir, name) for name in os.listdir(rpms_dir))
+    subprocess.check_call(["rpm", "--root", root, "--initdb"])
+    subprocess.check_call(["rpm", "--root", root, "-i", "--justdb", "--nodeps", "--noscripts"] + rpms)
+
+
+def create_repository(repodir: str, count: int) -> None:
+    packages = []
+    for index in range(count):
+        name = package_name(index)
+        for version in SCENARIOS[index % len(SCENARIOS)]:
+            checksum = hashlib.sha256(("%s-%s" % (name, version)).encode()).hexdigest()
+            packages.append(PRIMARY_PACKAGE_TEMPLATE.format(name=name, version=version, checksum=checksum))
+
+    primary = (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" '
+        'packages="%d">\n%s</metadata>\n' % (len(packages), "".join(packages))
+    ).encode()
+    primary_gz = gzip.compress(primary)
+
+    os.makedirs(os.path.join(repodir, "repodata"))
+    with open(os.path.join(repodir, "repodata", "primary.xml.gz"), "wb") as f:
+        f.write(primary_gz)
+    with open(os.path.join(repodir, "repodata", "repomd.xml"), "w") as f:
+        f.write(
+            REPOMD_TEMPLATE.format(
+                checksum=hashlib.sha256(primary_gz).hexdigest(),
+                open_checksum=hashlib.sha256(primary).hexdigest(),
+                size=len(primary_gz),
+                open_size=len(primary),
+            )
+        )
+
+
+def create_base(workdir: str, root: str, repodir: str) -> dnf.Base:
+    base = dnf.Base()
+    base.conf.installroot = root
+    base.conf.cachedir = os.path.join(workdir, "cache")
+    base.conf.substitutions["releasever"] = "8"
+    base.repos.add_new_repo("c2r-synthetic", base.conf, baseurl=["file://%s" % repodir])
+    base.fill_sack(load_system_repo=True, load_available_repos=True)
+    return base
+
+
+def perform_operations_per_spec(base: dnf.Base, pkgs: list) -> None:
+    """The implementation before the bulk classification."""
+    upgrades = base.sack.query().upgrades().latest()
+    for pkg in pkgs:
+        name, arch = tuple(pkg.rsplit(".", 1))
+        if next(iter(upgrades.filter(name=name, arch=arch)), None):
+            base.upgrade(pkg_spec=pkg)
+            continue
+
+        try:
+            base.reinstall(pkg_spec=pkg)
+        except dnf.exceptions.PackagesNotAvailableError:
+            try:
+                base.downgrade(pkg_spec=pkg)
+            except dnf.exceptions.Error:
+                pass
+
+
+def perform_operations_bulk(base: dnf.Base, pkgs: list) -> None:
+    dnf_handler.get_system_packages_for_replacement = lambda: pkgs
+    handler = dnf_handler.DnfTransactionHandler()
+    handler._base = base
+    handler._perform_operations()
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed))
+    return elapsed, result
+
+
+def resolved_transaction(base: dnf.Base) -> list:
+    base.resolve(allow_erasing=True)
+    transaction = sorted(str(pkg) for pkg in base.transaction.install_set)
+    base.reset(goal=True)
+    return transaction
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=2000, help="Number of synthetic packages.")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory with the chroot.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="c2r-dnf-bench.")
+    root = os.path.join(workdir, "chroot")
+    repodir = os.path.join(workdir, "repo")
+    try:
+        print("Building %d packages in %s" % (args.packages, workdir))
+        build_and_install_packages(workdir, root, args.packages)
+        create_repository(repodir, args.packages)
+        base = create_base(workdir, root, repodir)
+        pkgs = ["%s.noarch" % package_name(index) for index in range(args.packages)]
+
+        per_spec_time, _ = timed("per package spec", lambda: perform_operations_per_spec(base, pkgs))
+        expected = resolved_transaction(base)
+
+        bulk_time, _ = timed("bulk classification", lambda: perform_operations_bulk(base, pkgs))
+        if resolved_transaction(base) != expected:
+            print("Warning: the resolved transactions differ")
+
+        print("{0:<30} {1:7.1f}x".format("speedup", per_spec_time / bulk_time))
+        base.close()
+    finally:
+        if args.keep:
+            print("The working directory was kept in %s" % workdir)
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
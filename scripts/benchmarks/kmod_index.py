@@ -0,0 +1,114 @@
+"""Compare listing the kernel modules in the repositories with repoquery and with the in-process index.
+
+The previous implementation of
+``EnsureKernelModulesCompatibility._get_rhel_supported_kmods()`` ran
+``repoquery -f /lib/modules/*.ko*`` to find the packages with kernel modules
+and ``repoquery -l`` over the most recent of them, splitting the whole file
+listing in Python. The current one reads the file lists of the packages in
+the yum/dnf sack directly and stores the result per repository on disk.
+
+The following are timed:
+
+* the two repoquery subprocesses
+* building the index, with the repository metadata loaded into a new sack
+* reading the stored index, as the following convert2rhel runs do
+
+The kernel modules found by all of them are checked to be the same.
+
+Run it as root, from the root of the repository, on a system with the
+repositories configured:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/kmod_index.py --releasever 8 --setopt module_platform_id=platform:el8 \
+    --repoid rhel-8-for-x86_64-baseos-rpms --repoid rhel-8-for-x86_64-appstream-rpms
+```
+"""
+import argparse
+import itertools
+import os
+import shutil
+import subprocess
+import tempfile
+import time
+
+from functools import cmp_to_key
+
+from convert2rhel import kmodindex, pkghandler
+from convert2rhel.pkgmanager.session import session
+
+
+def repoquery_pipeline(repoids: list, releasever: str, setopts: list) -> set:
+    """The implementation before the in-process index."""
+    cmd = ["repoquery", "--quiet", "--releasever=%s" % releasever]
+    for repoid in repoids:
+        cmd.extend(("--repoid", repoid))
+    cmd.extend("--setopt=%s" % setopt for setopt in setopts)
+
+    output = subprocess.check_output(
+        cmd + ["--qf", "%{NAME}-%{EPOCH}:%{VERSION}-%{RELEASE}.%{ARCH}", "-f", "/lib/modules/*.ko*"],
+        universal_newlines=True,
+    )
+    pkgs = sorted(set(line.strip() for line in output.splitlines() if line.strip()))
+
+    newest = []
+    for name, group in itertools.groupby(pkgs, lambda pkg: pkg.split(":")[0]):
+        if name.startswith(("kernel", "kmod")):
+            newest.append(max(group, key=cmp_to_key(pkghandler.compare_package_versions)))
+
+    output = subprocess.check_output(cmd + ["-l"] + newest, universal_newlines=True)
+    return set(
+        kmodindex.get_kmod_comparison_key(path)
+        for path in output.splitlines()
+        if path.startswith("/lib/modules/") and path.strip().endswith(("ko.xz", "ko"))
+    )
+
+
+def in_process_index(repoids: list, releasever: str, index_file: str) -> set:
+    session.close()
+    return kmodindex.get_rhel_kmods(repoids, releasever, index_file=index_file)[1]
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed))
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repoid", action="append", required=True, help="Repository to look into, repeatable.")
+    parser.add_argument("--releasever", required=True, help="The $releasever to use in the repofiles.")
+    parser.add_argument(
+        "--setopt",
+        action="append",
+        default=[],
+        help="Additional repoquery option, e.g. module_platform_id=platform:el8.",
+    )
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="c2r-kmod-bench.")
+    index_file = os.path.join(workdir, "kmod-index.json")
+    try:
+        # Make sure the metadata is in the yum/dnf cache for all of them
+        repoquery_pipeline(args.repoid, args.releasever, args.setopt)
+
+        repoquery_time, expected = timed(
+            "repoquery -f + repoquery -l", lambda: repoquery_pipeline(args.repoid, args.releasever, args.setopt)
+        )
+        build_time, built = timed("index built", lambda: in_process_index(args.repoid, args.releasever, index_file))
+        stored_time, stored = timed("index stored", lambda: in_process_index(args.repoid, args.releasever, index_file))
+
+        if not expected == built == stored:
+            print("Warning: the kernel modules found differ")
+        print("{0:<30} {1:7.1f}x".format("speedup (built)", repoquery_time / build_time))
+        print("{0:<30} {1:7.1f}x".format("speedup (stored)", repoquery_time / stored_time))
+        print("{0:<30} {1:8d}".format("index size (bytes)", os.path.getsize(index_file)))
+    finally:
+        session.close()
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
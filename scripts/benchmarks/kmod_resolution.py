@@ -0,0 +1,68 @@
+"""Compare the ways of resolving the loaded kernel modules to their files.
+
+The previous implementation of
+``EnsureKernelModulesCompatibility._get_loaded_kmods()`` ran ``modinfo`` once
+for every module listed by ``lsmod``. The current one reads ``/proc/modules``
+and ``modules.dep`` once and runs ``modinfo`` only for the modules missing
+from the index.
+
+Run it on the host whose modules should be measured, from the root of the
+repository:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/kmod_resolution.py --rounds 5
+```
+"""
+import argparse
+import re
+import statistics
+import subprocess
+import time
+
+from convert2rhel.actions.pre_ponr_changes.kernel_modules import EnsureKernelModulesCompatibility
+
+
+def modinfo_loop() -> set:
+    """The per-module implementation used before the modules.dep lookup."""
+    action = EnsureKernelModulesCompatibility()
+    lsmod_output = subprocess.check_output(["lsmod"], universal_newlines=True)
+    modules = re.findall(r"^(\w+)\s.+$", lsmod_output, flags=re.MULTILINE)[1:]
+    return set(
+        action._get_kmod_comparison_key(
+            subprocess.check_output(["modinfo", "-F", "filename", module], universal_newlines=True)
+        )
+        for module in modules
+    )
+
+
+def modules_dep_lookup() -> set:
+    return EnsureKernelModulesCompatibility()._get_loaded_kmods()
+
+
+def measure(func, rounds: int) -> list:
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=5, help="How many times to run each implementation.")
+    args = parser.parse_args()
+
+    if modinfo_loop() != modules_dep_lookup():
+        print("Warning: the implementations resolved the loaded modules differently.")
+
+    results = {}
+    for name, func in (("modinfo loop", modinfo_loop), ("modules.dep lookup", modules_dep_lookup)):
+        results[name] = statistics.median(measure(func, args.rounds))
+        print("{0:<20} median {1:8.4f}s over {2} rounds".format(name, results[name], args.rounds))
+
+    print("Speedup: {0:.1f}x".format(results["modinfo loop"] / results["modules.dep lookup"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Compare the package string parsing before and after the regex parser and cache.
+
+Generates a realistic list of installed packages (NEVRA, NVRA, ENVR, ... with
+the usual mix of arches, epochs and -devel/-libs subpackages) and times:
+
+* the previous implementation: yum/dnf parser plus validation for every call
+* parse_pkg_string() with an empty cache
+* parse_pkg_string() with a warm cache
+* sorting the list with compare_package_versions() which parses both sides of
+  every comparison
+
+Run it from the root of the repository on a system with yum or dnf:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/nevra_parsing.py --packages 5000
+```
+"""
+import argparse
+import random
+import time
+
+from functools import cmp_to_key
+
+from convert2rhel import pkghandler, pkgmanager
+
+
+BASE_NAMES = (
+    "kernel",
+    "kernel-core",
+    "glibc",
+    "NetworkManager",
+    "bind-export",
+    "python3",
+    "systemd",
+    "openssl",
+    "libgcc",
+    "perl-Data-Dumper",
+    "xorg-x11-server",
+    "java-11-openjdk",
+)
+SUBPACKAGES = ("", "-devel", "-libs", "-common", "-headers", "-tools")
+ARCHES = ("x86_64", "noarch", "i686", "aarch64")
+
+
+def generate_packages(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    packages = []
+    for i in range(count):
+        name = "%s%s-%d" % (rng.choice(BASE_NAMES), rng.choice(SUBPACKAGES), i // 50)
+        version = ".".join(str(rng.randint(0, 40)) for _ in range(rng.randint(1, 3)))
+        release = "%d.el%d_%d" % (rng.randint(1, 300), rng.choice((7, 8, 9)), rng.randint(0, 9))
+        epoch = str(rng.choice((0, 0, 0, 1, 2, 32)))
+        arch = rng.choice(ARCHES)
+
+        form = rng.choice(("NEVRA", "NEVRA", "NVRA", "NEVR", "ENVRA", "NVR"))
+        if form == "NEVRA":
+            packages.append("%s-%s:%s-%s.%s" % (name, epoch, version, release, arch))
+        elif form == "NVRA":
+            packages.append("%s-%s-%s.%s" % (name, version, release, arch))
+        elif form == "NEVR":
+            packages.append("%s-%s:%s-%s" % (name, epoch, version, release))
+        elif form == "ENVRA":
+            packages.append("%s:%s-%s-%s.%s" % (epoch, name, version, release, arch))
+        else:
+            packages.append("%s-%s-%s" % (name, version, release))
+
+    return packages
+
+
+def previous_parse_pkg_string(pkg: str) -> tuple:
+    """parse_pkg_string() before the regex parser and the cache were added."""
+    if pkgmanager.TYPE == "yum":
+        pkg_ver_components = pkghandler._parse_pkg_with_yum(pkg)
+    else:
+        pkg_ver_components = pkghandler._parse_pkg_with_dnf(pkg)
+
+    pkghandler._validate_parsed_fields(pkg, *pkg_ver_components)
+    return pkg_ver_components
+
+
+def timed(label: str, func) -> float:
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print("{0:<45} {1:8.4f}s".format(label, elapsed))
+    return elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=5000, help="Number of package strings to generate.")
+    args = parser.parse_args()
+
+    packages = generate_packages(args.packages)
+
+    mismatches = [pkg for pkg in packages if tuple(previous_parse_pkg_string(pkg)) != pkghandler.parse_pkg_string(pkg)]
+    if mismatches:
+        print("Warning: %d packages were parsed differently, e.g. %s" % (len(mismatches), mismatches[0]))
+
+    pkghandler._parsed_pkg_cache.clear()
+    previous = timed("previous parser", lambda: [previous_parse_pkg_string(pkg) for pkg in packages])
+    cold = timed("parse_pkg_string, empty cache", lambda: [pkghandler.parse_pkg_string(pkg) for pkg in packages])
+    timed("parse_pkg_string, warm cache", lambda: [pkghandler.parse_pkg_string(pkg) for pkg in packages])
+
+    # Sort every group of packages with the same name and arch, the way
+    # _get_most_recent_unique_kernel_pkgs() picks the latest kernel packages.
+    groups = {}
+    for pkg in packages:
+        name, _, _, _, arch = pkghandler.parse_pkg_string(pkg)
+        groups.setdefault((name, arch), []).append(pkg)
+
+    pkghandler._parsed_pkg_cache.clear()
+    timed(
+        "sorting with compare_package_versions",
+        lambda: [sorted(group, key=cmp_to_key(pkghandler.compare_package_versions)) for group in groups.values()],
+    )
+
+    print("Speedup with an empty cache: {0:.1f}x".format(previous / cold))
+
+
+if __name__ == "__main__":
+    main()
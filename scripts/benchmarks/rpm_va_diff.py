@@ -0,0 +1,109 @@
+"""Compare diffing the rpm -Va outputs from before and after the conversion with difflib and keyed by the file path.
+
+``SystemInfo.modified_rpm_files_diff()`` used to load both outputs and run
+``difflib.unified_diff`` over them. It now uses ``rpmverify.diff_rpm_va()``,
+which matches the lines by the path of the file they are about.
+
+Synthetic outputs are generated: the one from after the conversion has a part
+of the lines from before the conversion with changed verification flags,
+removed and added, and is in a different order, as the packages are replaced
+during the conversion.
+
+Run it from the root of the repository:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/rpm_va_diff.py --lines 100000 --changed 0.1
+```
+"""
+import argparse
+import difflib
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from convert2rhel import rpmverify
+
+
+FLAGS = ("S.5....T.", ".M.......", "..5....T.", "S.5......", ".......T.", "missing  ")
+
+
+def generate_outputs(workdir: str, lines: int, changed: float, seed: int) -> tuple:
+    rnd = random.Random(seed)
+    pre = ["%s  c /usr/share/pkg%d/file%d" % (rnd.choice(FLAGS), i // 50, i) for i in range(lines)]
+
+    post = []
+    for line in pre:
+        roll = rnd.random()
+        if roll < changed / 3:
+            # Removed
+            continue
+        if roll < changed * 2 / 3:
+            post.append("%s%s" % (rnd.choice(FLAGS), line[9:]))
+        else:
+            post.append(line)
+    # The added files of the replaced packages end up spread over the output
+    for i in range(int(lines * changed / 3)):
+        post.insert(rnd.randrange(len(post) + 1), "S.5....T.  c /etc/added/file%d" % i)
+
+    paths = []
+    for name, content in (("rpm_va.log", pre), ("rpm_va_after_conversion.log", post)):
+        path = os.path.join(workdir, name)
+        with open(path, "w") as f:
+            f.write("".join("%s\n" % line for line in content))
+        paths.append(path)
+
+    return tuple(paths)
+
+
+def unified_diff(pre_output_file: str, post_output_file: str) -> str:
+    """The implementation before the keyed diff."""
+    with open(pre_output_file) as f:
+        pre = [line.strip() for line in f]
+    with open(post_output_file) as f:
+        post = [line.strip() for line in f]
+    return "\n".join(
+        difflib.unified_diff(pre, post, fromfile=pre_output_file, tofile=post_output_file, n=0, lineterm="")
+    )
+
+
+def keyed_diff(pre_output_file: str, post_output_file: str) -> str:
+    diff = rpmverify.diff_rpm_va(pre_output_file, post_output_file)
+    return rpmverify.format_rpm_va_diff(diff, pre_output_file, post_output_file)
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed))
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--lines", type=int, default=100000, help="Number of lines of the output before conversion.")
+    parser.add_argument("--changed", type=float, default=0.1, help="Ratio of the changed, removed and added lines.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the generated outputs.")
+    parser.add_argument("--skip-difflib", action="store_true", help="Time only the keyed diff.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="c2r-rpm-va-diff-bench.")
+    try:
+        pre_output_file, post_output_file = generate_outputs(workdir, args.lines, args.changed, args.seed)
+
+        keyed_time, keyed = timed("keyed diff", lambda: keyed_diff(pre_output_file, post_output_file))
+        print("{0:<30} {1:8d}".format("keyed diff lines", len(keyed.splitlines())))
+        if args.skip_difflib:
+            return
+
+        difflib_time, unified = timed("difflib.unified_diff", lambda: unified_diff(pre_output_file, post_output_file))
+        print("{0:<30} {1:8d}".format("difflib lines", len(unified.splitlines())))
+        print("{0:<30} {1:7.1f}x".format("speedup", difflib_time / keyed_time))
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""Compare a single ``rpm -Va`` with the sharded parallel ``rpm -V`` processes.
+
+Builds a set of synthetic noarch packages with rpmbuild, installs them into a
+fresh rpmdb in a chroot directory and modifies some of the installed files so
+that the verification has something to report. Then times:
+
+* the serial ``rpm --root <chroot> -Va``
+* ``rpmverify._verify_pkgs()`` with the given numbers of parallel processes
+
+and checks that both produce the same output in the same order.
+
+Run it as root, from the root of the repository, on a system with rpm-build:
+
+```bash
+PYTHONPATH=. python scripts/benchmarks/rpm_va_parallel.py --packages 500 --jobs 1 4 16
+```
+"""
+import argparse
+import os
+import random
+import shutil
+import subprocess
+import tempfile
+import textwrap
+import time
+
+from convert2rhel import rpmverify
+
+
+SPEC_TEMPLATE = textwrap.dedent(
+    """\
+    Name: c2r-synthetic-{index:05d}
+    Version: 1.0
+    Release: 1
+    Summary: Synthetic package for benchmarking rpm -V
+    License: GPLv3+
+    BuildArch: noarch
+    %define __os_install_post %{{nil}}
+    %define _build_id_links none
+
+    %description
+    Synthetic package for benchmarking rpm -V.
+
+    %install
+    mkdir -p %{{buildroot}}/opt/c2r-synthetic/%{{name}}
+    for i in $(seq 1 {files}); do
+        head -c {file_size} /dev/urandom > %{{buildroot}}/opt/c2r-synthetic/%{{name}}/file$i
+    done
+
+    %files
+    /opt/c2r-synthetic/%{{name}}
+    """
+)
+
+
+def build_packages(workdir: str, count: int, files: int, file_size: int) -> list:
+    topdir = os.path.join(workdir, "rpmbuild")
+    for index in range(count):
+        spec = os.path.join(workdir, "synthetic-%05d.spec" % index)
+        with open(spec, "w") as f:
+            f.write(SPEC_TEMPLATE.format(index=index, files=files, file_size=file_size))
+        subprocess.check_call(
+            ["rpmbuild", "--quiet", "--define", "_topdir %s" % topdir, "-bb", spec],
+            stdout=subprocess.DEVNULL,
+        )
+
+    rpms_dir = os.path.join(topdir, "RPMS", "noarch")
+    return sorted(os.path.join(rpms_dir, name) for name in os.listdir(rpms_dir))
+
+
+def install_packages(root: str, rpms: list) -> list:
+    subprocess.check_call(["rpm", "--root", root, "--initdb"])
+    subprocess.check_call(["rpm", "--root", root, "-i", "--nodeps", "--noscripts"] + rpms)
+    output = subprocess.check_output(
+        ["rpm", "--root", root, "-qa", "--qf", "%{NAME}-%{VERSION}-%{RELEASE}.%{ARCH}\\n"],
+        universal_newlines=True,
+    )
+    return output.split()
+
+
+def modify_files(root: str, ratio: float, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for dirpath, _, filenames in os.walk(os.path.join(root, "opt", "c2r-synthetic")):
+        for filename in filenames:
+            if rng.random() < ratio:
+                with open(os.path.join(dirpath, filename), "ab") as f:
+                    f.write(b"modified")
+
+
+def timed(label: str, func):
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    print("{0:<30} {1:8.3f}s".format(label, elapsed))
+    return elapsed, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--packages", type=int, default=200, help="Number of synthetic packages.")
+    parser.add_argument("--files", type=int, default=50, help="Number of files in every package.")
+    parser.add_argument("--file-size", type=int, default=64 * 1024, help="Size of every file in bytes.")
+    parser.add_argument("--modified", type=float, default=0.01, help="Ratio of the installed files to modify.")
+    parser.add_argument("--jobs", type=int, nargs="+", default=[1, 2, 4, 8], help="Numbers of parallel processes.")
+    parser.add_argument("--keep", action="store_true", help="Keep the working directory with the chroot.")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="c2r-rpm-va-bench.")
+    root = os.path.join(workdir, "chroot")
+    try:
+        print("Building %d packages in %s" % (args.packages, workdir))
+        rpms = build_packages(workdir, args.packages, args.files, args.file_size)
+        labels = install_packages(root, rpms)
+        modify_files(root, args.modified)
+
+        def serial():
+            output = subprocess.run(["rpm", "--root", root, "-Va"], stdout=subprocess.PIPE, universal_newlines=True)
+            return output.stdout.splitlines()
+
+        # Drop the first measurement, it's mostly about populating the page cache
+        serial()
+        serial_time, expected = timed("rpm -Va", serial)
+
+        for jobs in args.jobs:
+            elapsed, output = timed(
+                "sharded rpm -V, %d jobs" % jobs,
+                lambda: rpmverify._verify_pkgs(labels, jobs, cmd=("rpm", "--root", root, "-V")),
+            )
+            if output != expected:
+                print("Warning: the output differs from the one of rpm -Va")
+            print("{0:<30} {1:7.1f}x".format("speedup", serial_time / elapsed))
+    finally:
+        if args.keep:
+            print("The working directory was kept in %s" % workdir)
+        else:
+            shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()